@@ -1,32 +1,23 @@
 from __future__ import annotations
 import os, json
 from typing import Any, Optional
-from sqlalchemy import create_engine
 
-from config import _is_production
+def get_db(replica: bool = False):
+    """Pooled connection; ``replica=True`` reads from a fresh replica when configured."""
+    if replica:
+        from erp.db_routing import read_engine
 
-_engine = None
-def _ensure_engine():
-    global _engine
-    if _engine is None:
-        url = os.environ.get("DATABASE_URL")
-        if not url:
-            if _is_production():
-                raise RuntimeError("DATABASE_URL must be set in production environments")
-
-            db_path = os.environ.get("DATABASE_PATH")
-            url = f"sqlite+pysqlite:///{db_path}" if db_path else "sqlite+pysqlite:///:memory:"
-        _engine = create_engine(url, future=True)
-    return _engine
-
-def get_db():
-    return _ensure_engine().connect()
+        return read_engine().connect()
+    return get_engine().connect()
 
 def get_engine():
-    return _ensure_engine()
+    """Shared pooled engine from :mod:`erp.engines` (Flask-SQLAlchemy's inside an app)."""
+    from erp.engines import get_engine as _registry_engine
+
+    return _registry_engine()
 
 def get_dialect() -> str:
-    return str(_ensure_engine().dialect.name)
+    return str(get_engine().dialect.name)
 
 class _MemRedis:
     def __init__(self) -> None:
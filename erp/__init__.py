@@ -15,6 +15,7 @@ from .security import apply_security
 from .middleware.security_headers import apply_security_headers
 from .middleware.tenant_guard import install_tenant_guard
 from .security_gate import install_global_gate
+from .socket import socketio
 
 LOGGER = logging.getLogger(__name__)
 
@@ -109,4 +110,4 @@ def create_app() -> Flask:
     return app
 
 
-__all__ = ["create_app"]
+__all__ = ["create_app", "socketio"]
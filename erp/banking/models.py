@@ -160,6 +160,35 @@ class BankSyncJob(db.Model):
     bank_account = relationship("BankAccount")
 
 
+class BankSyncCursor(db.Model):
+    """Incremental sync position for one account on one connection."""
+
+    __tablename__ = "bank_sync_cursors"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "connection_id", "bank_account_id", name="uq_bank_sync_cursors_connection_account"
+        ),
+        {"extend_existing": True},
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    org_id: Mapped[int] = mapped_column(db.Integer, nullable=False, index=True)
+    connection_id: Mapped[int] = mapped_column(
+        db.Integer, db.ForeignKey("bank_connections.id", ondelete="CASCADE"), nullable=False
+    )
+    bank_account_id: Mapped[int] = mapped_column(
+        db.Integer, db.ForeignKey("bank_accounts.id", ondelete="CASCADE"), nullable=False
+    )
+
+    # Provider page cursor of the last page fetched (None: use the watermark).
+    cursor: Mapped[str | None] = mapped_column(db.String(512))
+    last_tx_date: Mapped[date | None] = mapped_column(db.Date)
+    last_external_id: Mapped[str | None] = mapped_column(db.String(128))
+    lines_synced: Mapped[int] = mapped_column(db.Integer, nullable=False, default=0)
+
+    updated_at: Mapped[datetime | None] = mapped_column(db.DateTime)
+
+
 # Back-populate relationship now that BankStatement is imported
 BankStatement.bank_account = relationship(
     "BankAccount",
@@ -180,5 +209,6 @@ __all__ = [
     "BankAccessToken",
     "BankTwoFactorChallenge",
     "BankSyncJob",
+    "BankSyncCursor",
     "BankTransaction",
 ]
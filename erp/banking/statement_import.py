@@ -0,0 +1,587 @@
+"""Streaming bank statement file import (CSV, MT940, CAMT.053).
+
+Parsers read the file incrementally and yield events: an opening balance,
+statement rows, per-row errors, and a closing balance. Memory does not
+grow with the size of the statement. CAMT.053 uses ``iterparse`` and
+clears each ``Ntry`` once it has been read.
+
+:func:`ingest` consumes events for one :class:`BankStatement`:
+
+* it checks the running balance against each row that carries one, and
+  the final total against the closing balance;
+* it bulk-inserts rows in chunks of ``BANK_IMPORT_CHUNK``;
+* it records per-row problems on the :class:`BankStatementImport`
+  without stopping the import.
+
+:func:`run_import` drives an uploaded file end to end and updates the
+import's progress after each chunk. The finance-reconcile routes call it
+inline for small files and through Celery for large ones.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import itertools
+import os
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import IO, Any
+from xml.etree import ElementTree
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, or_
+
+from erp.banking.sync import upsert_statement_lines
+from erp.extensions import db
+from erp.models.finance_gl import BankStatement, BankStatementImport, BankStatementLine
+
+CSV, MT940, CAMT053 = "csv", "mt940", "camt053"
+FORMATS = (CSV, MT940, CAMT053)
+
+DEFAULT_CHUNK = 1000
+
+
+class StatementFormatError(ValueError):
+    """The file as a whole cannot be read in the declared format."""
+
+
+@dataclass
+class Row:
+    line_no: int
+    tx_date: date
+    amount: Decimal
+    balance: Decimal | None = None
+    description: str | None = None
+    reference: str | None = None
+    external_id: str | None = None
+
+
+@dataclass
+class Opening:
+    amount: Decimal
+
+
+@dataclass
+class Closing:
+    amount: Decimal
+
+
+@dataclass
+class RowError:
+    line_no: int | None
+    error: str
+
+
+Event = Row | Opening | Closing | RowError
+
+
+# -- field helpers -------------------------------------------------------------
+
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d.%m.%Y", "%Y%m%d")
+
+
+def parse_amount(text: Any) -> Decimal:
+    """Decimal from ``1,234.56``, ``1.234,56``, ``-12,5`` and similar."""
+
+    s = str(text).strip().replace(" ", "").replace(" ", "")
+    if not s:
+        raise ValueError("amount is empty")
+    if "," in s and "." in s:
+        s = s.replace(",", "") if s.rfind(".") > s.rfind(",") else s.replace(".", "").replace(",", ".")
+    elif "," in s:
+        decimals = len(s) - s.rfind(",") - 1
+        s = s.replace(",", ".") if decimals in (1, 2) else s.replace(",", "")
+    try:
+        return Decimal(s)
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {text!r}") from None
+
+
+def parse_date(text: Any) -> date:
+    s = str(text).strip()[:10]
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date {text!r}")
+
+
+def _clean(value: Any, limit: int) -> str | None:
+    text = " ".join(str(value or "").split())
+    return text[:limit] or None
+
+
+def detect_format(filename: str, head: bytes) -> str:
+    name = filename.lower()
+    sample = head.lstrip()
+    if name.endswith(".xml") or sample.startswith(b"<"):
+        return CAMT053
+    if name.endswith((".sta", ".mt940", ".940")) or b":20:" in head or b":61:" in head:
+        return MT940
+    return CSV
+
+
+# -- CSV -----------------------------------------------------------------------
+
+_CSV_COLUMNS = {
+    "date": ("tx_date", "date", "booking_date", "value_date", "transaction_date"),
+    "amount": ("amount",),
+    "debit": ("debit", "withdrawal"),
+    "credit": ("credit", "deposit"),
+    "balance": ("balance", "running_balance"),
+    "description": ("description", "narrative", "details", "memo"),
+    "reference": ("reference", "ref"),
+    "external_id": ("id", "external_id", "transaction_id"),
+}
+
+
+def parse_csv(stream: IO[bytes]) -> Iterator[Event]:
+    # Decoding happens as the reader advances, so a file in the wrong
+    # encoding fails mid-stream rather than on a single row.
+    try:
+        yield from _parse_csv(stream)
+    except UnicodeDecodeError as exc:
+        raise StatementFormatError(f"CSV is not UTF-8 encoded: {exc}") from exc
+    except csv.Error as exc:
+        raise StatementFormatError(f"invalid CSV: {exc}") from exc
+
+
+def _parse_csv(stream: IO[bytes]) -> Iterator[Event]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    header = text.readline()
+    if not header.strip():
+        raise StatementFormatError("CSV file is empty")
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    reader = csv.DictReader(itertools.chain([header], text), delimiter=delimiter)
+    fields = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+    columns = {
+        key: next((fields[a] for a in aliases if a in fields), None) for key, aliases in _CSV_COLUMNS.items()
+    }
+    if columns["date"] is None or (columns["amount"] is None and columns["credit"] is None):
+        raise StatementFormatError("CSV needs a date column and an amount (or debit/credit) column")
+
+    for record in reader:
+        line_no = reader.line_num
+        try:
+            if columns["amount"] is not None:
+                amount = parse_amount(record[columns["amount"]])
+            else:
+                credit = record.get(columns["credit"]) or "0"
+                debit = record.get(columns["debit"]) or "0" if columns["debit"] else "0"
+                amount = parse_amount(credit) - parse_amount(debit)
+            balance_raw = record.get(columns["balance"]) if columns["balance"] else None
+            yield Row(
+                line_no=line_no,
+                tx_date=parse_date(record[columns["date"]]),
+                amount=amount,
+                balance=parse_amount(balance_raw) if balance_raw not in (None, "") else None,
+                description=_clean(record.get(columns["description"]), 255) if columns["description"] else None,
+                reference=_clean(record.get(columns["reference"]), 64) if columns["reference"] else None,
+                external_id=_clean(record.get(columns["external_id"]), 128) if columns["external_id"] else None,
+            )
+        except (ValueError, TypeError, KeyError) as exc:
+            yield RowError(line_no, str(exc))
+
+
+# -- MT940 ---------------------------------------------------------------------
+
+_TAG = re.compile(r"^:(\d{2}[A-Z]?):(.*)$")
+_BALANCE = re.compile(r"^(?P<mark>[CD])(?P<date>\d{6})(?P<currency>[A-Z]{3})(?P<amount>[\d,]+)")
+_STATEMENT_LINE = re.compile(
+    r"^(?P<date>\d{6})(?P<entry>\d{4})?(?P<mark>R?[CD])[A-Z]?(?P<amount>\d[\d,]*)"
+    r"(?P<type>[NSF][A-Z0-9]{3})(?P<ref>[^/]*?)(?://(?P<bank_ref>.*))?$"
+)
+
+
+def _mt940_amount(text: str) -> Decimal:
+    try:
+        return Decimal(text.replace(",", ".").rstrip(".") or "0")
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {text!r}") from None
+
+
+def _mt940_date(text: str) -> date:
+    return datetime.strptime(text, "%y%m%d").date()
+
+
+def _mt940_balance(value: str) -> Decimal:
+    match = _BALANCE.match(value.replace("\n", ""))
+    if not match:
+        raise ValueError(f"invalid balance {value!r}")
+    amount = _mt940_amount(match["amount"])
+    return -amount if match["mark"] == "D" else amount
+
+
+def _mt940_fields(stream: IO[bytes]) -> Iterator[tuple[int, str, str]]:
+    """``(line_no, tag, value)`` with continuation lines folded in."""
+
+    text = io.TextIOWrapper(stream, encoding="latin-1", newline=None)
+    tag: str | None = None
+    start = 0
+    parts: list[str] = []
+    for line_no, raw in enumerate(text, start=1):
+        line = raw.rstrip("\r\n")
+        match = _TAG.match(line)
+        if match or line.startswith("-"):
+            if tag is not None:
+                yield start, tag, "\n".join(parts)
+            tag, start, parts = (match[1], line_no, [match[2]]) if match else (None, 0, [])
+        elif tag is not None:
+            parts.append(line)
+    if tag is not None:
+        yield start, tag, "\n".join(parts)
+
+
+def _mt940_row(line_no: int, value: str, info: str | None) -> Row:
+    first, _, extra = value.partition("\n")
+    match = _STATEMENT_LINE.match(first)
+    if not match:
+        raise ValueError(f"invalid :61: line {first!r}")
+    amount = _mt940_amount(match["amount"])
+    if match["mark"] in ("D", "RC"):
+        amount = -amount
+    ref = (match["ref"] or "").strip()
+    bank_ref = (match["bank_ref"] or "").strip()
+    return Row(
+        line_no=line_no,
+        tx_date=_mt940_date(match["date"]),
+        amount=amount,
+        description=_clean(info or extra, 255),
+        reference=_clean(ref if ref.upper() != "NONREF" else "", 64),
+        external_id=_clean(bank_ref or (ref if ref.upper() != "NONREF" else ""), 128),
+    )
+
+
+def parse_mt940(stream: IO[bytes]) -> Iterator[Event]:
+    pending: tuple[int, str] | None = None
+    info: str | None = None
+    opening_seen = False
+    closing: Decimal | None = None
+
+    def flush() -> Iterator[Event]:
+        if pending is None:
+            return
+        try:
+            yield _mt940_row(pending[0], pending[1], info)
+        except ValueError as exc:
+            yield RowError(pending[0], str(exc))
+
+    for line_no, tag, value in _mt940_fields(stream):
+        if tag == "86" and pending is not None:
+            info = value
+            continue
+        yield from flush()
+        pending, info = None, None
+        try:
+            if tag == "61":
+                pending = (line_no, value)
+            elif tag in ("60F", "60M") and not opening_seen:
+                opening_seen = True
+                yield Opening(_mt940_balance(value))
+            elif tag in ("62F", "62M"):
+                closing = _mt940_balance(value)
+        except ValueError as exc:
+            yield RowError(line_no, str(exc))
+    yield from flush()
+    if closing is not None:
+        yield Closing(closing)
+
+
+# -- CAMT.053 ------------------------------------------------------------------
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(elem: ElementTree.Element, *path: str) -> ElementTree.Element | None:
+    node: ElementTree.Element | None = elem
+    for name in path:
+        if node is None:
+            return None
+        node = next((c for c in node if _local(c.tag) == name), None)
+    return node
+
+
+def _text(elem: ElementTree.Element, *path: str) -> str | None:
+    node = _child(elem, *path)
+    return node.text.strip() if node is not None and node.text else None
+
+
+def _signed(elem: ElementTree.Element) -> Decimal:
+    amount = parse_amount(_text(elem, "Amt") or "")
+    return -amount if _text(elem, "CdtDbtInd") == "DBIT" else amount
+
+
+def _entry_description(entry: ElementTree.Element) -> str | None:
+    info = _text(entry, "AddtlNtryInf")
+    if info:
+        return info
+    tx = _child(entry, "NtryDtls", "TxDtls")
+    if tx is not None:
+        return _text(tx, "RmtInf", "Ustrd") or _text(tx, "AddtlTxInf")
+    return None
+
+
+def parse_camt053(stream: IO[bytes]) -> Iterator[Event]:
+    entry_no = 0
+    closing: Decimal | None = None
+    opening_seen = False
+    try:
+        for _event, elem in ElementTree.iterparse(stream, events=("end",)):
+            name = _local(elem.tag)
+            if name == "Bal":
+                code = _text(elem, "Tp", "CdOrPrtry", "Cd")
+                try:
+                    if code in ("OPBD", "PRCD") and not opening_seen:
+                        opening_seen = True
+                        yield Opening(_signed(elem))
+                    elif code == "CLBD":
+                        closing = _signed(elem)
+                except ValueError as exc:
+                    yield RowError(None, f"balance {code}: {exc}")
+                elem.clear()
+            elif name == "Ntry":
+                entry_no += 1
+                try:
+                    booked = _text(elem, "BookgDt", "Dt") or _text(elem, "BookgDt", "DtTm")
+                    booked = booked or _text(elem, "ValDt", "Dt")
+                    if not booked:
+                        raise ValueError("entry has no booking date")
+                    yield Row(
+                        line_no=entry_no,
+                        tx_date=parse_date(booked),
+                        amount=_signed(elem),
+                        description=_clean(_entry_description(elem), 255),
+                        reference=_clean(_text(elem, "NtryRef"), 64),
+                        external_id=_clean(_text(elem, "AcctSvcrRef") or _text(elem, "NtryRef"), 128),
+                    )
+                except ValueError as exc:
+                    yield RowError(entry_no, str(exc))
+                elem.clear()
+    except ElementTree.ParseError as exc:
+        raise StatementFormatError(f"invalid CAMT.053 XML: {exc}") from exc
+    if closing is not None:
+        yield Closing(closing)
+
+
+PARSERS = {CSV: parse_csv, MT940: parse_mt940, CAMT053: parse_camt053}
+
+
+def parse(stream: IO[bytes], file_format: str) -> Iterator[Event]:
+    if file_format not in PARSERS:
+        raise StatementFormatError(f"unsupported format {file_format!r}")
+    return PARSERS[file_format](stream)
+
+
+# -- ingestion -----------------------------------------------------------------
+
+
+@dataclass
+class IngestResult:
+    imported: int = 0
+    failed: int = 0
+    total: Decimal = Decimal("0")
+    first_date: date | None = None
+    last_date: date | None = None
+    opening: Decimal | None = None
+    closing: Decimal | None = None
+
+
+def _chunk_size() -> int:
+    if has_app_context():
+        return int(current_app.config.get("BANK_IMPORT_CHUNK") or DEFAULT_CHUNK)
+    return DEFAULT_CHUNK
+
+
+def _bank_account_id(org_id: int, code: str) -> int | None:
+    from erp.banking.models import BankAccount
+
+    row = (
+        db.session.query(BankAccount.id)
+        .filter(
+            BankAccount.org_id == org_id,
+            or_(BankAccount.gl_account_code == code, BankAccount.account_number == code),
+        )
+        .first()
+    )
+    return row[0] if row else None
+
+
+def ingest(
+    statement: BankStatement,
+    events: Iterable[Event],
+    *,
+    opening_known: bool = False,
+    record: BankStatementImport | None = None,
+    progress: Any = None,
+) -> IngestResult:
+    """Insert parsed rows for *statement*, validating balances as they pass.
+
+    Rows are written with ``upsert_statement_lines`` in chunks. A row whose
+    bank reference the account already holds is skipped, so re-importing
+    an overlapping file does not duplicate lines. *progress* is called
+    after every chunk.
+
+    The running balance starts from the file's opening balance, from
+    ``statement.opening_balance`` when *opening_known*, or else from the
+    first row that carries a balance.
+    """
+
+    result = IngestResult()
+    account_id = statement.bank_account_id or _bank_account_id(statement.org_id, statement.bank_account_code)
+    running: Decimal | None = Decimal(statement.opening_balance) if opening_known else None
+    chunk: list[dict] = []
+    size = _chunk_size()
+
+    def report(line_no: int | None, error: str) -> None:
+        result.failed += 1
+        if record is not None:
+            record.add_error(line_no, error)
+
+    def flush() -> None:
+        if chunk:
+            result.imported += len(upsert_statement_lines(db.session, chunk))
+            chunk.clear()
+        if record is not None:
+            record.lines_imported = result.imported
+            record.lines_failed = result.failed
+        if progress is not None:
+            progress(result)
+
+    for event in events:
+        if isinstance(event, Opening):
+            statement.opening_balance = result.opening = running = event.amount
+        elif isinstance(event, Closing):
+            result.closing = event.amount
+        elif isinstance(event, RowError):
+            report(event.line_no, event.error)
+        else:
+            if running is None and event.balance is not None:
+                running = event.balance - event.amount
+                statement.opening_balance = result.opening = running
+            if running is not None:
+                running += event.amount
+                if event.balance is not None and event.balance != running:
+                    report(event.line_no, f"running balance {event.balance} != expected {running}")
+                    running = event.balance
+            result.total += event.amount
+            result.first_date = min(result.first_date or event.tx_date, event.tx_date)
+            result.last_date = max(result.last_date or event.tx_date, event.tx_date)
+            chunk.append(
+                {
+                    "org_id": statement.org_id,
+                    "statement_id": statement.id,
+                    "bank_account_id": account_id,
+                    "external_id": event.external_id,
+                    "tx_date": event.tx_date,
+                    "description": event.description,
+                    "reference": event.reference,
+                    "amount": event.amount,
+                    "balance": event.balance,
+                }
+            )
+            if len(chunk) >= size:
+                flush()
+    flush()
+
+    if result.closing is not None:
+        statement.closing_balance = result.closing
+        if running is not None and running != result.closing:
+            report(None, f"closing balance {result.closing} != computed {running}")
+    else:
+        statement.closing_balance = result.closing = (
+            running if running is not None else Decimal(statement.opening_balance or 0) + result.total
+        )
+    return result
+
+
+class _CountingReader(io.RawIOBase):
+    """Binary reader that remembers how many bytes were consumed."""
+
+    def __init__(self, raw: IO[bytes]) -> None:
+        self.raw = raw
+        self.count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.count += n
+        return n
+
+
+def run_import(import_id: int) -> BankStatementImport | None:
+    """Parse and ingest the stored file of import *import_id*."""
+
+    record = db.session.get(BankStatementImport, import_id)
+    if record is None or record.status not in ("queued", "error"):
+        return record
+    if record.status == "error":
+        # Chunks committed by the failed run would be duplicated otherwise
+        # (rows without a bank reference are not deduplicated).
+        db.session.execute(delete(BankStatementLine).where(BankStatementLine.statement_id == record.statement_id))
+    record.status = "running"
+    record.started_at = datetime.utcnow()
+    record.errors = []
+    db.session.commit()
+
+    statement = db.session.get(BankStatement, record.statement_id)
+    try:
+        with open(record.file_path, "rb") as raw:
+            reader = _CountingReader(raw)
+            stream = io.BufferedReader(reader, buffer_size=64 * 1024)
+
+            def progress(_result: IngestResult) -> None:
+                record.bytes_read = reader.count
+                db.session.commit()
+
+            result = ingest(statement, parse(stream, record.file_format), record=record, progress=progress)
+        statement.period_start = record.period_start or result.first_date or statement.period_start
+        statement.period_end = record.period_end or result.last_date or statement.period_end
+        statement.statement_date = statement.period_end
+        record.bytes_read = record.bytes_total
+        record.status = "partial" if result.failed else "success"
+    except (StatementFormatError, OSError) as exc:
+        db.session.rollback()
+        record.status = "error"
+        record.add_error(None, str(exc))
+    except Exception as exc:
+        # Never leave the import stuck in "running": mark it for retry.
+        db.session.rollback()
+        if has_app_context():
+            current_app.logger.exception("bank statement import %s failed", import_id)
+        record.status = "error"
+        record.add_error(None, f"import failed: {exc}")
+    record.finished_at = datetime.utcnow()
+    db.session.commit()
+    if record.status != "error":
+        try:
+            os.remove(record.file_path)
+        except OSError:  # pragma: no cover - already cleaned up
+            pass
+    return record
+
+
+__all__ = [
+    "CAMT053",
+    "CSV",
+    "FORMATS",
+    "MT940",
+    "StatementFormatError",
+    "detect_format",
+    "ingest",
+    "parse",
+    "parse_amount",
+    "parse_camt053",
+    "parse_csv",
+    "parse_mt940",
+    "run_import",
+]
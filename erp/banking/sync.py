@@ -0,0 +1,636 @@
+"""Concurrent, incremental bank statement sync.
+
+:func:`sync_jobs` runs many :class:`BankSyncJob` rows at once:
+
+* one fetcher thread per job pages through the provider's transactions.
+  Each fetch first takes a token from its connection's
+  :class:`RateLimiter`, so several accounts on one bank share that bank's
+  request budget.
+* pages flow through a bounded queue to the calling thread. Memory stays
+  at ``QUEUE_PAGES`` pages however long the history is, and all database
+  work happens on one session.
+* each page is upserted into ``bank_statement_lines``. Lines are
+  de-duplicated on ``(bank_account_id, external_id)``. The page is
+  committed together with the account's :class:`BankSyncCursor`, so an
+  interrupted run resumes after the last committed page.
+
+The next run for an account starts from the stored provider cursor, or
+from the ``last_tx_date`` watermark when the provider has no cursor. It
+therefore only fetches what is new; overlap is dropped by the unique
+index.
+"""
+from __future__ import annotations
+
+import hashlib
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime, timedelta
+from decimal import Decimal
+from typing import Any
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from erp.banking.models import BankAccessToken, BankAccount, BankSyncCursor, BankSyncJob
+from erp.extensions import db
+from erp.models.finance_gl import BankStatement, BankStatementLine, FinanceAuditLog
+from erp.utils import http_client
+from erp.utils.upsert import conflict_insert
+
+RUNNABLE = ("pending", "error")
+UPSERT_CHUNK = 500
+QUEUE_PAGES = 32
+
+DEFAULTS = {
+    "BANK_SYNC_MAX_WORKERS": 8,
+    "BANK_SYNC_RATE_PER_SECOND": 5.0,
+    "BANK_SYNC_PAGE_SIZE": 500,
+    # A running job older than this is assumed to belong to a dead worker.
+    "BANK_SYNC_STALE_SECONDS": 3600,
+}
+
+
+def _setting(key: str) -> Any:
+    if has_app_context():
+        value = current_app.config.get(key)
+        if value is not None:
+            return type(DEFAULTS[key])(value)
+    return DEFAULTS[key]
+
+
+# -- rate limiting -------------------------------------------------------------
+
+
+class RateLimiter:
+    """Token bucket allowing *rate* requests per second (bursts of *burst*)."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+_limiters: dict[int, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(connection_id: int, rate: float) -> RateLimiter:
+    """Process-wide limiter for a bank connection."""
+
+    with _limiters_lock:
+        limiter = _limiters.get(connection_id)
+        if limiter is None or limiter.rate != rate:
+            limiter = _limiters[connection_id] = RateLimiter(rate)
+        return limiter
+
+
+# -- providers -----------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class SyncTarget:
+    """Everything a fetcher thread needs; no ORM objects cross threads."""
+
+    job_id: int
+    connection_id: int
+    provider: str
+    base_url: str
+    access_token: str
+    account_ref: str
+    cursor: str | None
+    since: date | None
+    page_size: int
+    rate: float
+
+
+@dataclass
+class StatementPage:
+    transactions: list[dict]
+    request_cursor: str | None
+    next_cursor: str | None = None
+    closing_balance: Any = None
+
+    @property
+    def resume_cursor(self) -> str | None:
+        # At the end of the feed, re-read the last page next time so rows
+        # appended to it are picked up.
+        return self.next_cursor or self.request_cursor
+
+
+class RestStatementProvider:
+    """Generic JSON provider: ``GET {base}/accounts/{ref}/transactions``.
+
+    Accepts ``cursor`` (or ``from`` on the first request) and ``limit``;
+    responds with ``transactions``, ``next_cursor`` and an optional
+    ``closing_balance`` (the account balance at the end of the feed).
+    """
+
+    def __init__(self, target: SyncTarget) -> None:
+        self.target = target
+
+    def pages(self) -> Iterator[StatementPage]:
+        t = self.target
+        url = f"{t.base_url.rstrip('/')}/accounts/{t.account_ref}/transactions"
+        headers = {"Authorization": f"Bearer {t.access_token}"}
+        limiter = limiter_for(t.connection_id, t.rate)
+        cursor = t.cursor
+        while True:
+            params: dict[str, Any] = {"limit": t.page_size}
+            if cursor:
+                params["cursor"] = cursor
+            elif t.since:
+                params["from"] = t.since.isoformat()
+            limiter.acquire()
+            data = http_client.get_json(
+                url, headers=headers, params=params, upstream=f"bank:{t.connection_id}"
+            )
+            page = StatementPage(
+                transactions=list(data.get("transactions") or []),
+                request_cursor=cursor,
+                next_cursor=data.get("next_cursor"),
+                closing_balance=data.get("closing_balance"),
+            )
+            yield page
+            if not page.next_cursor:
+                return
+            cursor = page.next_cursor
+
+
+# Provider name -> adapter; anything unregistered speaks the generic REST shape.
+PROVIDERS: dict[str, Callable[[SyncTarget], Any]] = {}
+
+
+def provider_for(target: SyncTarget):
+    return PROVIDERS.get(target.provider, RestStatementProvider)(target)
+
+
+# -- line upsert ---------------------------------------------------------------
+
+
+def _decimal(value: Any) -> Decimal | None:
+    if value is None or value == "":
+        return None
+    return Decimal(str(value))
+
+
+def _fingerprint(tx_date: date, amount: Decimal, balance: Decimal | None, description: str, reference: str) -> str:
+    raw = f"{tx_date.isoformat()}|{amount}|{balance}|{description}|{reference}"
+    return "fp:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def normalize_line(raw: dict, *, org_id: int, bank_account_id: int, statement_id: int) -> dict:
+    """Provider transaction -> ``bank_statement_lines`` row."""
+
+    tx_date = raw.get("tx_date") or raw.get("date")
+    if not isinstance(tx_date, date):
+        tx_date = date.fromisoformat(str(tx_date)[:10])
+    amount = Decimal(str(raw["amount"]))
+    balance = _decimal(raw.get("balance"))
+    description = (raw.get("description") or "").strip()[:255]
+    reference = (raw.get("reference") or "").strip()[:64]
+    external_id = str(raw.get("id") or raw.get("external_id") or "").strip()
+    return {
+        "org_id": org_id,
+        "statement_id": statement_id,
+        "bank_account_id": bank_account_id,
+        "external_id": external_id[:128] or _fingerprint(tx_date, amount, balance, description, reference),
+        "tx_date": tx_date,
+        "description": description or None,
+        "reference": reference or None,
+        "amount": amount,
+        "balance": balance,
+    }
+
+
+def upsert_statement_lines(session: Session, rows: list[dict]) -> list[dict]:
+    """Insert *rows*, skipping external IDs the account already has.
+
+    Rows without an ``external_id`` (file imports lacking bank references)
+    cannot be matched against earlier runs and are always inserted. Returns
+    the rows that were actually inserted.
+    """
+
+    table = BankStatementLine.__table__
+    unkeyed = [r for r in rows if r["external_id"] is None]
+    unique = list({(r["bank_account_id"], r["external_id"]): r for r in rows if r["external_id"] is not None}.values())
+    if unkeyed:
+        session.execute(insert(table), unkeyed)
+    if not unique:
+        return unkeyed
+    inserted: list[dict] = list(unkeyed)
+    for start in range(0, len(unique), UPSERT_CHUNK):
+        chunk = unique[start : start + UPSERT_CHUNK]
+        stmt = conflict_insert(session, table)
+        if stmt is not None:
+            stmt = (
+                stmt.values(chunk)
+                .on_conflict_do_nothing(index_elements=[table.c.bank_account_id, table.c.external_id])
+                .returning(table.c.external_id)
+            )
+            fresh = set(session.execute(stmt).scalars())
+            inserted.extend(r for r in chunk if r["external_id"] in fresh)
+            continue
+        existing = set(
+            session.execute(
+                select(table.c.external_id).where(
+                    table.c.bank_account_id == chunk[0]["bank_account_id"],
+                    table.c.external_id.in_([r["external_id"] for r in chunk]),
+                )
+            ).scalars()
+        )
+        fresh_rows = [r for r in chunk if r["external_id"] not in existing]
+        if fresh_rows:
+            session.execute(insert(table), fresh_rows)
+        inserted.extend(fresh_rows)
+    return inserted
+
+
+# -- sync engine ---------------------------------------------------------------
+
+
+@dataclass
+class _JobRun:
+    job: BankSyncJob
+    account: BankAccount
+    cursor: BankSyncCursor
+    target: SyncTarget
+    cancel: threading.Event = field(default_factory=threading.Event)
+    statement: BankStatement | None = None
+    pages: int = 0
+    fetched: int = 0
+    inserted: int = 0
+    amount_total: Decimal = Decimal("0")
+    first_date: date | None = None
+    last_date: date | None = None
+    last_balance: Decimal | None = None
+    closing_hint: Decimal | None = None
+    failed: bool = False
+
+
+def _get_latest_token(org_id: int, connection_id: int) -> BankAccessToken | None:
+    return (
+        BankAccessToken.query.filter_by(org_id=org_id, connection_id=connection_id)
+        .order_by(BankAccessToken.created_at.desc(), BankAccessToken.id.desc())
+        .first()
+    )
+
+
+def _cursor_row(job: BankSyncJob) -> BankSyncCursor:
+    row = BankSyncCursor.query.filter_by(
+        connection_id=job.connection_id, bank_account_id=job.bank_account_id
+    ).first()
+    if row is None:
+        row = BankSyncCursor(
+            org_id=job.org_id,
+            connection_id=job.connection_id,
+            bank_account_id=job.bank_account_id,
+            lines_synced=0,
+        )
+        db.session.add(row)
+        db.session.flush()
+    return row
+
+
+def _start(job: BankSyncJob) -> _JobRun:
+    conn, account = job.connection, job.bank_account
+    if conn is None or account is None:
+        raise RuntimeError("Sync job has no connection or bank account")
+    if not conn.api_base_url:
+        raise RuntimeError("Connection has no api_base_url configured")
+    token = _get_latest_token(job.org_id, conn.id)
+    if not token:
+        raise RuntimeError("No access token configured for this connection")
+
+    cursor = _cursor_row(job)
+    credentials = conn.credentials_json or {}
+    target = SyncTarget(
+        job_id=job.id,
+        connection_id=conn.id,
+        provider=conn.provider,
+        base_url=conn.api_base_url,
+        access_token=token.access_token,
+        account_ref=account.account_number or str(account.id),
+        cursor=cursor.cursor,
+        since=cursor.last_tx_date or job.requested_from,
+        page_size=_setting("BANK_SYNC_PAGE_SIZE"),
+        rate=float(credentials.get("rate_limit_per_second") or _setting("BANK_SYNC_RATE_PER_SECOND")),
+    )
+    return _JobRun(job=job, account=account, cursor=cursor, target=target)
+
+
+def _previous_closing(account: BankAccount) -> Decimal:
+    closing = db.session.execute(
+        select(BankStatement.closing_balance)
+        .where(BankStatement.bank_account_id == account.id)
+        .order_by(BankStatement.period_end.desc(), BankStatement.id.desc())
+        .limit(1)
+    ).scalar()
+    return Decimal(closing if closing is not None else account.initial_balance or 0)
+
+
+def _statement(run: _JobRun) -> BankStatement:
+    if run.statement is not None:
+        return run.statement
+    job, account = run.job, run.account
+    # Refined from the first inserted line in _write_page when it has a balance.
+    opening = _previous_closing(account)
+    today = date.today()
+    run.statement = BankStatement(
+        org_id=job.org_id,
+        bank_account_id=account.id,
+        bank_account_code=account.gl_account_code or (account.account_number or ""),
+        currency=account.currency,
+        period_start=job.requested_from or today,
+        period_end=job.requested_to or today,
+        opening_balance=opening,
+        closing_balance=opening,
+        source="API",
+        external_reference=f"conn:{job.connection_id}:job:{job.id}",
+        created_by_id=job.requested_by_id,
+    )
+    db.session.add(run.statement)
+    db.session.flush()
+    return run.statement
+
+
+def _write_page(run: _JobRun, page: StatementPage) -> None:
+    run.pages += 1
+    run.fetched += len(page.transactions)
+    if page.closing_balance is not None:
+        run.closing_hint = _decimal(page.closing_balance)
+    if page.transactions:
+        statement = _statement(run)
+        rows = [
+            normalize_line(
+                raw, org_id=run.job.org_id, bank_account_id=run.account.id, statement_id=statement.id
+            )
+            for raw in page.transactions
+        ]
+        for row in upsert_statement_lines(db.session, rows):
+            if run.inserted == 0 and row["balance"] is not None:
+                # Re-read pages start with rows stored last time; the
+                # statement opens just before the first *new* line.
+                statement.opening_balance = row["balance"] - row["amount"]
+            run.inserted += 1
+            run.amount_total += row["amount"]
+            run.first_date = min(run.first_date or row["tx_date"], row["tx_date"])
+            run.last_date = max(run.last_date or row["tx_date"], row["tx_date"])
+            if row["balance"] is not None:
+                run.last_balance = row["balance"]
+        last = rows[-1]
+        run.cursor.last_tx_date = max(run.cursor.last_tx_date or last["tx_date"], last["tx_date"])
+        run.cursor.last_external_id = last["external_id"]
+
+    run.cursor.cursor = page.resume_cursor
+    run.cursor.updated_at = datetime.now(UTC)
+    run.job.lines_created = run.inserted
+
+
+def _finish(run: _JobRun) -> None:
+    job, statement = run.job, run.statement
+    if statement is not None and run.inserted == 0:
+        db.session.delete(statement)
+        statement = None
+    elif statement is not None:
+        statement.period_start = job.requested_from or run.first_date or statement.period_start
+        statement.period_end = job.requested_to or run.last_date or statement.period_end
+        statement.statement_date = statement.period_end
+        if run.closing_hint is not None:
+            statement.closing_balance = run.closing_hint
+        elif run.last_balance is not None:
+            statement.closing_balance = run.last_balance
+        else:
+            statement.closing_balance = Decimal(statement.opening_balance) + run.amount_total
+
+    run.cursor.lines_synced = (run.cursor.lines_synced or 0) + run.inserted
+    job.status = "success"
+    job.finished_at = datetime.utcnow()
+    job.statements_created = 1 if statement is not None else 0
+    job.lines_created = run.inserted
+    db.session.add(
+        FinanceAuditLog(
+            org_id=job.org_id,
+            event_type="BANK_SYNC_JOB_SUCCESS",
+            entity_type="BANK_SYNC_JOB",
+            entity_id=job.id,
+            payload={
+                "connection": job.connection.name,
+                "bank_account": run.account.name,
+                "lines_created": run.inserted,
+                "lines_fetched": run.fetched,
+                "pages": run.pages,
+            },
+            created_by_id=job.requested_by_id,
+        )
+    )
+    db.session.commit()
+
+
+def _fail(job: BankSyncJob, exc: BaseException) -> None:
+    job.status = "error"
+    job.finished_at = datetime.utcnow()
+    job.error_message = str(exc)
+    db.session.add(
+        FinanceAuditLog(
+            org_id=job.org_id,
+            event_type="BANK_SYNC_JOB_ERROR",
+            entity_type="BANK_SYNC_JOB",
+            entity_id=job.id,
+            payload={"error": str(exc)},
+            created_by_id=job.requested_by_id,
+        )
+    )
+    db.session.commit()
+
+
+def _fetch(target: SyncTarget, out: queue.Queue, stop: threading.Event, cancel: threading.Event) -> None:
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                out.put((target.job_id, item), timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for page in provider_for(target).pages():
+            if cancel.is_set() or not put(page):
+                break
+    except Exception as exc:
+        put(exc)
+        return
+    put(None)
+
+
+def _stale_running():
+    """Running jobs whose worker stopped before finishing them."""
+
+    cutoff = datetime.utcnow() - timedelta(seconds=_setting("BANK_SYNC_STALE_SECONDS"))
+    return and_(BankSyncJob.status == "running", BankSyncJob.started_at < cutoff)
+
+
+def _claim(ids: list[int]) -> list[int]:
+    """Move runnable jobs among *ids* to running; returns the ids this caller won.
+
+    The status check is part of the UPDATE, so when ``morning_sync`` and a
+    manual ``run_sync_job`` race for the same job only one of them runs it.
+    Jobs left running past ``BANK_SYNC_STALE_SECONDS`` are claimed again.
+    """
+
+    values = {"status": "running", "started_at": datetime.utcnow(), "error_message": None}
+
+    def claim(*criteria):
+        return (
+            update(BankSyncJob)
+            .where(or_(BankSyncJob.status.in_(RUNNABLE), _stale_running()), *criteria)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    if db.session.get_bind().dialect.update_returning:
+        claimed = list(db.session.execute(claim(BankSyncJob.id.in_(ids)).returning(BankSyncJob.id)).scalars())
+    else:
+        claimed = [job_id for job_id in ids if db.session.execute(claim(BankSyncJob.id == job_id)).rowcount]
+    db.session.commit()
+    return claimed
+
+
+def sync_jobs(job_ids: Iterable[int], *, max_workers: int | None = None) -> dict[int, str]:
+    """Run the given pending/errored jobs concurrently; returns final statuses.
+
+    Jobs already claimed by another caller are skipped and left out of the
+    result.
+    """
+
+    ids = list(job_ids)
+    if not ids:
+        return {}
+    claimed = _claim(ids)
+    if not claimed:
+        return {}
+    jobs = BankSyncJob.query.filter(BankSyncJob.id.in_(claimed)).order_by(BankSyncJob.id).all()
+
+    runs: dict[int, _JobRun] = {}
+    for job in jobs:
+        try:
+            with db.session.begin_nested():
+                runs[job.id] = _start(job)
+            db.session.commit()
+        except Exception as exc:
+            _fail(job, exc)
+
+    if runs:
+        _pump(runs, max_workers or _setting("BANK_SYNC_MAX_WORKERS"))
+    return {job.id: job.status for job in jobs}
+
+
+def _pump(runs: dict[int, _JobRun], max_workers: int) -> None:
+    out: queue.Queue = queue.Queue(maxsize=QUEUE_PAGES)
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(runs)), thread_name_prefix="bank-sync") as pool:
+        for run in runs.values():
+            pool.submit(_fetch, run.target, out, stop, run.cancel)
+        remaining = len(runs)
+        try:
+            while remaining:
+                job_id, item = out.get()
+                run = runs[job_id]
+                if isinstance(item, StatementPage):
+                    if run.failed:
+                        continue
+                    try:
+                        # A failing page only undoes itself; earlier pages
+                        # and other jobs stay committed.
+                        with db.session.begin_nested():
+                            _write_page(run, item)
+                        db.session.commit()
+                    except Exception as exc:
+                        run.failed = True
+                        run.cancel.set()
+                        _fail(run.job, exc)
+                    continue
+                remaining -= 1
+                if run.failed:
+                    continue
+                if item is None:
+                    _finish(run)
+                else:
+                    _fail(run.job, item)
+        finally:
+            stop.set()
+
+
+def pending_job_ids(org_id: int | None = None) -> list[int]:
+    query = (
+        select(BankSyncJob.id)
+        .where(or_(BankSyncJob.status == "pending", _stale_running()))
+        .order_by(BankSyncJob.id)
+    )
+    if org_id is not None:
+        query = query.where(BankSyncJob.org_id == org_id)
+    return list(db.session.execute(query).scalars())
+
+
+def enqueue_incremental_jobs() -> list[int]:
+    """Create a pending job for every account synced before and not already queued."""
+
+    active = select(BankSyncJob.id).where(
+        BankSyncJob.connection_id == BankSyncCursor.connection_id,
+        BankSyncJob.bank_account_id == BankSyncCursor.bank_account_id,
+        BankSyncJob.status.in_(("pending", "running")),
+    )
+    rows = db.session.execute(
+        select(BankSyncCursor.org_id, BankSyncCursor.connection_id, BankSyncCursor.bank_account_id).where(
+            ~active.exists()
+        )
+    ).all()
+    jobs = [
+        BankSyncJob(org_id=org_id, connection_id=conn_id, bank_account_id=account_id, status="pending")
+        for org_id, conn_id, account_id in rows
+    ]
+    db.session.add_all(jobs)
+    db.session.commit()
+    return [job.id for job in jobs]
+
+
+__all__ = [
+    "PROVIDERS",
+    "RateLimiter",
+    "RestStatementProvider",
+    "StatementPage",
+    "SyncTarget",
+    "enqueue_incremental_jobs",
+    "limiter_for",
+    "normalize_line",
+    "pending_job_ids",
+    "sync_jobs",
+    "upsert_statement_lines",
+]
@@ -1,15 +1,15 @@
 """Module: blueprints/device_trust.py — audit-added docstring. Refine with precise purpose when convenient."""
-from flask import Blueprint, request, jsonify, current_app
-from sqlalchemy import create_engine, text
+from flask import Blueprint, request, jsonify
+from sqlalchemy import text
 from datetime import UTC, datetime, timedelta
 
+from erp.engines import get_engine
+
 device_bp = Blueprint("device", __name__, url_prefix="/api/device")
 
 def _engine():
-    """Autogenerated docstring (audit). Describe purpose, params, and return value."""
-    url = (current_app.config.get("SQLALCHEMY_DATABASE_URI")
-           or current_app.config["DATABASE_URL"])
-    return create_engine(url, pool_pre_ping=True)
+    """Shared pooled engine; building one per request opened a new pool each call."""
+    return get_engine()
 
 @device_bp.post("/trust")
 def check_trust():
@@ -8,12 +8,12 @@ from typing import Iterable, Tuple
 from flask import Blueprint, current_app, jsonify, request
 
 from erp.bot_security import verify_telegram_secret
-from erp.bots.nlp_intents import parse_intent
+from erp.bots.nlp_intents import parse_message
 from erp.extensions import csrf, db, limiter
 from erp.models import BotEvent, BotJobOutbox, User
 from erp.models.security_ext import UserSession
 from erp.utils import resolve_org_id
-from erp.tasks.bot_worker import process_bot_job
+from erp.tasks.bot_worker import process_bot_batch
 
 bp = Blueprint("telegram_webhook", __name__, url_prefix="/telegram")
 
@@ -172,7 +172,9 @@ def telegram_webhook(bot_name: str):
         if text.startswith("/"):
             intent, intent_ctx = _command_intent(text)
         if not intent:
-            intent = parse_intent(text)
+            parsed = parse_message(text)
+            intent = parsed.intent
+            intent_ctx = {**parsed.entities, **intent_ctx}
 
         job = BotJobOutbox(
             org_id=org_id,
@@ -188,9 +190,9 @@ def telegram_webhook(bot_name: str):
         db.session.commit()
 
         try:
-            process_bot_job.delay(job.id)
+            process_bot_batch.delay()
         except Exception:
-            process_bot_job.run(job.id)
+            process_bot_batch.run()
         return jsonify({"status": "queued"}), HTTPStatus.OK
 
     if cbq:
@@ -236,9 +238,9 @@ def telegram_webhook(bot_name: str):
         db.session.commit()
 
         try:
-            process_bot_job.delay(job.id)
+            process_bot_batch.delay()
         except Exception:
-            process_bot_job.run(job.id)
+            process_bot_batch.run()
         return jsonify({"status": "queued"}), HTTPStatus.OK
 
     return jsonify({"status": "ignored"}), HTTPStatus.OK
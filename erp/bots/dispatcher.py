@@ -4,8 +4,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Callable, Dict
 
-from erp.extensions import db
-from erp.models import BotEvent
+from erp.bots.telemetry import EventRecorder
 from erp.security import user_has_role
 from erp.utils import resolve_org_id
 
@@ -38,40 +37,37 @@ def dispatch(
     intent: str | None,
     ctx: dict,
 ) -> dict:
-    """Execute a bot command after permission and intent checks."""
+    """Execute a bot command after permission and intent checks.
+
+    Bot events are buffered for the whole dispatch and written in one insert
+    when it finishes; committing is left to the caller.
+    """
 
     org_id = resolve_org_id()
     user = ctx.get("user")
 
-    if not intent or intent not in COMMANDS:
-        _event(org_id, bot_name, "command_parsed", actor_id, chat_id, message_id, {"intent": intent}, "warning")
-        return {"text": "Sorry, I didn't understand. Type /help for commands."}
-
-    spec = COMMANDS[intent]
-
-    if spec.required_role and not user_has_role(user, spec.required_role):
-        _event(org_id, bot_name, "permission_denied", actor_id, chat_id, message_id, {"intent": intent}, "warning")
-        return {"text": f"You don't have permission for {intent}."}
-
-    _event(org_id, bot_name, "command_executing", actor_id, chat_id, message_id, {"intent": intent}, "info")
-    out = spec.handler(ctx)
-    _event(org_id, bot_name, "command_executed", actor_id, chat_id, message_id, {"intent": intent}, "info")
-    return out
-
-
-def _event(org_id: int, bot_name: str, event_type: str, actor_id: int | None, chat_id: str, message_id: str,
-           payload: dict, severity: str) -> None:
-    db.session.add(
-        BotEvent(
-            org_id=org_id,
-            bot_name=bot_name,
-            event_type=event_type,
-            actor_type="user",
-            actor_id=actor_id,
-            chat_id=str(chat_id),
-            message_id=str(message_id),
-            payload_json=payload or {},
-            severity=severity,
-        )
-    )
-    db.session.commit()
+    with EventRecorder(
+        org_id=org_id,
+        bot_name=bot_name,
+        actor_id=actor_id,
+        chat_id=chat_id,
+        message_id=message_id,
+    ) as events:
+        events.intent = intent
+        if not intent or intent not in COMMANDS:
+            events.outcome = "unknown_intent"
+            events.record("command_parsed", {"intent": intent}, "warning")
+            return {"text": "Sorry, I didn't understand. Type /help for commands."}
+
+        spec = COMMANDS[intent]
+
+        if spec.required_role and not user_has_role(user, spec.required_role):
+            events.outcome = "denied"
+            events.record("permission_denied", {"intent": intent}, "warning")
+            return {"text": f"You don't have permission for {intent}."}
+
+        events.record("command_executing", {"intent": intent}, "info")
+        out = spec.handler(ctx)
+        events.outcome = "ok"
+        events.record("command_executed", {"intent": intent}, "info")
+        return out
@@ -1,7 +1,19 @@
-"""Lightweight NLP intent parsing for bot commands."""
+"""Lightweight NLP intent parsing for bot commands.
+
+All ``INTENT_RULES`` are compiled into a single alternation regex with one
+named group per rule, so a message is scanned once regardless of how many
+intents exist. Every position is probed with a zero-width lookahead, which
+lets overlapping rules all register a hit; the intent with the most hits wins
+and ties go to the rule listed first, matching the historical first-match
+behaviour. Messages that match no rule fall back to a token-level fuzzy
+scorer against the rule keywords so small misspellings ("aprove",
+"inventroy") still resolve. Parses are cached per normalised text.
+"""
 from __future__ import annotations
 
 import re
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
 INTENT_RULES = [
@@ -15,12 +27,146 @@ INTENT_RULES = [
     (r"\banalytics\b|\bperformance\b|\bscore\b", "analytics_query"),
 ]
 
+FUZZY_MIN_TOKEN = 4
+FUZZY_THRESHOLD = 0.75
+CACHE_SIZE = 4096
+
+_ENTITY_RE = re.compile(
+    r"\b(?P<entity_type>order|invoice|po|so|grn|tender)\s*(?:no\.?|number|#)?\s*:?\s*#?"
+    r"(?P<entity_id>[a-z0-9-]*\d[a-z0-9-]*)\b"
+)
+_QUANTITY_RE = re.compile(
+    r"\b(?P<qty>\d+(?:\.\d+)?)\s*(?P<unit>pcs|pieces|units|boxes|box|packs|kg|x)\b"
+)
+_TOKEN_RE = re.compile(r"[^\W\d_]+")
+
+
+@dataclass(frozen=True)
+class ParsedIntent:
+    """Result of parsing one message; ``score`` is 0 when nothing matched."""
+
+    intent: Optional[str]
+    score: float
+    fuzzy: bool
+    entity_items: tuple = ()
+
+    @property
+    def entities(self) -> dict:
+        return dict(self.entity_items)
+
+
+class _Engine:
+    def __init__(self, rules: list[tuple[str, str]]):
+        self.intents = [intent for _, intent in rules]
+        alternation = "|".join(f"(?P<r{i}>{pattern})" for i, (pattern, _) in enumerate(rules))
+        self.pattern = re.compile(f"(?=(?:{alternation}))")
+        self.keywords: dict[int, list[tuple[str, int]]] = {}
+        for index, (pattern, _) in enumerate(rules):
+            for word in _keywords(pattern):
+                self.keywords.setdefault(len(word), []).append((word, index))
+
+    def match(self, text: str) -> tuple[int, float] | None:
+        hits: dict[int, int] = {}
+        for m in self.pattern.finditer(text):
+            index = int(m.lastgroup[1:])
+            hits[index] = hits.get(index, 0) + 1
+        if not hits:
+            return None
+        best = min(hits, key=lambda i: (-hits[i], i))
+        return best, float(hits[best])
+
+    def fuzzy(self, text: str) -> tuple[int, float] | None:
+        scores: dict[int, float] = {}
+        for token in _TOKEN_RE.findall(text):
+            if len(token) < FUZZY_MIN_TOKEN:
+                continue
+            limit = 1 if len(token) < 8 else 2
+            best: tuple[float, int] | None = None
+            for length in range(len(token) - limit, len(token) + limit + 1):
+                for word, index in self.keywords.get(length, ()):
+                    distance = _edit_distance(token, word, limit)
+                    if distance > limit:
+                        continue
+                    similarity = 1 - distance / max(len(token), len(word))
+                    if best is None or (similarity, -index) > (best[0], -best[1]):
+                        best = (similarity, index)
+            if best and best[0] >= FUZZY_THRESHOLD:
+                scores[best[1]] = scores.get(best[1], 0.0) + best[0]
+        if not scores:
+            return None
+        index = min(scores, key=lambda i: (-scores[i], i))
+        return index, scores[index]
+
+
+def _keywords(pattern: str) -> set[str]:
+    """Literal words in a rule pattern, used as the fuzzy vocabulary."""
+
+    literal = re.sub(r"\\[a-zA-Z][*+?]?", " ", pattern)
+    return {w for w in _TOKEN_RE.findall(literal) if len(w) >= FUZZY_MIN_TOKEN}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance with early exit once every cell exceeds *limit*."""
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _extract_entities(text: str) -> tuple:
+    entities: dict = {}
+    ref = _ENTITY_RE.search(text)
+    if ref:
+        entities["entity_type"] = ref.group("entity_type").upper()
+        raw_id = ref.group("entity_id")
+        entities["entity_id"] = int(raw_id) if raw_id.isdigit() else raw_id.upper()
+    qty = _QUANTITY_RE.search(text)
+    if qty:
+        value = qty.group("qty")
+        entities["quantity"] = float(value) if "." in value else int(value)
+        entities["unit"] = qty.group("unit")
+    return tuple(entities.items())
+
+
+_engine = _Engine(INTENT_RULES)
+
+
+def register_intent_rule(pattern: str, intent: str) -> None:
+    """Add a rule (e.g. a synonym in another language) and rebuild the matcher."""
+
+    global _engine
+    INTENT_RULES.append((pattern, intent))
+    _engine = _Engine(INTENT_RULES)
+    _parse_cleaned.cache_clear()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_cleaned(cleaned: str) -> ParsedIntent:
+    entities = _extract_entities(cleaned)
+    matched = _engine.match(cleaned)
+    if matched:
+        return ParsedIntent(_engine.intents[matched[0]], matched[1], False, entities)
+    fuzzy = _engine.fuzzy(cleaned)
+    if fuzzy:
+        return ParsedIntent(_engine.intents[fuzzy[0]], fuzzy[1], True, entities)
+    return ParsedIntent(None, 0.0, False, entities)
+
+
+def parse_message(text: str) -> ParsedIntent:
+    """Return the best intent for *text* together with extracted entities."""
+
+    return _parse_cleaned((text or "").lower().strip())
+
 
 def parse_intent(text: str) -> Optional[str]:
-    """Return the first matching intent for *text*, or ``None`` if unknown."""
+    """Return the best matching intent for *text*, or ``None`` if unknown."""
 
-    cleaned = (text or "").lower().strip()
-    for pattern, intent in INTENT_RULES:
-        if re.search(pattern, cleaned):
-            return intent
-    return None
+    return parse_message(text).intent
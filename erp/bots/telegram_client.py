@@ -1,9 +1,20 @@
 """Telegram transport helpers with inline keyboard support."""
 from __future__ import annotations
 
-import requests
 from flask import current_app
 
+from erp.utils import http_client
+
+
+def _post(url: str, data: dict, timeout: float):
+    # Breaker bookkeeping stays with the caller (``TG_BREAKER`` in
+    # erp.services.notification_service); sends are not retried so a
+    # message is never delivered twice.
+    response = http_client.request(
+        "POST", url, json=data, upstream="telegram", breaker=None, retry=False, timeout=timeout
+    )
+    return response.json()
+
 
 def _bot_token(bot_name: str) -> str:
     bots = current_app.config.get("TELEGRAM_BOTS") or {}
@@ -34,9 +45,7 @@ def telegram_send(bot_name: str, chat_id: str, payload: dict):
             "one_time_keyboard": kb.get("one_time", False),
         }
 
-    response = requests.post(url, json=data, timeout=20)
-    response.raise_for_status()
-    return response.json()
+    return _post(url, data, timeout=20)
 
 
 def telegram_edit(bot_name: str, chat_id: str, message_id: str, payload: dict):
@@ -49,15 +58,11 @@ def telegram_edit(bot_name: str, chat_id: str, message_id: str, payload: dict):
         "parse_mode": payload.get("parse_mode", "HTML"),
         "disable_web_page_preview": True,
     }
-    response = requests.post(url, json=data, timeout=20)
-    response.raise_for_status()
-    return response.json()
+    return _post(url, data, timeout=20)
 
 
 def telegram_answer_callback(bot_name: str, callback_query_id: str, text: str = "OK"):
     token = _bot_token(bot_name)
     url = f"https://api.telegram.org/bot{token}/answerCallbackQuery"
     data = {"callback_query_id": callback_query_id, "text": text}
-    response = requests.post(url, json=data, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    return _post(url, data, timeout=10)
@@ -0,0 +1,179 @@
+"""Buffered ``BotEvent`` telemetry for the command dispatcher.
+
+``EventRecorder`` collects the events emitted while one command is dispatched
+and writes them with a single multi-row insert at the end, inside the
+caller's transaction (it never commits). When many dispatches are in flight
+at once the rows are handed to ``BufferedEventSink`` instead, which writes
+them from a background thread on its own connection so the bot path does not
+wait on telemetry writes. A dispatch that raises also goes to the sink: its
+transaction is about to be rolled back, and writing into it could mask the
+original error. Dispatch latency per intent is observed from the same
+recorder.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from flask import current_app
+from sqlalchemy import insert
+
+from erp.extensions import db
+from erp.metrics import BOT_DISPATCH_LATENCY, BOT_EVENTS_DROPPED
+from erp.models import BotEvent
+
+DEFAULT_OFFLOAD_CONCURRENCY = 8
+
+
+class BufferedEventSink:
+    """Bounded in-process buffer flushed to ``bot_events`` by a daemon thread."""
+
+    def __init__(self, *, max_size: int = 10_000, batch_size: int = 500, interval_s: float = 1.0):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval_s = interval_s
+        self._rows: deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._app = None
+
+    def submit(self, rows: list[dict]) -> None:
+        """Queue *rows* for a background write, dropping the oldest on overflow."""
+
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                if len(self._rows) >= self.max_size:
+                    self._rows.popleft()
+                    BOT_EVENTS_DROPPED.inc()
+                self._rows.append(row)
+            pending = len(self._rows)
+        self._ensure_worker()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def drain(self) -> int:
+        """Write everything currently buffered; returns the number of rows written."""
+
+        written = 0
+        while True:
+            with self._lock:
+                batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+            if not batch:
+                return written
+            with db.engine.begin() as conn:
+                conn.execute(insert(BotEvent.__table__), batch)
+            written += len(batch)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        try:
+            self._app = current_app._get_current_object()
+        except RuntimeError:  # pragma: no cover - no app context, flush inline later
+            return
+        self._thread = threading.Thread(target=self._run, name="bot-event-sink", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:  # pragma: no cover - background thread
+        while True:
+            self._wakeup.wait(self.interval_s)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self.drain()
+            except Exception as exc:
+                self._app.logger.warning("bot_event_sink_flush_failed", extra={"error": str(exc)})
+
+
+_SINK = BufferedEventSink()
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+def get_event_sink() -> BufferedEventSink:
+    return _SINK
+
+
+class EventRecorder:
+    """Accumulate bot events for a single dispatch and flush them together."""
+
+    def __init__(
+        self,
+        *,
+        org_id: int,
+        bot_name: str,
+        actor_id: int | None,
+        chat_id: str,
+        message_id: str,
+    ) -> None:
+        self.base = {
+            "org_id": org_id,
+            "bot_name": bot_name,
+            "actor_type": "user",
+            "actor_id": actor_id,
+            "chat_id": str(chat_id),
+            "message_id": str(message_id),
+        }
+        self.rows: list[dict[str, Any]] = []
+        self.intent: str | None = None
+        self.outcome = "unknown"
+        self._started = 0.0
+
+    def __enter__(self) -> "EventRecorder":
+        global _inflight
+        with _inflight_lock:
+            _inflight += 1
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        global _inflight
+        if exc is not None:
+            self.outcome = "error"
+            self.record("command_failed", {"intent": self.intent, "error": str(exc)}, "critical")
+        BOT_DISPATCH_LATENCY.labels(
+            self.base["bot_name"], self.intent or "unknown", self.outcome
+        ).observe(time.perf_counter() - self._started)
+        with _inflight_lock:
+            offload = _inflight > _offload_threshold()
+            _inflight -= 1
+        self.flush(offload=offload or exc is not None)
+
+    def record(self, event_type: str, payload: dict | None = None, severity: str = "info") -> None:
+        self.rows.append(
+            {
+                **self.base,
+                "event_type": event_type,
+                "payload_json": payload or {},
+                "severity": severity,
+            }
+        )
+
+    def flush(self, *, offload: bool = False) -> None:
+        """Insert the recorded rows in one statement, or hand them to the sink."""
+
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+        if offload:
+            _SINK.submit(rows)
+            return
+        db.session.execute(insert(BotEvent), rows)
+
+
+def _offload_threshold() -> int:
+    try:
+        return int(current_app.config.get("BOT_EVENT_OFFLOAD_CONCURRENCY", DEFAULT_OFFLOAD_CONCURRENCY))
+    except RuntimeError:  # pragma: no cover - outside app context
+        return DEFAULT_OFFLOAD_CONCURRENCY
+
+
+__all__ = ["BufferedEventSink", "EventRecorder", "get_event_sink"]
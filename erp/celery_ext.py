@@ -8,6 +8,7 @@ Safe Celery integration that doesn't run unless ENABLE_CELERY=true and CELERY_BR
 from __future__ import annotations
 from typing import Optional
 from celery import Celery
+from celery.schedules import crontab
 
 def init_celery(flask_app) -> Optional[Celery]:
     broker = flask_app.config.get("CELERY_BROKER_URL")
@@ -26,6 +27,40 @@ def init_celery(flask_app) -> Optional[Celery]:
         timezone=flask_app.config.get("CELERY_TIMEZONE", "UTC"),
         enable_utc=True,
         # Add your queue/exchange config here as lowercase keys
+        beat_schedule={
+            "bot-metrics-sweep": {
+                "task": "erp.tasks.bot.metrics_sweep",
+                "schedule": float(flask_app.config.get("BOT_METRICS_SWEEP_SECONDS", 15.0)),
+            },
+            "bot-outbox-drain": {
+                "task": "erp.tasks.bot.process_batch",
+                "schedule": float(flask_app.config.get("BOT_OUTBOX_DRAIN_SECONDS", 10.0)),
+            },
+            "idempotency-key-retention": {
+                "task": "erp.tasks.idempotency.retention_sweep",
+                "schedule": crontab(minute=15),
+            },
+            "session-activity-flush": {
+                "task": "erp.tasks.sessions.flush_activity",
+                "schedule": float(flask_app.config.get("SESSION_ACTIVITY_FLUSH_SECONDS", 30.0)),
+            },
+            "inventory-stock-checkpoints": {
+                "task": "erp.tasks.inventory.stock_checkpoints",
+                "schedule": crontab(hour=0, minute=10),
+            },
+            "maintenance-preventive-work-orders": {
+                "task": "erp.tasks.maintenance.fan_out_scheduled_work_orders",
+                "schedule": crontab(hour=1, minute=0),
+            },
+            "bank-statement-morning-sync": {
+                "task": "erp.tasks.bank_sync.morning_sync",
+                "schedule": crontab(hour=5, minute=30),
+            },
+            "marketing-segment-refresh": {
+                "task": "erp.tasks.marketing.refresh_segments",
+                "schedule": float(flask_app.config.get("MARKETING_SEGMENT_REFRESH_SECONDS", 900.0)),
+            },
+        },
     )
 
     class AppContextTask(celery.Task):
@@ -10,6 +10,26 @@ class Config:
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///:memory:")
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional read replica and pool sizing, applied by erp.engines.init_engines
+    DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 10))
+    REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", 5))
+    # Bank statement sync (erp.banking.sync)
+    BANK_SYNC_MAX_WORKERS = int(os.getenv("BANK_SYNC_MAX_WORKERS", 8))
+    BANK_SYNC_RATE_PER_SECOND = float(os.getenv("BANK_SYNC_RATE_PER_SECOND", 5))
+    BANK_SYNC_PAGE_SIZE = int(os.getenv("BANK_SYNC_PAGE_SIZE", 500))
+    # Statement file imports (erp.banking.statement_import)
+    BANK_IMPORT_DIR = os.getenv("BANK_IMPORT_DIR")
+    BANK_IMPORT_CHUNK = int(os.getenv("BANK_IMPORT_CHUNK", 1000))
+    BANK_IMPORT_INLINE_BYTES = int(os.getenv("BANK_IMPORT_INLINE_BYTES", 1024 * 1024))
+    # Marketing segment membership refresh (erp.tasks.marketing_segments)
+    MARKETING_SEGMENT_REFRESH_SECONDS = float(os.getenv("MARKETING_SEGMENT_REFRESH_SECONDS", 900))
+    # Campaign stats push (erp.services.campaign_stats)
+    CAMPAIGN_STATS_PUSH_SECONDS = float(os.getenv("CAMPAIGN_STATS_PUSH_SECONDS", 1.0))
     CACHE_TYPE = os.getenv("CACHE_TYPE", "SimpleCache")
     CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", 300))
     SESSION_COOKIE_HTTPONLY = True
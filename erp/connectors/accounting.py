@@ -1,12 +1,8 @@
 """Module: connectors/accounting.py — audit-added docstring. Refine with precise purpose when convenient."""
-import requests
+from erp.utils import http_client
 
 
 def push_invoice(data: dict, endpoint: str):
     """Send invoice data to an external accounting system."""
-    response = requests.post(endpoint, json=data, timeout=5)
-    response.raise_for_status()
-    return response.json()
-
-
-
+    # Not retried: a repeated POST could book the invoice twice.
+    return http_client.post_json(endpoint, data, upstream="accounting", retry=False, timeout=5)
@@ -1,12 +1,18 @@
 """Module: connectors/ecommerce.py — audit-added docstring. Refine with precise purpose when convenient."""
-import requests
+from collections.abc import Sequence
+
+from erp.utils import http_client
 
 
 def fetch_products(endpoint: str):
     """Retrieve products from an external e-commerce API."""
-    response = requests.get(endpoint, timeout=5)
-    response.raise_for_status()
-    return response.json()
+    return http_client.get_json(endpoint, upstream="ecommerce", timeout=5)
 
 
+def fetch_products_many(endpoints: Sequence[str]) -> list:
+    """Fetch several catalogue endpoints concurrently.
 
+    Results come back in input order; a failed endpoint yields its
+    exception instead of aborting the batch.
+    """
+    return http_client.gather_json(endpoints, upstream="ecommerce", timeout=5)
@@ -0,0 +1,180 @@
+"""Read-replica routing for read-only endpoints and reporting tasks.
+
+Code that only reads declares replica affinity with :func:`replica_reads`
+(a decorator for views, helpers and Celery tasks), the :func:`use_replica`
+context manager, or ``db.session.info[REPLICA_AFFINITY] = True``. Inside
+that scope :class:`RoutingSession` sends plain ``SELECT`` statements to the
+``replica`` bind configured by :mod:`erp.engines`. Flushes, locking reads
+and models with their own bind key stay where they were.
+
+Replica lag is measured at most every ``REPLICA_LAG_CHECK_SECONDS`` and
+exported as ``erp_db_replica_lag_seconds``. When it exceeds
+``REPLICA_MAX_LAG_SECONDS``, or cannot be measured, reads fall back to the
+primary.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, TypeVar
+
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+
+from erp.engines import PRIMARY, REPLICA, get_engine
+from erp.metrics import DB_REPLICA_LAG, DB_REPLICA_READS
+
+REPLICA_AFFINITY = "replica_affinity"
+
+DEFAULT_MAX_LAG_SECONDS = 10.0
+DEFAULT_LAG_CHECK_SECONDS = 5.0
+
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_affinity: ContextVar[bool] = ContextVar("replica_affinity", default=False)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@contextmanager
+def use_replica() -> Iterator[None]:
+    """Route plain reads in this block to the replica when it is fresh enough."""
+
+    token = _affinity.set(True)
+    try:
+        yield
+    finally:
+        _affinity.reset(token)
+
+
+def replica_reads(fn: F) -> F:
+    """Decorator form of :func:`use_replica`."""
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return fn(*args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def measure_lag(engine: Engine) -> float | None:
+    """Replication delay of *engine* in seconds (``None`` if unknown).
+
+    Only PostgreSQL streaming replicas report lag; other databases (such as
+    a SQLite stand-in) are treated as current.
+    """
+
+    if engine.dialect.name != "postgresql":
+        return 0.0
+    try:
+        with engine.connect() as conn:
+            value = conn.execute(_PG_LAG_SQL).scalar()
+    except Exception:  # pragma: no cover - replica unreachable
+        return None
+    return float(value or 0)
+
+
+def _config(key: str, default: float) -> float:
+    if has_app_context():
+        value = current_app.config.get(key)
+        if value is not None:
+            return float(value)
+    return default
+
+
+class _LagMonitor:
+    """Caches the last lag sample per replica engine."""
+
+    def __init__(self) -> None:
+        self._samples: dict[int, tuple[float, float | None]] = {}
+        self._lock = threading.Lock()
+
+    def lag(self, engine: Engine) -> float | None:
+        interval = _config("REPLICA_LAG_CHECK_SECONDS", DEFAULT_LAG_CHECK_SECONDS)
+        now = time.monotonic()
+        sample = self._samples.get(id(engine))
+        if sample is not None and now - sample[0] < interval:
+            return sample[1]
+        with self._lock:
+            sample = self._samples.get(id(engine))
+            if sample is not None and now - sample[0] < interval:
+                return sample[1]
+            lag = measure_lag(engine)
+            self._samples[id(engine)] = (now, lag)
+        DB_REPLICA_LAG.set(-1 if lag is None else lag)
+        return lag
+
+    def usable(self, engine: Engine) -> bool:
+        lag = self.lag(engine)
+        return lag is not None and lag <= _config("REPLICA_MAX_LAG_SECONDS", DEFAULT_MAX_LAG_SECONDS)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+lag_monitor = _LagMonitor()
+
+
+def replica_affinity() -> bool:
+    return _affinity.get()
+
+
+def read_engine() -> Engine:
+    """Engine for raw-SQL reads: the replica when fresh, else the primary."""
+
+    primary = get_engine(PRIMARY)
+    replica = get_engine(REPLICA)
+    if replica is not primary and lag_monitor.usable(replica):
+        DB_REPLICA_READS.labels(REPLICA).inc()
+        return replica
+    if replica is not primary:
+        DB_REPLICA_READS.labels("fallback").inc()
+    return primary
+
+
+def _plain_select(clause: Any) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that honours replica affinity for reads."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing:
+            return engine
+        if not (_affinity.get() or self.info.get(REPLICA_AFFINITY)) or not _plain_select(clause):
+            return engine
+        engines = self._db.engines
+        replica = engines.get(REPLICA)
+        if replica is None or engine is not engines.get(None):
+            return engine
+        if lag_monitor.usable(replica):
+            DB_REPLICA_READS.labels(REPLICA).inc()
+            return replica
+        DB_REPLICA_READS.labels("fallback").inc()
+        return engine
+
+
+__all__ = [
+    "REPLICA_AFFINITY",
+    "RoutingSession",
+    "lag_monitor",
+    "measure_lag",
+    "read_engine",
+    "replica_affinity",
+    "replica_reads",
+    "use_replica",
+]
@@ -0,0 +1,185 @@
+"""Process-wide SQLAlchemy engine registry.
+
+Flask-SQLAlchemy owns the engines inside the app: :func:`init_engines`
+fills ``SQLALCHEMY_ENGINE_OPTIONS`` (pool size, overflow, timeout,
+recycle, ``pool_pre_ping``) and, when ``DATABASE_REPLICA_URL`` is set, a
+``replica`` bind with the same options. Raw-SQL helpers (``db.get_engine``,
+workflows, tenders, data quality, device trust) go through
+:func:`get_engine`, which hands out those same engines, so every path
+shares one pool per database instead of building its own.
+
+Outside an app context (scripts, Celery workers without an app) the
+registry builds the engines once per URL with the same options.
+
+Pools report checkout wait time, connections in use and connections
+opened to Prometheus, labelled by engine name.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any
+
+from flask import Flask, has_app_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from erp.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_CONNECTIONS_OPENED, DB_POOL_IN_USE
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+DEFAULTS = {
+    "DB_POOL_SIZE": 10,
+    "DB_MAX_OVERFLOW": 20,
+    "DB_POOL_TIMEOUT": 30,
+    "DB_POOL_RECYCLE": 1800,
+}
+
+_standalone: dict[str, Engine] = {}
+_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` that records how long callers wait for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(self._orig_logging_name or PRIMARY).observe(
+                time.perf_counter() - start
+            )
+
+
+def _setting(config: Mapping[str, Any] | None, key: str) -> int:
+    if config is not None and config.get(key) is not None:
+        return int(config[key])
+    return int(os.environ.get(key, DEFAULTS[key]))
+
+
+def engine_options(url: str, name: str = PRIMARY, config: Mapping[str, Any] | None = None) -> dict:
+    """``create_engine`` keyword arguments for *url*.
+
+    SQLite keeps SQLAlchemy's default pool (single connection for
+    ``:memory:``); server databases get a sized, timed ``QueuePool``.
+    """
+
+    options: dict[str, Any] = {"pool_pre_ping": True, "pool_logging_name": name}
+    if url.startswith("sqlite"):
+        return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=_setting(config, "DB_POOL_SIZE"),
+        max_overflow=_setting(config, "DB_MAX_OVERFLOW"),
+        pool_timeout=_setting(config, "DB_POOL_TIMEOUT"),
+        pool_recycle=_setting(config, "DB_POOL_RECYCLE"),
+    )
+    return options
+
+
+def instrument(engine: Engine, name: str = PRIMARY) -> Engine:
+    """Export in-use and opened-connection counts for *engine*'s pool."""
+
+    if getattr(engine, "_erp_instrumented", False):
+        return engine
+    pool = engine.pool
+
+    def _in_use(returning: int) -> None:
+        checked_out = getattr(pool, "checkedout", None)
+        if callable(checked_out):
+            DB_POOL_IN_USE.labels(name).set(max(0, checked_out() - returning))
+
+    event.listen(pool, "connect", lambda *_: DB_POOL_CONNECTIONS_OPENED.labels(name).inc())
+    event.listen(pool, "checkout", lambda *_: _in_use(0))
+    # ``checkin`` fires before the connection is handed back to the pool.
+    event.listen(pool, "checkin", lambda *_: _in_use(1))
+    engine._erp_instrumented = True  # type: ignore[attr-defined]
+    return engine
+
+
+def init_engines(app: Flask) -> None:
+    """Set pool options (and the replica bind) before ``db.init_app``."""
+
+    config = app.config
+    primary_url = config.get("SQLALCHEMY_DATABASE_URI") or "sqlite:///:memory:"
+    config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(primary_url, PRIMARY, config))
+    replica_url = config.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+        binds.setdefault(REPLICA, {"url": replica_url, **engine_options(replica_url, REPLICA, config)})
+        config["SQLALCHEMY_BINDS"] = binds
+
+
+def instrument_app_engines(app: Flask) -> None:
+    """Attach pool metrics once Flask-SQLAlchemy has built the engines."""
+
+    from erp.extensions import db
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            instrument(engine, PRIMARY if key is None else key)
+
+
+def _standalone_engine(name: str) -> Engine | None:
+    if name == REPLICA:
+        url = os.environ.get("DATABASE_REPLICA_URL")
+        if not url:
+            return None
+    else:
+        url = os.environ.get("DATABASE_URL")
+        if not url:
+            from config import _is_production
+
+            if _is_production():
+                raise RuntimeError("DATABASE_URL must be set in production environments")
+            db_path = os.environ.get("DATABASE_PATH")
+            url = f"sqlite+pysqlite:///{db_path}" if db_path else "sqlite+pysqlite:///:memory:"
+    with _lock:
+        engine = _standalone.get(url)
+        if engine is None:
+            engine = instrument(create_engine(url, **engine_options(url, name)), name)
+            _standalone[url] = engine
+    return engine
+
+
+def get_engine(name: str = PRIMARY) -> Engine:
+    """Shared engine *name* (``primary`` or ``replica``).
+
+    Falls back to the primary when no replica is configured.
+    """
+
+    if has_app_context():
+        from erp.extensions import db
+
+        if name == REPLICA and REPLICA in db.engines:
+            return db.engines[REPLICA]
+        return db.engine
+    engine = _standalone_engine(name)
+    return engine if engine is not None else _standalone_engine(PRIMARY)
+
+
+def dispose_all() -> None:
+    """Close standalone pools (e.g. after ``fork`` in a worker)."""
+
+    with _lock:
+        for engine in _standalone.values():
+            engine.dispose()
+        _standalone.clear()
+
+
+__all__ = [
+    "PRIMARY",
+    "REPLICA",
+    "TimedQueuePool",
+    "dispose_all",
+    "engine_options",
+    "get_engine",
+    "init_engines",
+    "instrument",
+    "instrument_app_engines",
+]
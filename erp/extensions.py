@@ -17,6 +17,8 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
 
+from erp.db_routing import RoutingSession
+
 # UPGRADE: Add Flask-Principal for RBAC (new import)
 from flask_principal import Principal, Identity, RoleNeed, UserNeed, AnonymousIdentity
 
@@ -71,7 +73,11 @@ _NAMING_CONVENTION = {
 
 # --- Core extensions ---------------------------------------------------------
 
-db: SQLAlchemy = SQLAlchemy(metadata=MetaData(naming_convention=_NAMING_CONVENTION))
+db: SQLAlchemy = SQLAlchemy(
+    metadata=MetaData(naming_convention=_NAMING_CONVENTION),
+    # Reads declared replica-safe (erp.db_routing.replica_reads) go to the replica bind.
+    session_options={"class_": RoutingSession},
+)
 migrate: Migrate = Migrate()
 
 cache: Cache = Cache()
@@ -130,11 +136,25 @@ def load_user(user_id: str):
         return client
 
     try:
-        employee = User.query.get(int(user_id))
+        numeric_id = int(user_id)
     except (TypeError, ValueError):
         # Malformed or non-integer user_id in session
         return None
 
+    from erp.security_principal import PrincipalUser, get_snapshot, is_user_active, snapshots_enabled
+
+    if snapshots_enabled():
+        # Roles come from the principal cache, but the active flag is read
+        # from the database so deactivation is never served stale.
+        if not is_user_active(numeric_id):
+            return None
+        snapshot = get_snapshot(numeric_id)
+        if snapshot is None:
+            return None
+        return PrincipalUser(snapshot)
+
+    employee = User.query.get(numeric_id)
+
     if employee is None:
         return None
     if not getattr(employee, "is_active", True):
@@ -146,8 +166,17 @@ def load_user(user_id: str):
 @principal.identity_loader
 def load_identity():
     from flask_login import current_user
+    from erp.security_principal import snapshot_for
+
     if current_user.is_authenticated:
         identity = Identity(current_user.id)
+        snapshot = snapshot_for(current_user)
+        if snapshot is not None:
+            for role_name in snapshot.role_names:
+                identity.provides.add(RoleNeed(role_name))
+            for perm in snapshot.permissions:
+                identity.provides.add(UserNeed(perm))
+            return identity
         for role in current_user.roles:
             identity.provides.add(RoleNeed(role.name))
         # Dynamic permissions from roles
@@ -166,7 +195,11 @@ def init_extensions(app: Flask) -> None:
     This is called from erp.create_app() and must remain idempotent.
     """
     # Database + migrations
+    from erp.engines import init_engines, instrument_app_engines
+
+    init_engines(app)
     db.init_app(app)
+    instrument_app_engines(app)
     migrate.init_app(app, db)
 
     # Caching and mail (safe even if not heavily used yet)
@@ -186,5 +219,17 @@ def init_extensions(app: Flask) -> None:
     # UPGRADE: Principal for RBAC (added; original missing)
     principal.init_app(app)
 
+    from erp.security_principal import init_principal_snapshots
+
+    init_principal_snapshots(app)
+
+    from erp.services.session_activity import init_session_activity
+
+    init_session_activity(app)
+
+    from erp.services.campaign_stats import init_campaign_stats
+
+    init_campaign_stats(app)
+
     # Optional: allow anonymous users by default (Flask-Login default),
     # but you could override login_manager.anonymous_user if needed.
\ No newline at end of file
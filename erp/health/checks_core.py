@@ -208,7 +208,7 @@ def config_sanity() -> dict[str, Any]:
 def _register_checks() -> None:
     try:
         health_registry.register(HealthCheck("db", db_check, critical=True))
-        health_registry.register(HealthCheck("config", config_sanity, critical=True))
+        health_registry.register(HealthCheck("config", config_sanity, critical=True, liveness=True))
         health_registry.register(HealthCheck("db_migrations", db_migrations, critical=True))
         health_registry.register(HealthCheck("redis", redis_check, critical=False))
         health_registry.register(HealthCheck("telegram_cfg", telegram_configured, critical=False))
@@ -1,10 +1,29 @@
-"""Health check registry for lightweight service diagnostics."""
+"""Health check registry for lightweight service diagnostics.
+
+Checks run concurrently on a bounded thread pool and each one is held to
+its ``timeout_s``, so a probe takes as long as the slowest check rather
+than the sum of all of them. Concurrent probes share one run of each
+check: a probe that finds the check already running waits on that run
+for the rest of its own timeout. A check that overruns is reported as
+failed; its thread is left to finish in the background and the check is
+not started again until it has. Non-critical checks may be served from
+cache for ``stale_after_s`` seconds.
+
+``run_all`` is the full readiness run; ``liveness`` only runs checks
+registered with ``liveness=True`` and is meant to stay cheap.
+"""
 from __future__ import annotations
 
+import os
+import threading
+import time
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 from dataclasses import dataclass
 from typing import Any, Callable
-import time
+
+from flask import current_app, has_app_context
 
 
 @dataclass
@@ -15,51 +34,124 @@ class HealthCheck:
     fn: Callable[[], dict[str, Any]]
     timeout_s: float = 2.0
     critical: bool = True
+    liveness: bool = False
+    # Non-critical checks only; ``None`` uses the registry default.
+    stale_after_s: float | None = None
 
 
 class HealthRegistry:
     """In-memory registry that executes registered health checks."""
 
-    def __init__(self) -> None:
+    def __init__(self, max_workers: int | None = None, stale_after_s: float | None = None) -> None:
         self._checks: "OrderedDict[str, HealthCheck]" = OrderedDict()
+        self.max_workers = max_workers or int(os.getenv("HEALTH_CHECK_MAX_WORKERS", "8"))
+        self.stale_after_s = (
+            stale_after_s
+            if stale_after_s is not None
+            else float(os.getenv("HEALTH_CHECK_STALE_SECONDS", "30"))
+        )
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._cache: dict[str, tuple[float, dict[str, Any]]] = {}
 
     def register(self, check: HealthCheck) -> None:
         """Register or replace a health check by name."""
 
         self._checks[check.name] = check
+        self._cache.pop(check.name, None)
 
     def run_all(self) -> tuple[bool, dict[str, dict[str, Any]]]:
         """Run all checks and return the overall status and per-check details."""
 
-        results: dict[str, dict[str, Any]] = {}
-        overall_ok = True
+        return self._run(list(self._checks.values()))
+
+    def liveness(self) -> tuple[bool, dict[str, dict[str, Any]]]:
+        """Run only the cheap checks flagged ``liveness=True``."""
+
+        return self._run([c for c in self._checks.values() if c.liveness])
+
+    # -- internals ---------------------------------------------------------
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="health-check"
+                )
+            return self._executor
 
-        for name, check in self._checks.items():
-            start = time.time()
+    def _cached(self, check: HealthCheck, now: float) -> dict[str, Any] | None:
+        if check.critical:
+            return None
+        entry = self._cache.get(check.name)
+        window = check.stale_after_s if check.stale_after_s is not None else self.stale_after_s
+        if entry is None or now - entry[0] > window:
+            return None
+        return {**entry[1], "cached": True, "age_s": round(now - entry[0], 3)}
+
+    def _submit(self, check: HealthCheck) -> Future:
+        """Start *check*, or join the run of it that is still going."""
+
+        pool = self._pool()
+        app = current_app._get_current_object() if has_app_context() else None
+
+        def _call() -> tuple[dict[str, Any], float]:
+            start = time.monotonic()
+            if app is None:
+                detail = check.fn() or {}
+            else:
+                with app.app_context():
+                    detail = check.fn() or {}
+            return detail, time.monotonic() - start
+
+        with self._lock:
+            running = self._inflight.get(check.name)
+            if running is not None and not running.done():
+                return running
+            future = pool.submit(_call)
+            self._inflight[check.name] = future
+        return future
+
+    def _run(self, checks: list[HealthCheck]) -> tuple[bool, dict[str, dict[str, Any]]]:
+        results: dict[str, dict[str, Any]] = {}
+        started = time.monotonic()
+        pending: list[tuple[HealthCheck, Future]] = []
+        for check in checks:
+            cached = self._cached(check, started)
+            if cached is not None:
+                results[check.name] = cached
+            else:
+                pending.append((check, self._submit(check)))
+
+        for check, future in pending:
             ok = True
             detail: dict[str, Any] = {}
             error: str | None = None
-
+            duration = float(check.timeout_s)
+            remaining = max(0.0, started + check.timeout_s - time.monotonic())
             try:
-                detail = check.fn() or {}
+                detail, duration = future.result(timeout=remaining)
                 ok = bool(detail.get("ok", True))
+            except FutureTimeout:
+                ok, error = False, f"timed out after {check.timeout_s}s"
             except Exception as exc:  # pragma: no cover - defensive guard
-                ok = False
-                error = str(exc)
+                ok, error = False, str(exc)
 
-            duration = time.time() - start
-            results[name] = {
+            results[check.name] = {
                 "ok": ok,
                 "critical": check.critical,
                 "duration_ms": int(duration * 1000),
                 "detail": detail,
                 "error": error,
+                "cached": False,
             }
+            if not check.critical and future.done():
+                self._cache[check.name] = (time.monotonic(), results[check.name])
 
-            if check.critical and not ok:
-                overall_ok = False
-
-        return overall_ok, results
+        ordered = {check.name: results[check.name] for check in checks}
+        overall_ok = all(r["ok"] for r in ordered.values() if r["critical"])
+        return overall_ok, ordered
 
 
 health_registry = HealthRegistry()
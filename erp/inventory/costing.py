@@ -0,0 +1,378 @@
+"""Inventory valuation: FIFO cost layers and weighted-average cost.
+
+Costing runs incrementally inside :func:`erp.services.stock_posting.post_movements`:
+receipts open a :class:`StockCostLayer` (FIFO) and issues are costed before
+their ledger rows are written, so every issue carries its ``unit_cost``.
+:class:`StockValuation` keeps the running quantity and value per
+item/warehouse, which is what the valuation report reads.
+
+Open layers are held as cumulative quantity/value arrays. The cost of
+issuing units ``(a, b]`` is ``value_at(b) - value_at(a)`` where
+``value_at`` is a bisect over the cumulative quantities, so consuming
+layers is O(log n) per issue regardless of how many layers are open. The
+same arrays drive :func:`revalue`, which re-costs an item's whole ledger
+in one pass.
+"""
+from __future__ import annotations
+
+import uuid
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from erp.inventory.models import StockCostLayer, StockLedgerEntry, StockValuation
+
+FIFO = "fifo"
+WEIGHTED_AVERAGE = "wavg"
+METHODS = (FIFO, WEIGHTED_AVERAGE)
+
+_ZERO = Decimal("0")
+_COST_PLACES = Decimal("0.0001")
+
+Key = tuple[uuid.UUID, uuid.UUID]
+
+
+class FifoLayers:
+    """Open layers for one item/warehouse as cumulative arrays."""
+
+    def __init__(self, last_cost: Decimal = _ZERO):
+        self.ids: list[uuid.UUID] = []
+        self.qty: list[Decimal] = []
+        self.cost: list[Decimal] = []
+        self.cum_qty: list[Decimal] = []
+        self.cum_value: list[Decimal] = []
+        self.consumed = _ZERO
+        self.last_cost = last_cost
+
+    def add(self, layer_id: uuid.UUID, qty: Decimal, unit_cost: Decimal) -> None:
+        self.ids.append(layer_id)
+        self.qty.append(qty)
+        self.cost.append(unit_cost)
+        self.cum_qty.append((self.cum_qty[-1] if self.cum_qty else _ZERO) + qty)
+        self.cum_value.append((self.cum_value[-1] if self.cum_value else _ZERO) + qty * unit_cost)
+        self.last_cost = unit_cost
+
+    def value_at(self, position: Decimal) -> Decimal:
+        """Value of the first *position* units; beyond the layers at last cost."""
+
+        if position <= 0:
+            return _ZERO
+        index = bisect_left(self.cum_qty, position)
+        if index >= len(self.cum_qty):
+            total_qty = self.cum_qty[-1] if self.cum_qty else _ZERO
+            total_value = self.cum_value[-1] if self.cum_value else _ZERO
+            return total_value + (position - total_qty) * self.last_cost
+        prev_qty = self.cum_qty[index - 1] if index else _ZERO
+        prev_value = self.cum_value[index - 1] if index else _ZERO
+        return prev_value + (position - prev_qty) * self.cost[index]
+
+    def issue(self, qty: Decimal) -> Decimal:
+        start = self.consumed
+        self.consumed += qty
+        return self.value_at(self.consumed) - self.value_at(start)
+
+    def remaining(self, index: int) -> Decimal:
+        return min(self.qty[index], max(_ZERO, self.cum_qty[index] - self.consumed))
+
+
+@dataclass
+class _Running:
+    qty: Decimal = _ZERO
+    value: Decimal = _ZERO
+    last_cost: Decimal = _ZERO
+    row_id: uuid.UUID | None = None
+
+    @property
+    def avg_cost(self) -> Decimal:
+        return self.value / self.qty if self.qty > 0 else self.last_cost
+
+
+def _unit(cost: Decimal, qty: Decimal) -> Decimal:
+    return (cost / qty).quantize(_COST_PLACES) if qty else _ZERO
+
+
+@dataclass
+class CostingPlan:
+    """Pending writes computed by :func:`plan_costing`."""
+
+    org_id: int
+    method: str
+    running: dict[Key, _Running] = field(default_factory=dict)
+    new_layers: list[dict] = field(default_factory=list)
+    layer_updates: list[dict] = field(default_factory=list)
+
+    def write(self, session: Session) -> None:
+        if self.new_layers:
+            session.execute(insert(StockCostLayer), self.new_layers)
+        if self.layer_updates:
+            session.execute(update(StockCostLayer), self.layer_updates)
+        _write_running(session, self.org_id, self.method, self.running)
+
+
+def _load_running(session: Session, org_id: int, keys: set[Key]) -> dict[Key, _Running]:
+    rows = session.execute(
+        select(
+            StockValuation.id,
+            StockValuation.item_id,
+            StockValuation.warehouse_id,
+            StockValuation.qty,
+            StockValuation.value,
+            StockValuation.last_unit_cost,
+        ).where(
+            StockValuation.org_id == org_id,
+            StockValuation.item_id.in_({k[0] for k in keys}),
+            StockValuation.warehouse_id.in_({k[1] for k in keys}),
+        )
+    )
+    running = {key: _Running() for key in keys}
+    for row_id, item_id, warehouse_id, qty, value, last_cost in rows:
+        if (item_id, warehouse_id) in running:
+            running[(item_id, warehouse_id)] = _Running(
+                Decimal(qty), Decimal(value), Decimal(last_cost or 0), row_id
+            )
+    return running
+
+
+def _write_running(session: Session, org_id: int, method: str, running: dict[Key, _Running]) -> None:
+    now = datetime.now(UTC)
+    updates, inserts = [], []
+    for (item_id, warehouse_id), state in running.items():
+        values = {
+            "qty": state.qty,
+            "value": state.value.quantize(_COST_PLACES),
+            "last_unit_cost": state.last_cost.quantize(_COST_PLACES),
+            "method": method,
+            "updated_at": now,
+        }
+        if state.row_id is not None:
+            updates.append({"id": state.row_id, **values})
+        else:
+            inserts.append(
+                {"id": uuid.uuid4(), "org_id": org_id, "item_id": item_id, "warehouse_id": warehouse_id, **values}
+            )
+    if updates:
+        session.execute(update(StockValuation), updates)
+    if inserts:
+        session.execute(insert(StockValuation), inserts)
+
+
+def _load_layers(session: Session, org_id: int, keys: set[Key], running) -> dict[Key, FifoLayers]:
+    layers = {key: FifoLayers(running[key].last_cost) for key in keys}
+    if not keys:
+        return layers
+    rows = session.execute(
+        select(
+            StockCostLayer.id,
+            StockCostLayer.item_id,
+            StockCostLayer.warehouse_id,
+            StockCostLayer.qty_remaining,
+            StockCostLayer.unit_cost,
+        )
+        .where(
+            StockCostLayer.org_id == org_id,
+            StockCostLayer.item_id.in_({k[0] for k in keys}),
+            StockCostLayer.warehouse_id.in_({k[1] for k in keys}),
+            StockCostLayer.qty_remaining > 0,
+        )
+        .order_by(StockCostLayer.received_at, StockCostLayer.id)
+        .with_for_update()
+    )
+    for layer_id, item_id, warehouse_id, remaining, unit_cost in rows:
+        key = (item_id, warehouse_id)
+        if key in layers:
+            layers[key].add(layer_id, Decimal(remaining), Decimal(unit_cost))
+    return layers
+
+
+def plan_costing(session: Session, org_id: int, rows: list[dict], method: str = FIFO) -> CostingPlan:
+    """Cost ledger *rows* (dicts about to be inserted) in order.
+
+    Sets ``unit_cost`` on issue rows and on receipts that arrived without
+    one (at the current average cost). Nothing is written until
+    :meth:`CostingPlan.write` is called after the ledger insert.
+    """
+
+    keys = {(row["item_id"], row["warehouse_id"]) for row in rows}
+    plan = CostingPlan(org_id, method, _load_running(session, org_id, keys))
+    issue_keys = {
+        (row["item_id"], row["warehouse_id"]) for row in rows if row["quantity_delta"] < 0
+    }
+    fifo = (
+        _load_layers(session, org_id, issue_keys, plan.running) if method == FIFO else {}
+    )
+    opened: list[tuple[Key, int, dict]] = []
+
+    for row in rows:
+        key = (row["item_id"], row["warehouse_id"])
+        state = plan.running[key]
+        qty = Decimal(row["quantity_delta"])
+        if qty > 0:
+            cost = row.get("unit_cost")
+            cost = Decimal(cost) if cost is not None else state.avg_cost
+            row["unit_cost"] = cost
+            state.qty += qty
+            state.value += qty * cost
+            state.last_cost = cost
+            if method == FIFO:
+                layer = {
+                    "id": uuid.uuid4(),
+                    "org_id": org_id,
+                    "item_id": key[0],
+                    "warehouse_id": key[1],
+                    "ledger_entry_id": row["id"],
+                    # Rows of one batch share created_at; keep their order.
+                    "received_at": row["created_at"] + timedelta(microseconds=len(plan.new_layers)),
+                    "qty_in": qty,
+                    "qty_remaining": qty,
+                    "unit_cost": cost,
+                }
+                plan.new_layers.append(layer)
+                if key in fifo:
+                    fifo[key].add(layer["id"], qty, cost)
+                    opened.append((key, len(fifo[key].ids) - 1, layer))
+        elif qty < 0:
+            out = -qty
+            cost = fifo[key].issue(out) if method == FIFO else state.avg_cost * out
+            row["unit_cost"] = _unit(cost, out)
+            state.qty -= out
+            state.value -= cost
+
+    new_ids = {layer["id"] for layer in plan.new_layers}
+    for key, layers in fifo.items():
+        for index, layer_id in enumerate(layers.ids):
+            if layer_id not in new_ids and layers.remaining(index) != layers.qty[index]:
+                plan.layer_updates.append({"id": layer_id, "qty_remaining": layers.remaining(index)})
+    for key, index, layer in opened:
+        layer["qty_remaining"] = fifo[key].remaining(index)
+    return plan
+
+
+def revalue(session: Session, org_id: int, item_id, warehouse_id, method: str = FIFO) -> dict:
+    """Re-cost the full ledger of one item/warehouse in a single pass.
+
+    Rebuilds its layers and running value and rewrites issue costs on the
+    ledger. Receipts extend the cumulative arrays and each issue is a pair
+    of bisects over them.
+    """
+
+    entries = session.execute(
+        select(
+            StockLedgerEntry.id,
+            StockLedgerEntry.quantity_delta,
+            StockLedgerEntry.unit_cost,
+            StockLedgerEntry.created_at,
+        )
+        .where(
+            StockLedgerEntry.org_id == org_id,
+            StockLedgerEntry.item_id == item_id,
+            StockLedgerEntry.warehouse_id == warehouse_id,
+        )
+        .order_by(StockLedgerEntry.created_at, StockLedgerEntry.id)
+    ).all()
+
+    state = _Running()
+    layers = FifoLayers()
+    receipts: list[tuple[int, dict]] = []
+    ledger_costs: list[dict] = []
+    for entry_id, delta, unit_cost, created_at in entries:
+        qty = Decimal(delta)
+        if qty > 0:
+            cost = Decimal(unit_cost) if unit_cost is not None else state.avg_cost
+            state.last_cost = cost
+            layer_id = uuid.uuid4()
+            if method == FIFO:
+                layers.add(layer_id, qty, cost)
+            receipts.append(
+                (
+                    len(layers.ids) - 1,
+                    {
+                        "id": layer_id,
+                        "org_id": org_id,
+                        "item_id": item_id,
+                        "warehouse_id": warehouse_id,
+                        "ledger_entry_id": entry_id,
+                        "received_at": created_at,
+                        "qty_in": qty,
+                        "qty_remaining": qty,
+                        "unit_cost": cost,
+                    },
+                )
+            )
+            state.qty += qty
+            state.value += qty * cost
+        elif qty < 0:
+            out = -qty
+            if method == FIFO:
+                cost = layers.issue(out)
+            else:
+                cost = state.avg_cost * out
+            state.qty -= out
+            state.value -= cost
+            ledger_costs.append({"id": entry_id, "unit_cost": _unit(cost, out)})
+
+    session.execute(
+        delete(StockCostLayer).where(
+            StockCostLayer.org_id == org_id,
+            StockCostLayer.item_id == item_id,
+            StockCostLayer.warehouse_id == warehouse_id,
+        )
+    )
+    if method == FIFO:
+        open_layers = []
+        for index, layer in receipts:
+            layer["qty_remaining"] = layers.remaining(index)
+            if layer["qty_remaining"] > 0:
+                open_layers.append(layer)
+        if open_layers:
+            session.execute(insert(StockCostLayer), open_layers)
+    if ledger_costs:
+        session.execute(update(StockLedgerEntry), ledger_costs)
+
+    key = (item_id, warehouse_id)
+    existing = _load_running(session, org_id, {key})[key]
+    state.row_id = existing.row_id
+    _write_running(session, org_id, method, {key: state})
+    return {"qty": state.qty, "value": state.value.quantize(_COST_PLACES), "issues": len(ledger_costs)}
+
+
+def valuation_report(session: Session, org_id: int, warehouse_id=None) -> dict:
+    """Quantity and value per item/warehouse from the maintained valuations."""
+
+    stmt = select(
+        StockValuation.item_id,
+        StockValuation.warehouse_id,
+        StockValuation.method,
+        StockValuation.qty,
+        StockValuation.value,
+    ).where(StockValuation.org_id == org_id)
+    if warehouse_id is not None:
+        stmt = stmt.where(StockValuation.warehouse_id == warehouse_id)
+    rows = []
+    total = _ZERO
+    for item_id, wh_id, method, qty, value in session.execute(stmt):
+        total += Decimal(value)
+        rows.append(
+            {
+                "item_id": str(item_id),
+                "warehouse_id": str(wh_id),
+                "method": method,
+                "qty": str(qty),
+                "value": str(value),
+            }
+        )
+    return {"rows": rows, "total_value": str(total)}
+
+
+__all__ = [
+    "FIFO",
+    "WEIGHTED_AVERAGE",
+    "CostingPlan",
+    "FifoLayers",
+    "plan_costing",
+    "revalue",
+    "valuation_report",
+]
@@ -0,0 +1,214 @@
+"""First-expired-first-out picking and the lot expiry sweep.
+
+:func:`fefo_pick_list` allocates an order's lines from active, unexpired
+lots in expiry order. Lot quantities per warehouse come from the ledger,
+joined to ``StockBalance`` so a warehouse is never asked for more than it
+holds. The whole order is resolved with one query, whatever its number of
+lines.
+
+:func:`expiring_page` walks lots expiring before a cutoff with a keyset
+cursor over ``(expiry, id)`` instead of truncating at a fixed limit.
+"""
+from __future__ import annotations
+
+import uuid
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import and_, func, or_, select
+
+from erp.extensions import db
+from erp.inventory.models import Lot, StockBalance, StockLedgerEntry
+
+EXPIRY_PAGE = 500
+
+_ZERO = Decimal("0")
+
+
+@dataclass(frozen=True)
+class LotStock:
+    item_id: uuid.UUID
+    lot_id: uuid.UUID
+    lot_number: str | None
+    expiry: date | None
+    warehouse_id: uuid.UUID
+    qty: Decimal
+
+
+@dataclass
+class PickLine:
+    item_id: uuid.UUID
+    requested: Decimal
+    picks: list[dict] = field(default_factory=list)
+
+    @property
+    def allocated(self) -> Decimal:
+        return sum((pick["qty"] for pick in self.picks), _ZERO)
+
+    @property
+    def shortfall(self) -> Decimal:
+        return self.requested - self.allocated
+
+
+def available_lots(
+    org_id: int, item_ids: Iterable, *, warehouse_id=None, on: date | None = None
+) -> dict[uuid.UUID, list[LotStock]]:
+    """Unexpired lot stock per item in FEFO order (lots without expiry last)."""
+
+    ids = set(item_ids)
+    if not ids:
+        return {}
+    on = on or date.today()
+    qty = func.sum(StockLedgerEntry.quantity_delta)
+    stmt = (
+        select(
+            Lot.item_id,
+            Lot.id,
+            Lot.number,
+            Lot.expiry,
+            StockLedgerEntry.warehouse_id,
+            qty,
+            StockBalance.qty_on_hand,
+        )
+        .join(
+            StockLedgerEntry,
+            and_(StockLedgerEntry.lot_id == Lot.id, StockLedgerEntry.org_id == Lot.org_id),
+        )
+        .join(
+            StockBalance,
+            and_(
+                StockBalance.org_id == Lot.org_id,
+                StockBalance.item_id == Lot.item_id,
+                StockBalance.warehouse_id == StockLedgerEntry.warehouse_id,
+            ),
+        )
+        .where(
+            Lot.org_id == org_id,
+            Lot.item_id.in_(ids),
+            Lot.is_active.is_(True),
+            or_(Lot.expiry.is_(None), Lot.expiry >= on),
+            StockBalance.qty_on_hand > 0,
+        )
+        .group_by(
+            Lot.item_id,
+            Lot.id,
+            Lot.number,
+            Lot.expiry,
+            StockLedgerEntry.warehouse_id,
+            StockBalance.qty_on_hand,
+        )
+        .having(qty > 0)
+        .order_by(Lot.item_id, Lot.expiry.is_(None), Lot.expiry, Lot.number, StockLedgerEntry.warehouse_id)
+    )
+    if warehouse_id is not None:
+        stmt = stmt.where(StockLedgerEntry.warehouse_id == warehouse_id)
+
+    lots: dict[uuid.UUID, list[LotStock]] = {}
+    # A lot can never supply more than its warehouse balance still holds.
+    headroom: dict[tuple, Decimal] = {}
+    for item_id, lot_id, number, expiry, wh_id, lot_qty, on_hand in db.session.execute(stmt):
+        key = (item_id, wh_id)
+        room = headroom.setdefault(key, Decimal(on_hand))
+        usable = min(Decimal(lot_qty), room)
+        if usable <= 0:
+            continue
+        headroom[key] = room - usable
+        lots.setdefault(item_id, []).append(LotStock(item_id, lot_id, number, expiry, wh_id, usable))
+    return lots
+
+
+def fefo_pick_list(
+    org_id: int, lines: Iterable[tuple], *, warehouse_id=None, on: date | None = None
+) -> list[PickLine]:
+    """Allocate ``(item_id, qty)`` *lines* from the earliest-expiring lots.
+
+    Lines for the same item draw from the same lots in order. Unallocated
+    quantity is reported as the line's ``shortfall``.
+    """
+
+    result = [PickLine(item_id, Decimal(qty)) for item_id, qty in lines]
+    lots = available_lots(org_id, {line.item_id for line in result}, warehouse_id=warehouse_id, on=on)
+    cursors = {item_id: [0, _ZERO] for item_id in lots}  # [lot index, qty taken from it]
+    for line in result:
+        stock = lots.get(line.item_id, [])
+        position = cursors.get(line.item_id)
+        needed = line.requested
+        while position is not None and needed > 0 and position[0] < len(stock):
+            lot = stock[position[0]]
+            take = min(needed, lot.qty - position[1])
+            line.picks.append(
+                {
+                    "lot_id": lot.lot_id,
+                    "lot_number": lot.lot_number,
+                    "expiry": lot.expiry,
+                    "warehouse_id": lot.warehouse_id,
+                    "qty": take,
+                }
+            )
+            needed -= take
+            position[1] += take
+            if position[1] >= lot.qty:
+                position[0] += 1
+                position[1] = _ZERO
+    return result
+
+
+def encode_cursor(lot: Lot) -> str:
+    return f"{lot.expiry.isoformat()}~{lot.id}"
+
+
+def decode_cursor(raw: str) -> tuple[date, uuid.UUID]:
+    """Inverse of :func:`encode_cursor`; raises ``ValueError`` when malformed."""
+
+    expiry, _, lot_id = raw.partition("~")
+    return date.fromisoformat(expiry), uuid.UUID(lot_id)
+
+
+def expiring_page(
+    org_id: int | None,
+    cutoff: date,
+    *,
+    after: str | None = None,
+    limit: int = EXPIRY_PAGE,
+    unalerted_only: bool = False,
+) -> tuple[list[Lot], str | None]:
+    """One page of active lots expiring on or before *cutoff*.
+
+    Returns the lots and the cursor for the next page (``None`` at the end).
+    """
+
+    query = Lot.query.filter(
+        Lot.org_id == org_id,
+        Lot.is_active.is_(True),
+        Lot.expiry.isnot(None),
+        Lot.expiry <= cutoff,
+    )
+    if unalerted_only:
+        query = query.filter(
+            or_(Lot.expiry_alerted_for.is_(None), Lot.expiry_alerted_for != Lot.expiry)
+        )
+    if after:
+        expiry, lot_id = decode_cursor(after)
+        query = query.filter(
+            or_(Lot.expiry > expiry, and_(Lot.expiry == expiry, Lot.id > lot_id))
+        )
+    limit = max(1, limit)
+    lots = query.order_by(Lot.expiry.asc(), Lot.id.asc()).limit(limit + 1).all()
+    if len(lots) > limit:
+        lots = lots[:limit]
+        return lots, encode_cursor(lots[-1])
+    return lots, None
+
+
+__all__ = [
+    "EXPIRY_PAGE",
+    "LotStock",
+    "PickLine",
+    "available_lots",
+    "decode_cursor",
+    "encode_cursor",
+    "expiring_page",
+    "fefo_pick_list",
+]
@@ -6,8 +6,9 @@ import uuid
 from datetime import UTC, datetime, date
 from decimal import Decimal
 
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import synonym
 
 from ..extensions import db
 
@@ -22,6 +23,7 @@ class Warehouse(db.Model):
     name = db.Column(db.String(255), nullable=False)
     code = db.Column(db.String(64), nullable=True, index=True)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
+    is_default = db.Column(db.Boolean, nullable=False, default=False)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
 
 
@@ -51,9 +53,29 @@ class Lot(db.Model):
     received_date = db.Column(db.Date, nullable=True)
     supplier_id = db.Column(UUID(as_uuid=True), nullable=True)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
+    # Expiry date the last alert was raised for; a changed expiry re-alerts.
+    expiry_alerted_for = db.Column(db.Date, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
 
-    __table_args__ = (UniqueConstraint("org_id", "item_id", "number", name="uq_item_lot_number"),)
+    __table_args__ = (
+        UniqueConstraint("org_id", "item_id", "number", name="uq_item_lot_number"),
+        # FEFO picking: active lots of an item by expiry.
+        Index(
+            "ix_lots_org_item_expiry",
+            "org_id",
+            "item_id",
+            "expiry",
+            postgresql_where=db.text("is_active"),
+        ),
+        # Expiry sweeps: keyset pagination over (expiry, id) per org.
+        Index(
+            "ix_lots_org_expiry",
+            "org_id",
+            "expiry",
+            "id",
+            postgresql_where=db.text("is_active AND expiry IS NOT NULL"),
+        ),
+    )
 
     @property
     def lot_number(self) -> str | None:
@@ -114,14 +136,106 @@ class StockLedgerEntry(db.Model):
     org_id = db.Column(db.Integer, nullable=True, index=True)
     item_id = db.Column(UUID(as_uuid=True), db.ForeignKey("items.id"), nullable=False, index=True)
     warehouse_id = db.Column(UUID(as_uuid=True), db.ForeignKey("warehouses.id"), nullable=False, index=True)
+    location_id = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("inventory_locations.id"), nullable=True, index=True
+    )
     lot_id = db.Column(UUID(as_uuid=True), db.ForeignKey("lots.id"), nullable=True, index=True)
     serial_id = db.Column(UUID(as_uuid=True), db.ForeignKey("inventory_serials.id"), nullable=True, index=True)
     quantity_delta = db.Column(db.Numeric(18, 3), nullable=False, default=Decimal("0"))
+    tx_type = db.Column(db.String(64), nullable=True)
     reason = db.Column(db.String(255), nullable=True)
     reference_type = db.Column(db.String(64), nullable=True)
     reference_id = db.Column(db.String(64), nullable=True)
+    idempotency_key = db.Column(db.String(128), nullable=True)
+    unit_cost = db.Column(db.Numeric(18, 4), nullable=True)
+    created_by_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
+
+    qty = synonym("quantity_delta")
+    posting_time = synonym("created_at")
+
+    __table_args__ = (
+        UniqueConstraint("org_id", "idempotency_key", name="uq_stock_ledger_idempotency"),
+        Index("ix_stock_ledger_org_created", "org_id", "created_at"),
+    )
+
+
+class StockCostLayer(db.Model):
+    """FIFO cost layer created by a receipt; consumed front-to-back by issues."""
+
+    __tablename__ = "stock_cost_layers"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    org_id = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(UUID(as_uuid=True), db.ForeignKey("items.id"), nullable=False)
+    warehouse_id = db.Column(UUID(as_uuid=True), db.ForeignKey("warehouses.id"), nullable=False)
+    ledger_entry_id = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("stock_ledger_entries.id", ondelete="CASCADE"), nullable=True
+    )
+    received_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    qty_in = db.Column(db.Numeric(18, 3), nullable=False)
+    qty_remaining = db.Column(db.Numeric(18, 3), nullable=False)
+    unit_cost = db.Column(db.Numeric(18, 4), nullable=False, default=Decimal("0"))
+
+    __table_args__ = (
+        Index(
+            "ix_stock_cost_layers_open",
+            "org_id",
+            "item_id",
+            "warehouse_id",
+            "received_at",
+            postgresql_where=db.text("qty_remaining > 0"),
+        ),
+    )
+
+
+class StockValuation(db.Model):
+    """Maintained quantity and value per item/warehouse (FIFO or weighted average)."""
+
+    __tablename__ = "stock_valuations"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    org_id = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(UUID(as_uuid=True), db.ForeignKey("items.id"), nullable=False)
+    warehouse_id = db.Column(UUID(as_uuid=True), db.ForeignKey("warehouses.id"), nullable=False)
+    method = db.Column(db.String(16), nullable=False, default="fifo")
+    qty = db.Column(db.Numeric(18, 3), nullable=False, default=Decimal("0"))
+    value = db.Column(db.Numeric(20, 4), nullable=False, default=Decimal("0"))
+    last_unit_cost = db.Column(db.Numeric(18, 4), nullable=False, default=Decimal("0"))
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
+
+    __table_args__ = (
+        UniqueConstraint("org_id", "item_id", "warehouse_id", name="uq_stock_valuation_key"),
+    )
+
+    @property
+    def avg_cost(self) -> Decimal:
+        return (Decimal(self.value) / Decimal(self.qty)) if self.qty else Decimal(self.last_unit_cost)
+
+
+class StockCheckpoint(db.Model):
+    """Snapshot of on-hand quantity per item/warehouse/lot at ``as_of``.
+
+    Written for every org at the same instant (daily or monthly), so one
+    checkpoint time covers all items. Zero quantities are not stored.
+    """
+
+    __tablename__ = "stock_checkpoints"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    org_id = db.Column(db.Integer, nullable=False)
+    as_of = db.Column(db.DateTime(timezone=True), nullable=False)
+    period = db.Column(db.String(16), nullable=False, default="daily")
+    item_id = db.Column(UUID(as_uuid=True), db.ForeignKey("items.id"), nullable=False)
+    warehouse_id = db.Column(UUID(as_uuid=True), db.ForeignKey("warehouses.id"), nullable=False)
+    lot_id = db.Column(UUID(as_uuid=True), db.ForeignKey("lots.id"), nullable=True)
+    qty = db.Column(db.Numeric(18, 3), nullable=False, default=Decimal("0"))
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
 
+    __table_args__ = (
+        Index("ix_stock_checkpoints_org_asof_item", "org_id", "as_of", "item_id"),
+    )
+
 
 class CycleCount(db.Model):
     """Cycle-count document (header)."""
@@ -131,8 +245,15 @@ class CycleCount(db.Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     org_id = db.Column(db.Integer, nullable=True, index=True)
     warehouse_id = db.Column(UUID(as_uuid=True), db.ForeignKey("warehouses.id"), nullable=False, index=True)
+    location_id = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("inventory_locations.id", ondelete="SET NULL"), nullable=True
+    )
     scheduled_for = db.Column(db.Date, nullable=True)
     status = db.Column(db.String(32), nullable=False, default="scheduled")
+    counted_by_id = db.Column(db.Integer, nullable=True)
+    submitted_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    approved_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    approved_by_id = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
 
     lines = db.relationship("CycleCountLine", back_populates="cycle_count", cascade="all, delete-orphan")
@@ -219,6 +340,9 @@ __all__ = [
     "SerialNumber",
     "StockBalance",
     "StockLedgerEntry",
+    "StockCheckpoint",
+    "StockCostLayer",
+    "StockValuation",
     "CycleCount",
     "CycleCountLine",
     "InventoryLocation",
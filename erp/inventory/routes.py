@@ -1,12 +1,15 @@
 """Module: inventory/routes.py — audit-added docstring. Refine with precise purpose when convenient."""
 # erp/inventory/routes.py â€” API for inventory + WAC shim
 from __future__ import annotations
-from decimal import Decimal
-from flask import Blueprint, request, jsonify
+import uuid
+from decimal import Decimal, InvalidOperation
+from flask import Blueprint, current_app, request, jsonify
 from sqlalchemy import func
 from .models import Item, Warehouse, Lot, StockLedgerEntry
 from ..extensions import db
-from flask_login import login_required
+from ..services.stock_posting import NegativeStockError, StockMovement, post_movements
+from ..utils import resolve_org_id
+from flask_login import current_user, login_required
 
 inventory_bp = Blueprint("inventory", __name__, url_prefix="/api/inventory")
 
@@ -42,43 +45,58 @@ def _onhand(item_id, warehouse_id=None):
         q = q.filter(StockLedgerEntry.warehouse_id == warehouse_id)
     return Decimal(q.scalar() or 0)
 
-@inventory_bp.route("/grn", methods=["POST"])
-@login_required
-def grn():
-    """Autogenerated docstring (audit). Describe purpose, params, and return value."""
-    data = request.get_json() or {}
-    for ln in data.get("lines", []):
-        sle = StockLedgerEntry(
-            item_id=ln["item_id"],
-            warehouse_id=ln["warehouse_id"],
-            lot_id=ln.get("lot_id"),
-            qty=Decimal(str(ln["qty"])),
-            rate=Decimal(str(ln.get("rate", 0))),
-            value=Decimal(str(ln.get("rate", 0))) * Decimal(str(ln["qty"])),
-            voucher_type="GRN"
+def _uuid_or_none(value):
+    return uuid.UUID(str(value)) if value not in (None, "") else None
+
+def _post_document(data, voucher_type, sign):
+    movements = []
+    for line_no, ln in enumerate(data.get("lines", []), start=1):
+        try:
+            item_id = uuid.UUID(str(ln["item_id"]))
+            warehouse_id = uuid.UUID(str(ln["warehouse_id"]))
+            location_id = _uuid_or_none(ln.get("location_id"))
+            lot_id = _uuid_or_none(ln.get("lot_id"))
+            qty = abs(Decimal(str(ln["qty"])))
+            rate = Decimal(str(ln.get("rate", 0)))
+        except (KeyError, ValueError, InvalidOperation, AttributeError, TypeError) as exc:
+            return jsonify(
+                {"error": f"line {line_no}: item_id and warehouse_id must be UUIDs and qty a number ({exc!r})"}
+            ), 400
+        movements.append(
+            StockMovement(
+                item_id=item_id,
+                warehouse_id=warehouse_id,
+                location_id=location_id,
+                lot_id=lot_id,
+                delta=sign * qty,
+                tx_type=voucher_type,
+                reference_type=voucher_type,
+                reference_id=data.get("reference_id"),
+                idempotency_key=ln.get("idempotency_key"),
+                unit_cost=rate,
+                created_by_id=getattr(current_user, "id", None),
+            )
         )
-        db.session.add(sle)
+    try:
+        post_movements(
+            resolve_org_id(),
+            movements,
+            allow_negative=bool(current_app.config.get("ALLOW_NEGATIVE_STOCK")),
+        )
+    except NegativeStockError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), 409
     db.session.commit()
     return jsonify({"status":"ok"}), 201
 
+@inventory_bp.route("/grn", methods=["POST"])
+@login_required
+def grn():
+    """Receive goods: post all GRN lines as one stock batch."""
+    return _post_document(request.get_json() or {}, "GRN", 1)
+
 @inventory_bp.route("/delivery", methods=["POST"])
 @login_required
 def delivery():
-    """Autogenerated docstring (audit). Describe purpose, params, and return value."""
-    data = request.get_json() or {}
-    for ln in data.get("lines", []):
-        sle = StockLedgerEntry(
-            item_id=ln["item_id"],
-            warehouse_id=ln["warehouse_id"],
-            lot_id=ln.get("lot_id"),
-            qty=-abs(Decimal(str(ln["qty"]))),
-            rate=Decimal(str(ln.get("rate", 0))),
-            value=-abs(Decimal(str(ln.get("rate", 0))) * Decimal(str(ln["qty"]))),
-            voucher_type="Delivery"
-        )
-        db.session.add(sle)
-    db.session.commit()
-    return jsonify({"status":"ok"}), 201
-
-
-
+    """Fulfil a delivery: post all lines as one stock batch (honours ``ALLOW_NEGATIVE_STOCK``)."""
+    return _post_document(request.get_json() or {}, "Delivery", -1)
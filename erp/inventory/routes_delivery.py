@@ -7,10 +7,12 @@ try:
     from erp.extensions import db
     from erp.inventory.valuation import post_sle
     from erp.inventory.models import Delivery
+    from erp.services.stock_posting import NegativeStockError
 except Exception as e:
     db = None
     post_sle = None
     Delivery = None
+    NegativeStockError = None
 
 inventory_delivery_bp = Blueprint("inventory_delivery", __name__, url_prefix="/inventory")
 
@@ -26,16 +28,20 @@ def create_delivery():
         d = Delivery(customer_id=data.get("customer_id"))
         db.session.add(d); db.session.flush()
         delivery_id = d.id
-    for ln in data.get("lines", []):
-        qty = Decimal(str(ln.get("qty", 0)))
-        if qty > 0:
-            qty = -qty  # issues are negative
-        post_sle(item_id=ln["item_id"],
-                 warehouse_id=ln["warehouse_id"],
-                 qty=qty,
-                 voucher_type="Delivery",
-                 voucher_id=delivery_id,
-                 lot_id=ln.get("lot_id"))
+    try:
+        for ln in data.get("lines", []):
+            qty = Decimal(str(ln.get("qty", 0)))
+            if qty > 0:
+                qty = -qty  # issues are negative
+            post_sle(item_id=ln["item_id"],
+                     warehouse_id=ln["warehouse_id"],
+                     qty=qty,
+                     voucher_type="Delivery",
+                     voucher_id=delivery_id,
+                     lot_id=ln.get("lot_id"))
+    except NegativeStockError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), 409
     db.session.commit()
     return jsonify({"id": str(delivery_id) if delivery_id else None}), 201
 
@@ -1,5 +1,16 @@
-"""Module: inventory/valuation.py — audit-added docstring. Refine with precise purpose when convenient."""
-from flask import Blueprint, jsonify
+"""Inventory valuation and historical stock endpoints."""
+import uuid
+from datetime import UTC, datetime
+from decimal import Decimal
+
+from flask import Blueprint, current_app, jsonify, request
+
+from erp.extensions import db
+from erp.inventory.costing import METHODS, revalue, valuation_report
+from erp.inventory.history import quantities_as_of
+from erp.security import require_roles
+from erp.services.stock_posting import StockMovement, post_movements
+from erp.utils import resolve_org_id
 
 bp = Blueprint("inventory_valuation", __name__)
 
@@ -10,4 +21,111 @@ def health():
     return jsonify({"ok": True})
 
 
+def post_sle(item_id, warehouse_id, qty, voucher_type, voucher_id=None, lot_id=None, rate=None):
+    """Post one stock ledger entry through the batch engine (no commit).
+
+    Receipts carry *rate* as their unit cost; issues are costed by the
+    configured valuation method.
+    """
+    qty = Decimal(str(qty))
+    movement = StockMovement(
+        item_id=item_id,
+        warehouse_id=warehouse_id,
+        delta=qty,
+        lot_id=lot_id,
+        tx_type="receipt" if qty > 0 else "issue",
+        reference_type=voucher_type,
+        reference_id=voucher_id,
+        unit_cost=Decimal(str(rate)) if rate is not None and qty > 0 else None,
+    )
+    return post_movements(
+        resolve_org_id(),
+        [movement],
+        allow_negative=bool(current_app.config.get("ALLOW_NEGATIVE_STOCK")),
+    )
+
+
+def _parse_as_of(raw):
+    if not raw:
+        return datetime.now(UTC)
+    value = datetime.fromisoformat(raw)
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
+
+
+@bp.route("/valuation/stock-as-of", methods=["GET", "POST"])
+@require_roles("inventory", "admin")
+def stock_as_of():
+    """On-hand quantities at a past instant (checkpoint + ledger replay).
+
+    GET takes ``as_of``, ``warehouse_id`` and repeated ``item_id`` query
+    parameters; POST takes the same keys as JSON (``item_ids`` as a list) for
+    batch lookups of thousands of items.
+    """
+    if request.method == "POST":
+        payload = request.get_json(silent=True) or {}
+        raw_as_of = payload.get("as_of")
+        warehouse_id = payload.get("warehouse_id")
+        item_ids = payload.get("item_ids")
+    else:
+        raw_as_of = request.args.get("as_of")
+        warehouse_id = request.args.get("warehouse_id")
+        item_ids = request.args.getlist("item_id") or None
+    try:
+        as_of = _parse_as_of(raw_as_of)
+        warehouse_id = uuid.UUID(str(warehouse_id)) if warehouse_id else None
+        item_ids = [uuid.UUID(str(i)) for i in item_ids] if item_ids else None
+    except ValueError:
+        return jsonify({"error": "as_of must be ISO-8601 and ids must be UUIDs"}), 400
+
+    quantities = quantities_as_of(
+        resolve_org_id(), as_of, item_ids=item_ids, warehouse_id=warehouse_id
+    )
+    rows = [
+        {
+            "item_id": str(item_id),
+            "warehouse_id": str(wh_id),
+            "lot_id": str(lot_id) if lot_id else None,
+            "qty": str(qty),
+        }
+        for (item_id, wh_id, lot_id), qty in sorted(quantities.items(), key=lambda kv: str(kv[0]))
+    ]
+    return jsonify({"as_of": as_of.isoformat(), "rows": rows})
+
+
+@bp.get("/valuation/report")
+@require_roles("inventory", "finance", "admin")
+def report():
+    """Stock value per item/warehouse from the maintained valuations."""
+    warehouse_id = request.args.get("warehouse_id")
+    try:
+        warehouse_id = uuid.UUID(warehouse_id) if warehouse_id else None
+    except ValueError:
+        return jsonify({"error": "warehouse_id must be a UUID"}), 400
+    return jsonify(valuation_report(db.session, resolve_org_id(), warehouse_id))
+
+
+@bp.post("/valuation/revalue")
+@require_roles("inventory", "finance", "admin")
+def revalue_item():
+    """Re-cost one item/warehouse from its full ledger (e.g. after changing
+    ``INVENTORY_VALUATION_METHOD``).
 
+    Only the configured method is accepted: postings keep using it, so
+    re-costing with another one would leave layers and averages that the
+    next posting cannot continue from.
+    """
+    payload = request.get_json(silent=True) or {}
+    configured = str(current_app.config.get("INVENTORY_VALUATION_METHOD", "fifo")).lower()
+    method = str(payload.get("method") or configured).lower()
+    if method not in METHODS:
+        return jsonify({"error": f"method must be one of {', '.join(METHODS)}"}), 400
+    if method != configured:
+        return jsonify({"error": f"method must match the configured valuation method ({configured})"}), 409
+    try:
+        item_id = uuid.UUID(str(payload["item_id"]))
+        warehouse_id = uuid.UUID(str(payload["warehouse_id"]))
+    except (KeyError, ValueError):
+        return jsonify({"error": "item_id and warehouse_id must be UUIDs"}), 400
+    result = revalue(db.session, resolve_org_id(), item_id, warehouse_id, method)
+    db.session.commit()
+    return jsonify({key: str(value) for key, value in result.items()})
@@ -1,11 +1,14 @@
 from .routes import bp
 from .models import (
+    MarketingABExposure,
     MarketingABVariant,
     MarketingCampaign,
+    MarketingCampaignStat,
     MarketingConsent,
     MarketingEvent,
     MarketingGeofence,
     MarketingSegment,
+    MarketingSegmentMember,
     MarketingVisit,
 )
 
@@ -14,8 +17,11 @@ __all__ = [
     "MarketingEvent",
     "MarketingVisit",
     "MarketingCampaign",
+    "MarketingCampaignStat",
     "MarketingSegment",
+    "MarketingSegmentMember",
     "MarketingConsent",
     "MarketingABVariant",
+    "MarketingABExposure",
     "MarketingGeofence",
 ]
@@ -46,6 +46,11 @@ class MarketingCampaign(TimestampMixin, OrgScopedMixin, db.Model):
     currency: Mapped[str] = mapped_column(db.String(8), nullable=False, default="ETB")
     ab_test_enabled: Mapped[bool] = mapped_column(db.Boolean, nullable=False, default=False)
     created_by_id: Mapped[Optional[int]] = mapped_column(db.Integer)
+    # Set once marketing_campaign_stats has been backfilled from events.
+    stats_seeded_at: Mapped[Optional[datetime]] = mapped_column(db.DateTime)
+    # Replaced whenever the campaign's A/B variants change; part of the
+    # cache key of its variant table (erp.services.marketing_ab).
+    ab_version: Mapped[Optional[str]] = mapped_column(db.String(32))
 
     segments = relationship(
         "MarketingSegment",
@@ -88,10 +93,30 @@ class MarketingSegment(TimestampMixin, OrgScopedMixin, db.Model):
     rules_json: Mapped[dict] = mapped_column(db.JSON, nullable=False, default=dict)
     is_active: Mapped[bool] = mapped_column(db.Boolean, nullable=False, default=True)
     created_by_id: Mapped[Optional[int]] = mapped_column(db.Integer)
+    # Materialised membership state (erp.services.marketing_segment_compiler)
+    members_refreshed_at: Mapped[Optional[datetime]] = mapped_column(db.DateTime)
+    members_rules_hash: Mapped[Optional[str]] = mapped_column(db.String(64))
 
     campaign = relationship("MarketingCampaign", back_populates="segments")
 
 
+class MarketingSegmentMember(OrgScopedMixin, db.Model):
+    """Client currently matching a segment, kept by the refresh job."""
+
+    __tablename__ = "marketing_segment_members"
+    __table_args__ = (
+        Index("ux_marketing_segment_members_segment_client", "segment_id", "client_id", unique=True),
+        Index("ix_marketing_segment_members_client", "client_id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    segment_id: Mapped[int] = mapped_column(
+        db.Integer, db.ForeignKey("marketing_segments.id", ondelete="CASCADE"), nullable=False
+    )
+    client_id: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    added_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=False)
+
+
 class MarketingConsent(TimestampMixin, OrgScopedMixin, db.Model):
     __tablename__ = "marketing_consents"
     __table_args__ = (Index("ix_marketing_consents_subject", "subject_id"),)
@@ -126,6 +151,26 @@ class MarketingABVariant(TimestampMixin, OrgScopedMixin, db.Model):
     campaign = relationship("MarketingCampaign", back_populates="variants")
 
 
+class MarketingABExposure(OrgScopedMixin, db.Model):
+    """Daily assignment counts per variant (erp.services.marketing_ab)."""
+
+    __tablename__ = "marketing_ab_exposures"
+    __table_args__ = (
+        Index("ux_marketing_ab_exposures_variant_day", "variant_id", "day", unique=True),
+        Index("ix_marketing_ab_exposures_campaign", "campaign_id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    campaign_id: Mapped[int] = mapped_column(
+        db.Integer, db.ForeignKey("marketing_campaigns.id", ondelete="CASCADE"), nullable=False
+    )
+    variant_id: Mapped[int] = mapped_column(
+        db.Integer, db.ForeignKey("marketing_ab_variants.id", ondelete="CASCADE"), nullable=False
+    )
+    day: Mapped[date] = mapped_column(db.Date, nullable=False)
+    assignments: Mapped[int] = mapped_column(db.BigInteger, nullable=False, default=0)
+
+
 class MarketingGeofence(TimestampMixin, OrgScopedMixin, db.Model):
     __tablename__ = "marketing_geofences"
     __table_args__ = (
@@ -177,12 +222,31 @@ class MarketingEvent(TimestampMixin, OrgScopedMixin, db.Model):
     campaign = relationship("MarketingCampaign", back_populates="events")
 
 
+class MarketingCampaignStat(OrgScopedMixin, db.Model):
+    """Running count of a campaign's events per type (erp.services.campaign_stats)."""
+
+    __tablename__ = "marketing_campaign_stats"
+    __table_args__ = (
+        Index("ux_marketing_campaign_stats_campaign_type", "campaign_id", "event_type", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    campaign_id: Mapped[int] = mapped_column(
+        db.Integer, db.ForeignKey("marketing_campaigns.id", ondelete="CASCADE"), nullable=False
+    )
+    event_type: Mapped[str] = mapped_column(db.String(64), nullable=False)
+    count: Mapped[int] = mapped_column(db.BigInteger, nullable=False, default=0)
+
+
 __all__ = [
     "MarketingVisit",
     "MarketingCampaign",
     "MarketingSegment",
+    "MarketingSegmentMember",
     "MarketingConsent",
     "MarketingABVariant",
+    "MarketingABExposure",
     "MarketingGeofence",
     "MarketingEvent",
+    "MarketingCampaignStat",
 ]
@@ -1,6 +1,6 @@
 """Module: metrics.py — audit-added docstring. Refine with precise purpose when convenient."""
 try:
-    from prometheus_client import Gauge, Counter  # type: ignore
+    from prometheus_client import Gauge, Counter, Histogram  # type: ignore
 except Exception:  # fallback when prometheus_client is missing
     class _NoopMetric:
         def labels(self, *a, **kw): return self
@@ -10,6 +10,7 @@ except Exception:  # fallback when prometheus_client is missing
         def set(self, *a, **kw):  ...
     def Gauge(*a, **kw): return _NoopMetric()
     def Counter(*a, **kw): return _NoopMetric()
+    def Histogram(*a, **kw): return _NoopMetric()
 
 # Core metrics expected by tests
 QUEUE_LAG = Gauge("erp_queue_lag_seconds", "Queue lag in seconds", ["queue"]) if callable(Gauge) else Gauge
@@ -19,6 +20,37 @@ AUDIT_CHAIN_BROKEN = Counter("erp_audit_chain_broken_total", "Audit chain broken
 DLQ_MESSAGES = Counter("erp_dead_letter_messages_total", "Dead-letter messages")
 BOT_JOBS_QUEUED = Gauge("erp_bot_jobs_queued", "Queued bot jobs", ["org_id", "bot_name"]) if callable(Gauge) else Gauge
 BOT_JOBS_FAILED = Gauge("erp_bot_jobs_failed", "Failed bot jobs", ["org_id", "bot_name"]) if callable(Gauge) else Gauge
+BOT_JOBS_PROCESSING = Gauge("erp_bot_jobs_processing", "Bot jobs being processed", ["org_id", "bot_name"]) if callable(Gauge) else Gauge
+BOT_DISPATCH_LATENCY = Histogram(
+    "erp_bot_dispatch_seconds",
+    "Bot command dispatch latency",
+    ["bot_name", "intent", "outcome"],
+)
+BOT_EVENTS_DROPPED = Counter("erp_bot_events_dropped_total", "Bot events dropped by the buffered sink")
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "erp_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    ["engine"],
+)
+DB_POOL_IN_USE = Gauge("erp_db_pool_connections_in_use", "Pooled database connections checked out", ["engine"])
+DB_POOL_CONNECTIONS_OPENED = Counter(
+    "erp_db_pool_connections_opened_total", "New DBAPI connections opened by a pool", ["engine"]
+)
+DB_REPLICA_LAG = Gauge("erp_db_replica_lag_seconds", "Last measured read-replica lag (-1 when unknown)")
+DB_REPLICA_READS = Counter(
+    "erp_db_replica_reads_total", "Reads with replica affinity by target (replica or fallback)", ["target"]
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "erp_circuit_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["breaker"]
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "erp_circuit_breaker_transitions_total", "Circuit breaker state transitions", ["breaker", "state"]
+)
+HTTP_CLIENT_LATENCY = Histogram(
+    "erp_http_client_request_seconds",
+    "Outbound HTTP request latency by upstream",
+    ["upstream", "method", "outcome"],
+)
 
 # Success sentinel expected by scripts/tests
 OLAP_EXPORT_SUCCESS = "OLAP_EXPORT_SUCCESS"
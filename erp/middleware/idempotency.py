@@ -1,46 +1,180 @@
-"""Module: middleware/idempotency.py — audit-added docstring. Refine with precise purpose when convenient."""
+"""Idempotency-Key enforcement with response replay for mutating endpoints."""
 # erp/middleware/idempotency.py
 from __future__ import annotations
 
+import zlib
+from datetime import UTC, datetime
 from functools import wraps
-from flask import request, jsonify
+
+from flask import Response, current_app, jsonify, make_response, request
+from flask_login import current_user
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
 from erp import db
 from erp.models.idempotency import IdempotencyKey
+from erp.utils.upsert import conflict_insert
+
+REPLAY_HEADER = "Idempotent-Replayed"
+DEFAULT_REPLAY_TTL = 24 * 3600
+DEFAULT_LOCK_TTL = 60
+
+
+def _redis():
+    """Real Redis client when configured, else ``None`` (DB-only mode)."""
+    if not current_app.config.get("IDEMPOTENCY_USE_REDIS", True):
+        return None
+    try:
+        from db import redis_client
+    except Exception:  # pragma: no cover - optional dependency
+        return None
+    return redis_client.client if getattr(redis_client, "is_real", False) else None
+
+
+def _actor() -> tuple[int, str | None]:
+    """``(org_id, user_id)`` of the caller; keys never cross tenants."""
+    user_id = None
+    org_id = None
+    if getattr(current_user, "is_authenticated", False):
+        user_id = str(current_user.get_id())
+        org_id = getattr(current_user, "org_id", None)
+    if org_id is None:
+        from erp.utils import resolve_org_id
+
+        org_id = resolve_org_id(default=0)
+    return int(org_id), user_id
+
+
+def _reserve(key: str, endpoint: str, org_id: int, user_id: str | None) -> bool:
+    """Insert the key in one statement; False when it already exists.
+
+    Runs inside the caller's transaction, so a concurrent request with the
+    same key blocks on the unique index until this one commits or rolls back.
+    """
+    values = {
+        "key": key,
+        "endpoint": endpoint,
+        "org_id": org_id,
+        "user_id": user_id,
+        "created_at": datetime.now(UTC),
+    }
+    stmt = conflict_insert(db.session, IdempotencyKey.__table__)
+    if stmt is not None:
+        stmt = stmt.values(**values).on_conflict_do_nothing(index_elements=["org_id", "key"])
+        return db.session.execute(stmt).rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(IdempotencyKey).values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def _pack(status: int, content_type: str | None, body: bytes) -> bytes:
+    return f"{status}\n{content_type or ''}\n".encode() + zlib.compress(body)
+
+
+def _unpack(blob: bytes) -> tuple[int, str | None, bytes]:
+    status, content_type, body = blob.split(b"\n", 2)
+    return int(status), content_type.decode() or None, zlib.decompress(body)
+
+
+def _replay(status: int, content_type: str | None, body: bytes) -> Response:
+    resp = Response(body, status=status, content_type=content_type)
+    resp.headers[REPLAY_HEADER] = "true"
+    return resp
+
 
 def idempotent(endpoint_name: str, status_code_on_duplicate: int = 200):
     """
     Decorator that enforces exactly-once semantics per Idempotency-Key header.
 
     Clients must send:  Idempotency-Key: <opaque unique value>
-    If the same key is seen again, we short-circuit with status_code_on_duplicate.
+    The key is reserved with a single insert-or-ignore in the handler's
+    transaction and the handler's response (status, content type and
+    compressed body) is stored on the same row. A repeated key replays that
+    response with an ``Idempotent-Replayed: true`` header. Keys are scoped
+    to the caller's org; a key already used by another user of the org
+    answers 422 instead of replaying their response. Keys stored before
+    responses were recorded answer ``{"status": "duplicate"}`` with
+    status_code_on_duplicate. When Redis is available, completed responses
+    are also cached there so retries skip the database, and a ``SET NX``
+    lock turns concurrent duplicates away with 409 instead of queueing them
+    on the unique index.
     """
     def wrap(fn):
-        """Autogenerated docstring (audit). Describe purpose, params, and return value."""
         @wraps(fn)
         def inner(*args, **kwargs):
-            """Autogenerated docstring (audit). Describe purpose, params, and return value."""
             key = request.headers.get("Idempotency-Key")
             if not key:
                 return jsonify({"error": "Missing Idempotency-Key header"}), 409
 
-            # Already used?
-            exists = IdempotencyKey.query.filter_by(key=key).first()
-            if exists:
-                return jsonify({"status": "duplicate"}), status_code_on_duplicate
-
-            db.session.add(IdempotencyKey(key=key, endpoint=endpoint_name))
-            db.session.flush()  # reserve the key before executing handler
+            org_id, user_id = _actor()
+            redis = _redis()
+            replay_key = f"idem:resp:{org_id}:{user_id or '-'}:{endpoint_name}:{key}"
+            lock_key = f"idem:lock:{org_id}:{key}"
+            if redis is not None:
+                try:
+                    cached = redis.get(replay_key)
+                    if cached:
+                        return _replay(*_unpack(cached))
+                    lock_ttl = int(current_app.config.get("IDEMPOTENCY_LOCK_TTL", DEFAULT_LOCK_TTL))
+                    if not redis.set(lock_key, b"1", nx=True, ex=lock_ttl):
+                        return jsonify({"error": "request_in_progress"}), 409
+                except Exception:
+                    redis = None
 
             try:
-                resp = fn(*args, **kwargs)
+                if not _reserve(key, endpoint_name, org_id, user_id):
+                    existing = IdempotencyKey.query.filter_by(org_id=org_id, key=key).first()
+                    if existing is not None and (
+                        existing.endpoint != endpoint_name or existing.user_id != user_id
+                    ):
+                        return jsonify({"error": "Idempotency-Key reused for a different request"}), 422
+                    if existing is None or existing.response_status is None:
+                        return jsonify({"status": "duplicate"}), status_code_on_duplicate
+                    return _replay(
+                        existing.response_status,
+                        existing.response_content_type,
+                        zlib.decompress(existing.response_body or zlib.compress(b"")),
+                    )
+
+                try:
+                    resp = make_response(fn(*args, **kwargs))
+                except Exception:
+                    # Roll back both the handler and the reserved key to allow retry.
+                    db.session.rollback()
+                    raise
+
+                if resp.status_code >= 500 or resp.is_streamed:
+                    # Server errors release the key so the client can retry.
+                    db.session.rollback()
+                    return resp
+
+                body = resp.get_data()
+                db.session.query(IdempotencyKey).filter_by(org_id=org_id, key=key).update(
+                    {
+                        "response_status": resp.status_code,
+                        "response_content_type": resp.content_type,
+                        "response_body": zlib.compress(body),
+                        "completed_at": datetime.now(UTC),
+                    },
+                    synchronize_session=False,
+                )
                 db.session.commit()
+
+                if redis is not None:
+                    ttl = int(current_app.config.get("IDEMPOTENCY_REPLAY_TTL", DEFAULT_REPLAY_TTL))
+                    try:
+                        redis.set(replay_key, _pack(resp.status_code, resp.content_type, body), ex=ttl)
+                    except Exception:
+                        pass
                 return resp
-            except Exception:
-                # Roll back both the handler and the reserved key to allow retry.
-                db.session.rollback()
-                raise
+            finally:
+                if redis is not None:
+                    try:
+                        redis.delete(lock_key)
+                    except Exception:
+                        pass
         return inner
     return wrap
-
-
-
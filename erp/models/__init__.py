@@ -111,18 +111,22 @@ from .core_entities import ( # noqa: F401
     RegistrationInvite,
 )
 from erp.marketing.models import (
+    MarketingABExposure,
     MarketingABVariant,
     MarketingCampaign,
+    MarketingCampaignStat,
     MarketingConsent,
     MarketingEvent,
     MarketingGeofence,
     MarketingSegment,
+    MarketingSegmentMember,
     MarketingVisit,
 )
 from erp.banking.models import (
     BankAccessToken,
     BankAccount,
     BankConnection,
+    BankSyncCursor,
     BankSyncJob,
     BankTwoFactorChallenge,
 )
@@ -132,6 +136,7 @@ from .finance_gl import (
     FinanceAuditLog,
     BankStatement,
     BankStatementLine,
+    BankStatementImport,
 )
 StatementLine = BankStatementLine # noqa: F401
 # Inventory: try eager, else lazy fallback + back-compat aliases
@@ -230,9 +235,12 @@ __all__ = [
     "MarketingEvent",
     "MarketingVisit",
     "MarketingCampaign",
+    "MarketingCampaignStat",
     "MarketingSegment",
+    "MarketingSegmentMember",
     "MarketingConsent",
     "MarketingABVariant",
+    "MarketingABExposure",
     "MarketingGeofence",
     "AnalyticsMetric",
     "AnalyticsFact",
@@ -252,8 +260,10 @@ __all__ = [
     "BankAccessToken",
     "BankTwoFactorChallenge",
     "BankSyncJob",
+    "BankSyncCursor",
     "BankStatement",
     "BankStatementLine",
+    "BankStatementImport",
     "StatementLine",
     "GLJournalEntry",
     "GLJournalLine",
@@ -111,7 +111,7 @@ class FinanceAuditLog(db.Model):
 
     __tablename__ = "finance_audit_log"
 
-    id = db.Column(db.BigInteger, primary_key=True)
+    id = db.Column(db.BigInteger().with_variant(db.Integer(), "sqlite"), primary_key=True)
     org_id = db.Column(db.Integer, nullable=False, index=True)
     event_type = db.Column(db.String(64), nullable=False, index=True)
     entity_type = db.Column(db.String(64), nullable=False)
@@ -164,6 +164,16 @@ class BankStatement(db.Model):
 
 class BankStatementLine(db.Model):
     __tablename__ = "bank_statement_lines"
+    __table_args__ = (
+        # Provider transaction IDs are unique per account; lines without one
+        # (NULL) never collide, so manual uploads are unaffected.
+        db.Index(
+            "ux_bank_statement_lines_account_external",
+            "bank_account_id",
+            "external_id",
+            unique=True,
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     org_id = db.Column(db.Integer, nullable=False, index=True)
@@ -179,6 +189,14 @@ class BankStatementLine(db.Model):
     amount = db.Column(db.Numeric(14, 2), nullable=False)
     balance = db.Column(db.Numeric(14, 2), nullable=True)
 
+    # Set by API sync for de-duplication across runs
+    bank_account_id = db.Column(
+        db.Integer,
+        db.ForeignKey("bank_accounts.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    external_id = db.Column(db.String(128), nullable=True)
+
     # Compatibility fields for legacy banking upload screens
     reference = db.Column(db.String(64), nullable=True)
     posted_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
@@ -198,10 +216,78 @@ class BankStatementLine(db.Model):
     journal_entry = db.relationship("GLJournalEntry")
 
 
+class BankStatementImport(db.Model):
+    """Progress and per-line errors of a statement file import."""
+
+    __tablename__ = "bank_statement_imports"
+
+    MAX_ERRORS = 200
+
+    id = db.Column(db.Integer, primary_key=True)
+    org_id = db.Column(db.Integer, nullable=False, index=True)
+    statement_id = db.Column(
+        db.Integer,
+        db.ForeignKey("bank_statements.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    # queued | running | success | partial | error
+    status = db.Column(db.String(16), nullable=False, default="queued", index=True)
+    file_format = db.Column(db.String(16), nullable=False)
+    filename = db.Column(db.String(255), nullable=True)
+    file_path = db.Column(db.String(512), nullable=False)
+    # Explicit period from the upload form; otherwise taken from the lines.
+    period_start = db.Column(db.Date, nullable=True)
+    period_end = db.Column(db.Date, nullable=True)
+
+    bytes_total = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_read = db.Column(db.BigInteger, nullable=False, default=0)
+    lines_imported = db.Column(db.Integer, nullable=False, default=0)
+    lines_failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.JSON, nullable=False, default=list)
+
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+    created_by_id = db.Column(db.Integer, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    statement = db.relationship("BankStatement")
+
+    def add_error(self, line_no: int | None, error: str) -> None:
+        """Record a problem; only the first ``MAX_ERRORS`` are kept."""
+
+        if len(self.errors or []) < self.MAX_ERRORS:
+            # Reassign so the JSON column is flagged dirty.
+            self.errors = [*(self.errors or []), {"line": line_no, "error": error}]
+
+    @property
+    def progress(self) -> float:
+        if self.status in ("success", "partial"):
+            return 1.0
+        return round(self.bytes_read / self.bytes_total, 4) if self.bytes_total else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "statement_id": self.statement_id,
+            "status": self.status,
+            "format": self.file_format,
+            "filename": self.filename,
+            "progress": self.progress,
+            "lines_imported": self.lines_imported,
+            "lines_failed": self.lines_failed,
+            "errors": self.errors or [],
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
 __all__ = [
     "GLJournalEntry",
     "GLJournalLine",
     "FinanceAuditLog",
     "BankStatement",
     "BankStatementLine",
+    "BankStatementImport",
 ]
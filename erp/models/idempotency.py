@@ -12,24 +12,48 @@ class IdempotencyKey(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(128), nullable=False)
     endpoint = db.Column(db.String(128), nullable=False)
+    # Keys are scoped per tenant; user_id is Flask-Login's get_id() of the
+    # caller ("client:<id>" for client accounts, NULL when anonymous).
+    org_id = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    user_id = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(UTC))
 
+    # Original response, stored so retries replay it verbatim. The body is
+    # zlib-compressed; NULL status means the key predates response storage.
+    response_status = db.Column(db.Integer, nullable=True)
+    response_content_type = db.Column(db.String(128), nullable=True)
+    response_body = db.Column(db.LargeBinary, nullable=True)
+    completed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
     __table_args__ = (
-        UniqueConstraint("key", name="uq_idem_key"),
+        UniqueConstraint("org_id", "key", name="uq_idem_org_key"),
         Index("ix_idem_endpoint", "endpoint"),
         Index("ix_idem_created_at", "created_at"),
     )
 
     @staticmethod
-    def purge_older_than(hours: int = 24) -> int:
+    def purge_older_than(hours: int = 24, batch_size: int = 5000) -> int:
         """
-        Delete old keys to keep the table small.
-        Returns number of rows deleted.
+        Delete old keys in id-ordered batches to keep the table small.
+        Each batch is committed separately so the sweep never holds a long
+        lock on the table. Returns number of rows deleted.
         """
         cutoff = datetime.now(UTC) - timedelta(hours=hours)
-        res = db.session.query(IdempotencyKey).filter(IdempotencyKey.created_at < cutoff).delete()
-        return res
-
-
-
-
+        deleted = 0
+        while True:
+            ids = [
+                row_id
+                for (row_id,) in db.session.query(IdempotencyKey.id)
+                .filter(IdempotencyKey.created_at < cutoff)
+                .order_by(IdempotencyKey.id)
+                .limit(batch_size)
+                .all()
+            ]
+            if not ids:
+                return deleted
+            deleted += (
+                db.session.query(IdempotencyKey)
+                .filter(IdempotencyKey.id.in_(ids))
+                .delete(synchronize_session=False)
+            )
+            db.session.commit()
@@ -8,6 +8,7 @@ PUBLIC_PATHS: set[str] = {
     "/healthz",
     "/health/ready",
     "/health/live",
+    "/livez",
     "/health/readyz",
     "/healthz/ready",
     "/readyz",
@@ -1,6 +1,6 @@
 """Reliability helpers: circuit breakers, chaos toggles, and incidents."""
 from __future__ import annotations
 
-from .circuit_breaker import CircuitBreaker, get_breaker  # noqa: F401
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker  # noqa: F401
 from .chaos import apply_chaos_to_external_calls, chaos_enabled, maybe_fail  # noqa: F401
 from .incident_service import close_incident, open_incident  # noqa: F401
@@ -1,56 +1,328 @@
-"""Lightweight circuit breaker to protect external dependencies."""
+"""Circuit breakers shared by every worker process.
+
+Breaker state lives in a backend rather than on the instance. With Redis
+(the default when :data:`db.redis_client` is connected) every gunicorn
+worker and Celery process reads and updates the same state, so an outage
+trips the breaker everywhere at once. :class:`LocalBackend` is the
+in-process stand-in used without Redis or when
+``CIRCUIT_BREAKER_BACKEND=local``.
+
+Each transition is a read-modify-write of one small state document:
+under a lock for the local backend, and in a ``WATCH``/``MULTI``
+transaction for Redis. Concurrent callers therefore never lose an update
+or open the breaker twice.
+
+The breaker trips on the failure *rate* over a sliding ``window_s``
+window. The window is kept as ``WINDOW_BUCKETS`` time buckets. It waits
+for ``min_calls`` outcomes before judging. After ``reset_timeout_s`` it
+goes half-open and lets up to ``half_open_success`` probe calls through.
+If they all succeed it closes again; one failure re-opens it.
+"""
 from __future__ import annotations
 
+import json
+import os
+import threading
 import time
-from dataclasses import dataclass, field
+from collections.abc import Callable
+from functools import wraps
+from typing import Any, TypeVar
+
+from erp.metrics import CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRANSITIONS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+WINDOW_BUCKETS = 10
+
+T = TypeVar("T")
+State = dict[str, Any]
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised by :meth:`CircuitBreaker.call` while the breaker rejects calls."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"circuit '{name}' is open")
+        self.name = name
+
+
+def _initial() -> State:
+    return {"state": CLOSED, "since": 0.0, "buckets": [], "probes": 0, "successes": 0}
+
+
+class LocalBackend:
+    """Process-local breaker state guarded by a lock."""
+
+    def __init__(self) -> None:
+        self._states: dict[str, State] = {}
+        self._lock = threading.Lock()
+
+    def read(self, name: str) -> State | None:
+        with self._lock:
+            state = self._states.get(name)
+            return json.loads(json.dumps(state)) if state is not None else None
+
+    def update(self, name: str, fn: Callable[[State | None], tuple[State, T]]) -> T:
+        with self._lock:
+            current = self._states.get(name)
+            new, result = fn(json.loads(json.dumps(current)) if current is not None else None)
+            self._states[name] = new
+            return result
+
+    def reset(self, name: str | None = None) -> None:
+        with self._lock:
+            if name is None:
+                self._states.clear()
+            else:
+                self._states.pop(name, None)
+
+
+class RedisBackend:
+    """Breaker state shared through Redis.
+
+    Updates use optimistic ``WATCH`` transactions. If Redis stops
+    answering, the backend keeps working from a local copy, the same way
+    :data:`db.redis_client` falls back to memory.
+    """
+
+    def __init__(self, client: Any, prefix: str = "circuit:", ttl_s: int = 86400) -> None:
+        self.client = client
+        self.prefix = prefix
+        self.ttl_s = ttl_s
+        self._fallback = LocalBackend()
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def read(self, name: str) -> State | None:
+        try:
+            raw = self.client.get(self._key(name))
+        except Exception:
+            return self._fallback.read(name)
+        return json.loads(raw) if raw else None
+
+    def update(self, name: str, fn: Callable[[State | None], tuple[State, T]]) -> T:
+        from redis.exceptions import WatchError  # type: ignore
+
+        key = self._key(name)
+        try:
+            with self.client.pipeline() as pipe:
+                while True:
+                    try:
+                        pipe.watch(key)
+                        raw = pipe.get(key)
+                        current = json.loads(raw) if raw else None
+                        # *fn* mutates its argument; compare against an untouched copy.
+                        new, result = fn(json.loads(raw) if raw else None)
+                        if new == current:
+                            pipe.unwatch()
+                        else:
+                            pipe.multi()
+                            pipe.set(key, json.dumps(new), ex=self.ttl_s)
+                            pipe.execute()
+                        return result
+                    except WatchError:
+                        continue
+        except Exception:
+            return self._fallback.update(name, fn)
+
+    def reset(self, name: str | None = None) -> None:
+        self._fallback.reset(name)
+        try:
+            if name is None:
+                keys = list(self.client.scan_iter(f"{self.prefix}*"))
+                if keys:
+                    self.client.delete(*keys)
+            else:
+                self.client.delete(self._key(name))
+        except Exception:
+            pass
+
+
+_default_backend: LocalBackend | RedisBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def default_backend() -> LocalBackend | RedisBackend:
+    """Redis when connected (unless ``CIRCUIT_BREAKER_BACKEND=local``)."""
+
+    global _default_backend
+    with _backend_lock:
+        if _default_backend is None:
+            choice = os.getenv("CIRCUIT_BREAKER_BACKEND", "auto").lower()
+            client = None
+            if choice != "local":
+                from db import redis_client
+
+                client = redis_client.client if redis_client.is_real else None
+            _default_backend = RedisBackend(client) if client is not None else LocalBackend()
+        return _default_backend
 
 
-@dataclass
 class CircuitBreaker:
-    name: str
-    failure_threshold: int = 5
-    reset_timeout_s: int = 60
-    half_open_success: int = 2
+    """Sliding-window failure-rate breaker whose state lives in *backend*."""
 
-    state: str = field(default="closed")
-    failures: int = field(default=0)
-    successes: int = field(default=0)
-    opened_at: float | None = field(default=None)
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_rate: float = 0.5,
+        min_calls: int = 5,
+        window_s: float = 60,
+        reset_timeout_s: float = 60,
+        half_open_success: int = 2,
+        backend: LocalBackend | RedisBackend | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_s = window_s
+        self.reset_timeout_s = reset_timeout_s
+        self.half_open_success = half_open_success
+        self.backend = backend if backend is not None else default_backend()
+        self.clock = clock
+        CIRCUIT_BREAKER_STATE.labels(name).set(STATE_CODES[CLOSED])
 
-    def allow(self) -> bool:
-        if self.state == "closed":
-            return True
+    # -- public API --------------------------------------------------------
 
-        if self.state == "open":
-            if self.opened_at and (time.time() - self.opened_at) > self.reset_timeout_s:
-                self.state = "half_open"
-                self.failures = 0
-                self.successes = 0
-                return True
-            return False
+    @property
+    def state(self) -> str:
+        state = self.backend.read(self.name) or _initial()
+        if state["state"] == OPEN and self.clock() - state["since"] >= self.reset_timeout_s:
+            return HALF_OPEN
+        return state["state"]
 
-        return True
+    def failure_stats(self) -> tuple[int, int]:
+        """``(calls, failures)`` currently inside the window."""
+
+        state = self.backend.read(self.name) or _initial()
+        buckets = self._live_buckets(state, self.clock())
+        return sum(b[1] + b[2] for b in buckets), sum(b[2] for b in buckets)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. Half-open admits limited probes."""
+
+        current = self.backend.read(self.name)
+        if current is None or current["state"] == CLOSED:
+            return True
+        return self._update(self._allow)
 
     def record_success(self) -> None:
-        if self.state == "half_open":
-            self.successes += 1
-            if self.successes >= self.half_open_success:
-                self.state = "closed"
-                self.failures = 0
-        else:
-            self.failures = 0
+        self._update(lambda s, moved: self._record(s, moved, ok=True))
 
     def record_failure(self) -> None:
-        self.failures += 1
-        if self.failures >= self.failure_threshold:
-            self.state = "open"
-            self.opened_at = time.time()
+        self._update(lambda s, moved: self._record(s, moved, ok=False))
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run *fn* through the breaker, raising :class:`CircuitOpenError` if open."""
+
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def __call__(self, fn: Callable[..., T]) -> Callable[..., T]:
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            return self.call(fn, *args, **kwargs)
+
+        return wrapper
+
+    def reset(self) -> None:
+        self.backend.reset(self.name)
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(STATE_CODES[CLOSED])
+
+    # -- transitions (run atomically by the backend) -----------------------
+
+    def _update(self, fn: Callable[[State | None, list[str]], tuple[State, T]]) -> T:
+        # The backend may re-run *fn* on a write conflict, so transitions
+        # are collected per attempt and only exported once it commits.
+        moved: list[str] = []
+
+        def attempt(current: State | None) -> tuple[State, T]:
+            moved.clear()
+            return fn(current, moved)
+
+        result = self.backend.update(self.name, attempt)
+        for to in moved:
+            CIRCUIT_BREAKER_STATE.labels(self.name).set(STATE_CODES[to])
+            CIRCUIT_BREAKER_TRANSITIONS.labels(self.name, to).inc()
+        return result
+
+    def _bucket_width(self) -> float:
+        return self.window_s / WINDOW_BUCKETS
+
+    def _live_buckets(self, state: State, now: float) -> list[list[float]]:
+        oldest = int(now // self._bucket_width()) - WINDOW_BUCKETS
+        return [b for b in state["buckets"] if b[0] > oldest]
+
+    @staticmethod
+    def _move(state: State, to: str, now: float, moved: list[str]) -> State:
+        state.update(state=to, since=now, probes=0, successes=0)
+        if to != OPEN:
+            state["buckets"] = []
+        moved.append(to)
+        return state
+
+    def _allow(self, current: State | None, moved: list[str]) -> tuple[State, bool]:
+        state = current or _initial()
+        now = self.clock()
+        if state["state"] == CLOSED:
+            return state, True
+        if now - state["since"] >= self.reset_timeout_s:
+            # Open long enough, or half-open probes never reported back.
+            state = self._move(state, HALF_OPEN, now, moved)
+        if state["state"] == OPEN or state["probes"] >= self.half_open_success:
+            return state, False
+        state["probes"] += 1
+        return state, True
+
+    def _record(self, current: State | None, moved: list[str], *, ok: bool) -> tuple[State, None]:
+        state = current or _initial()
+        now = self.clock()
+        if state["state"] == OPEN:
+            # Late result of a call admitted before the breaker opened.
+            return state, None
+        if state["state"] == HALF_OPEN:
+            if not ok:
+                return self._move(state, OPEN, now, moved), None
+            state["successes"] += 1
+            if state["successes"] >= self.half_open_success:
+                state = self._move(state, CLOSED, now, moved)
+            return state, None
+
+        index = int(now // self._bucket_width())
+        buckets = self._live_buckets(state, now)
+        if buckets and buckets[-1][0] == index:
+            buckets[-1][1 if ok else 2] += 1
+        else:
+            buckets.append([index, int(ok), int(not ok)])
+        state["buckets"] = buckets
+        calls = sum(b[1] + b[2] for b in buckets)
+        failures = sum(b[2] for b in buckets)
+        if not ok and calls >= self.min_calls and failures / calls >= self.failure_rate:
+            state = self._move(state, OPEN, now, moved)
+        return state, None
 
 
 _breakers: dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
 
+def get_breaker(name: str, **options: Any) -> CircuitBreaker:
+    """Process-wide breaker *name*; *options* apply on first creation only."""
 
-def get_breaker(name: str) -> CircuitBreaker:
-    if name not in _breakers:
-        _breakers[name] = CircuitBreaker(name=name)
-    return _breakers[name]
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **options)
+        return breaker
@@ -17,6 +17,7 @@ from erp.models import (
     UserMFA,
 )
 from erp.security_decorators_phase2 import require_permission
+from erp.security_principal import invalidate_principal
 from erp.services.client_auth_utils import set_password
 from erp.services.mfa_service import (
     disable_mfa,
@@ -103,6 +104,7 @@ def deactivate_user(user_id: int):
     user.is_active = False
     revoke_all_sessions_for_user(user_id, getattr(current_user, "id", None))
     db.session.commit()
+    invalidate_principal(user_id)
     return jsonify({"status": "deactivated"}), HTTPStatus.OK
 
 
@@ -112,6 +114,7 @@ def reactivate_user(user_id: int):
     user = User.query.get_or_404(user_id)
     user.is_active = True
     db.session.commit()
+    invalidate_principal(user_id)
     return jsonify({"status": "reactivated"}), HTTPStatus.OK
 
 
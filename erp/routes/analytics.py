@@ -10,6 +10,7 @@ from flask import Blueprint, jsonify, render_template, request
 from sqlalchemy import func
 
 from erp.analytics import DemandForecaster
+from erp.db_routing import replica_reads, use_replica
 from erp.extensions import db
 from erp.models import (
     ActivityEvent,
@@ -28,6 +29,7 @@ from erp.utils import resolve_org_id, utc_now
 bp = Blueprint("analytics", __name__, url_prefix="/analytics")
 
 
+@replica_reads
 def _monthly_sales(org_id: int) -> list[dict[str, float | str]]:
     """Aggregate sales totals by month for dashboard visualisations."""
 
@@ -283,54 +285,56 @@ def _generate_recommendations(org_id: int, scorecards: list[dict[str, object]]):
 def fetch_kpis(org_id: int) -> dict[str, object]:
     """Return live KPIs sourced from the relational models."""
 
-    pending_orders = (
-        Order.query.filter_by(organization_id=org_id, status="pending").count()
-    )
-    open_tickets = (
-        MaintenanceTicket.query.filter_by(org_id=org_id, status="open").count()
-    )
-    low_stock = (
-        Inventory.query.filter(
-            Inventory.org_id == org_id,
-            Inventory.quantity <= 5,
-        ).count()
-    )
-    pipeline_value = (
-        db.session.query(func.coalesce(func.sum(CrmLead.potential_value), 0))
-        .filter(CrmLead.org_id == org_id, CrmLead.status.in_(["qualified", "won"]))
-        .scalar()
-    )
+    # Live aggregates are replica-safe; scorecards and recommendations write.
+    with use_replica():
+        pending_orders = (
+            Order.query.filter_by(organization_id=org_id, status="pending").count()
+        )
+        open_tickets = (
+            MaintenanceTicket.query.filter_by(org_id=org_id, status="open").count()
+        )
+        low_stock = (
+            Inventory.query.filter(
+                Inventory.org_id == org_id,
+                Inventory.quantity <= 5,
+            ).count()
+        )
+        pipeline_value = (
+            db.session.query(func.coalesce(func.sum(CrmLead.potential_value), 0))
+            .filter(CrmLead.org_id == org_id, CrmLead.status.in_(["qualified", "won"]))
+            .scalar()
+        )
 
-    geo_hotspots = (
-        db.session.query(AnalyticsEvent.location_label, func.count())
-        .filter(
-            AnalyticsEvent.org_id == org_id,
-            AnalyticsEvent.location_label.isnot(None),
+        geo_hotspots = (
+            db.session.query(AnalyticsEvent.location_label, func.count())
+            .filter(
+                AnalyticsEvent.org_id == org_id,
+                AnalyticsEvent.location_label.isnot(None),
+            )
+            .group_by(AnalyticsEvent.location_label)
+            .order_by(func.count().desc())
+            .limit(10)
+            .all()
         )
-        .group_by(AnalyticsEvent.location_label)
-        .order_by(func.count().desc())
-        .limit(10)
-        .all()
-    )
 
-    avg_resolution_hours, sla_ratio = _ticket_resolution_stats(org_id)
+        avg_resolution_hours, sla_ratio = _ticket_resolution_stats(org_id)
 
-    total_leads = CrmLead.query.filter(CrmLead.org_id == org_id).count()
-    won_leads = (
-        CrmLead.query.filter(CrmLead.org_id == org_id, CrmLead.status == "won").count()
-    )
-    conversion_rate = float(won_leads / total_leads) if total_leads else 0.0
-
-    last_day = utc_now() - timedelta(hours=24)
-    automation_events = (
-        db.session.query(func.count(AnalyticsEvent.id))
-        .filter(
-            AnalyticsEvent.org_id == org_id,
-            AnalyticsEvent.metric.in_(["automation", "bot_trigger"]),
-            AnalyticsEvent.captured_at >= last_day,
+        total_leads = CrmLead.query.filter(CrmLead.org_id == org_id).count()
+        won_leads = (
+            CrmLead.query.filter(CrmLead.org_id == org_id, CrmLead.status == "won").count()
         )
-        .scalar()
-    ) or 0
+        conversion_rate = float(won_leads / total_leads) if total_leads else 0.0
+
+        last_day = utc_now() - timedelta(hours=24)
+        automation_events = (
+            db.session.query(func.count(AnalyticsEvent.id))
+            .filter(
+                AnalyticsEvent.org_id == org_id,
+                AnalyticsEvent.metric.in_(["automation", "bot_trigger"]),
+                AnalyticsEvent.captured_at >= last_day,
+            )
+            .scalar()
+        ) or 0
 
     scorecards = _scorecards(org_id)
     recommendations = _generate_recommendations(org_id, scorecards)
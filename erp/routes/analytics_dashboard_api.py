@@ -7,6 +7,7 @@ from typing import Dict
 from flask import Blueprint, jsonify, request
 from sqlalchemy import func, or_
 
+from erp.db_routing import replica_reads
 from erp.extensions import db
 from erp.models import (
     BotJobOutbox,
@@ -22,6 +23,7 @@ bp = Blueprint("analytics_dashboard_api", __name__, url_prefix="/api/analytics-d
 
 @bp.get("/operations")
 @require_permission("analytics", "view")
+@replica_reads
 def operations_summary():
     org_id = resolve_org_id()
 
@@ -66,6 +68,7 @@ def operations_summary():
 
 @bp.get("/bot-activity")
 @require_permission("analytics", "view")
+@replica_reads
 def bot_activity():
     org_id = resolve_org_id()
 
@@ -94,6 +97,7 @@ def bot_activity():
 
 @bp.get("/executive")
 @require_permission("analytics", "view")
+@replica_reads
 def executive_summary():
     org_id = resolve_org_id()
 
@@ -1,18 +1,22 @@
 """Bank reconciliation endpoints including imports and auto-matching."""
 from __future__ import annotations
 
+import os
 from datetime import date, datetime
 from decimal import Decimal
 from http import HTTPStatus
 from typing import Any
+from uuid import uuid4
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_login import current_user
 from sqlalchemy.orm import joinedload
 
+from erp.banking.statement_import import FORMATS, detect_format, run_import
 from erp.extensions import db
 from erp.models import (
     BankStatement,
+    BankStatementImport,
     BankStatementLine,
     GLJournalEntry,
     GLJournalLine,
@@ -33,9 +37,16 @@ def _parse_decimal(value: Any) -> Decimal:
 @bp.post("/bank-statements/import")
 @require_roles("finance", "admin")
 def import_bank_statement():
-    """Import a bank statement (manual upload or API)."""
+    """Import a bank statement (manual upload or API).
+
+    A multipart ``file`` (CSV, MT940 or CAMT.053) is stored and streamed
+    through :mod:`erp.banking.statement_import`; otherwise the JSON body
+    carries the lines directly.
+    """
 
     org_id = resolve_org_id()
+    if "file" in request.files:
+        return _import_statement_file(org_id)
     payload = request.get_json(silent=True) or {}
 
     bank_account_code = (payload.get("bank_account_code") or "").strip()
@@ -79,6 +90,82 @@ def import_bank_statement():
     return jsonify({"statement_id": stmt.id}), HTTPStatus.CREATED
 
 
+def _import_statement_file(org_id: int):
+    upload = request.files["file"]
+    form = request.form
+    bank_account_code = (form.get("bank_account_code") or "").strip()
+    if not bank_account_code:
+        return jsonify({"error": "bank_account_code is required"}), HTTPStatus.BAD_REQUEST
+
+    head = upload.stream.read(512)
+    upload.stream.seek(0)
+    file_format = (form.get("format") or detect_format(upload.filename or "", head)).lower()
+    if file_format not in FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), HTTPStatus.BAD_REQUEST
+    try:
+        period_start = date.fromisoformat(form["period_start"]) if form.get("period_start") else None
+        period_end = date.fromisoformat(form["period_end"]) if form.get("period_end") else None
+    except ValueError:
+        return jsonify({"error": "period dates must be YYYY-MM-DD"}), HTTPStatus.BAD_REQUEST
+
+    directory = current_app.config.get("BANK_IMPORT_DIR") or os.path.join(current_app.instance_path, "bank_imports")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid4().hex}.{file_format}")
+    upload.save(path)
+
+    # Period and balances are placeholders until the file has been read.
+    today = date.today()
+    stmt = BankStatement(
+        org_id=org_id,
+        bank_account_code=bank_account_code,
+        currency=(form.get("currency") or "ETB").upper(),
+        period_start=period_start or today,
+        period_end=period_end or today,
+        opening_balance=Decimal("0"),
+        closing_balance=Decimal("0"),
+        source=(form.get("source") or "UPLOAD").upper(),
+        external_reference=(form.get("external_reference") or "").strip() or None,
+        created_by_id=getattr(current_user, "id", None),
+        statement_date=period_end or today,
+    )
+    db.session.add(stmt)
+    db.session.flush()
+    record = BankStatementImport(
+        org_id=org_id,
+        statement_id=stmt.id,
+        file_format=file_format,
+        filename=(upload.filename or "")[:255] or None,
+        file_path=path,
+        period_start=period_start,
+        period_end=period_end,
+        bytes_total=os.path.getsize(path),
+        created_by_id=getattr(current_user, "id", None),
+    )
+    db.session.add(record)
+    db.session.commit()
+
+    if record.bytes_total <= current_app.config.get("BANK_IMPORT_INLINE_BYTES", 1024 * 1024):
+        run_import(record.id)
+        return jsonify({"statement_id": stmt.id, "import": record.to_dict()}), HTTPStatus.CREATED
+
+    from erp.tasks.bank_import import process_statement_import
+
+    try:
+        process_statement_import.delay(record.id)
+    except Exception:
+        process_statement_import.run(record.id)
+    return jsonify({"statement_id": stmt.id, "import": record.to_dict()}), HTTPStatus.ACCEPTED
+
+
+@bp.get("/bank-statements/imports/<int:import_id>")
+@require_roles("finance", "admin")
+def statement_import_status(import_id: int):
+    """Progress and per-line errors of a statement file import."""
+
+    record = BankStatementImport.query.filter_by(org_id=resolve_org_id(), id=import_id).first_or_404()
+    return jsonify(record.to_dict())
+
+
 @bp.post("/bank-statements/<int:statement_id>/auto-match")
 @require_roles("finance", "admin")
 def auto_match(statement_id: int):
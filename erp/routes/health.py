@@ -30,6 +30,15 @@ def healthz():
     return jsonify({"status": "ok" if ok else "error", "ok": ok, "checks": results}), status_code
 
 
+@bp.get("/livez")
+@bp.get("/health/live")
+def livez():
+    """Cheap liveness probe: only checks registered with ``liveness=True``."""
+    ok, results = health_registry.liveness()
+    status_code = HTTPStatus.OK if ok else HTTPStatus.SERVICE_UNAVAILABLE
+    return jsonify({"status": "ok" if ok else "error", "alive": ok, "checks": results}), status_code
+
+
 @bp.get("/health/ready")
 def health_ready():
     ok, results = _response_from_registry()
@@ -2,15 +2,22 @@
 
 from __future__ import annotations
 
+import csv
+import io
+import json
+import uuid
 from datetime import UTC, date, datetime, timedelta
 from decimal import Decimal
 from http import HTTPStatus
+from itertools import islice
 from typing import Any
 
 from flask import Blueprint, jsonify, request
 from flask_login import current_user
+from sqlalchemy import func, insert, select
 
 from erp.extensions import db
+from erp.inventory.fefo import EXPIRY_PAGE, expiring_page, fefo_pick_list
 from erp.inventory.models import (
     CycleCount,
     CycleCountLine,
@@ -18,9 +25,11 @@ from erp.inventory.models import (
     Lot,
     ReorderRule,
     StockBalance,
+    StockLedgerEntry,
     Warehouse,
 )
 from erp.security import require_roles
+from erp.services.stock_posting import StockMovement, post_movements
 from erp.services.stock_service import adjust_stock
 from erp.utils import resolve_org_id
 
@@ -160,26 +169,168 @@ def create_lot():
 @bp.get("/lots/expiring")
 @require_roles("inventory", "admin")
 def expiring_lots():
+    """Lots expiring within ``days``, one page per call.
+
+    The next page is requested with the cursor returned in ``X-Next-Cursor``.
+    """
     org_id = resolve_org_id()
-    days = int(request.args.get("days", "90"))
+    try:
+        days = int(request.args.get("days", "90"))
+        limit = max(1, min(int(request.args.get("limit", EXPIRY_PAGE)), EXPIRY_PAGE))
+    except ValueError:
+        return jsonify({"error": "days and limit must be integers"}), HTTPStatus.BAD_REQUEST
     cutoff = date.today() + timedelta(days=days)
-    lots = (
-        Lot.query.filter(
-            Lot.org_id == org_id,
-            Lot.is_active.is_(True),
-            Lot.expiry.isnot(None),
-            Lot.expiry <= cutoff,
-        )
-        .order_by(Lot.expiry.asc())
-        .limit(500)
-        .all()
+    try:
+        lots, next_cursor = expiring_page(org_id, cutoff, after=request.args.get("cursor"), limit=limit)
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), HTTPStatus.BAD_REQUEST
+    resp = jsonify([_serialize_lot(l) for l in lots])
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp, HTTPStatus.OK
+
+
+@bp.post("/pick-lists/fefo")
+@require_roles("inventory", "admin")
+def fefo_pick_list_api():
+    """First-expired-first-out lot picks for an order's lines."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        warehouse_id = _uuid_or_none(payload.get("warehouse_id"))
+        lines = [
+            (uuid.UUID(str(line["item_id"])), _parse_decimal(line.get("qty")))
+            for line in payload.get("lines") or []
+        ]
+    except (KeyError, ValueError, ArithmeticError):
+        return jsonify({"error": "lines need an item_id UUID and a numeric qty"}), HTTPStatus.BAD_REQUEST
+    if not lines:
+        return jsonify({"error": "lines are required"}), HTTPStatus.BAD_REQUEST
+
+    picks = fefo_pick_list(resolve_org_id(), lines, warehouse_id=warehouse_id)
+    return (
+        jsonify(
+            {
+                "lines": [
+                    {
+                        "item_id": str(line.item_id),
+                        "requested": str(line.requested),
+                        "shortfall": str(line.shortfall),
+                        "picks": [
+                            {
+                                "lot_id": str(pick["lot_id"]),
+                                "lot_number": pick["lot_number"],
+                                "expiry_date": pick["expiry"].isoformat() if pick["expiry"] else None,
+                                "warehouse_id": str(pick["warehouse_id"]),
+                                "qty": str(pick["qty"]),
+                            }
+                            for pick in line.picks
+                        ],
+                    }
+                    for line in picks
+                ]
+            }
+        ),
+        HTTPStatus.OK,
     )
-    return jsonify([_serialize_lot(l) for l in lots]), HTTPStatus.OK
 
 
 # ---------------------------------------------------------------------------
 # Cycle counts
 # ---------------------------------------------------------------------------
+
+CYCLE_COUNT_CHUNK = 1000
+
+
+def _uuid_or_none(value: Any) -> uuid.UUID | None:
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+class _SystemQuantities:
+    """System quantities for one warehouse, fetched once per count.
+
+    Lines without location/lot compare against the warehouse balance; lines
+    naming a location or lot compare against the ledger total for that
+    (item, location, lot). Each source is loaded with a single query the
+    first time it is needed.
+    """
+
+    def __init__(self, org_id: int, warehouse_id: Any):
+        self.org_id = org_id
+        self.warehouse_id = _uuid_or_none(warehouse_id)
+        self._totals: dict[uuid.UUID, Decimal] | None = None
+        self._detail: dict[tuple, Decimal] | None = None
+
+    def get(self, item_id, location_id, lot_id) -> Decimal:
+        if location_id is None and lot_id is None:
+            if self._totals is None:
+                rows = db.session.execute(
+                    select(StockBalance.item_id, StockBalance.qty_on_hand).where(
+                        StockBalance.org_id == self.org_id,
+                        StockBalance.warehouse_id == self.warehouse_id,
+                    )
+                )
+                self._totals = {item: Decimal(qty or 0) for item, qty in rows}
+            return self._totals.get(item_id, Decimal("0"))
+        if self._detail is None:
+            rows = db.session.execute(
+                select(
+                    StockLedgerEntry.item_id,
+                    StockLedgerEntry.location_id,
+                    StockLedgerEntry.lot_id,
+                    func.sum(StockLedgerEntry.quantity_delta),
+                )
+                .where(
+                    StockLedgerEntry.org_id == self.org_id,
+                    StockLedgerEntry.warehouse_id == self.warehouse_id,
+                )
+                .group_by(
+                    StockLedgerEntry.item_id,
+                    StockLedgerEntry.location_id,
+                    StockLedgerEntry.lot_id,
+                )
+            )
+            self._detail = {(i, loc, lot): Decimal(qty or 0) for i, loc, lot, qty in rows}
+        return self._detail.get((item_id, location_id, lot_id), Decimal("0"))
+
+
+class _CountLineError(ValueError):
+    def __init__(self, line_no: int, exc: Exception):
+        super().__init__(f"line {line_no}: {exc}")
+
+
+def _insert_count_lines(org_id: int, cc_id: Any, system: _SystemQuantities, numbered_raws) -> int:
+    rows = []
+    for line_no, raw in numbered_raws:
+        try:
+            item_id = _uuid_or_none(raw.get("item_id"))
+            if item_id is None:
+                raise ValueError("item_id is required")
+            location_id = _uuid_or_none(raw.get("location_id"))
+            lot_id = _uuid_or_none(raw.get("lot_id"))
+            system_qty = system.get(item_id, location_id, lot_id)
+            counted_qty = _parse_decimal(raw.get("counted_qty"), default=str(system_qty))
+        except (ValueError, KeyError, AttributeError, ArithmeticError) as exc:
+            raise _CountLineError(line_no, exc) from exc
+        rows.append(
+            {
+                "id": uuid.uuid4(),
+                "org_id": org_id,
+                "cycle_count_id": cc_id,
+                "item_id": item_id,
+                "lot_id": lot_id,
+                "location_id": location_id,
+                "system_qty": system_qty,
+                "counted_qty": counted_qty,
+                "variance": counted_qty - system_qty,
+            }
+        )
+    if rows:
+        db.session.execute(insert(CycleCountLine), rows)
+    return len(rows)
+
+
 @bp.post("/cycle-counts")
 @require_roles("inventory", "admin")
 def create_cycle_count():
@@ -190,8 +341,8 @@ def create_cycle_count():
 
     cc = CycleCount(
         org_id=org_id,
-        warehouse_id=payload["warehouse_id"],
-        location_id=payload.get("location_id"),
+        warehouse_id=_uuid_or_none(payload["warehouse_id"]),
+        location_id=_uuid_or_none(payload.get("location_id")),
         status="open",
         counted_by_id=getattr(current_user, "id", None),
         created_at=datetime.now(UTC),
@@ -199,31 +350,65 @@ def create_cycle_count():
     db.session.add(cc)
     db.session.flush()
 
-    for raw in payload.get("lines", []):
-        bal = StockBalance.query.filter_by(
-            org_id=org_id,
-            item_id=raw.get("item_id"),
-            warehouse_id=payload["warehouse_id"],
-            location_id=raw.get("location_id"),
-            lot_id=raw.get("lot_id"),
-        ).first()
-        system_qty = Decimal(bal.qty_on_hand) if bal else Decimal("0")
-        counted_qty = _parse_decimal(raw.get("counted_qty"), default=str(system_qty))
-        line = CycleCountLine(
-            org_id=org_id,
-            cycle_count_id=cc.id,
-            item_id=raw.get("item_id"),
-            lot_id=raw.get("lot_id"),
-            location_id=raw.get("location_id"),
-            system_qty=system_qty,
-            counted_qty=counted_qty,
-            variance=counted_qty - system_qty,
-        )
-        db.session.add(line)
+    system = _SystemQuantities(org_id, cc.warehouse_id)
+    lines = payload.get("lines", [])
+    try:
+        for start in range(0, len(lines), CYCLE_COUNT_CHUNK):
+            chunk = enumerate(lines[start : start + CYCLE_COUNT_CHUNK], start + 1)
+            _insert_count_lines(org_id, cc.id, system, chunk)
+    except _CountLineError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), HTTPStatus.BAD_REQUEST
     db.session.commit()
     return jsonify({"id": str(cc.id), "status": cc.status}), HTTPStatus.CREATED
 
 
+@bp.post("/cycle-counts/<uuid:cc_id>/lines/import")
+@require_roles("inventory", "admin")
+def import_cycle_count_lines(cc_id):
+    """Stream count lines (CSV or NDJSON) from a scanner dump into an open count.
+
+    The body is read incrementally and inserted in chunks; columns/keys are
+    ``item_id``, ``location_id``, ``lot_id`` and ``counted_qty``.
+    """
+    org_id = resolve_org_id()
+    cc = CycleCount.query.filter_by(org_id=org_id, id=cc_id).first_or_404()
+    if cc.status != "open":
+        return jsonify({"error": "cycle count not open"}), HTTPStatus.BAD_REQUEST
+
+    fmt = (request.args.get("format") or request.mimetype or "").lower()
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+    if "csv" in fmt:
+        records = csv.DictReader(stream)
+    elif "json" in fmt:
+        records = (json.loads(raw) for raw in stream if raw.strip())
+    else:
+        return jsonify({"error": "send text/csv or application/x-ndjson"}), HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+    system = _SystemQuantities(org_id, cc.warehouse_id)
+    imported = read = 0
+
+    def numbered():
+        nonlocal read
+        for raw in records:
+            read += 1
+            yield read, raw
+
+    lines = numbered()
+    try:
+        while chunk := list(islice(lines, CYCLE_COUNT_CHUNK)):
+            imported += _insert_count_lines(org_id, cc.id, system, chunk)
+    except _CountLineError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), HTTPStatus.BAD_REQUEST
+    except (ValueError, KeyError, ArithmeticError) as exc:
+        # Undecodable input: the line after the last one read.
+        db.session.rollback()
+        return jsonify({"error": f"line {read + 1}: {exc}"}), HTTPStatus.BAD_REQUEST
+    db.session.commit()
+    return jsonify({"id": str(cc.id), "imported": imported}), HTTPStatus.OK
+
+
 @bp.post("/cycle-counts/<uuid:cc_id>/submit")
 @require_roles("inventory", "admin")
 def submit_cycle_count(cc_id):
@@ -246,22 +431,29 @@ def approve_cycle_count(cc_id):
     if cc.status != "submitted":
         return jsonify({"error": "cycle count not submitted"}), HTTPStatus.BAD_REQUEST
 
-    for line in cc.lines:
-        if line.variance == 0:
-            continue
-        adjust_stock(
-            org_id=org_id,
+    actor_id = getattr(current_user, "id", None)
+    movements = [
+        StockMovement(
             item_id=line.item_id,
             warehouse_id=cc.warehouse_id,
             location_id=line.location_id,
             lot_id=line.lot_id,
-            qty_delta=Decimal(line.variance),
+            delta=Decimal(line.variance),
             tx_type="cycle_count",
             reference_type="CYCLE_COUNT",
             reference_id=cc.id,
-            created_by_id=getattr(current_user, "id", None),
+            created_by_id=actor_id,
             idempotency_key=f"cc:{cc.id}:line:{line.id}",
         )
+        for line in cc.lines
+        if line.variance != 0
+    ]
+    try:
+        # Counted quantities are authoritative, so variances may go negative.
+        post_movements(org_id, movements, allow_negative=True)
+    except ValueError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), HTTPStatus.CONFLICT
 
     cc.status = "approved"
     cc.approved_at = datetime.now(UTC)
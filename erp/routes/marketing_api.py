@@ -1,21 +1,25 @@
 from __future__ import annotations
 
+import json
+import time
 from datetime import date
 from decimal import Decimal
 from http import HTTPStatus
 from typing import Any
 
-from flask import Blueprint, Response, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request
 from flask_login import current_user
-from sqlalchemy import func
 
 from erp.extensions import db
-from erp.models import MarketingCampaign, MarketingConsent, MarketingEvent, MarketingSegment
+from erp.models import MarketingCampaign, MarketingConsent, MarketingSegment
 from erp.security import require_roles
+from erp.services.campaign_stats import campaign_counts, ensure_listener, hub
 from erp.utils import resolve_org_id
 
 bp = Blueprint("marketing_api", __name__, url_prefix="/api/marketing")
 
+KEEPALIVE_SECONDS = 15.0
+
 
 def _parse_decimal(value: Any, default: str = "0") -> Decimal:
     if value is None or value == "":
@@ -185,35 +189,48 @@ def upsert_consent():
 # ---------------------------------------------------------------------------
 
 
-def _campaign_stats(org_id: int, campaign_id: int) -> dict[str, int]:
-    query = (
-        db.session.query(MarketingEvent.event_type, func.count(MarketingEvent.id))
-        .filter(MarketingEvent.org_id == org_id, MarketingEvent.campaign_id == campaign_id)
-        .group_by(MarketingEvent.event_type)
-    )
-    return {etype: int(count) for etype, count in query.all()}
-
-
 @bp.get("/campaigns/<int:campaign_id>/stats")
 @require_roles("marketing", "admin")
 def campaign_stats(campaign_id: int):
     org_id = resolve_org_id()
-    counts = _campaign_stats(org_id, campaign_id)
+    counts = campaign_counts(org_id, campaign_id)
+    db.session.commit()
     return jsonify(counts), HTTPStatus.OK
 
 
 @bp.get("/campaigns/<int:campaign_id>/stats/stream")
 @require_roles("marketing", "admin")
 def stream_campaign_stats(campaign_id: int):
+    """SSE fallback for the ``/marketing`` Socket.IO feed.
+
+    Sends the counts, then again only after events for the campaign are
+    committed (at most once per ``interval`` seconds), with a keep-alive
+    comment while idle.
+    """
+
     org_id = resolve_org_id()
-    interval = int(request.args.get("interval", "5"))
+    interval = max(float(request.args.get("interval", "5")), 0.5)
+    key = (org_id, campaign_id)
+    app = current_app._get_current_object()
+    ensure_listener()
 
     def gen():
+        seen = hub.version(key)
+        with app.app_context():
+            counts = campaign_counts(org_id, campaign_id)
+            db.session.commit()
+            db.session.remove()
+        yield f"data: {json.dumps(counts)}\n\n"
         while True:
-            counts = _campaign_stats(org_id, campaign_id)
-            yield f"data: {counts}\n\n"
-            import time
-
+            current = hub.wait(key, seen, timeout=KEEPALIVE_SECONDS)
+            if current == seen:
+                yield ": keep-alive\n\n"
+                continue
+            seen = current
+            with app.app_context():
+                counts = campaign_counts(org_id, campaign_id)
+                db.session.remove()
+            yield f"data: {json.dumps(counts)}\n\n"
             time.sleep(interval)
 
     return Response(gen(), mimetype="text/event-stream")
@@ -10,9 +10,15 @@ from flask import Blueprint, jsonify, request
 from flask_login import current_user
 
 from erp.extensions import db
-from erp.models import Inventory, InventoryReservation, Order
+from erp.models import Order
 from erp.security_decorators_phase2 import require_permission
 from erp.security_rbac_phase2 import ensure_default_policy, is_allowed
+from erp.services.order_reservation import (
+    ReservationError,
+    aggregate_lines,
+    create_reservations,
+    reserve_stock,
+)
 from erp.utils import resolve_org_id
 
 bp = Blueprint("orders", __name__, url_prefix="/orders")
@@ -134,32 +140,24 @@ def index():
             )
 
         total = Decimal("0")
-        reservations: list[InventoryReservation] = []
+        lines: list[tuple[int, int]] = []
 
         for item in items:
-            inventory_item_id = item.get("inventory_item_id")
+            inventory_item_id = _safe_int(item.get("inventory_item_id"), 0)
             qty = _safe_int(item.get("quantity"), 0)
             unit_price = _safe_decimal(item.get("unit_price"), Decimal("0"))
             if not inventory_item_id or qty <= 0:
                 return jsonify({"error": "inventory_item_id and positive quantity required"}), HTTPStatus.BAD_REQUEST
 
-            inv = Inventory.query.filter_by(org_id=org_id, id=inventory_item_id).first()
-            if inv is None:
-                return jsonify({"error": f"inventory item {inventory_item_id} not found"}), HTTPStatus.NOT_FOUND
-
-            if inv.quantity < qty:
-                return jsonify({"error": f"insufficient stock for item {inventory_item_id}"}), HTTPStatus.CONFLICT
-
             total += unit_price * Decimal(qty)
+            lines.append((inventory_item_id, qty))
 
-            reservations.append(
-                InventoryReservation(
-                    org_id=org_id,
-                    order_id=0,  # filled after order flush
-                    inventory_item_id=inv.id,
-                    quantity=qty,
-                )
-            )
+        quantities = aggregate_lines(lines)
+        try:
+            reserve_stock(org_id, quantities)
+        except ReservationError as exc:
+            db.session.rollback()
+            return jsonify({"error": str(exc)}), exc.status
 
         order = Order(
             organization_id=org_id,
@@ -188,10 +186,7 @@ def index():
 
         db.session.add(order)
         db.session.flush()
-
-        for r in reservations:
-            r.order_id = order.id
-            db.session.add(r)
+        create_reservations(org_id, order.id, quantities)
 
         db.session.commit()
         return jsonify(_serialize(order)), HTTPStatus.CREATED
@@ -6,6 +6,7 @@ from flask_login import login_required, current_user
 from erp.security import require_roles, mfa_required
 from sqlalchemy import func
 
+from erp.db_routing import replica_reads
 from erp.extensions import db
 from erp.models import (
     AnalyticsEvent,
@@ -33,6 +34,7 @@ def builder_view():
 @login_required
 @require_roles("admin", "analytics", "management")
 @mfa_required
+@replica_reads
 def run_report():
     org_id = resolve_org_id()
     payload = request.get_json(silent=True) or {}
@@ -236,7 +236,7 @@ def export_tenders_csv():
         request.args.get("sort", "due_date"), ALLOWED_SORTS, "due_date"
     )
     direction = sanitize_direction(request.args.get("dir", "asc"))
-    conn = get_db()
+    conn = get_db(replica=True)
     rows = _iter_rows(conn, _build_query(sort, direction))
     headers = [
         "id",
@@ -265,7 +265,7 @@ def export_tenders_xlsx():
         request.args.get("sort", "due_date"), ALLOWED_SORTS, "due_date"
     )
     direction = sanitize_direction(request.args.get("dir", "asc"))
-    conn = get_db()
+    conn = get_db(replica=True)
     rows = _iter_rows(conn, _build_query(sort, direction))
     headers = [
         "id",
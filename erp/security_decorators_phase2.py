@@ -8,7 +8,8 @@ from typing import Callable
 from flask import jsonify, redirect, request, url_for
 from flask_login import current_user
 
-from erp.security_rbac_phase2 import ensure_default_policy, is_allowed
+from erp.security_principal import snapshot_for
+from erp.security_rbac_phase2 import ensure_default_policy, is_allowed, is_allowed_for
 
 
 def _is_api_request() -> bool:
@@ -30,12 +31,7 @@ def require_permission(resource: str, action: str) -> Callable:
                     return jsonify({"error": "authentication_required"}), 401
                 return redirect(url_for("auth.login", next=request.url))
 
-            org_id = getattr(current_user, "org_id", None) or 1
-            roles = getattr(current_user, "roles", None) or []
             actor_id = getattr(current_user, "id", None)
-
-            ensure_default_policy(int(org_id))
-
             ctx = {
                 "actor_id": actor_id,
                 # route handlers can add more fields to ctx by setting request.rbac_ctx
@@ -44,7 +40,16 @@ def require_permission(resource: str, action: str) -> Callable:
             if isinstance(extra_ctx, dict):
                 ctx.update(extra_ctx)
 
-            if not is_allowed(int(org_id), roles, resource, action, ctx):
+            snapshot = snapshot_for(current_user)
+            if snapshot is not None:
+                allowed = is_allowed_for(snapshot, resource, action, ctx)
+            else:
+                org_id = getattr(current_user, "org_id", None) or 1
+                roles = getattr(current_user, "roles", None) or []
+                ensure_default_policy(int(org_id))
+                allowed = is_allowed(int(org_id), roles, resource, action, ctx)
+
+            if not allowed:
                 payload = {
                     "error": "permission_denied",
                     "resource": resource,
@@ -55,6 +55,12 @@ def get_identity():
                 # Give a stable role so RBAC can allow/deny cleanly
                 return {"client_id": client_id, "roles": ["client"]}
 
+            from erp.security_principal import snapshot_for
+
+            snapshot = snapshot_for(current_user)
+            if snapshot is not None:
+                return {"id": snapshot.user_id, "roles": sorted(snapshot.role_names)}
+
             # Standard User session id should be numeric (or convertible)
             try:
                 user_id = int(raw_id) if raw_id is not None else int(getattr(current_user, "id", 0))
@@ -0,0 +1,295 @@
+"""Cached principal snapshots for request-time authorization.
+
+A :class:`PrincipalSnapshot` is an immutable record of everything the
+authorization layers need about a user: org, canonical roles, the role
+hierarchy closure, permission names and the policy version it was built
+against. Snapshots are built once (on login, or on the first request after
+an invalidation) with a single query and cached under
+``principal:<user_id>:v<policy_version>``.
+
+Flask-Login restores a :class:`PrincipalUser` from the snapshot, and
+Flask-Principal and the Phase-2 RBAC evaluator read roles and permissions
+from it. The only identity query left on an authenticated request is the
+``users.is_active`` check, so deactivation takes effect immediately in
+every worker. Bumping the policy version (done by
+``invalidate_policy_cache``) or calling :func:`invalidate_principal` forces
+a rebuild. Invalidation only reaches other workers through a shared cache
+backend (Redis, Memcached); with a per-process cache snapshots expire after
+``LOCAL_SNAPSHOT_TTL_SECONDS`` instead.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, NamedTuple
+
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import or_, select
+
+from erp.extensions import cache, db
+from erp.models import Permission, Role, RolePermission, User, UserRoleAssignment
+from erp.models.user_role import UserRole
+from erp.rbac.defaults import canonical_role
+
+SNAPSHOT_TTL_SECONDS = 900
+LOCAL_SNAPSHOT_TTL_SECONDS = 30
+_SHARED_CACHE_MARKERS = ("redis", "memcache")
+_VERSION_KEY = "principal:policy_version"
+_WILDCARD_ROLES = frozenset({"admin", "management"})
+
+
+@dataclass(frozen=True)
+class PrincipalSnapshot:
+    user_id: int
+    org_id: int
+    is_active: bool
+    role_names: frozenset[str]
+    roles: frozenset[str]
+    effective_roles: frozenset[str]
+    permissions: frozenset[str]
+    policy_version: int
+
+    def has_role(self, name: str) -> bool:
+        return name.strip().lower() in self.role_names
+
+    def has_permission(self, perm_name: str) -> bool:
+        """Mirror :meth:`User.has_permission` (admin/management are wildcards)."""
+
+        if self.role_names & _WILDCARD_ROLES:
+            return True
+        return perm_name.lower() in self.permissions
+
+
+class _RoleRef(NamedTuple):
+    key: str
+    name: str
+
+
+class PrincipalUser(UserMixin):
+    """``current_user`` backed by a snapshot.
+
+    Identity and role attributes are answered from the snapshot; any other
+    attribute loads the ORM ``User`` on first access and is delegated to it.
+    """
+
+    # Legacy single-role fields probed by ``erp.security``; ``User`` has
+    # neither, so answer here rather than loading the row on every check.
+    role: str | None = None
+    role_name: str | None = None
+
+    def __init__(self, snapshot: PrincipalSnapshot):
+        self.snapshot = snapshot
+        self._user: User | None = None
+
+    @property
+    def id(self) -> int:
+        return self.snapshot.user_id
+
+    @property
+    def org_id(self) -> int:
+        return self.snapshot.org_id
+
+    @property
+    def is_active(self) -> bool:
+        return self.snapshot.is_active
+
+    @property
+    def role_names(self) -> list[str]:
+        return sorted(self.snapshot.role_names)
+
+    @property
+    def roles(self) -> tuple[_RoleRef, ...]:
+        return tuple(_RoleRef(key=name, name=name) for name in self.role_names)
+
+    def get_id(self) -> str:
+        return str(self.snapshot.user_id)
+
+    def has_role(self, name: str) -> bool:
+        return self.snapshot.has_role(name)
+
+    def has_permission(self, perm_name: str) -> bool:
+        return self.snapshot.has_permission(perm_name)
+
+    def has_any_permission(self, *perm_names: str) -> bool:
+        return any(self.snapshot.has_permission(p) for p in perm_names)
+
+    @property
+    def user(self) -> User:
+        """The ORM row, loaded lazily for code that needs a persistent object."""
+
+        if self._user is None:
+            self._user = db.session.get(User, self.snapshot.user_id)
+        return self._user
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name == "snapshot":
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other: object) -> bool:
+        other_id = getattr(other, "id", None)
+        return isinstance(other, (PrincipalUser, User)) and other_id == self.id
+
+    def __hash__(self) -> int:
+        return hash(("principal", self.snapshot.user_id))
+
+
+def snapshots_enabled() -> bool:
+    try:
+        return bool(current_app.config.get("PRINCIPAL_SNAPSHOTS", True))
+    except RuntimeError:  # pragma: no cover - outside app context
+        return False
+
+
+def shared_cache() -> bool:
+    """True when ``cache`` is visible to every worker process."""
+
+    try:
+        cache_type = str(current_app.config.get("CACHE_TYPE") or "").lower()
+    except RuntimeError:  # pragma: no cover - outside app context
+        return False
+    return any(marker in cache_type for marker in _SHARED_CACHE_MARKERS)
+
+
+def snapshot_ttl() -> int:
+    return SNAPSHOT_TTL_SECONDS if shared_cache() else LOCAL_SNAPSHOT_TTL_SECONDS
+
+
+def is_user_active(user_id: int) -> bool:
+    """Read ``users.is_active`` from the database (never cached)."""
+
+    return bool(db.session.execute(select(User.is_active).where(User.id == user_id)).scalar())
+
+
+def policy_version() -> int:
+    try:
+        return int(cache.get(_VERSION_KEY) or 0)
+    except Exception:  # pragma: no cover - cache not initialised
+        return 0
+
+
+def bump_policy_version() -> int:
+    """Invalidate every cached snapshot by moving to a new policy version."""
+
+    version = policy_version() + 1
+    try:
+        cache.set(_VERSION_KEY, version, timeout=0)
+    except Exception:  # pragma: no cover - cache not initialised
+        pass
+    return version
+
+
+def _cache_key(user_id: int, version: int) -> str:
+    return f"principal:{user_id}:v{version}"
+
+
+def build_snapshot(user: User, version: int | None = None) -> PrincipalSnapshot:
+    """Resolve roles and permissions for *user* with one query."""
+
+    from erp.security_rbac_phase2 import _expand_roles_with_hierarchy
+
+    role_ids = or_(
+        Role.id.in_(select(UserRole.role_id).where(UserRole.user_id == user.id)),
+        Role.id.in_(
+            select(UserRoleAssignment.role_id).where(UserRoleAssignment.user_id == user.id)
+        ),
+    )
+    rows = db.session.execute(
+        select(Role.key, Role.name, Permission.name)
+        .select_from(Role)
+        .outerjoin(RolePermission, RolePermission.role_id == Role.id)
+        .outerjoin(Permission, Permission.id == RolePermission.permission_id)
+        .where(role_ids)
+    ).all()
+
+    role_names: set[str] = set()
+    roles: set[str] = set()
+    permissions: set[str] = set()
+    for key, name, perm in rows:
+        if name:
+            role_names.add(name.strip().lower())
+        canonical = canonical_role(key or name or "")
+        if canonical:
+            roles.add(canonical)
+        if perm:
+            permissions.add(perm.lower())
+
+    org_id = int(getattr(user, "org_id", None) or 1)
+    return PrincipalSnapshot(
+        user_id=int(user.id),
+        org_id=org_id,
+        is_active=bool(getattr(user, "is_active", True)),
+        role_names=frozenset(role_names),
+        roles=frozenset(roles),
+        effective_roles=_expand_roles_with_hierarchy(org_id, frozenset(roles)),
+        permissions=frozenset(permissions),
+        policy_version=policy_version() if version is None else version,
+    )
+
+
+def prime_snapshot(user: User) -> PrincipalSnapshot:
+    """Build and cache a snapshot for *user* (called on login)."""
+
+    version = policy_version()
+    snapshot = build_snapshot(user, version)
+    cache.set(_cache_key(snapshot.user_id, version), snapshot, timeout=snapshot_ttl())
+    return snapshot
+
+
+def get_snapshot(user_id: int) -> PrincipalSnapshot | None:
+    """Return the cached snapshot for *user_id*, building it on a miss."""
+
+    version = policy_version()
+    snapshot = cache.get(_cache_key(user_id, version))
+    if snapshot is not None:
+        return snapshot
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    return prime_snapshot(user)
+
+
+def invalidate_principal(user_id: int) -> None:
+    try:
+        cache.delete(_cache_key(user_id, policy_version()))
+    except Exception:  # pragma: no cover - cache not initialised
+        pass
+
+
+def snapshot_for(user: Any) -> PrincipalSnapshot | None:
+    """Snapshot for an authenticated user object, if one can be resolved."""
+
+    if isinstance(user, PrincipalUser):
+        return user.snapshot
+    if isinstance(user, User) and snapshots_enabled():
+        return get_snapshot(int(user.id))
+    return None
+
+
+def _on_user_logged_in(_sender, user=None, **_extra) -> None:
+    if isinstance(user, User) and snapshots_enabled():
+        prime_snapshot(user)
+
+
+def init_principal_snapshots(app) -> None:
+    from flask_login import user_logged_in
+
+    app.config.setdefault("PRINCIPAL_SNAPSHOTS", True)
+    user_logged_in.connect(_on_user_logged_in, app)
+
+
+__all__ = [
+    "PrincipalSnapshot",
+    "PrincipalUser",
+    "build_snapshot",
+    "bump_policy_version",
+    "get_snapshot",
+    "init_principal_snapshots",
+    "invalidate_principal",
+    "is_user_active",
+    "policy_version",
+    "prime_snapshot",
+    "shared_cache",
+    "snapshot_for",
+]
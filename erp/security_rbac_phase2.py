@@ -14,7 +14,7 @@ from __future__ import annotations
 from collections import deque
 from fnmatch import fnmatch
 from functools import lru_cache
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable, NamedTuple
 
 from flask import current_app
 from sqlalchemy.exc import IntegrityError
@@ -23,25 +23,56 @@ from erp.extensions import db
 from erp.models import RBACPolicy, RBACPolicyRule, RoleHierarchy
 from erp.rbac.defaults import DEFAULT_POLICY_NAME, canonical_role, iter_default_rules
 
+if TYPE_CHECKING:
+    from erp.security_principal import PrincipalSnapshot
+
+
+class _Rule(NamedTuple):
+    """Detached copy of an ``RBACPolicyRule`` safe to keep across sessions."""
+
+    role_key: str
+    resource: str
+    action: str
+    effect: str
+    condition_json: dict
+
 
 @lru_cache(maxsize=2048)
-def _load_rules(org_id: int) -> list[RBACPolicyRule]:
+def _load_rules(org_id: int) -> tuple[_Rule, ...]:
     policies: Iterable[RBACPolicy] = (
         RBACPolicy.query.filter_by(org_id=org_id, is_active=True)
         .order_by(RBACPolicy.priority.asc())
         .all()
     )
 
-    rules: list[RBACPolicyRule] = []
+    rules: list[_Rule] = []
     for policy in policies:
-        rules.extend(policy.rules)
-    return rules
+        rules.extend(
+            _Rule(
+                role_key=rule.role_key,
+                resource=rule.resource,
+                action=rule.action,
+                effect=rule.effect,
+                condition_json=rule.condition_json or {},
+            )
+            for rule in policy.rules
+        )
+    return tuple(rules)
+
+
+# Orgs whose default policy is known to exist, so snapshot-based checks can
+# skip the COUNT in ``ensure_default_policy`` on every request.
+_DEFAULTS_ENSURED: set[int] = set()
 
 
 def invalidate_policy_cache() -> None:
-    """Clear cached policy rules."""
+    """Clear cached policy rules and invalidate cached principal snapshots."""
+    from erp.security_principal import bump_policy_version
+
     _load_rules.cache_clear()
     _expand_roles_with_hierarchy.cache_clear()
+    _DEFAULTS_ENSURED.clear()
+    bump_policy_version()
 
 
 def ensure_default_policy(org_id: int) -> None:
@@ -137,9 +168,36 @@ def is_allowed(
     ensure_default_policy(int(org_id))
 
     roles = _normalize_roles(user_roles)
-    roles = set(_expand_roles_with_hierarchy(int(org_id), frozenset(roles)))
+    roles = _expand_roles_with_hierarchy(int(org_id), frozenset(roles))
+    return _evaluate(int(org_id), roles, resource, action, ctx)
+
+
+def is_allowed_for(
+    snapshot: "PrincipalSnapshot",
+    resource: str,
+    action: str,
+    ctx: dict | None = None,
+) -> bool:
+    """Evaluate rules for a cached principal snapshot without touching the DB.
+
+    The snapshot already carries canonical roles and their hierarchy
+    closure; rules come from the per-org cache.
+    """
+    org_id = int(snapshot.org_id)
+    if org_id not in _DEFAULTS_ENSURED:
+        ensure_default_policy(org_id)
+        _DEFAULTS_ENSURED.add(org_id)
+    return _evaluate(org_id, snapshot.effective_roles, resource, action, ctx or {})
 
-    rules = _load_rules(int(org_id))
+
+def _evaluate(
+    org_id: int,
+    roles: frozenset[str],
+    resource: str,
+    action: str,
+    ctx: dict,
+) -> bool:
+    rules = _load_rules(org_id)
     matched_allow = False
 
     for rule in rules:
@@ -186,4 +244,4 @@ def _conditions_met(conditions: dict, ctx: dict) -> bool:
     return True
 
 
-__all__ = ["ensure_default_policy", "invalidate_policy_cache", "is_allowed"]
+__all__ = ["ensure_default_policy", "invalidate_policy_cache", "is_allowed", "is_allowed_for"]
@@ -1,12 +1,16 @@
-"""Banking client wrapper with circuit breaker protection."""
+"""Banking client wrapper with circuit breaker protection.
+
+``BANK_BREAKER`` state is shared by every worker (see
+:mod:`erp.reliability.circuit_breaker`), so once the bank API trips it no
+process keeps sending requests until the half-open probes succeed.
+"""
 from __future__ import annotations
 
 import os
 from typing import Any
 
-import requests
-
 from erp.reliability import apply_chaos_to_external_calls, close_incident, get_breaker, open_incident
+from erp.utils import http_client
 
 BANK_BREAKER = get_breaker("banking")
 
@@ -22,11 +26,10 @@ def banking_ping(org_id: int | None = None) -> bool:
     if not url:
         return True  # no external dependency configured
 
-    apply_chaos_to_external_calls()
-
     try:
-        resp = requests.get(url, timeout=3)
-        resp.raise_for_status()
+        apply_chaos_to_external_calls()
+        # BANK_BREAKER records outcomes here, so the shared layer skips its own.
+        http_client.request("GET", url, upstream="banking", breaker=None, retry=False, timeout=3)
         BANK_BREAKER.record_success()
         close_incident(org_id, "banking")
         return True
@@ -50,15 +53,17 @@ def fetch_statement(
     if not base_url:
         return {"ok": False, "error": "bank_api_base_url_not_configured"}
 
-    apply_chaos_to_external_calls()
-
     try:
-        resp = requests.get(
+        apply_chaos_to_external_calls()
+        resp = http_client.request(
+            "GET",
             f"{base_url.rstrip('/')}/accounts/{account_id}/statement",
+            upstream="banking",
+            breaker=None,
+            retry=False,
             params=params or {},
             timeout=8,
         )
-        resp.raise_for_status()
         BANK_BREAKER.record_success()
         close_incident(org_id, "banking")
         return {"ok": True, "data": resp.json()}
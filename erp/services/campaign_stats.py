@@ -0,0 +1,403 @@
+"""Incremental campaign event counters with push delivery.
+
+Counts of ``MarketingEvent`` rows per campaign and type live in
+``marketing_campaign_stats``. A session ``after_flush`` hook bumps them in
+the same transaction that inserts or deletes events. A campaign's counters
+are seeded from one ``GROUP BY`` the first time they are read
+(``MarketingCampaign.stats_seeded_at``).
+
+After a commit that touched a campaign's events, a notice is published on
+the ``marketing:campaign_stats`` Redis channel. Without Redis it goes to
+this process only. Each process listens once and wakes its local
+subscribers through :class:`StatsHub`:
+
+* Socket.IO clients on the ``/marketing`` namespace send
+  ``subscribe_campaign_stats`` and then receive ``campaign_stats`` events.
+  A single background pump re-reads the counters of each changed campaign
+  at most once per ``CAMPAIGN_STATS_PUSH_SECONDS``, however many clients
+  watch it.
+* The legacy SSE route waits on the hub instead of re-counting events on
+  a timer.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import Counter
+from collections.abc import Iterable
+from datetime import datetime
+
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.orm import Session
+
+from erp.extensions import db
+from erp.models import MarketingCampaign, MarketingCampaignStat, MarketingEvent
+from erp.utils.upsert import upsert_counts
+
+LOGGER = logging.getLogger(__name__)
+
+CHANNEL = "marketing:campaign_stats"
+NAMESPACE = "/marketing"
+DEFAULT_PUSH_SECONDS = 1.0
+_CHANGED_KEY = "campaign_stats_changed"
+_STAT_KEYS = ("campaign_id", "event_type")
+
+CampaignKey = tuple[int, int]
+
+
+def _redis():
+    try:
+        from db import redis_client
+    except Exception:  # pragma: no cover - optional dependency
+        return None
+    return redis_client.client if getattr(redis_client, "is_real", False) else None
+
+
+# -- counters ------------------------------------------------------------------
+
+
+def _bump(connection, deltas: Counter[tuple[int, int, str]]) -> None:
+    rows = [
+        {"org_id": org_id, "campaign_id": campaign_id, "event_type": event_type, "count": n}
+        for (org_id, campaign_id, event_type), n in deltas.items()
+        if n
+    ]
+    upsert_counts(connection, MarketingCampaignStat.__table__, rows, keys=_STAT_KEYS, column="count")
+
+
+def seed_campaign_stats(org_id: int, campaign_id: int) -> bool:
+    """Set a campaign's counters to an exact count of its events, once.
+
+    Runs in the caller's transaction without committing. The campaign row
+    is locked and ``stats_seeded_at`` re-checked first, so concurrent
+    readers seed a campaign once. On PostgreSQL the lock also waits for
+    in-flight event inserts (their foreign key check shares the row), so
+    the count cannot miss an event whose bump it overwrites. Returns False
+    when the campaign was already seeded.
+    """
+
+    table = MarketingCampaignStat.__table__
+    session = db.session
+    row = session.execute(
+        select(MarketingCampaign.stats_seeded_at)
+        .where(MarketingCampaign.id == campaign_id, MarketingCampaign.org_id == org_id)
+        .with_for_update()
+    ).first()
+    if row is None or row[0] is not None:
+        return False
+    counts = session.execute(
+        select(MarketingEvent.event_type, func.count(MarketingEvent.id))
+        .where(MarketingEvent.org_id == org_id, MarketingEvent.campaign_id == campaign_id)
+        .group_by(MarketingEvent.event_type)
+    ).all()
+    session.execute(
+        delete(table).where(
+            table.c.campaign_id == campaign_id, table.c.event_type.notin_([etype for etype, _ in counts])
+        )
+    )
+    upsert_counts(
+        session,
+        table,
+        [{"org_id": org_id, "campaign_id": campaign_id, "event_type": etype, "count": int(n)} for etype, n in counts],
+        keys=_STAT_KEYS,
+        column="count",
+        replace=True,
+    )
+    session.execute(
+        update(MarketingCampaign)
+        .where(MarketingCampaign.id == campaign_id, MarketingCampaign.org_id == org_id)
+        .values(stats_seeded_at=datetime.utcnow())
+        .execution_options(synchronize_session="fetch")
+    )
+    return True
+
+
+def campaign_counts(org_id: int, campaign_id: int) -> dict[str, int]:
+    """Event counts per type for a campaign, from the counters table.
+
+    The first read of an unseeded campaign seeds it in the caller's
+    transaction; request handlers commit afterwards to keep the seed and
+    release the campaign row lock.
+    """
+
+    session = db.session
+    seeded = session.execute(
+        select(MarketingCampaign.stats_seeded_at).where(
+            MarketingCampaign.id == campaign_id, MarketingCampaign.org_id == org_id
+        )
+    ).first()
+    if seeded is None:
+        return {}
+    if seeded[0] is None:
+        seed_campaign_stats(org_id, campaign_id)
+    rows = session.execute(
+        select(MarketingCampaignStat.event_type, MarketingCampaignStat.count).where(
+            MarketingCampaignStat.org_id == org_id,
+            MarketingCampaignStat.campaign_id == campaign_id,
+            MarketingCampaignStat.count > 0,
+        )
+    )
+    return {etype: int(count) for etype, count in rows}
+
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed_events(session: Session, _context) -> None:
+    deltas: Counter[tuple[int, int, str]] = Counter()
+    for obj in session.new:
+        if isinstance(obj, MarketingEvent) and obj.campaign_id:
+            deltas[(obj.org_id, obj.campaign_id, obj.event_type)] += 1
+    for obj in session.deleted:
+        if isinstance(obj, MarketingEvent) and obj.campaign_id:
+            deltas[(obj.org_id, obj.campaign_id, obj.event_type)] -= 1
+    if not deltas:
+        return
+    _bump(session.connection(), deltas)
+    session.info.setdefault(_CHANGED_KEY, set()).update((o, c) for o, c, _ in deltas)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    for key in session.info.pop(_CHANGED_KEY, ()):
+        publish(*key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_CHANGED_KEY, None)
+
+
+# -- fan-out -------------------------------------------------------------------
+
+
+class StatsHub:
+    """Change notices for this process, with blocking waits."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._versions: Counter[CampaignKey] = Counter()
+        self._dirty: set[CampaignKey] = set()
+
+    def notify(self, key: CampaignKey) -> None:
+        with self._cond:
+            self._versions[key] += 1
+            self._dirty.add(key)
+            self._cond.notify_all()
+
+    def version(self, key: CampaignKey) -> int:
+        with self._cond:
+            return self._versions[key]
+
+    def wait(self, key: CampaignKey, seen: int, timeout: float) -> int:
+        """Block until *key* moves past version *seen* or *timeout* passes."""
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._versions[key] != seen, timeout)
+            return self._versions[key]
+
+    def take_dirty(self, timeout: float) -> set[CampaignKey]:
+        """Campaigns changed since the last call, waiting up to *timeout*."""
+
+        with self._cond:
+            self._cond.wait_for(lambda: bool(self._dirty), timeout)
+            dirty, self._dirty = self._dirty, set()
+            return dirty
+
+
+hub = StatsHub()
+_listener_lock = threading.Lock()
+_listener_started = False
+
+
+def publish(org_id: int, campaign_id: int) -> None:
+    redis = _redis()
+    if redis is not None:
+        try:
+            redis.publish(CHANNEL, f"{org_id}:{campaign_id}")
+            return
+        except Exception:
+            LOGGER.warning("campaign stats: redis publish failed, notifying locally")
+    hub.notify((org_id, campaign_id))
+
+
+def _listen(redis) -> None:
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL)
+    for message in pubsub.listen():
+        data = message.get("data")
+        data = data.decode() if isinstance(data, bytes) else str(data)
+        org_id, _, campaign_id = data.partition(":")
+        try:
+            hub.notify((int(org_id), int(campaign_id)))
+        except ValueError:
+            continue
+
+
+def ensure_listener() -> None:
+    """Start this process's Redis subscription (once)."""
+
+    global _listener_started
+    redis = _redis()
+    if redis is None or _listener_started:
+        return
+    with _listener_lock:
+        if _listener_started:
+            return
+        threading.Thread(target=_listen, args=(redis,), name="campaign-stats-listener", daemon=True).start()
+        _listener_started = True
+
+
+# -- Socket.IO delivery --------------------------------------------------------
+
+
+def _room(key: CampaignKey) -> str:
+    return f"campaign_stats:{key[0]}:{key[1]}"
+
+
+class _Subscriptions:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_sid: dict[str, set[CampaignKey]] = {}
+        self._watchers: Counter[CampaignKey] = Counter()
+
+    def add(self, sid: str, key: CampaignKey) -> None:
+        with self._lock:
+            keys = self._by_sid.setdefault(sid, set())
+            if key not in keys:
+                keys.add(key)
+                self._watchers[key] += 1
+
+    def remove(self, sid: str, keys: Iterable[CampaignKey] | None = None) -> None:
+        with self._lock:
+            held = self._by_sid.get(sid, set())
+            for key in list(held if keys is None else keys):
+                if key in held:
+                    held.discard(key)
+                    self._watchers[key] -= 1
+                    if self._watchers[key] <= 0:
+                        del self._watchers[key]
+            if not held:
+                self._by_sid.pop(sid, None)
+
+    def watched(self, keys: Iterable[CampaignKey]) -> list[CampaignKey]:
+        with self._lock:
+            return [k for k in keys if self._watchers.get(k)]
+
+
+subscriptions = _Subscriptions()
+_pump_lock = threading.Lock()
+_pump_started = False
+
+
+def push_changes(socketio, timeout: float = 0.0) -> int:
+    """Emit fresh counts for changed, watched campaigns; returns rooms pushed."""
+
+    pushed = 0
+    for key in subscriptions.watched(hub.take_dirty(timeout)):
+        socketio.emit(
+            "campaign_stats",
+            {"campaign_id": key[1], "counts": campaign_counts(*key)},
+            to=_room(key),
+            namespace=NAMESPACE,
+        )
+        pushed += 1
+    return pushed
+
+
+def _pump(socketio, app) -> None:
+    interval = float(app.config.get("CAMPAIGN_STATS_PUSH_SECONDS", DEFAULT_PUSH_SECONDS))
+    while True:
+        try:
+            with app.app_context():
+                push_changes(socketio, timeout=60.0)
+                db.session.remove()
+        except Exception:  # pragma: no cover - keep the pump alive
+            LOGGER.exception("campaign stats: push failed")
+        socketio.sleep(interval)
+
+
+def _ensure_pump(socketio, app) -> None:
+    global _pump_started
+    if _pump_started:
+        return
+    with _pump_lock:
+        if not _pump_started:
+            socketio.start_background_task(_pump, socketio, app)
+            _pump_started = True
+
+
+def _may_watch() -> bool:
+    if current_app.config.get("LOGIN_DISABLED"):
+        return True
+    from erp.security import user_has_role
+
+    user = current_user
+    return bool(getattr(user, "is_authenticated", False)) and (
+        user_has_role(user, "marketing") or user_has_role(user, "admin")
+    )
+
+
+def register_socket_handlers(socketio) -> None:
+    from flask_socketio import join_room, leave_room
+
+    from erp.utils import resolve_org_id
+
+    @socketio.on("subscribe_campaign_stats", namespace=NAMESPACE)
+    def _subscribe(data):
+        if not _may_watch():
+            return {"error": "forbidden"}
+        try:
+            key = (resolve_org_id(), int((data or {})["campaign_id"]))
+        except (KeyError, TypeError, ValueError):
+            return {"error": "campaign_id required"}
+        if MarketingCampaign.query.filter_by(org_id=key[0], id=key[1]).first() is None:
+            return {"error": "not found"}
+        join_room(_room(key))
+        subscriptions.add(request.sid, key)
+        ensure_listener()
+        _ensure_pump(socketio, current_app._get_current_object())
+        counts = campaign_counts(*key)
+        db.session.commit()
+        return {"campaign_id": key[1], "counts": counts}
+
+    @socketio.on("unsubscribe_campaign_stats", namespace=NAMESPACE)
+    def _unsubscribe(data):
+        try:
+            key = (resolve_org_id(), int((data or {})["campaign_id"]))
+        except (KeyError, TypeError, ValueError):
+            return {"error": "campaign_id required"}
+        leave_room(_room(key))
+        subscriptions.remove(request.sid, [key])
+        return {"campaign_id": key[1]}
+
+    @socketio.on("disconnect", namespace=NAMESPACE)
+    def _disconnect(*_args):
+        subscriptions.remove(request.sid)
+
+
+def init_campaign_stats(app) -> None:
+    """Wire the Socket.IO server (if installed) and stats handlers."""
+
+    app.config.setdefault("CAMPAIGN_STATS_PUSH_SECONDS", DEFAULT_PUSH_SECONDS)
+    from erp.socket import socketio
+
+    if socketio is None:
+        return
+    socketio.init_app(app)
+    if not getattr(socketio, "_campaign_stats_handlers", False):
+        register_socket_handlers(socketio)
+        socketio._campaign_stats_handlers = True
+
+
+__all__ = [
+    "NAMESPACE",
+    "StatsHub",
+    "campaign_counts",
+    "ensure_listener",
+    "hub",
+    "init_campaign_stats",
+    "publish",
+    "push_changes",
+    "seed_campaign_stats",
+]
@@ -1,28 +1,359 @@
+"""A/B variant allocation for marketing campaigns.
+
+Each campaign's active variants are compiled once into a
+:class:`VariantTable`, which holds the variant ids and the cumulative sums
+of their weights in hundredths. The table is cached under
+``marketing_ab:<org_id>:<campaign_id>:<ab_version>``. Inserting, updating
+or deleting a ``MarketingABVariant`` through the ORM replaces
+``MarketingCampaign.ab_version`` in the same transaction, so every worker
+switches to the new table as soon as the change commits, whichever cache
+backend is configured. Bulk ``UPDATE`` statements bypass mapper events and
+must call :func:`invalidate_campaign` themselves. Each process also keeps
+the table it last read for ``LOCAL_TTL_SECONDS`` without re-reading the
+version, so repeated picks make no database round trip; other workers
+pick up a change within that window.
+
+Assignment is sticky: a subject's bucket is a keyed hash of
+``(campaign_id, subject_id)``, scaled onto the total weight and looked up
+with a bisect. The same client always sees the same variant for as long
+as the campaign's active variants and weights are unchanged.
+
+Assignments are counted per variant and day in ``marketing_ab_exposures``.
+:func:`assign` writes its counts in the caller's transaction, so they are
+committed with the send that used them. Single picks are buffered per
+process and written in their own transaction by a background flusher
+every ``FLUSH_SECONDS`` (sooner after ``FLUSH_EVERY`` picks) and at
+interpreter exit.
+"""
 from __future__ import annotations
 
+import atexit
+import logging
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+from datetime import date
 from decimal import Decimal
+from hashlib import blake2b
 from random import random
+from uuid import uuid4
+
+from flask import current_app
+from sqlalchemy import event, func, select, update
+
+from erp.extensions import cache, db
+from erp.models import MarketingABExposure, MarketingABVariant, MarketingCampaign
+from erp.utils.upsert import upsert_counts
+
+LOGGER = logging.getLogger(__name__)
+
+TABLE_TTL_SECONDS = 300
+LOCAL_TTL_SECONDS = 5.0
+FLUSH_EVERY = 500
+FLUSH_SECONDS = 30.0
+_WEIGHT_SCALE = 100  # weights are Numeric(5, 2)
+
+
+@dataclass(frozen=True)
+class VariantTable:
+    """Prefix sums over a campaign's active variants, ordered by id."""
+
+    campaign_id: int
+    variant_ids: tuple[int, ...]
+    bounds: tuple[int, ...]
+
+    @property
+    def total(self) -> int:
+        return self.bounds[-1] if self.bounds else 0
+
+    def _salt(self) -> bytes:
+        return str(self.campaign_id).encode()
+
+    def index_for(self, subject_id: int | str) -> int:
+        if self.total <= 0:
+            return 0
+        digest = blake2b(str(subject_id).encode(), digest_size=8, key=self._salt()).digest()
+        return bisect_right(self.bounds, (int.from_bytes(digest, "big") * self.total) >> 64)
+
+    def variant_for(self, subject_id: int | str) -> int | None:
+        return self.variant_ids[self.index_for(subject_id)] if self.variant_ids else None
+
+    def variants_for(self, subject_ids: Iterable[int | str]) -> Iterator[int]:
+        """Variant id per subject, in order (hot loop for bulk sends)."""
+
+        if not self.variant_ids:
+            return
+        ids, bounds, total = self.variant_ids, self.bounds, self.total
+        if total <= 0:
+            for _ in subject_ids:
+                yield ids[0]
+            return
+        salt = self._salt()
+        for subject_id in subject_ids:
+            h = int.from_bytes(blake2b(str(subject_id).encode(), digest_size=8, key=salt).digest(), "big")
+            yield ids[bisect_right(bounds, (h * total) >> 64)]
+
+    def random_variant(self) -> int | None:
+        if not self.variant_ids:
+            return None
+        if self.total <= 0:
+            return self.variant_ids[0]
+        return self.variant_ids[bisect_right(self.bounds, int(random() * self.total))]
+
+
+def build_table(org_id: int, campaign_id: int) -> VariantTable:
+    rows = db.session.execute(
+        select(MarketingABVariant.id, MarketingABVariant.weight)
+        .where(
+            MarketingABVariant.org_id == org_id,
+            MarketingABVariant.campaign_id == campaign_id,
+            MarketingABVariant.is_active.is_(True),
+        )
+        .order_by(MarketingABVariant.id)
+    ).all()
+    bounds: list[int] = []
+    running = 0
+    for _id, weight in rows:
+        running += max(int(Decimal(weight or 0) * _WEIGHT_SCALE), 0)
+        bounds.append(running)
+    return VariantTable(campaign_id=campaign_id, variant_ids=tuple(r[0] for r in rows), bounds=tuple(bounds))
+
+
+_local_tables: dict[tuple[int, int], tuple[float, VariantTable]] = {}
+
+
+def _cache_key(org_id: int, campaign_id: int, version: str | None) -> str:
+    return f"marketing_ab:{org_id}:{campaign_id}:{version or '0'}"
+
+
+def variant_table(org_id: int, campaign_id: int) -> VariantTable:
+    """Cached :class:`VariantTable` for a campaign, built on a miss."""
+
+    local = _local_tables.get((org_id, campaign_id))
+    if local is not None and local[0] > time.monotonic():
+        return local[1]
+    version = db.session.execute(
+        select(MarketingCampaign.ab_version).where(
+            MarketingCampaign.id == campaign_id, MarketingCampaign.org_id == org_id
+        )
+    ).scalar()
+    key = _cache_key(org_id, campaign_id, version)
+    try:
+        table = cache.get(key)
+    except Exception:  # pragma: no cover - cache not initialised
+        table = None
+    if table is None:
+        table = build_table(org_id, campaign_id)
+        try:
+            cache.set(key, table, timeout=TABLE_TTL_SECONDS)
+        except Exception:  # pragma: no cover - cache not initialised
+            pass
+    _local_tables[(org_id, campaign_id)] = (time.monotonic() + LOCAL_TTL_SECONDS, table)
+    return table
+
+
+def _new_version(campaign_id: int):
+    return (
+        update(MarketingCampaign.__table__)
+        .where(MarketingCampaign.__table__.c.id == campaign_id)
+        .values(ab_version=uuid4().hex)
+    )
+
+
+def invalidate_campaign(org_id: int, campaign_id: int) -> None:
+    """Retire the campaign's cached table (takes effect when the session commits)."""
+
+    db.session.execute(_new_version(campaign_id).where(MarketingCampaign.__table__.c.org_id == org_id))
+    _local_tables.pop((org_id, campaign_id), None)
+
+
+def _variant_changed(_mapper, connection, target: MarketingABVariant) -> None:
+    connection.execute(_new_version(target.campaign_id))
+    _local_tables.pop((target.org_id, target.campaign_id), None)
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(MarketingABVariant, _event_name, _variant_changed)
+
+
+# -- exposure counts -----------------------------------------------------------
 
-from erp.models import MarketingABVariant
 
+class _ExposureBuffer:
+    """Per-process assignment counts, written in batches."""
 
-def pick_variant(org_id: int, campaign_id: int) -> MarketingABVariant | None:
-    variants = (
-        MarketingABVariant.query.filter_by(
-            org_id=org_id, campaign_id=campaign_id, is_active=True
-        ).all()
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Counter[tuple[int, int, int, date]] = Counter()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, org_id: int, campaign_id: int, variant_id: int, n: int = 1) -> bool:
+        """Buffer *n* assignments; returns True when a flush is due."""
+
+        with self._lock:
+            self._counts[(org_id, campaign_id, variant_id, date.today())] += n
+            self._pending += n
+            return self._pending >= FLUSH_EVERY or time.monotonic() - self._last_flush >= FLUSH_SECONDS
+
+    def drain(self) -> Counter:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        return counts
+
+    def restore(self, counts: Counter) -> None:
+        """Put back counts whose write failed, to retry on the next flush."""
+
+        with self._lock:
+            self._counts.update(counts)
+            self._pending += sum(counts.values())
+
+
+_BUFFER = _ExposureBuffer()
+_wake = threading.Event()
+_flusher_lock = threading.Lock()
+_flusher: threading.Thread | None = None
+
+
+def _write_exposures(counts: Mapping[tuple[int, int, int, date], int]) -> None:
+    rows = [
+        {"org_id": org_id, "campaign_id": campaign_id, "variant_id": variant_id, "day": day, "assignments": n}
+        for (org_id, campaign_id, variant_id, day), n in counts.items()
+        if n
+    ]
+    upsert_counts(
+        db.session, MarketingABExposure.__table__, rows, keys=("variant_id", "day"), column="assignments"
+    )
+
+
+def flush_exposures() -> int:
+    """Write buffered single-pick counts and commit them; returns rows written.
+
+    Uses ``db.session`` of the current app context, so call it outside any
+    request transaction (the background flusher and exit hook do).
+    """
+
+    counts = _BUFFER.drain()
+    if not counts:
+        return 0
+    try:
+        _write_exposures(counts)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _BUFFER.restore(counts)
+        raise
+    return len(counts)
+
+
+def _flush_in(app) -> None:
+    with app.app_context():
+        try:
+            flush_exposures()
+        except Exception:
+            LOGGER.exception("marketing A/B exposure flush failed")
+        finally:
+            db.session.remove()
+
+
+def _flush_loop(app) -> None:
+    while True:
+        _wake.wait(FLUSH_SECONDS)
+        _wake.clear()
+        _flush_in(app)
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _flusher_lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        app = current_app._get_current_object()
+        _flusher = threading.Thread(target=_flush_loop, args=(app,), name="marketing-ab-exposures", daemon=True)
+        _flusher.start()
+        atexit.register(_flush_in, app)
+
+
+def exposure_counts(org_id: int, campaign_id: int, *, since: date | None = None) -> dict[int, int]:
+    """Total assignments per variant id (buffered picks not yet flushed excluded)."""
+
+    stmt = (
+        select(MarketingABExposure.variant_id, func.sum(MarketingABExposure.assignments))
+        .where(MarketingABExposure.org_id == org_id, MarketingABExposure.campaign_id == campaign_id)
+        .group_by(MarketingABExposure.variant_id)
     )
-    if not variants:
-        return None
-
-    total = sum(Decimal(variant.weight) for variant in variants)
-    if total <= 0:
-        return variants[0]
-
-    threshold = Decimal(str(random())) * total
-    cumulative = Decimal("0")
-    for variant in variants:
-        cumulative += Decimal(variant.weight)
-        if threshold <= cumulative:
-            return variant
-    return variants[-1]
+    if since is not None:
+        stmt = stmt.where(MarketingABExposure.day >= since)
+    return {variant_id: int(total) for variant_id, total in db.session.execute(stmt)}
+
+
+# -- public API ----------------------------------------------------------------
+
+
+def pick_variant_id(
+    org_id: int, campaign_id: int, subject_id: int | str | None = None, *, record: bool = True
+) -> int | None:
+    """Variant id for *subject_id* (sticky), or a weighted random one without it.
+
+    Per-recipient sends should use this (or :func:`assign`): it does not load
+    the variant row.
+    """
+
+    table = variant_table(org_id, campaign_id)
+    variant_id = table.variant_for(subject_id) if subject_id is not None else table.random_variant()
+    if variant_id is not None and record:
+        if _BUFFER.add(org_id, campaign_id, variant_id):
+            _wake.set()
+        _ensure_flusher()
+    return variant_id
+
+
+def pick_variant(
+    org_id: int, campaign_id: int, subject_id: int | str | None = None, *, record: bool = True
+) -> MarketingABVariant | None:
+    """Like :func:`pick_variant_id`, but returns the ``MarketingABVariant`` row."""
+
+    variant_id = pick_variant_id(org_id, campaign_id, subject_id, record=record)
+    return db.session.get(MarketingABVariant, variant_id) if variant_id is not None else None
+
+
+def assign(
+    org_id: int, campaign_id: int, subject_ids: Iterable[int | str], *, record: bool = True
+) -> dict[int | str, int]:
+    """Sticky variant id for every subject, with one cache read and one write.
+
+    Subjects map to the same variants as :func:`pick_variant`. An empty dict
+    means the campaign has no active variants.
+    """
+
+    table = variant_table(org_id, campaign_id)
+    if not table.variant_ids:
+        return {}
+    subjects = subject_ids if isinstance(subject_ids, (list, tuple)) else list(subject_ids)
+    assignments = dict(zip(subjects, table.variants_for(subjects)))
+    if record:
+        today = date.today()
+        _write_exposures(
+            {(org_id, campaign_id, variant_id, today): n for variant_id, n in Counter(assignments.values()).items()}
+        )
+    return assignments
+
+
+__all__ = [
+    "VariantTable",
+    "assign",
+    "build_table",
+    "exposure_counts",
+    "flush_exposures",
+    "invalidate_campaign",
+    "pick_variant",
+    "pick_variant_id",
+    "variant_table",
+]
@@ -0,0 +1,293 @@
+"""Compile marketing segment rules into SQL and materialise membership.
+
+``matches_segment`` checks one client object at a time. This module turns
+the same ``MarketingSegment.rules_json`` into a SQLAlchemy filter, so an
+audience is one query whose ids stream back in batches.
+
+Rules are compiled against a :class:`ClientSource`. The source names the
+client table's id, org and ``updated_at`` columns and maps each rule field
+(``client_type``, ``region``, ...) to a column. By default that is
+:class:`~erp.models.core_entities.Institution`. A rule whose field the
+source cannot map is left in ``CompiledSegment.residual`` and checked
+with ``matches_segment`` on the streamed rows, so the Python evaluator
+stays the reference semantics.
+
+:func:`refresh_segment` keeps ``marketing_segment_members`` current. After
+the first full build it only re-evaluates clients whose ``updated_at`` is
+newer than the last refresh. It rebuilds from scratch when the rules
+change, or when the day changes and the rules are relative to today.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Callable, Iterator, Mapping
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Any
+
+from sqlalchemy import ColumnElement, and_, delete, false, func, insert, select, true
+from sqlalchemy.orm import Session
+
+from erp.extensions import db
+from erp.marketing.models import MarketingSegment, MarketingSegmentMember
+from erp.services.marketing_segment_eval import matches_segment
+from erp.utils.upsert import conflict_insert
+
+BATCH_SIZE = 1000
+
+# Rules whose result moves with the calendar even if the client row does not.
+DATE_RELATIVE_RULES = frozenset({"last_order_days_lte"})
+
+
+@dataclass(frozen=True)
+class ClientSource:
+    """Where segment rules are evaluated: a client table and its fields."""
+
+    id: Any
+    org_id: Any
+    updated_at: Any
+    fields: Mapping[str, Any] = field(default_factory=dict)
+
+
+def default_source() -> ClientSource:
+    from erp.models.core_entities import Institution
+
+    fields = {"client_type": Institution.institution_type, "region": Institution.region}
+    # Order metrics are not denormalised onto institutions in every
+    # deployment; rules on them fall back to Python when absent.
+    for name in ("last_order_date", "avg_monthly_spend"):
+        if hasattr(Institution, name):
+            fields[name] = getattr(Institution, name)
+    return ClientSource(
+        id=Institution.id, org_id=Institution.org_id, updated_at=Institution.updated_at, fields=fields
+    )
+
+
+# -- compiler ------------------------------------------------------------------
+
+
+def _in(column, values, _today: date) -> ColumnElement:
+    values = list(values)
+    return column.in_(values) if values else false()
+
+
+def _last_order_days_lte(column, value, today: date) -> ColumnElement:
+    return column >= today - timedelta(days=int(value))
+
+
+def _avg_monthly_spend_gte(column, value, _today: date) -> ColumnElement:
+    return func.coalesce(column, 0) >= float(value)
+
+
+# rule key -> (client field the rule reads, clause builder)
+RULES: dict[str, tuple[str, Callable[[Any, Any, date], ColumnElement]]] = {
+    "client_type": ("client_type", _in),
+    "region": ("region", _in),
+    "last_order_days_lte": ("last_order_date", _last_order_days_lte),
+    "avg_monthly_spend_gte": ("avg_monthly_spend", _avg_monthly_spend_gte),
+}
+
+
+@dataclass
+class CompiledSegment:
+    clause: ColumnElement
+    residual: dict[str, Any]
+    residual_fields: tuple[str, ...] = ()
+
+    @property
+    def fully_sql(self) -> bool:
+        return not self.residual
+
+
+def compile_segment(
+    rules: Mapping[str, Any], source: ClientSource | None = None, *, today: date | None = None
+) -> CompiledSegment:
+    """Translate *rules* into a filter over *source*.
+
+    Keys the evaluator does not know are ignored, as in ``matches_segment``.
+    """
+
+    source = source or default_source()
+    today = today or date.today()
+    clauses: list[ColumnElement] = []
+    residual: dict[str, Any] = {}
+    residual_fields: list[str] = []
+    for key, value in (rules or {}).items():
+        if key not in RULES:
+            continue
+        field_name, build = RULES[key]
+        column = source.fields.get(field_name)
+        if column is None:
+            residual[key] = value
+            residual_fields.append(field_name)
+            continue
+        clauses.append(build(column, value, today))
+    clause = and_(*clauses) if clauses else true()
+    return CompiledSegment(clause=clause, residual=residual, residual_fields=tuple(residual_fields))
+
+
+def rules_hash(rules: Mapping[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(rules or {}, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# -- audiences -----------------------------------------------------------------
+
+
+def _residual_columns(compiled: CompiledSegment, source: ClientSource) -> list:
+    # Fields missing from the source are read as absent by the evaluator.
+    return [source.fields[name].label(name) for name in compiled.residual_fields if name in source.fields]
+
+
+def iter_audience(
+    rules: Mapping[str, Any],
+    *,
+    org_id: int,
+    source: ClientSource | None = None,
+    session: Session | None = None,
+    extra: ColumnElement | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[int]:
+    """Yield the ids of clients of *org_id* matching *rules*.
+
+    Rows are fetched ``batch_size`` at a time; only rules the source cannot
+    express are checked in Python.
+    """
+
+    source = source or default_source()
+    session = session or db.session
+    compiled = compile_segment(rules, source)
+    stmt = select(source.id.label("id"), *_residual_columns(compiled, source)).where(
+        source.org_id == org_id, compiled.clause
+    )
+    if extra is not None:
+        stmt = stmt.where(extra)
+    result = session.execute(stmt.execution_options(yield_per=batch_size))
+    for row in result:
+        if compiled.residual and not matches_segment(SimpleNamespace(**row._mapping), compiled.residual):
+            continue
+        yield row.id
+
+
+def segment_audience(segment: MarketingSegment, **kwargs: Any) -> Iterator[int]:
+    return iter_audience(segment.rules_json or {}, org_id=segment.org_id, **kwargs)
+
+
+# -- materialised membership ---------------------------------------------------
+
+
+def _batches(ids: Iterator[int], size: int) -> Iterator[list[int]]:
+    batch: list[int] = []
+    for client_id in ids:
+        batch.append(client_id)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _add_members(session: Session, segment: MarketingSegment, client_ids: list[int], now: datetime) -> None:
+    table = MarketingSegmentMember.__table__
+    rows = [
+        {"org_id": segment.org_id, "segment_id": segment.id, "client_id": cid, "added_at": now}
+        for cid in client_ids
+    ]
+    stmt = conflict_insert(session, table)
+    if stmt is not None:
+        session.execute(stmt.on_conflict_do_nothing(index_elements=[table.c.segment_id, table.c.client_id]), rows)
+        return
+    existing = set(
+        session.execute(
+            select(table.c.client_id).where(table.c.segment_id == segment.id, table.c.client_id.in_(client_ids))
+        ).scalars()
+    )
+    fresh = [r for r in rows if r["client_id"] not in existing]
+    if fresh:
+        session.execute(insert(table), fresh)
+
+
+def _needs_rebuild(segment: MarketingSegment, digest: str, now: datetime) -> bool:
+    last = segment.members_refreshed_at
+    if last is None or segment.members_rules_hash != digest:
+        return True
+    if DATE_RELATIVE_RULES & set(segment.rules_json or {}):
+        return last.date() != now.date()
+    return False
+
+
+def refresh_segment(
+    segment: MarketingSegment,
+    *,
+    source: ClientSource | None = None,
+    full: bool = False,
+    batch_size: int = BATCH_SIZE,
+    now: datetime | None = None,
+) -> dict[str, int | str]:
+    """Bring ``marketing_segment_members`` for *segment* up to date.
+
+    Returns ``{"mode": "full"|"incremental", "added": n, "removed": n}``
+    (for a full rebuild, ``added`` is the audience size).
+    """
+
+    source = source or default_source()
+    session = db.session
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    rules = segment.rules_json or {}
+    digest = rules_hash(rules)
+    members = MarketingSegmentMember.__table__
+    # Read the watermark before querying, so rows updated mid-refresh are
+    # picked up again next time rather than missed.
+    since = segment.members_refreshed_at
+    added = removed = 0
+
+    if full or _needs_rebuild(segment, digest, now):
+        mode = "full"
+        removed = session.execute(delete(members).where(members.c.segment_id == segment.id)).rowcount or 0
+        for batch in _batches(segment_audience(segment, source=source, batch_size=batch_size), batch_size):
+            _add_members(session, segment, batch, now)
+            added += len(batch)
+    else:
+        mode = "incremental"
+        changed = select(source.id).where(source.org_id == segment.org_id, source.updated_at > since)
+        changed_ids = session.execute(changed.execution_options(yield_per=batch_size)).scalars()
+        for batch in _batches(changed_ids, batch_size):
+            matching = list(
+                iter_audience(rules, org_id=segment.org_id, source=source, extra=source.id.in_(batch), batch_size=batch_size)
+            )
+            stale = set(batch) - set(matching)
+            if stale:
+                removed += session.execute(
+                    delete(members).where(members.c.segment_id == segment.id, members.c.client_id.in_(stale))
+                ).rowcount or 0
+            if matching:
+                before = session.execute(
+                    select(func.count()).where(members.c.segment_id == segment.id, members.c.client_id.in_(matching))
+                ).scalar_one()
+                _add_members(session, segment, matching, now)
+                added += len(matching) - before
+
+    segment.members_refreshed_at = now
+    segment.members_rules_hash = digest
+    session.commit()
+    return {"mode": mode, "added": added, "removed": removed}
+
+
+def refresh_active_segments(*, source: ClientSource | None = None) -> dict[int, dict]:
+    results = {}
+    for segment in MarketingSegment.query.filter_by(is_active=True).order_by(MarketingSegment.id).all():
+        results[segment.id] = refresh_segment(segment, source=source)
+    return results
+
+
+__all__ = [
+    "ClientSource",
+    "CompiledSegment",
+    "compile_segment",
+    "default_source",
+    "iter_audience",
+    "refresh_active_segments",
+    "refresh_segment",
+    "segment_audience",
+]
@@ -34,9 +34,9 @@ def send_telegram_message(
         open_incident(org_id, "telegram", {"reason": "open_circuit"})
         return {"ok": False, "error": "telegram_open_circuit"}
 
-    apply_chaos_to_external_calls()
-
     try:
+        # Inside the try so injected failures count against the breaker too.
+        apply_chaos_to_external_calls()
         from erp.bots.telegram_client import telegram_send
 
         telegram_send(bot_name, chat_id, payload)
@@ -0,0 +1,122 @@
+"""Atomic stock reservation for order creation.
+
+``Inventory.quantity`` is the reservable quantity: reserving decrements it
+and releasing a reservation (e.g. ``supplychain`` ``release_inventory``)
+adds it back, so availability is always net of open reservations.
+
+All requested items are read with one ``IN`` query that locks the rows in
+primary-key order (``SELECT ... FOR UPDATE`` where supported), so two orders
+touching overlapping items always acquire locks in the same order and cannot
+deadlock. The stock is then taken with a single conditional
+``UPDATE ... SET quantity = quantity - CASE id ... WHERE quantity >= CASE id
+...``; if fewer rows than requested were updated another transaction got
+there first and the caller must roll back. Reservation rows are written with
+one bulk insert.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from http import HTTPStatus
+
+from sqlalchemy import case, insert, select, update
+
+from erp.extensions import db
+from erp.models import Inventory, InventoryReservation
+
+
+class ReservationError(ValueError):
+    """Raised when a reservation cannot be satisfied; the caller rolls back."""
+
+    status = HTTPStatus.CONFLICT
+
+    def __init__(self, message: str, inventory_item_id: int | None = None):
+        super().__init__(message)
+        self.inventory_item_id = inventory_item_id
+
+
+class InventoryItemNotFound(ReservationError):
+    status = HTTPStatus.NOT_FOUND
+
+
+class InsufficientStock(ReservationError):
+    pass
+
+
+def aggregate_lines(lines: Iterable[tuple[int, int]]) -> dict[int, int]:
+    """Sum quantities per item so repeated lines reserve once."""
+
+    totals: dict[int, int] = {}
+    for item_id, qty in lines:
+        totals[int(item_id)] = totals.get(int(item_id), 0) + int(qty)
+    return totals
+
+
+def reserve_stock(org_id: int, quantities: Mapping[int, int]) -> dict[int, int]:
+    """Decrement stock for every item in *quantities* or raise.
+
+    Returns the remaining quantity per item as seen before the update. Runs in
+    the caller's transaction; nothing is committed here.
+    """
+
+    item_ids = sorted(quantities)
+    if not item_ids:
+        return {}
+
+    stmt = (
+        select(Inventory.id, Inventory.quantity)
+        .where(Inventory.org_id == org_id, Inventory.id.in_(item_ids))
+        .order_by(Inventory.id)
+        .with_for_update()
+    )
+    on_hand = {item_id: qty for item_id, qty in db.session.execute(stmt)}
+
+    for item_id in item_ids:
+        if item_id not in on_hand:
+            raise InventoryItemNotFound(f"inventory item {item_id} not found", item_id)
+        if (on_hand[item_id] or 0) < quantities[item_id]:
+            raise InsufficientStock(f"insufficient stock for item {item_id}", item_id)
+
+    requested = case(quantities, value=Inventory.id)
+    result = db.session.execute(
+        update(Inventory)
+        .where(
+            Inventory.org_id == org_id,
+            Inventory.id.in_(item_ids),
+            Inventory.quantity >= requested,
+        )
+        .values(quantity=Inventory.quantity - requested)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(item_ids):
+        # Lost a race with a concurrent reservation between read and update.
+        raise InsufficientStock("insufficient stock for one or more items")
+    return {item_id: on_hand[item_id] - quantities[item_id] for item_id in item_ids}
+
+
+def create_reservations(org_id: int, order_id: int, quantities: Mapping[int, int]) -> None:
+    """Bulk-insert one reservation row per item for *order_id*."""
+
+    if not quantities:
+        return
+    db.session.execute(
+        insert(InventoryReservation),
+        [
+            {
+                "org_id": org_id,
+                "order_id": order_id,
+                "inventory_item_id": item_id,
+                "quantity": qty,
+            }
+            for item_id, qty in sorted(quantities.items())
+        ],
+    )
+
+
+__all__ = [
+    "InsufficientStock",
+    "InventoryItemNotFound",
+    "ReservationError",
+    "aggregate_lines",
+    "create_reservations",
+    "reserve_stock",
+]
@@ -3,6 +3,7 @@ from __future__ import annotations
 from erp.extensions import db
 from erp.models import Role, User, UserRoleAssignment
 from erp.security import user_has_role, _get_user_role_names
+from erp.security_principal import invalidate_principal
 
 
 def _ensure_role(role_name: str) -> Role:
@@ -29,6 +30,7 @@ def grant_role_to_user(
     if not UserRoleAssignment.query.filter_by(user_id=user.id, role_id=role.id).first():
         db.session.add(UserRoleAssignment(user_id=user.id, role_id=role.id))
     db.session.commit()
+    invalidate_principal(user.id)
 
 
 def revoke_role_from_user(
@@ -55,6 +57,7 @@ def revoke_role_from_user(
 
     UserRoleAssignment.query.filter_by(user_id=user.id, role_id=role.id).delete()
     db.session.commit()
+    invalidate_principal(user.id)
 
 
 def list_role_names(user: User | None) -> set[str]:
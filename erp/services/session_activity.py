@@ -0,0 +1,258 @@
+"""Write-behind tracking of session last-seen times and revocations.
+
+Touching a session only records a timestamp in memory (or in a Redis hash
+when Redis is available, so every worker shares one buffer). Timestamps are
+written to ``user_sessions`` in one bulk ``UPDATE ... FROM (VALUES ...)``
+at most once per flush interval, and a session is only re-recorded once its
+last recorded time is older than the configured granularity.
+
+Revocation checks are answered from an in-process set that is refreshed
+incrementally from ``user_sessions.revoked_at`` once per flush interval, so
+a revocation issued on any worker is honoured everywhere within one
+interval without a query per request. Each refresh re-reads a short
+overlap behind the newest revocation already seen.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app, session
+from flask_login import current_user, logout_user
+from sqlalchemy import DateTime, Integer, String, bindparam, column, select, values
+
+from erp.extensions import db
+from erp.models import UserSession
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 30.0
+DEFAULT_GRANULARITY_SECONDS = 60.0
+# Revocations are re-read this far behind the newest one seen, so a row
+# stamped before the watermark but committed after the last poll (slow
+# transaction, clock skew between workers) is still picked up.
+DEFAULT_REVOKED_OVERLAP = timedelta(minutes=5)
+_REDIS_KEY = "session:activity"
+
+SessionKey = tuple[int, str]
+
+
+def _redis():
+    try:
+        from db import redis_client
+    except Exception:  # pragma: no cover - optional dependency
+        return None
+    return redis_client.client if getattr(redis_client, "is_real", False) else None
+
+
+class SessionActivityTracker:
+    """Buffers last-seen timestamps and caches revoked sessions."""
+
+    def __init__(
+        self,
+        *,
+        flush_interval: float = DEFAULT_FLUSH_SECONDS,
+        granularity: float = DEFAULT_GRANULARITY_SECONDS,
+        revoked_lookback: timedelta = timedelta(days=31),
+        revoked_overlap: timedelta = DEFAULT_REVOKED_OVERLAP,
+        redis=None,
+    ):
+        self.flush_interval = flush_interval
+        self.granularity = timedelta(seconds=granularity)
+        self.revoked_lookback = revoked_lookback
+        self.revoked_overlap = revoked_overlap
+        self.redis = redis
+        self._lock = threading.Lock()
+        self._pending: dict[SessionKey, datetime] = {}
+        self._recorded: dict[SessionKey, datetime] = {}
+        self._revoked: set[SessionKey] = set()
+        self._revoked_watermark: datetime | None = None
+        self._last_flush = time.monotonic()
+        self._last_refresh = float("-inf")
+
+    # -- activity ---------------------------------------------------------
+
+    def touch(self, org_id: int, session_id: str, now: datetime | None = None) -> bool:
+        """Record activity; returns False when inside the granularity window."""
+
+        now = now or datetime.utcnow()
+        key = (int(org_id), session_id)
+        with self._lock:
+            previous = self._recorded.get(key)
+            if previous is not None and now - previous < self.granularity:
+                return False
+            self._recorded[key] = now
+            if self.redis is None:
+                self._pending[key] = now
+        if self.redis is not None:
+            try:
+                self.redis.hset(_REDIS_KEY, f"{key[0]}:{key[1]}", now.isoformat())
+            except Exception:
+                LOGGER.warning("session activity: redis unavailable, buffering locally")
+                with self._lock:
+                    self._pending[key] = now
+        return True
+
+    def seen(self, org_id: int, session_id: str, at: datetime) -> None:
+        """Note a timestamp already persisted (e.g. by ``record_session``)."""
+
+        with self._lock:
+            self._recorded[(int(org_id), session_id)] = at
+
+    def flush_due(self) -> bool:
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _drain(self) -> dict[SessionKey, datetime]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            cutoff = datetime.utcnow() - self.granularity
+            self._recorded = {k: v for k, v in self._recorded.items() if v >= cutoff}
+        if self.redis is not None:
+            staging = f"{_REDIS_KEY}:flush:{uuid.uuid4().hex}"
+            try:
+                self.redis.rename(_REDIS_KEY, staging)
+            except Exception:
+                # No pending activity (RENAME on a missing key) or Redis down.
+                return batch
+            try:
+                for field, stamp in self.redis.hgetall(staging).items():
+                    field = field.decode() if isinstance(field, bytes) else field
+                    stamp = stamp.decode() if isinstance(stamp, bytes) else stamp
+                    org_id, _, session_id = field.partition(":")
+                    seen_at = datetime.fromisoformat(stamp)
+                    key = (int(org_id), session_id)
+                    if key not in batch or batch[key] < seen_at:
+                        batch[key] = seen_at
+            finally:
+                self.redis.delete(staging)
+        return batch
+
+    def flush(self) -> int:
+        """Write buffered timestamps in one statement; returns rows updated."""
+
+        batch = self._drain()
+        if not batch:
+            return 0
+        rows = [(org_id, sid, seen_at) for (org_id, sid), seen_at in batch.items()]
+        table = UserSession.__table__
+        with db.engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                seen = values(
+                    column("org_id", Integer),
+                    column("session_id", String),
+                    column("seen_at", DateTime),
+                    name="seen",
+                ).data(rows)
+                stmt = (
+                    table.update()
+                    .where(
+                        table.c.org_id == seen.c.org_id,
+                        table.c.session_id == seen.c.session_id,
+                        table.c.revoked_at.is_(None),
+                        table.c.last_seen_at < seen.c.seen_at,
+                    )
+                    .values(last_seen_at=seen.c.seen_at)
+                )
+                return conn.execute(stmt).rowcount
+            stmt = (
+                table.update()
+                .where(
+                    table.c.org_id == bindparam("b_org_id"),
+                    table.c.session_id == bindparam("b_session_id"),
+                    table.c.revoked_at.is_(None),
+                    table.c.last_seen_at < bindparam("b_seen_at"),
+                )
+                .values(last_seen_at=bindparam("b_seen_at"))
+            )
+            result = conn.execute(
+                stmt,
+                [{"b_org_id": o, "b_session_id": s, "b_seen_at": t} for o, s, t in rows],
+            )
+            return result.rowcount
+
+    # -- revocation -------------------------------------------------------
+
+    def mark_revoked(self, keys) -> None:
+        with self._lock:
+            for org_id, session_id in keys:
+                key = (int(org_id), session_id)
+                self._revoked.add(key)
+                self._pending.pop(key, None)
+                self._recorded.pop(key, None)
+
+    def refresh_revoked(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._last_refresh < self.flush_interval:
+            return
+        if self._revoked_watermark is None:
+            since = watermark = datetime.utcnow() - self.revoked_lookback
+        else:
+            watermark = self._revoked_watermark
+            since = watermark - self.revoked_overlap
+        stmt = select(UserSession.org_id, UserSession.session_id, UserSession.revoked_at).where(
+            UserSession.revoked_at.is_not(None), UserSession.revoked_at >= since
+        )
+        with db.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        with self._lock:
+            # The overlap re-reads recent rows; the set dedupes them.
+            for org_id, session_id, revoked_at in rows:
+                self._revoked.add((int(org_id), session_id))
+                if self._revoked_watermark is None or revoked_at > self._revoked_watermark:
+                    self._revoked_watermark = revoked_at
+            if self._revoked_watermark is None:
+                self._revoked_watermark = watermark
+            self._last_refresh = time.monotonic()
+
+    def is_revoked(self, org_id: int, session_id: str) -> bool:
+        self.refresh_revoked()
+        return (int(org_id), session_id) in self._revoked
+
+
+def get_tracker() -> SessionActivityTracker:
+    tracker = current_app.extensions.get("session_activity")
+    if tracker is None:
+        cfg = current_app.config
+        lifetime = cfg.get("PERMANENT_SESSION_LIFETIME") or timedelta(days=31)
+        if not isinstance(lifetime, timedelta):
+            lifetime = timedelta(seconds=int(lifetime))
+        tracker = SessionActivityTracker(
+            flush_interval=float(cfg.get("SESSION_ACTIVITY_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS)),
+            granularity=float(
+                cfg.get("SESSION_ACTIVITY_GRANULARITY_SECONDS", DEFAULT_GRANULARITY_SECONDS)
+            ),
+            revoked_lookback=lifetime,
+            redis=_redis() if cfg.get("SESSION_ACTIVITY_USE_REDIS", True) else None,
+        )
+        current_app.extensions["session_activity"] = tracker
+    return tracker
+
+
+def _track_request_activity():
+    session_id = session.get("session_id")
+    if not session_id or not current_user.is_authenticated:
+        return None
+    org_id = getattr(current_user, "org_id", None) or 1
+    try:
+        from erp.services.session_service import is_session_revoked, touch_session
+
+        if is_session_revoked(org_id, session_id):
+            logout_user()
+            session.pop("session_id", None)
+            return None
+        touch_session(org_id, session_id)
+    except Exception:
+        LOGGER.exception("session activity tracking failed")
+    return None
+
+
+def init_session_activity(app) -> None:
+    app.config.setdefault("SESSION_ACTIVITY_TRACKING", True)
+    if app.config["SESSION_ACTIVITY_TRACKING"]:
+        app.before_request(_track_request_activity)
+
+
+__all__ = ["SessionActivityTracker", "get_tracker", "init_session_activity"]
@@ -5,6 +5,7 @@ import secrets
 
 from erp.extensions import db
 from erp.models import UserSession
+from erp.services.session_activity import get_tracker
 
 
 def record_session(org_id: int, user_id: int, session_id: str) -> UserSession:
@@ -14,16 +15,19 @@ def record_session(org_id: int, user_id: int, session_id: str) -> UserSession:
         db.session.add(record)
     record.last_seen_at = datetime.utcnow()
     db.session.commit()
+    get_tracker().seen(org_id, session_id, record.last_seen_at)
     return record
 
 
 def revoke_all_sessions_for_user(user_id: int, revoked_by_id: int | None = None) -> None:
     rows = UserSession.query.filter_by(user_id=user_id, revoked_at=None).all()
     now = datetime.utcnow()
+    revoked = [(row.org_id, row.session_id) for row in rows]
     for row in rows:
         row.revoked_at = now
         row.revoked_by_id = revoked_by_id
     db.session.commit()
+    get_tracker().mark_revoked(revoked)
 
 
 def revoke_session(org_id: int, session_id: str, revoked_by_id: int | None = None) -> None:
@@ -32,13 +36,22 @@ def revoke_session(org_id: int, session_id: str, revoked_by_id: int | None = Non
         record.revoked_at = datetime.utcnow()
         record.revoked_by_id = revoked_by_id
         db.session.commit()
+        get_tracker().mark_revoked([(org_id, session_id)])
+
+
+def is_session_revoked(org_id: int, session_id: str) -> bool:
+    """Answered from the tracker's revoked-session cache (no per-call query)."""
+    return get_tracker().is_revoked(org_id, session_id)
 
 
 def touch_session(org_id: int, session_id: str) -> None:
-    record = UserSession.query.filter_by(org_id=org_id, session_id=session_id, revoked_at=None).first()
-    if record:
-        record.mark_seen()
-        db.session.commit()
+    """Buffer a last-seen update; rows are written in bulk by the tracker."""
+    tracker = get_tracker()
+    if tracker.is_revoked(org_id, session_id):
+        return
+    tracker.touch(org_id, session_id)
+    if tracker.flush_due():
+        tracker.flush()
 
 
 def make_session_identifier() -> str:
@@ -0,0 +1,264 @@
+"""Set-based stock posting engine.
+
+A batch of :class:`StockMovement` records is posted in three statements
+regardless of its size:
+
+1. one ``SELECT`` that drops movements whose idempotency key was already
+   posted,
+2. one ``INSERT ... ON CONFLICT (org_id, item_id, warehouse_id) DO UPDATE``
+   per chunk of balances, adding the net delta per item/warehouse and
+   returning the new quantities. The update is guarded in SQL
+   (``qty_on_hand + delta >= 0`` for decreasing deltas), so a movement that
+   would drive stock negative is rejected without a read-modify-write race,
+3. one executemany ``INSERT`` of the ledger entries, costed first by
+   :mod:`erp.inventory.costing` (FIFO layers or weighted average).
+
+Everything runs inside a savepoint of the caller's transaction; a rejected
+batch leaves no trace and callers commit once for the whole document
+(cycle count, GRN, delivery).
+"""
+from __future__ import annotations
+
+import uuid
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from decimal import Decimal
+from typing import Any
+
+from flask import current_app
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+
+from erp.extensions import db
+from erp.inventory.costing import METHODS, plan_costing
+from erp.inventory.models import StockBalance, StockLedgerEntry
+from erp.utils.upsert import conflict_insert
+
+UPSERT_CHUNK = 500
+
+BalanceKey = tuple[uuid.UUID, uuid.UUID]
+
+
+class NegativeStockError(ValueError):
+    """A movement would drive one or more balances below zero."""
+
+    def __init__(self, keys: Sequence[BalanceKey]):
+        super().__init__(
+            "insufficient stock for "
+            + ", ".join(f"item {item} in warehouse {wh}" for item, wh in keys)
+        )
+        self.keys = list(keys)
+
+
+def _as_uuid(value: Any) -> uuid.UUID | None:
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+@dataclass(frozen=True)
+class StockMovement:
+    item_id: Any
+    warehouse_id: Any
+    delta: Decimal
+    location_id: Any = None
+    lot_id: Any = None
+    serial_id: Any = None
+    tx_type: str = "adjust"
+    reason: str | None = None
+    reference_type: str | None = None
+    reference_id: Any = None
+    idempotency_key: str | None = None
+    unit_cost: Decimal | None = None
+    created_by_id: int | None = None
+
+    @property
+    def balance_key(self) -> BalanceKey:
+        return _as_uuid(self.item_id), _as_uuid(self.warehouse_id)
+
+
+@dataclass(frozen=True)
+class PostingResult:
+    ledger_ids: list[uuid.UUID]
+    balances: dict[BalanceKey, Decimal]
+    skipped_keys: list[str]
+
+
+def _valuation_method() -> str | None:
+    """``INVENTORY_VALUATION_METHOD``: ``fifo`` (default), ``wavg`` or ``none``."""
+
+    try:
+        method = str(current_app.config.get("INVENTORY_VALUATION_METHOD", "fifo")).lower()
+    except RuntimeError:  # pragma: no cover - outside app context
+        method = "fifo"
+    return method if method in METHODS else None
+
+
+def _dedupe(session: Session, org_id: int, movements: list[StockMovement]):
+    keys = {m.idempotency_key for m in movements if m.idempotency_key}
+    posted: set[str] = set()
+    if keys:
+        posted = set(
+            session.scalars(
+                select(StockLedgerEntry.idempotency_key).where(
+                    StockLedgerEntry.org_id == org_id,
+                    StockLedgerEntry.idempotency_key.in_(keys),
+                )
+            )
+        )
+    fresh, skipped, seen = [], [], set(posted)
+    for movement in movements:
+        key = movement.idempotency_key
+        if key and key in seen:
+            skipped.append(key)
+            continue
+        if key:
+            seen.add(key)
+        fresh.append(movement)
+    return fresh, skipped
+
+
+def _upsert_balances(
+    session: Session, org_id: int, deltas: dict[BalanceKey, Decimal], allow_negative: bool
+) -> dict[BalanceKey, Decimal]:
+    table = StockBalance.__table__
+    if conflict_insert(session, table) is None:
+        return _update_balances_fallback(session, org_id, deltas, allow_negative)
+    now = datetime.now(UTC)
+    items = list(deltas.items())
+    balances: dict[BalanceKey, Decimal] = {}
+    for start in range(0, len(items), UPSERT_CHUNK):
+        chunk = items[start : start + UPSERT_CHUNK]
+        stmt = conflict_insert(session, table).values(
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "org_id": org_id,
+                    "item_id": item_id,
+                    "warehouse_id": warehouse_id,
+                    "qty_on_hand": delta,
+                    "created_at": now,
+                }
+                for (item_id, warehouse_id), delta in chunk
+            ]
+        )
+        new_qty = table.c.qty_on_hand + stmt.excluded.qty_on_hand
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.org_id, table.c.item_id, table.c.warehouse_id],
+            set_={"qty_on_hand": new_qty},
+            where=None if allow_negative else or_(stmt.excluded.qty_on_hand >= 0, new_qty >= 0),
+        ).returning(table.c.item_id, table.c.warehouse_id, table.c.qty_on_hand)
+        for item_id, warehouse_id, qty in session.execute(stmt):
+            balances[(_as_uuid(item_id), _as_uuid(warehouse_id))] = Decimal(qty)
+
+    if not allow_negative:
+        # Guarded conflicts return no row; fresh inserts of a negative delta
+        # come back below zero.
+        rejected = [
+            key
+            for key, delta in deltas.items()
+            if delta < 0 and (key not in balances or balances[key] < 0)
+        ]
+        if rejected:
+            raise NegativeStockError(rejected)
+    return balances
+
+
+def _update_balances_fallback(
+    session: Session, org_id: int, deltas: dict[BalanceKey, Decimal], allow_negative: bool
+) -> dict[BalanceKey, Decimal]:
+    """Row-locked read/modify for dialects without ``ON CONFLICT``."""
+
+    keys = sorted(deltas, key=lambda k: (str(k[0]), str(k[1])))
+    rows = {
+        (row.item_id, row.warehouse_id): row
+        for row in session.scalars(
+            select(StockBalance)
+            .where(
+                StockBalance.org_id == org_id,
+                StockBalance.item_id.in_({k[0] for k in keys}),
+                StockBalance.warehouse_id.in_({k[1] for k in keys}),
+            )
+            .with_for_update()
+        )
+    }
+    rejected, balances = [], {}
+    for key in keys:
+        row = rows.get(key)
+        if row is None:
+            row = StockBalance(org_id=org_id, item_id=key[0], warehouse_id=key[1], qty_on_hand=0)
+            session.add(row)
+        new_qty = Decimal(row.qty_on_hand or 0) + deltas[key]
+        if new_qty < 0 and deltas[key] < 0 and not allow_negative:
+            rejected.append(key)
+            continue
+        row.qty_on_hand = new_qty
+        balances[key] = new_qty
+    if rejected:
+        raise NegativeStockError(rejected)
+    session.flush()
+    return balances
+
+
+def post_movements(
+    org_id: int,
+    movements: Iterable[StockMovement],
+    *,
+    allow_negative: bool = False,
+    session: Session | None = None,
+) -> PostingResult:
+    """Post *movements* atomically in the caller's transaction (no commit).
+
+    Raises :class:`NegativeStockError` (a ``ValueError``) and leaves the
+    transaction untouched when any balance would go negative.
+    """
+
+    session = session or db.session
+    with session.begin_nested():
+        fresh, skipped = _dedupe(session, org_id, list(movements))
+        if not fresh:
+            return PostingResult([], {}, skipped)
+
+        deltas: dict[BalanceKey, Decimal] = {}
+        for movement in fresh:
+            key = movement.balance_key
+            deltas[key] = deltas.get(key, Decimal("0")) + Decimal(movement.delta)
+        balances = _upsert_balances(session, org_id, deltas, allow_negative)
+
+        now = datetime.now(UTC)
+        ledger_rows = [
+            {
+                "id": uuid.uuid4(),
+                "org_id": org_id,
+                "item_id": _as_uuid(m.item_id),
+                "warehouse_id": _as_uuid(m.warehouse_id),
+                "location_id": _as_uuid(m.location_id),
+                "lot_id": _as_uuid(m.lot_id),
+                "serial_id": _as_uuid(m.serial_id),
+                "quantity_delta": Decimal(m.delta),
+                "tx_type": m.tx_type,
+                "reason": m.reason,
+                "reference_type": m.reference_type,
+                "reference_id": None if m.reference_id is None else str(m.reference_id),
+                "idempotency_key": m.idempotency_key,
+                "unit_cost": m.unit_cost,
+                "created_by_id": m.created_by_id,
+                "created_at": now,
+            }
+            for m in fresh
+        ]
+        method = _valuation_method()
+        plan = plan_costing(session, org_id, ledger_rows, method) if method else None
+        session.execute(insert(StockLedgerEntry), ledger_rows)
+        if plan is not None:
+            plan.write(session)
+
+    # Balances were written with Core statements; refresh any loaded copies.
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, StockBalance) and (obj.item_id, obj.warehouse_id) in deltas:
+            session.expire(obj)
+    return PostingResult([row["id"] for row in ledger_rows], balances, skipped)
+
+
+__all__ = ["NegativeStockError", "PostingResult", "StockMovement", "post_movements"]
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import decimal
-from typing import Optional, Tuple
+from typing import Any, Optional, Tuple
 
 from flask import current_app
 from sqlalchemy.orm import Session
@@ -15,10 +15,20 @@ from erp.inventory.models import (
     SerialNumber,  # Crucial for device/equipment tracking
 )
 from erp.models.user import User
+from erp.services.stock_posting import NegativeStockError, StockMovement, post_movements
+
+
+def _allow_negative() -> bool:
+    return bool(current_app.config.get("ALLOW_NEGATIVE_STOCK"))
 
 
 class StockService:
-    """Core stock management service."""
+    """Core stock management service.
+
+    Every mutation goes through :func:`erp.services.stock_posting.post_movements`,
+    so balances are upserted and validated in SQL and a ledger entry is
+    written for each change.
+    """
 
     @classmethod
     def adjust(
@@ -34,48 +44,211 @@ class StockService:
         batch_number: Optional[str] = None,  # For reagents (alias for Lot)
     ) -> Tuple[StockBalance, StockLedgerEntry]:
         """Adjust stock level and create ledger entry."""
-        balance = cls._get_balance(session, item_id, warehouse_id)
+        org_id = int(getattr(user, "org_id", None) or 1)
+        if lot_id is None and batch_number:
+            lot_id = session.query(Lot.id).filter_by(item_id=item_id, number=batch_number).scalar()
+        serial_id = None
+        if serial_number:
+            serial_id = (
+                session.query(SerialNumber.id)
+                .filter_by(item_id=item_id, serial_number=serial_number)
+                .scalar()
+            )
+
+        try:
+            result = post_movements(
+                org_id,
+                [
+                    StockMovement(
+                        item_id=item_id,
+                        warehouse_id=warehouse_id,
+                        delta=decimal.Decimal(quantity),
+                        lot_id=lot_id,
+                        serial_id=serial_id,
+                        tx_type="adjust",
+                        reason=reason,
+                        reference_type="user",
+                        reference_id=user.id,
+                        created_by_id=user.id,
+                    )
+                ],
+                allow_negative=_allow_negative(),
+                session=session,
+            )
+        except NegativeStockError as exc:
+            raise ValueError("Cannot go negative without config flag") from exc
+        session.commit()
 
-        if quantity < 0 and balance.qty_on_hand + quantity < 0:
-            if not current_app.config.get("ALLOW_NEGATIVE_STOCK"):
-                raise ValueError("Cannot go negative without config flag")
+        return cls._get_balance(session, item_id, warehouse_id, org_id), session.get(
+            StockLedgerEntry, result.ledger_ids[0]
+        )
+
+    @classmethod
+    def _get_balance(
+        cls, session: Session, item_id: Any, warehouse_id: Any, org_id: int | None = None
+    ) -> StockBalance:
+        query = session.query(StockBalance).filter_by(item_id=item_id, warehouse_id=warehouse_id)
+        if org_id is not None:
+            query = query.filter_by(org_id=org_id)
+        balance = query.first()
+        if not balance:
+            # Create on demand; the caller's commit persists it.
+            balance = StockBalance(
+                org_id=org_id, item_id=item_id, warehouse_id=warehouse_id, qty_on_hand=0
+            )
+            session.add(balance)
+            session.flush()
+        return balance
 
-        # Update balance
-        balance.qty_on_hand += quantity
+    def _post(
+        self,
+        *,
+        org_id: int,
+        item_id: Any,
+        warehouse_id: Any,
+        delta: decimal.Decimal,
+        reason: str,
+        ref_type: str | None,
+        ref_id: Any,
+    ) -> None:
+        post_movements(
+            org_id,
+            [
+                StockMovement(
+                    item_id=item_id,
+                    warehouse_id=warehouse_id,
+                    delta=delta,
+                    tx_type=reason,
+                    reason=reason,
+                    reference_type=ref_type,
+                    reference_id=ref_id,
+                )
+            ],
+            allow_negative=_allow_negative(),
+        )
+        db.session.commit()
 
-        # Create ledger entry with serial/lot
-        ledger = StockLedgerEntry(
+    def increment(self, *, org_id, item_id, warehouse_id, qty, reason, ref_type=None, ref_id=None):
+        self._post(
+            org_id=org_id,
             item_id=item_id,
             warehouse_id=warehouse_id,
-            lot_id=lot_id,
-            serial_number=serial_number,  # Crucial for serialized items
-            batch_number=batch_number,  # For reagents/batches
-            quantity=quantity,
+            delta=abs(decimal.Decimal(str(qty))),
             reason=reason,
-            created_by=user.id,
-            reference_id=str(user.id),  # Simple ref for now
+            ref_type=ref_type,
+            ref_id=ref_id,
         )
-        session.add(ledger)
 
-        session.commit()
+    def decrement(self, *, org_id, item_id, warehouse_id, qty, reason, ref_type=None, ref_id=None):
+        self._post(
+            org_id=org_id,
+            item_id=item_id,
+            warehouse_id=warehouse_id,
+            delta=-abs(decimal.Decimal(str(qty))),
+            reason=reason,
+            ref_type=ref_type,
+            ref_id=ref_id,
+        )
 
-        return balance, ledger
+    def set_quantity(self, *, org_id, item_id, warehouse_id, new_qty, reason, ref_type=None, ref_id=None):
+        current = self.get_available_quantity(
+            org_id=org_id, item_id=item_id, warehouse_id=warehouse_id
+        )
+        self._post(
+            org_id=org_id,
+            item_id=item_id,
+            warehouse_id=warehouse_id,
+            delta=decimal.Decimal(str(new_qty)) - current,
+            reason=reason,
+            ref_type=ref_type,
+            ref_id=ref_id,
+        )
 
-    @classmethod
-    def _get_balance(
-        cls, session: Session, item_id: int, warehouse_id: int
-    ) -> StockBalance:
-        balance = (
-            session.query(StockBalance)
-            .filter_by(item_id=item_id, warehouse_id=warehouse_id)
-            .first()
+    def get_available_quantity(self, *, org_id, item_id, warehouse_id) -> decimal.Decimal:
+        qty = (
+            db.session.query(StockBalance.qty_on_hand)
+            .filter_by(org_id=org_id, item_id=item_id, warehouse_id=warehouse_id)
+            .scalar()
         )
-        if not balance:
-            # Create on demand
-            balance = StockBalance(item_id=item_id, warehouse_id=warehouse_id)
-            session.add(balance)
-            session.commit()
-        return balance
+        return decimal.Decimal(qty or 0)
+
+
+def create_stock_movement(
+    *,
+    org_id: int,
+    item_id: Any,
+    warehouse_id: Any,
+    delta_qty: decimal.Decimal,
+    tx_type: str,
+    reference_type: str | None = None,
+    reference_id: Any = None,
+    location_id: Any = None,
+    lot_id: Any = None,
+    idempotency_key: str | None = None,
+    unit_cost: decimal.Decimal | None = None,
+    created_by_id: int | None = None,
+    allow_negative: bool = False,
+) -> StockLedgerEntry | None:
+    """Post one movement in the caller's transaction and return its ledger row.
+
+    Returns the previously posted entry when *idempotency_key* was already
+    used.
+    """
+    result = post_movements(
+        org_id,
+        [
+            StockMovement(
+                item_id=item_id,
+                warehouse_id=warehouse_id,
+                delta=decimal.Decimal(delta_qty),
+                location_id=location_id,
+                lot_id=lot_id,
+                tx_type=tx_type,
+                reference_type=reference_type,
+                reference_id=reference_id,
+                idempotency_key=idempotency_key,
+                unit_cost=unit_cost,
+                created_by_id=created_by_id,
+            )
+        ],
+        allow_negative=allow_negative,
+    )
+    if result.ledger_ids:
+        return db.session.get(StockLedgerEntry, result.ledger_ids[0])
+    return StockLedgerEntry.query.filter_by(org_id=org_id, idempotency_key=idempotency_key).first()
+
+
+def adjust_stock(
+    *,
+    org_id: int,
+    item_id: Any,
+    warehouse_id: Any,
+    qty_delta: decimal.Decimal,
+    tx_type: str = "adjust",
+    location_id: Any = None,
+    lot_id: Any = None,
+    reference_type: str | None = None,
+    reference_id: Any = None,
+    idempotency_key: str | None = None,
+    unit_cost: decimal.Decimal | None = None,
+    created_by_id: int | None = None,
+) -> StockLedgerEntry | None:
+    """Single-movement adjustment honouring ``ALLOW_NEGATIVE_STOCK``."""
+    return create_stock_movement(
+        org_id=org_id,
+        item_id=item_id,
+        warehouse_id=warehouse_id,
+        delta_qty=qty_delta,
+        tx_type=tx_type,
+        reference_type=reference_type,
+        reference_id=reference_id,
+        location_id=location_id,
+        lot_id=lot_id,
+        idempotency_key=idempotency_key,
+        unit_cost=unit_cost,
+        created_by_id=created_by_id,
+        allow_negative=_allow_negative(),
+    )
 
 
 def get_available_stock(item_id: int, warehouse_id: int) -> decimal.Decimal:
@@ -83,4 +256,4 @@ def get_available_stock(item_id: int, warehouse_id: int) -> decimal.Decimal:
     balance = db.session.query(StockBalance).filter_by(
         item_id=item_id, warehouse_id=warehouse_id
     ).first()
-    return balance.qty_on_hand if balance else decimal.Decimal("0")
\ No newline at end of file
+    return balance.qty_on_hand if balance else decimal.Decimal("0")
@@ -54,6 +54,7 @@ def opening_stock_load():
         post_sle(item_id=it["item_id"], warehouse_id=it["warehouse_id"],
                  qty=Decimal(str(it["qty"])), voucher_type="Opening", voucher_id=None,
                  lot_id=it.get("lot_id"), rate=Decimal(str(it.get("rate",0))))
+    db.session.commit()
     return jsonify({"posted": len(items)}), 201
 
 
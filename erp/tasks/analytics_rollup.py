@@ -7,6 +7,7 @@ from decimal import Decimal
 from celery import shared_task
 from sqlalchemy import func
 
+from erp.db_routing import replica_reads
 from erp.extensions import db
 from erp.models import AnalyticsFact, AnalyticsMetric, MaintenanceWorkOrder, StockLedgerEntry
 
@@ -41,6 +42,32 @@ def _upsert_fact(org_id: int, metric_key: str, ts_date: date, value: Decimal, **
     db.session.add(fact)
 
 
+@replica_reads
+def _source_totals(org_id: int, ts_date: date) -> tuple[int, int]:
+    """Source aggregates for one day, read from the replica when fresh."""
+
+    stock_moves = (
+        db.session.query(func.count(StockLedgerEntry.id))
+        .filter(
+            StockLedgerEntry.org_id == org_id,
+            func.date(StockLedgerEntry.created_at) == ts_date,
+        )
+        .scalar()
+        or 0
+    )
+    downtime_sum = (
+        db.session.query(func.coalesce(func.sum(MaintenanceWorkOrder.downtime_minutes), 0))
+        .filter(
+            MaintenanceWorkOrder.org_id == org_id,
+            MaintenanceWorkOrder.status == "completed",
+            func.date(MaintenanceWorkOrder.completed_at) == ts_date,
+        )
+        .scalar()
+        or 0
+    )
+    return stock_moves, downtime_sum
+
+
 @shared_task(name="erp.tasks.analytics.rollup_daily")
 def rollup_daily() -> None:
     """Compute daily KPIs from source modules and persist into AnalyticsFact."""
@@ -50,27 +77,8 @@ def rollup_daily() -> None:
     org_ids = sorted({metric.org_id for metric in metrics})
 
     for org_id in org_ids:
-        stock_moves = (
-            db.session.query(func.count(StockLedgerEntry.id))
-            .filter(
-                StockLedgerEntry.org_id == org_id,
-                func.date(StockLedgerEntry.created_at) == ts_date,
-            )
-            .scalar()
-            or 0
-        )
+        stock_moves, downtime_sum = _source_totals(org_id, ts_date)
         _upsert_fact(org_id, "inventory.daily_stock_moves", ts_date, Decimal(stock_moves))
-
-        downtime_sum = (
-            db.session.query(func.coalesce(func.sum(MaintenanceWorkOrder.downtime_minutes), 0))
-            .filter(
-                MaintenanceWorkOrder.org_id == org_id,
-                MaintenanceWorkOrder.status == "completed",
-                func.date(MaintenanceWorkOrder.completed_at) == ts_date,
-            )
-            .scalar()
-            or 0
-        )
         _upsert_fact(org_id, "maintenance.total_downtime_minutes", ts_date, Decimal(downtime_sum))
 
     db.session.commit()
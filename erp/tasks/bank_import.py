@@ -0,0 +1,17 @@
+"""Celery task for large bank statement file imports.
+
+Parsing and ingestion live in :mod:`erp.banking.statement_import`; the
+route stores the upload and queues this task for files above
+``BANK_IMPORT_INLINE_BYTES``.
+"""
+from __future__ import annotations
+
+from celery import shared_task
+
+from erp.banking.statement_import import run_import
+
+
+@shared_task(name="erp.tasks.bank_import.process_statement_import")
+def process_statement_import(import_id: int) -> str | None:
+    record = run_import(import_id)
+    return record.status if record is not None else None
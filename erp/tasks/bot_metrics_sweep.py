@@ -1,32 +1,94 @@
-"""Periodic metrics exporter for bot queues."""
+"""Periodic metrics exporter for bot queues.
+
+One grouped query over ``bot_job_outbox`` yields per (org, bot, status)
+counts and the oldest queued timestamp for every org at once, so the sweep is
+cheap enough to run every few seconds (see ``BOT_METRICS_SWEEP_SECONDS``).
+"""
 from __future__ import annotations
 
+from datetime import UTC, datetime
+
 from celery import shared_task
+from sqlalchemy import func
 
-from erp.metrics import BOT_JOBS_FAILED, BOT_JOBS_QUEUED
+from erp.extensions import db
+from erp.metrics import (
+    BOT_JOBS_FAILED,
+    BOT_JOBS_PROCESSING,
+    BOT_JOBS_QUEUED,
+    QUEUE_LAG,
+)
 from erp.models import BotJobOutbox
 
+# Label sets exported by the previous sweep; groups that drained since then
+# are reset to zero instead of reporting their last non-zero value forever.
+_LAST_SEEN: set[tuple[str, str]] = set()
+
+
+def _queue_label(org_id: str, bot_name: str) -> str:
+    return f"bot_outbox:{org_id}:{bot_name}"
+
+
+def _age_seconds(oldest, now: datetime) -> float:
+    if oldest is None:
+        return 0.0
+    if oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=UTC)
+    return max((now - oldest).total_seconds(), 0.0)
+
 
 @shared_task(name="erp.tasks.bot.metrics_sweep")
-def metrics_sweep(org_id: int):
-    bots = (
-        BotJobOutbox.query.filter_by(org_id=org_id)
-        .with_entities(BotJobOutbox.bot_name)
-        .distinct()
-        .all()
-    )
-    for (bot_name,) in bots:
-        queued = (
-            BotJobOutbox.query.filter_by(
-                org_id=org_id, bot_name=bot_name, status="queued"
-            ).count()
-        )
-        failed = (
-            BotJobOutbox.query.filter_by(
-                org_id=org_id, bot_name=bot_name, status="failed"
-            ).count()
+def metrics_sweep(org_id: int | None = None):
+    """Export queued/failed/processing counts and queue lag for bot outboxes.
+
+    Without *org_id* the sweep covers every org in the same query.
+    """
+
+    query = db.session.query(
+        BotJobOutbox.org_id,
+        BotJobOutbox.bot_name,
+        BotJobOutbox.status,
+        func.count(BotJobOutbox.id),
+        func.min(BotJobOutbox.created_at),
+    ).filter(BotJobOutbox.status.in_(("queued", "failed", "processing")))
+    if org_id is not None:
+        query = query.filter(BotJobOutbox.org_id == org_id)
+    rows = query.group_by(
+        BotJobOutbox.org_id, BotJobOutbox.bot_name, BotJobOutbox.status
+    ).all()
+
+    now = datetime.now(UTC)
+    stats: dict[tuple[str, str], dict] = {}
+    for row_org, bot_name, status, count, oldest in rows:
+        entry = stats.setdefault(
+            (str(row_org), bot_name),
+            {"queued": 0, "failed": 0, "processing": 0, "oldest_queued_age_s": 0.0},
         )
-        BOT_JOBS_QUEUED.labels(str(org_id), bot_name).set(float(queued))
-        BOT_JOBS_FAILED.labels(str(org_id), bot_name).set(float(failed))
+        entry[status] = int(count)
+        if status == "queued":
+            entry["oldest_queued_age_s"] = _age_seconds(oldest, now)
+
+    stale = {
+        key for key in _LAST_SEEN - stats.keys()
+        if org_id is None or key[0] == str(org_id)
+    }
+    for key in stale:
+        stats[key] = {"queued": 0, "failed": 0, "processing": 0, "oldest_queued_age_s": 0.0}
+
+    for (label_org, bot_name), entry in stats.items():
+        BOT_JOBS_QUEUED.labels(label_org, bot_name).set(float(entry["queued"]))
+        BOT_JOBS_FAILED.labels(label_org, bot_name).set(float(entry["failed"]))
+        BOT_JOBS_PROCESSING.labels(label_org, bot_name).set(float(entry["processing"]))
+        QUEUE_LAG.labels(_queue_label(label_org, bot_name)).set(entry["oldest_queued_age_s"])
+
+    _LAST_SEEN.difference_update(stale)
+    _LAST_SEEN.update(key for key in stats if key not in stale)
 
-    return {"bots": [b[0] for b in bots]}
+    live = {key: entry for key, entry in stats.items() if key not in stale}
+    return {
+        "bots": sorted({bot_name for _, bot_name in live}),
+        "groups": [
+            {"org_id": int(key[0]), "bot_name": key[1], **entry}
+            for key, entry in sorted(live.items())
+        ],
+    }
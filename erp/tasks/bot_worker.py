@@ -1,7 +1,28 @@
-"""Celery worker for bot outbox processing with retries and idempotency."""
+"""Celery worker for bot outbox processing with retries and idempotency.
+
+``process_bot_batch`` is the ingestion path: the Telegram webhook enqueues it
+after writing an outbox row, and beat runs it every
+``BOT_OUTBOX_DRAIN_SECONDS`` to pick up anything the webhook could not
+enqueue. It claims up to ``BATCH_SIZE`` queued rows with ``FOR UPDATE SKIP
+LOCKED`` so several consumers can drain the outbox in parallel, prefetches
+idempotency keys, conversation state and users for the whole batch, and
+commits the results together. Jobs that fail inside a batch are handed to
+``process_bot_job``, which only handles retries with exponential backoff.
+Both paths claim a row by moving it to ``processing`` first, so a job is
+never run by both.
+
+The drain also recovers jobs the retry path lost: a retry still ``queued``
+``RETRY_OVERDUE_SECONDS`` after its last failure (its ``apply_async`` never
+ran) is claimed like a fresh job, and a row left in ``processing`` for
+``PROCESSING_TIMEOUT_SECONDS`` (the worker died after claiming it) is
+counted as a failed attempt and requeued as such a retry.
+"""
 from __future__ import annotations
 
+from datetime import UTC, datetime, timedelta
+
 from celery import shared_task
+from sqlalchemy import case, or_
 
 from erp.extensions import db
 from erp.models import (
@@ -15,6 +36,10 @@ from erp.bots.dispatcher import dispatch
 from erp.services.notification_service import send_email_fallback, send_telegram_message
 
 MAX_RETRIES = 5
+BATCH_SIZE = 50
+# Longer than the largest retry countdown (2 ** (MAX_RETRIES - 1) seconds).
+RETRY_OVERDUE_SECONDS = 60
+PROCESSING_TIMEOUT_SECONDS = 300
 
 
 def _resolve_user(job: BotJobOutbox):
@@ -34,11 +59,21 @@ def _load_state(job: BotJobOutbox):
 
 
 def _persist_state(job: BotJobOutbox, next_state: str | None, state_data: dict | None = None):
-    state = _load_state(job)
+    return _apply_state(job, _load_state(job), next_state, state_data)
+
+
+def _apply_state(
+    job: BotJobOutbox,
+    state: TelegramConversationState | None,
+    next_state: str | None,
+    state_data: dict | None = None,
+) -> TelegramConversationState | None:
+    """Write *next_state* onto an already loaded state row and return it."""
+
     if not next_state:
         if state:
             db.session.delete(state)
-        return
+        return None
     if state is None:
         state = TelegramConversationState(
             org_id=job.org_id, bot_name=job.bot_name, chat_id=job.chat_id
@@ -46,16 +81,105 @@ def _persist_state(job: BotJobOutbox, next_state: str | None, state_data: dict |
     state.state_key = next_state
     state.data_json = state_data or {}
     db.session.add(state)
+    return state
+
+
+def _idem_key(job: BotJobOutbox) -> tuple:
+    return (job.org_id, job.bot_name, job.chat_id, job.message_id)
+
+
+def _execute(job: BotJobOutbox, *, user, state: TelegramConversationState | None):
+    """Dispatch *job* and stage its side effects without committing.
+
+    Returns ``(result, state)`` where ``state`` is the conversation state row
+    after the handler ran (``None`` when cleared or never created).
+    """
+
+    intent = job.parsed_intent or parse_intent(job.raw_text or "")
+
+    # Merge the structured context captured at ingestion (e.g., entity_type,
+    # entity_id) directly into the handler context so downstream commands see
+    # the expected keys instead of a nested payload. This keeps approve/
+    # reject and inventory/analytics queries functional when dispatched via
+    # the outbox worker.
+    base_ctx = job.context_json if isinstance(job.context_json, dict) else {}
+    ctx = {
+        **base_ctx,
+        "user": user,
+        "raw_text": job.raw_text,
+        "state": getattr(state, "state_key", None),
+        "state_data": getattr(state, "data_json", {}) if state else {},
+    }
+    response = dispatch(
+        bot_name=job.bot_name,
+        actor_id=getattr(user, "id", None),
+        chat_id=job.chat_id,
+        message_id=job.message_id,
+        raw_text=job.raw_text or "",
+        intent=intent,
+        ctx=ctx,
+    )
+
+    delivery = send_telegram_message(job.bot_name, job.chat_id, response, org_id=job.org_id)
+
+    if isinstance(delivery, dict) and not delivery.get("ok", True):
+        job.last_error = delivery.get("error")
+        job.status = "failed"
+        return {"status": "delivery_failed", "error": delivery.get("error")}, state
+
+    if "next_state" in response or response.get("clear_state"):
+        state = _apply_state(
+            job,
+            state,
+            None if response.get("clear_state") else response.get("next_state"),
+            response.get("state_data") or {},
+        )
+
+    db.session.add(
+        BotIdempotencyKey(
+            org_id=job.org_id,
+            bot_name=job.bot_name,
+            chat_id=job.chat_id,
+            message_id=job.message_id,
+        )
+    )
+    job.status = "done"
+    return {"status": "ok"}, state
+
+
+def _record_failure(job: BotJobOutbox, exc: Exception) -> None:
+    db.session.add(
+        BotEvent(
+            org_id=job.org_id,
+            bot_name=job.bot_name,
+            event_type="error",
+            actor_type="user",
+            actor_id=None,
+            chat_id=job.chat_id,
+            message_id=job.message_id,
+            payload_json={"error": str(exc), "retry": job.retry_count + 1},
+            severity="critical",
+        )
+    )
+    job.retry_count += 1
+    job.last_error = str(exc)
+    job.status = "failed" if job.retry_count >= MAX_RETRIES else "queued"
 
 
 @shared_task(bind=True, name="erp.tasks.bot.process_job")
 def process_bot_job(self, job_id: int):
-    job = BotJobOutbox.query.get(job_id)
-    if not job or job.status in {"done", "processing"}:
-        return {"status": "noop"}
-
-    job.status = "processing"
+    # Conditional claim: a concurrent batch or retry that already moved the
+    # row to processing wins, and this call becomes a no-op.
+    claimed = (
+        BotJobOutbox.query.filter(
+            BotJobOutbox.id == job_id,
+            BotJobOutbox.status.notin_(("done", "processing")),
+        ).update({"status": "processing"}, synchronize_session=False)
+    )
     db.session.commit()
+    job = BotJobOutbox.query.get(job_id) if claimed else None
+    if not job:
+        return {"status": "noop"}
 
     existing = BotIdempotencyKey.query.filter_by(
         org_id=job.org_id, bot_name=job.bot_name, chat_id=job.chat_id, message_id=job.message_id
@@ -66,75 +190,11 @@ def process_bot_job(self, job_id: int):
         return {"status": "duplicate_ignored"}
 
     try:
-        intent = job.parsed_intent or parse_intent(job.raw_text or "")
-        state = _load_state(job)
-
-        # Merge the structured context captured at ingestion (e.g., entity_type,
-        # entity_id) directly into the handler context so downstream commands see
-        # the expected keys instead of a nested payload. This keeps approve/
-        # reject and inventory/analytics queries functional when dispatched via
-        # the outbox worker.
-        base_ctx = job.context_json if isinstance(job.context_json, dict) else {}
-        ctx = {
-            **base_ctx,
-            "user": _resolve_user(job),
-            "raw_text": job.raw_text,
-            "state": getattr(state, "state_key", None),
-            "state_data": getattr(state, "data_json", {}) if state else {},
-        }
-        response = dispatch(
-            bot_name=job.bot_name,
-            actor_id=getattr(ctx["user"], "id", None),
-            chat_id=job.chat_id,
-            message_id=job.message_id,
-            raw_text=job.raw_text or "",
-            intent=intent,
-            ctx=ctx,
-        )
-
-        delivery = send_telegram_message(job.bot_name, job.chat_id, response, org_id=job.org_id)
-
-        if isinstance(delivery, dict) and not delivery.get("ok", True):
-            job.last_error = delivery.get("error")
-            job.status = "failed"
-            db.session.commit()
-            return {"status": "delivery_failed", "error": delivery.get("error")}
-
-        if "next_state" in response or response.get("clear_state"):
-            _persist_state(
-                job,
-                None if response.get("clear_state") else response.get("next_state"),
-                response.get("state_data") or {},
-            )
-
-        db.session.add(
-            BotIdempotencyKey(
-                org_id=job.org_id,
-                bot_name=job.bot_name,
-                chat_id=job.chat_id,
-                message_id=job.message_id,
-            )
-        )
-        job.status = "done"
+        result, _state = _execute(job, user=_resolve_user(job), state=_load_state(job))
         db.session.commit()
-        return {"status": "ok"}
+        return result
     except Exception as exc:  # pragma: no cover - exercised in tests with retry
-        db.session.add(
-            BotEvent(
-                org_id=job.org_id,
-                bot_name=job.bot_name,
-                event_type="error",
-                actor_type="user",
-                actor_id=None,
-                chat_id=job.chat_id,
-                message_id=job.message_id,
-                payload_json={"error": str(exc), "retry": job.retry_count + 1},
-                severity="critical",
-            )
-        )
-        job.retry_count += 1
-        job.last_error = str(exc)
-        job.status = "failed" if job.retry_count >= MAX_RETRIES else "queued"
+        _record_failure(job, exc)
         db.session.commit()
 
         if job.retry_count < MAX_RETRIES:
@@ -142,3 +202,146 @@ def process_bot_job(self, job_id: int):
 
         send_email_fallback(job, error=str(exc))
         return {"status": "fallback_sent"}
+
+
+def _requeue_stale() -> int:
+    """Requeue jobs stuck in ``processing``, counting the lost run as a failure."""
+
+    cutoff = datetime.now(UTC) - timedelta(seconds=PROCESSING_TIMEOUT_SECONDS)
+    requeued = BotJobOutbox.query.filter(
+        BotJobOutbox.status == "processing",
+        BotJobOutbox.updated_at < cutoff,
+    ).update(
+        {
+            "status": case((BotJobOutbox.retry_count + 1 >= MAX_RETRIES, "failed"), else_="queued"),
+            "retry_count": BotJobOutbox.retry_count + 1,
+            "last_error": "processing timed out",
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return requeued
+
+
+def _claim_batch(limit: int) -> list[BotJobOutbox]:
+    """Lock and mark up to *limit* queued jobs as processing.
+
+    Rows already locked by another consumer are skipped rather than waited on.
+    Jobs with ``retry_count > 0`` belong to the per-job retry path and are
+    left alone until ``RETRY_OVERDUE_SECONDS`` after their last failure, so
+    their backoff countdown is respected.
+    """
+
+    overdue = datetime.now(UTC) - timedelta(seconds=RETRY_OVERDUE_SECONDS)
+    jobs = (
+        BotJobOutbox.query.filter(
+            BotJobOutbox.status == "queued",
+            or_(BotJobOutbox.retry_count == 0, BotJobOutbox.updated_at < overdue),
+        )
+        .order_by(BotJobOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in jobs:
+        job.status = "processing"
+    db.session.commit()
+    return jobs
+
+
+def _prefetch_consumed(jobs: list[BotJobOutbox]) -> set[tuple]:
+    rows = (
+        db.session.query(
+            BotIdempotencyKey.org_id,
+            BotIdempotencyKey.bot_name,
+            BotIdempotencyKey.chat_id,
+            BotIdempotencyKey.message_id,
+        )
+        .filter(
+            BotIdempotencyKey.org_id.in_({j.org_id for j in jobs}),
+            BotIdempotencyKey.chat_id.in_({j.chat_id for j in jobs}),
+            BotIdempotencyKey.message_id.in_({j.message_id for j in jobs}),
+        )
+        .all()
+    )
+    return {tuple(row) for row in rows}
+
+
+def _prefetch_states(jobs: list[BotJobOutbox]) -> dict[tuple, TelegramConversationState]:
+    rows = TelegramConversationState.query.filter(
+        TelegramConversationState.org_id.in_({j.org_id for j in jobs}),
+        TelegramConversationState.chat_id.in_({j.chat_id for j in jobs}),
+    ).all()
+    return {(s.org_id, s.bot_name, s.chat_id): s for s in rows}
+
+
+def _prefetch_users(jobs: list[BotJobOutbox]) -> dict[tuple, object]:
+    try:
+        from erp.models import User
+    except Exception:
+        return {}
+    if not hasattr(User, "telegram_chat_id"):
+        return {}
+    rows = User.query.filter(
+        User.org_id.in_({j.org_id for j in jobs}),
+        User.telegram_chat_id.in_({j.chat_id for j in jobs}),
+    ).all()
+    return {(u.org_id, u.telegram_chat_id): u for u in rows}
+
+
+@shared_task(name="erp.tasks.bot.process_batch")
+def process_bot_batch(limit: int = BATCH_SIZE) -> dict:
+    """Claim and process a batch of queued outbox jobs with one final commit."""
+
+    _requeue_stale()
+    jobs = _claim_batch(limit)
+    if not jobs:
+        return {"claimed": 0, "results": {}}
+
+    consumed = _prefetch_consumed(jobs)
+    states = _prefetch_states(jobs)
+    users = _prefetch_users(jobs)
+
+    results: dict[int, str] = {}
+    failed: list[tuple[BotJobOutbox, str]] = []
+
+    for job in jobs:
+        key = _idem_key(job)
+        if key in consumed:
+            job.status = "done"
+            results[job.id] = "duplicate_ignored"
+            continue
+
+        state_key = (job.org_id, job.bot_name, job.chat_id)
+        try:
+            # A savepoint per job keeps one handler failure from discarding
+            # the staged work of the rest of the batch.
+            with db.session.begin_nested():
+                result, state = _execute(
+                    job,
+                    user=users.get((job.org_id, job.chat_id)),
+                    state=states.get(state_key),
+                )
+        except Exception as exc:
+            _record_failure(job, exc)
+            failed.append((job, str(exc)))
+            results[job.id] = "retry_scheduled" if job.status == "queued" else "fallback_sent"
+            continue
+
+        if state is None:
+            states.pop(state_key, None)
+        else:
+            states[state_key] = state
+        if result["status"] == "ok":
+            consumed.add(key)
+        results[job.id] = result["status"]
+
+    db.session.commit()
+
+    for job, error in failed:
+        if job.status == "queued":
+            process_bot_job.apply_async((job.id,), countdown=2 ** job.retry_count)
+        else:
+            send_email_fallback(job, error=error)
+
+    return {"claimed": len(jobs), "results": results}
@@ -0,0 +1,14 @@
+"""Retention sweep for request idempotency keys."""
+from __future__ import annotations
+
+from celery import shared_task
+
+from erp.models.idempotency import IdempotencyKey
+
+
+@shared_task(name="erp.tasks.idempotency.retention_sweep")
+def retention_sweep(hours_to_keep: int = 24, batch_size: int = 5000):
+    """Delete idempotency keys (and their stored responses) past retention."""
+
+    deleted = IdempotencyKey.purge_older_than(hours=hours_to_keep, batch_size=batch_size)
+    return {"deleted": deleted}
@@ -1,14 +1,18 @@
 """Inventory background tasks for auto-reorder and expiry alerts."""
 from __future__ import annotations
 
-from datetime import date, timedelta
+from datetime import UTC, date, datetime, time, timedelta
 from decimal import Decimal
 
 from celery import shared_task
+from flask import current_app
+from sqlalchemy import insert, select, update
 
 from erp.extensions import db
 from erp.models import FinanceAuditLog
-from erp.inventory.models import Lot, ReorderRule, StockBalance
+from erp.inventory.fefo import expiring_page
+from erp.inventory.history import prune_checkpoints, write_checkpoint
+from erp.inventory.models import Lot, ReorderRule, StockBalance, StockLedgerEntry
 
 
 @shared_task(name="erp.tasks.inventory.reorder_scan")
@@ -61,29 +65,81 @@ def reorder_scan() -> list[dict]:
 
 @shared_task(name="erp.tasks.inventory.expiry_alerts")
 def expiry_alerts(days: int = 90) -> int:
-    """Log audit events for lots expiring within the provided window."""
+    """Log one audit event per lot expiring within the provided window.
+
+    Lots are swept a page at a time per org. A lot is alerted once for a
+    given expiry date; changing its expiry makes it eligible again.
+    """
 
     cutoff = date.today() + timedelta(days=days)
-    lots = Lot.query.filter(
-        Lot.is_active.is_(True),
-        Lot.expiry.isnot(None),
-        Lot.expiry <= cutoff,
+    org_ids = db.session.scalars(
+        select(Lot.org_id)
+        .where(Lot.is_active.is_(True), Lot.expiry.isnot(None), Lot.expiry <= cutoff)
+        .distinct()
     ).all()
 
-    for lot in lots:
-        audit = FinanceAuditLog(
-            org_id=lot.org_id,
-            event_type="LOT_EXPIRY_ALERT",
-            entity_type="LOT",
-            entity_id=None,
-            payload={
-                "item_id": str(lot.item_id),
-                "lot_id": str(lot.id),
-                "lot_number": lot.number,
-                "expiry": lot.expiry.isoformat() if lot.expiry else None,
-            },
-        )
-        db.session.add(audit)
+    alerted = 0
+    for org_id in org_ids:
+        cursor = None
+        while True:
+            lots, cursor = expiring_page(org_id, cutoff, after=cursor, unalerted_only=True)
+            if not lots:
+                break
+            db.session.execute(
+                insert(FinanceAuditLog),
+                [
+                    {
+                        "org_id": lot.org_id,
+                        "event_type": "LOT_EXPIRY_ALERT",
+                        "entity_type": "LOT",
+                        # Lot ids are UUIDs; the id is kept in the payload.
+                        "entity_id": 0,
+                        "payload": {
+                            "item_id": str(lot.item_id),
+                            "lot_id": str(lot.id),
+                            "lot_number": lot.number,
+                            "expiry": lot.expiry.isoformat(),
+                        },
+                    }
+                    for lot in lots
+                ],
+            )
+            db.session.execute(
+                update(Lot),
+                [{"id": lot.id, "expiry_alerted_for": lot.expiry} for lot in lots],
+            )
+            db.session.commit()
+            alerted += len(lots)
+            if cursor is None:
+                break
+    return alerted
+
+
+@shared_task(name="erp.tasks.inventory.stock_checkpoints")
+def stock_checkpoints(as_of: str | None = None) -> dict:
+    """Write the midnight (UTC) stock checkpoint for every org with ledger activity.
+
+    The checkpoint on the first of a month is kept as ``monthly``; daily ones
+    older than ``STOCK_CHECKPOINT_DAILY_RETENTION_DAYS`` are pruned.
+    """
+
+    at = (
+        datetime.fromisoformat(as_of)
+        if as_of
+        else datetime.combine(datetime.now(UTC).date(), time.min, tzinfo=UTC)
+    )
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=UTC)
+    period = "monthly" if at.day == 1 else "daily"
+    keep_days = int(current_app.config.get("STOCK_CHECKPOINT_DAILY_RETENTION_DAYS", 90))
+
+    org_ids = db.session.scalars(select(StockLedgerEntry.org_id).distinct()).all()
+    written = {}
+    for org_id in org_ids:
+        if org_id is None:
+            continue
+        written[org_id] = write_checkpoint(org_id, at, period)
+        prune_checkpoints(org_id, at - timedelta(days=keep_days))
+        db.session.commit()
+    return {"as_of": at.isoformat(), "period": period, "rows": written}
 
-    db.session.commit()
-    return len(lots)
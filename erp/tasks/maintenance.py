@@ -2,8 +2,11 @@
 from __future__ import annotations
 
 from datetime import UTC, date, datetime, timedelta
+from decimal import Decimal
 
 from celery import shared_task
+from sqlalchemy import and_, func, insert, select, update
+from sqlalchemy.orm import contains_eager
 
 from erp.extensions import db
 from erp.models import (
@@ -13,135 +16,344 @@ from erp.models import (
     MaintenanceEscalationRule,
     MaintenanceEvent,
     MaintenanceSchedule,
+    MaintenanceSensorReading,
     MaintenanceWorkOrder,
 )
 
 
-@shared_task(name="erp.tasks.maintenance.generate_scheduled_work_orders")
-def generate_scheduled_work_orders() -> None:
-    """Create preventive work orders for schedules that are due."""
+OPEN_STATUSES = ("open", "in_progress")
+METER_SCHEDULE_TYPES = ("meter", "usage")
 
-    today = date.today()
-    schedules = (
-        MaintenanceSchedule.query.filter(
+
+def _open_work_order_exists():
+    return (
+        select(MaintenanceWorkOrder.id)
+        .where(
+            MaintenanceWorkOrder.org_id == MaintenanceSchedule.org_id,
+            MaintenanceWorkOrder.schedule_id == MaintenanceSchedule.id,
+            MaintenanceWorkOrder.status.in_(OPEN_STATUSES),
+        )
+        .exists()
+    )
+
+
+def _advance(due: date, interval_days: int, today: date) -> date:
+    """First date on the ``due + k * interval`` grid that is after *today*."""
+
+    missed = (today - due).days // interval_days if due <= today else -1
+    return due + timedelta(days=interval_days * (missed + 1))
+
+
+def _due_time_schedules(org_id: int, today: date):
+    return (
+        db.session.query(
+            MaintenanceSchedule.id,
+            MaintenanceSchedule.asset_id,
+            MaintenanceSchedule.name,
+            MaintenanceSchedule.next_due_date,
+            MaintenanceSchedule.interval_days,
+        )
+        .filter(
+            MaintenanceSchedule.org_id == org_id,
             MaintenanceSchedule.is_active.is_(True),
             MaintenanceSchedule.schedule_type == "time",
             MaintenanceSchedule.next_due_date <= today,
+            ~_open_work_order_exists(),
         )
-        .options()
         .all()
     )
 
-    created_count = 0
-    for schedule in schedules:
-        existing = MaintenanceWorkOrder.query.filter(
-            MaintenanceWorkOrder.org_id == schedule.org_id,
-            MaintenanceWorkOrder.schedule_id == schedule.id,
-            MaintenanceWorkOrder.status.in_(["open", "in_progress"]),
-        ).first()
-        if existing:
-            continue
-
-        work_order = MaintenanceWorkOrder(
-            org_id=schedule.org_id,
-            asset_id=schedule.asset_id,
-            schedule_id=schedule.id,
-            work_type="preventive",
-            title=f"PM: {schedule.name}",
-            description=f"Preventive maintenance for {schedule.name}",
-            status="open",
-            priority="normal",
-            requested_at=datetime.now(UTC),
-            due_date=schedule.next_due_date,
+
+def _due_meter_schedules(org_id: int):
+    """Meter schedules whose latest reading moved ``usage_interval`` past the last one."""
+
+    latest = (
+        select(
+            MaintenanceSensorReading.asset_id,
+            MaintenanceSensorReading.sensor_type,
+            func.max(MaintenanceSensorReading.recorded_at).label("recorded_at"),
         )
-        db.session.add(work_order)
-
-        event = MaintenanceEvent(
-            org_id=schedule.org_id,
-            work_order=work_order,
-            event_type="STATUS_CHANGE",
-            from_status=None,
-            to_status="open",
+        .where(MaintenanceSensorReading.org_id == org_id)
+        .group_by(MaintenanceSensorReading.asset_id, MaintenanceSensorReading.sensor_type)
+        .subquery()
+    )
+    rows = (
+        db.session.query(
+            MaintenanceSchedule.id,
+            MaintenanceSchedule.asset_id,
+            MaintenanceSchedule.name,
+            MaintenanceSchedule.usage_interval,
+            MaintenanceSchedule.last_usage_value,
+            MaintenanceSensorReading.value,
+        )
+        .join(
+            latest,
+            and_(
+                latest.c.asset_id == MaintenanceSchedule.asset_id,
+                latest.c.sensor_type == MaintenanceSchedule.usage_metric,
+            ),
+        )
+        .join(
+            MaintenanceSensorReading,
+            and_(
+                MaintenanceSensorReading.asset_id == latest.c.asset_id,
+                MaintenanceSensorReading.sensor_type == latest.c.sensor_type,
+                MaintenanceSensorReading.recorded_at == latest.c.recorded_at,
+            ),
+        )
+        .filter(
+            MaintenanceSchedule.org_id == org_id,
+            MaintenanceSchedule.is_active.is_(True),
+            MaintenanceSchedule.schedule_type.in_(METER_SCHEDULE_TYPES),
+            MaintenanceSchedule.usage_interval > 0,
+            MaintenanceSensorReading.value.isnot(None),
+            ~_open_work_order_exists(),
         )
-        db.session.add(event)
+        .all()
+    )
+    return [
+        row
+        for row in rows
+        if Decimal(row.value) - Decimal(row.last_usage_value or 0) >= row.usage_interval
+    ]
 
-        if schedule.interval_days:
-            schedule.last_completed_date = schedule.next_due_date
-            schedule.next_due_date = schedule.next_due_date + timedelta(days=schedule.interval_days)
 
-        created_count += 1
+def _generate_for_org(org_id: int, today: date) -> int:
+    now = datetime.now(UTC)
+    time_due = _due_time_schedules(org_id, today)
+    meter_due = _due_meter_schedules(org_id)
+    if not time_due and not meter_due:
+        return 0
 
-    if created_count:
-        db.session.commit()
-    else:
-        db.session.flush()
+    work_orders: list[dict] = []
+    schedule_updates: list[dict] = []
+    for row in time_due:
+        work_orders.append(
+            {
+                "org_id": org_id,
+                "asset_id": row.asset_id,
+                "schedule_id": row.id,
+                "work_type": "preventive",
+                "title": f"PM: {row.name}",
+                "description": f"Preventive maintenance for {row.name}",
+                "status": "open",
+                "priority": "normal",
+                "requested_at": now,
+                "due_date": row.next_due_date,
+            }
+        )
+        if row.interval_days:
+            schedule_updates.append(
+                {
+                    "id": row.id,
+                    "last_completed_date": row.next_due_date,
+                    "next_due_date": _advance(row.next_due_date, row.interval_days, today),
+                }
+            )
+    for row in meter_due:
+        work_orders.append(
+            {
+                "org_id": org_id,
+                "asset_id": row.asset_id,
+                "schedule_id": row.id,
+                "work_type": "preventive",
+                "title": f"PM: {row.name}",
+                "description": f"Preventive maintenance for {row.name} (meter reading {row.value})",
+                "status": "open",
+                "priority": "normal",
+                "requested_at": now,
+                "due_date": today,
+            }
+        )
+        schedule_updates.append({"id": row.id, "last_usage_value": row.value})
+
+    created = db.session.execute(
+        insert(MaintenanceWorkOrder).returning(MaintenanceWorkOrder.id),
+        work_orders,
+    ).scalars().all()
+    db.session.execute(
+        insert(MaintenanceEvent),
+        [
+            {
+                "org_id": org_id,
+                "work_order_id": work_order_id,
+                "event_type": "STATUS_CHANGE",
+                "from_status": None,
+                "to_status": "open",
+                "created_at": now,
+            }
+            for work_order_id in created
+        ],
+    )
+    if schedule_updates:
+        db.session.execute(update(MaintenanceSchedule), schedule_updates)
+    db.session.commit()
+    return len(created)
 
 
-@shared_task(name="erp.tasks.maintenance.check_escalations")
-def check_escalations() -> None:
-    """Trigger escalation events for overdue downtime on critical assets."""
+def _orgs_with_schedules() -> list[int]:
+    rows = (
+        db.session.query(MaintenanceSchedule.org_id)
+        .filter(MaintenanceSchedule.is_active.is_(True))
+        .distinct()
+        .all()
+    )
+    return [org_id for (org_id,) in rows]
 
-    now = datetime.now(UTC)
-    work_orders = MaintenanceWorkOrder.query.filter(
-        MaintenanceWorkOrder.status.in_(["open", "in_progress"]),
-        MaintenanceWorkOrder.downtime_start.isnot(None),
-    ).all()
-    if not work_orders:
-        return
 
+@shared_task(name="erp.tasks.maintenance.generate_scheduled_work_orders")
+def generate_scheduled_work_orders(org_id: int | None = None) -> int:
+    """Create preventive work orders for schedules that are due.
+
+    Runs one org at a time (committing per org) unless *org_id* narrows it
+    to a single chunk; ``fan_out_scheduled_work_orders`` enqueues one chunk
+    per org so workers can generate in parallel.
+    """
+
+    today = date.today()
+    org_ids = [org_id] if org_id is not None else _orgs_with_schedules()
+    return sum(_generate_for_org(oid, today) for oid in org_ids)
+
+
+@shared_task(name="erp.tasks.maintenance.fan_out_scheduled_work_orders")
+def fan_out_scheduled_work_orders() -> list[int]:
+    """Enqueue ``generate_scheduled_work_orders`` once per org."""
+
+    org_ids = _orgs_with_schedules()
+    for oid in org_ids:
+        generate_scheduled_work_orders.delay(oid)
+    return org_ids
+
+
+class _RuleIndex:
+    """Escalation rules of one org bucketed by the asset scope they target."""
+
+    def __init__(self, rules: list[MaintenanceEscalationRule]):
+        self.by_asset: dict[int, list[MaintenanceEscalationRule]] = {}
+        self.by_category: dict[str, list[MaintenanceEscalationRule]] = {}
+        self.unscoped: list[MaintenanceEscalationRule] = []
+        for rule in rules:
+            if rule.asset_id:
+                self.by_asset.setdefault(rule.asset_id, []).append(rule)
+            elif rule.asset_category:
+                self.by_category.setdefault(rule.asset_category, []).append(rule)
+            else:
+                self.unscoped.append(rule)
+
+    def candidates(self, asset: MaintenanceAsset) -> list[MaintenanceEscalationRule]:
+        scoped = [
+            rule
+            for rule in self.by_asset.get(asset.id, ())
+            if not rule.asset_category or rule.asset_category == asset.category
+        ]
+        return scoped + self.by_category.get(asset.category, []) + self.unscoped
+
+
+def _escalate_org(org_id: int, now: datetime) -> int:
     rules = MaintenanceEscalationRule.query.filter(
-        MaintenanceEscalationRule.is_active.is_(True)
+        MaintenanceEscalationRule.org_id == org_id,
+        MaintenanceEscalationRule.is_active.is_(True),
     ).all()
     if not rules:
-        return
+        return 0
 
-    for work_order in work_orders:
-        asset = work_order.asset
-        if not asset or not asset.is_critical:
-            continue
+    work_orders = (
+        MaintenanceWorkOrder.query.join(MaintenanceWorkOrder.asset)
+        .options(contains_eager(MaintenanceWorkOrder.asset))
+        .filter(
+            MaintenanceWorkOrder.org_id == org_id,
+            MaintenanceWorkOrder.status.in_(OPEN_STATUSES),
+            MaintenanceWorkOrder.downtime_start.isnot(None),
+            MaintenanceAsset.is_critical.is_(True),
+        )
+        .all()
+    )
+    if not work_orders:
+        return 0
+
+    fired = set(
+        db.session.query(
+            MaintenanceEscalationEvent.rule_id, MaintenanceEscalationEvent.work_order_id
+        )
+        .filter(
+            MaintenanceEscalationEvent.org_id == org_id,
+            MaintenanceEscalationEvent.rule_id.in_([rule.id for rule in rules]),
+            MaintenanceEscalationEvent.work_order_id.in_([wo.id for wo in work_orders]),
+        )
+        .all()
+    )
 
-        elapsed = now - work_order.downtime_start
-        elapsed_minutes = int(elapsed.total_seconds() // 60)
+    index = _RuleIndex(rules)
+    escalations: list[dict] = []
+    events: list[dict] = []
+    audits: list[dict] = []
+    for work_order in work_orders:
+        downtime_start = work_order.downtime_start
+        if downtime_start.tzinfo is None:
+            downtime_start = downtime_start.replace(tzinfo=UTC)
+        elapsed_minutes = int((now - downtime_start).total_seconds() // 60)
 
-        for rule in rules:
-            if rule.org_id != work_order.org_id:
-                continue
-            if rule.asset_id and rule.asset_id != asset.id:
-                continue
-            if rule.asset_category and rule.asset_category != asset.category:
-                continue
+        for rule in index.candidates(work_order.asset):
             if elapsed_minutes < rule.downtime_threshold_minutes:
                 continue
-
-            exists = MaintenanceEscalationEvent.query.filter_by(
-                org_id=work_order.org_id, rule_id=rule.id, work_order_id=work_order.id
-            ).first()
-            if exists:
+            if (rule.id, work_order.id) in fired:
                 continue
+            fired.add((rule.id, work_order.id))
 
-            escalation = MaintenanceEscalationEvent(
-                org_id=work_order.org_id,
-                rule_id=rule.id,
-                work_order_id=work_order.id,
-                status="triggered",
+            escalations.append(
+                {
+                    "org_id": org_id,
+                    "rule_id": rule.id,
+                    "work_order_id": work_order.id,
+                    "status": "triggered",
+                    "created_at": now,
+                }
             )
-            db.session.add(escalation)
-
-            event = MaintenanceEvent(
-                org_id=work_order.org_id,
-                work_order=work_order,
-                event_type="ESCALATION_TRIGGERED",
-                message=f"Escalation rule {rule.name} triggered after {elapsed_minutes} minutes",
+            events.append(
+                {
+                    "org_id": org_id,
+                    "work_order_id": work_order.id,
+                    "event_type": "ESCALATION_TRIGGERED",
+                    "message": f"Escalation rule {rule.name} triggered after {elapsed_minutes} minutes",
+                    "created_at": now,
+                }
             )
-            db.session.add(event)
-
-            audit = FinanceAuditLog(
-                org_id=work_order.org_id,
-                event_type="MAINTENANCE_ESCALATION",
-                entity_type="MAINTENANCE_WORK_ORDER",
-                entity_id=work_order.id,
-                payload={"rule": rule.name, "elapsed_minutes": elapsed_minutes},
+            audits.append(
+                {
+                    "org_id": org_id,
+                    "event_type": "MAINTENANCE_ESCALATION",
+                    "entity_type": "MAINTENANCE_WORK_ORDER",
+                    "entity_id": work_order.id,
+                    "payload": {"rule": rule.name, "elapsed_minutes": elapsed_minutes},
+                }
             )
-            db.session.add(audit)
 
+    if escalations:
+        db.session.execute(insert(MaintenanceEscalationEvent), escalations)
+        db.session.execute(insert(MaintenanceEvent), events)
+        db.session.execute(insert(FinanceAuditLog), audits)
     db.session.commit()
+    return len(escalations)
+
+
+@shared_task(name="erp.tasks.maintenance.check_escalations")
+def check_escalations(org_id: int | None = None) -> int:
+    """Trigger escalation events for overdue downtime on critical assets.
+
+    Each org is evaluated as its own chunk: rules are indexed by asset and
+    category, assets are eager-loaded with the work orders, and the
+    (rule, work order) pairs that already fired are prefetched in one query.
+    """
+
+    now = datetime.now(UTC)
+    if org_id is not None:
+        org_ids = [org_id]
+    else:
+        org_ids = [
+            oid
+            for (oid,) in db.session.query(MaintenanceEscalationRule.org_id)
+            .filter(MaintenanceEscalationRule.is_active.is_(True))
+            .distinct()
+            .all()
+        ]
+    return sum(_escalate_org(oid, now) for oid in org_ids)
@@ -0,0 +1,13 @@
+"""Periodic refresh of materialised marketing segment membership."""
+from __future__ import annotations
+
+from celery import shared_task
+
+from erp.services.marketing_segment_compiler import refresh_active_segments
+
+
+@shared_task(name="erp.tasks.marketing.refresh_segments")
+def refresh_segments() -> dict[int, dict]:
+    """Re-evaluate clients changed since each active segment's last refresh."""
+
+    return refresh_active_segments()
@@ -0,0 +1,13 @@
+"""Periodic flush of buffered session activity."""
+from __future__ import annotations
+
+from celery import shared_task
+
+from erp.services.session_activity import get_tracker
+
+
+@shared_task(name="erp.tasks.sessions.flush_activity")
+def flush_activity():
+    """Write buffered last-seen timestamps (shared via Redis) to user_sessions."""
+
+    return {"updated": get_tracker().flush()}
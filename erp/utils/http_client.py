@@ -1,32 +1,336 @@
-"""Module: utils/http_client.py — audit-added docstring. Refine with precise purpose when convenient."""
+"""Module: utils/http_client.py — shared outbound HTTP layer.
+
+Every outbound call goes through one pooled ``httpx.Client``, or a
+per-event-loop ``httpx.AsyncClient`` for async callers and fan-out. So
+connections, and their TLS sessions, are reused across requests. HTTP/2
+is negotiated when the ``h2`` package is installed.
+
+Each request passes through the same policy stack:
+
+* a per-host concurrency limit. ``HTTP_CLIENT_MAX_PER_HOST`` sets it for
+  every host, and ``HTTP_CLIENT_HOST_LIMITS="host=n,..."`` overrides it
+  for particular hosts.
+* the shared circuit breaker for the upstream. Pass ``breaker=None``
+  when the caller records outcomes on its own breaker.
+* ``retry_external`` for transport errors, 429 and 5xx. Other 4xx
+  responses raise :class:`UpstreamError` and are not retried.
+
+Latency is recorded per upstream in ``erp_http_client_request_seconds``.
+"""
 # erp/utils/http_client.py
 from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections.abc import Sequence
+from typing import Any
+from urllib.parse import urlsplit
+
 import httpx
-from erp.utils.retries import retry_external, ExternalError
-from erp.utils.circuit import breaker
 
-# Shared HTTPX client; consider AsyncClient if you run async.
-_client = httpx.Client(timeout=httpx.Timeout(5.0, read=10.0))
+from erp.metrics import HTTP_CLIENT_LATENCY
+from erp.reliability.circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from erp.utils.retries import ExternalError, retry_external
+
+DEFAULT_TIMEOUT = httpx.Timeout(5.0, read=10.0)
+RETRYABLE_STATUS = frozenset({429, *range(500, 600)})
+
+_DEFAULT = object()
+
 
-@retry_external
-@breaker
-def get_json(url: str, *, headers: dict | None = None) -> dict:
+class UpstreamError(Exception):
+    """Non-retryable upstream response (4xx other than 429)."""
+
+    def __init__(self, response: httpx.Response) -> None:
+        super().__init__(f"{response.request.method} {response.request.url} -> {response.status_code}")
+        self.response = response
+        self.status_code = response.status_code
+
+
+def _http2() -> bool:
+    if os.getenv("HTTP_CLIENT_HTTP2", "1") == "0":
+        return False
     try:
-        r = _client.get(url, headers=headers)
-        r.raise_for_status()
-        return r.json()
-    except Exception as e:
-        raise ExternalError(str(e)) from e
-
-@retry_external
-@breaker
-def post_json(url: str, payload: dict, *, headers: dict | None = None) -> dict:
+        import h2  # noqa: F401  # type: ignore
+    except ImportError:
+        return False
+    return True
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_CLIENT_KEEPALIVE_SECONDS", "30")),
+    )
+
+
+def _host_limit(host: str) -> int:
+    for item in os.getenv("HTTP_CLIENT_HOST_LIMITS", "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() == host and value.strip():
+            return int(value)
+    return int(os.getenv("HTTP_CLIENT_MAX_PER_HOST", "10"))
+
+
+# -- pooled clients ----------------------------------------------------------
+
+_lock = threading.Lock()
+_client: httpx.Client | None = None
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def sync_client() -> httpx.Client:
+    """Process-wide pooled client (thread-safe)."""
+
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(timeout=DEFAULT_TIMEOUT, limits=_limits(), http2=_http2())
+        return _client
+
+
+def new_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=_limits(), http2=_http2())
+
+
+def async_client() -> httpx.AsyncClient:
+    """Pooled client for the running event loop."""
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = new_async_client()
+    return client
+
+
+def close() -> None:
+    """Close the sync pool; the next request opens a fresh one."""
+
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _host_slots.clear()
+
+
+def _reset_after_fork() -> None:
+    # Pooled sockets must not be shared with a forked worker.
+    global _client, _lock
+    _client = None
+    _lock = threading.Lock()
+    _host_slots.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _sync_slot(host: str) -> threading.BoundedSemaphore:
+    with _lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(_host_limit(host))
+        return slot
+
+
+def _async_slot(host: str) -> asyncio.Semaphore:
+    slots = _async_slots.setdefault(asyncio.get_running_loop(), {})
+    slot = slots.get(host)
+    if slot is None:
+        slot = slots[host] = asyncio.Semaphore(_host_limit(host))
+    return slot
+
+
+# -- policy helpers ----------------------------------------------------------
+
+
+def _resolve_breaker(breaker: Any, upstream: str) -> CircuitBreaker | None:
+    if breaker is _DEFAULT:
+        return get_breaker(f"http:{upstream}")
+    return breaker
+
+
+def _check(response: httpx.Response) -> httpx.Response:
+    if response.status_code in RETRYABLE_STATUS:
+        raise ExternalError(f"{response.request.url} -> {response.status_code}")
+    if response.status_code >= 400:
+        raise UpstreamError(response)
+    return response
+
+
+def _observe(upstream: str, method: str, outcome: str, started: float) -> None:
+    HTTP_CLIENT_LATENCY.labels(upstream, method, outcome).observe(time.perf_counter() - started)
+
+
+def _send(method: str, url: str, upstream: str, breaker: CircuitBreaker | None, kwargs: dict) -> httpx.Response:
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+    host = urlsplit(url).hostname or ""
+    slot = _sync_slot(host)
+    if not slot.acquire(timeout=DEFAULT_TIMEOUT.pool or 5.0):
+        raise ExternalError(f"per-host limit reached for {host}")
+    started = time.perf_counter()
     try:
-        r = _client.post(url, json=payload, headers=headers)
-        r.raise_for_status()
-        return r.json()
-    except Exception as e:
-        raise ExternalError(str(e)) from e
+        response = sync_client().request(method, url, **kwargs)
+    except httpx.HTTPError as exc:
+        _observe(upstream, method, "error", started)
+        if breaker is not None:
+            breaker.record_failure()
+        raise ExternalError(str(exc)) from exc
+    finally:
+        slot.release()
+    _observe(upstream, method, str(response.status_code), started)
+    if breaker is not None:
+        # Only server-side trouble counts against the upstream.
+        if response.status_code in RETRYABLE_STATUS:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    return _check(response)
+
+
+async def _asend(
+    method: str,
+    url: str,
+    upstream: str,
+    breaker: CircuitBreaker | None,
+    client: httpx.AsyncClient | None,
+    kwargs: dict,
+) -> httpx.Response:
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+    host = urlsplit(url).hostname or ""
+    async with _async_slot(host):
+        started = time.perf_counter()
+        try:
+            response = await (client or async_client()).request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            _observe(upstream, method, "error", started)
+            if breaker is not None:
+                breaker.record_failure()
+            raise ExternalError(str(exc)) from exc
+    _observe(upstream, method, str(response.status_code), started)
+    if breaker is not None:
+        if response.status_code in RETRYABLE_STATUS:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    return _check(response)
+
+
+# -- public API --------------------------------------------------------------
+
+
+def request(
+    method: str,
+    url: str,
+    *,
+    upstream: str | None = None,
+    retry: bool = True,
+    breaker: Any = _DEFAULT,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Send one request through the pooled client and policy stack.
+
+    *upstream* names the dependency for metrics and the default breaker
+    (the URL host when omitted). Remaining keyword arguments go to
+    ``httpx.Client.request``.
+    """
+
+    upstream = upstream or urlsplit(url).hostname or "unknown"
+    resolved = _resolve_breaker(breaker, upstream)
+    method = method.upper()
+    if not retry:
+        return _send(method, url, upstream, resolved, kwargs)
+    return retry_external(_send)(method, url, upstream, resolved, kwargs)
+
+
+async def arequest(
+    method: str,
+    url: str,
+    *,
+    upstream: str | None = None,
+    retry: bool = True,
+    breaker: Any = _DEFAULT,
+    client: httpx.AsyncClient | None = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Async counterpart of :func:`request`."""
+
+    upstream = upstream or urlsplit(url).hostname or "unknown"
+    resolved = _resolve_breaker(breaker, upstream)
+    method = method.upper()
+    if not retry:
+        return await _asend(method, url, upstream, resolved, client, kwargs)
+    return await retry_external(_asend)(method, url, upstream, resolved, client, kwargs)
+
+
+def get_json(url: str, *, headers: dict | None = None, upstream: str | None = None, **kwargs: Any) -> dict:
+    return request("GET", url, headers=headers, upstream=upstream, **kwargs).json()
+
+
+def post_json(
+    url: str, payload: dict, *, headers: dict | None = None, upstream: str | None = None, **kwargs: Any
+) -> dict:
+    return request("POST", url, json=payload, headers=headers, upstream=upstream, **kwargs).json()
+
+
+async def aget_json(url: str, *, headers: dict | None = None, upstream: str | None = None, **kwargs: Any) -> dict:
+    response = await arequest("GET", url, headers=headers, upstream=upstream, **kwargs)
+    return response.json()
+
+
+async def agather_json(
+    urls: Sequence[str], *, headers: dict | None = None, upstream: str | None = None, **kwargs: Any
+) -> list[Any]:
+    """GET *urls* concurrently; failures are returned in place as exceptions."""
+
+    return list(
+        await asyncio.gather(
+            *(aget_json(url, headers=headers, upstream=upstream, **kwargs) for url in urls),
+            return_exceptions=True,
+        )
+    )
+
+
+def gather_json(
+    urls: Sequence[str], *, headers: dict | None = None, upstream: str | None = None, **kwargs: Any
+) -> list[Any]:
+    """Fan-out helper for sync callers (views, Celery tasks).
+
+    Runs :func:`agather_json` on a private event loop with its own pooled
+    client, still bounded by the per-host limits. Must not be called from
+    inside a running loop; await :func:`agather_json` there instead.
+    """
+
+    async def _run() -> list[Any]:
+        async with new_async_client() as client:
+            return await agather_json(urls, headers=headers, upstream=upstream, client=client, **kwargs)
 
+    return asyncio.run(_run())
 
 
+__all__ = [
+    "UpstreamError",
+    "agather_json",
+    "aget_json",
+    "arequest",
+    "async_client",
+    "close",
+    "gather_json",
+    "get_json",
+    "post_json",
+    "request",
+    "sync_client",
+]
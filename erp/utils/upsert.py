@@ -0,0 +1,70 @@
+"""``INSERT ... ON CONFLICT`` helpers shared by bulk writers.
+
+PostgreSQL and SQLite get a single upsert statement. Other dialects fall
+back to ``UPDATE`` then ``INSERT`` per row, which is only safe when the
+caller already serialises writers to the same keys.
+"""
+from __future__ import annotations
+
+from collections.abc import Sequence
+from typing import Any
+
+from sqlalchemy import Table, and_, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+__all__ = ["conflict_insert", "upsert_counts"]
+
+
+def _dialect_name(bind: Session | Connection) -> str:
+    dialect = getattr(bind, "dialect", None) or bind.get_bind().dialect
+    return dialect.name
+
+
+def conflict_insert(bind: Session | Connection, table: Table):
+    """``insert(table)`` supporting ``on_conflict_*`` on *bind*, or ``None``.
+
+    Callers keep their own fallback for dialects without ``ON CONFLICT``.
+    """
+
+    name = _dialect_name(bind)
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+def upsert_counts(
+    bind: Session | Connection,
+    table: Table,
+    rows: Sequence[dict[str, Any]],
+    *,
+    keys: Sequence[str],
+    column: str,
+    replace: bool = False,
+) -> None:
+    """Insert *rows*, adding ``rows[column]`` to existing counters on *keys*.
+
+    With ``replace=True`` existing counters are set to the row's value
+    instead. *keys* must match a unique index of *table*.
+    """
+
+    if not rows:
+        return
+    counter = table.c[column]
+    stmt = conflict_insert(bind, table)
+    if stmt is not None:
+        new_value = stmt.excluded[column] if replace else counter + stmt.excluded[column]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[k] for k in keys], set_={column: new_value}
+        )
+        bind.execute(stmt, list(rows))
+        return
+    for row in rows:
+        match = and_(*(table.c[k] == row[k] for k in keys))
+        value = row[column] if replace else counter + row[column]
+        if not bind.execute(update(table).where(match).values({column: value})).rowcount:
+            bind.execute(table.insert(), [row])
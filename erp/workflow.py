@@ -1,22 +1,19 @@
 """Module: workflow.py — audit-added docstring. Refine with precise purpose when convenient."""
 from functools import wraps
 from flask import session, abort
-from db import get_db
+from db import get_engine
 from sqlalchemy import text
 
 
 def get_workflow(module):
     """Return (enabled, steps_json) for module in current org."""
-    conn = get_db()
-    cur = conn.execute(
-        text(
-            "SELECT enabled, steps FROM workflows WHERE org_id = :org AND module = :mod"
-        ),
-        {"org": session.get("org_id"), "mod": module},
-    )
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with get_engine().connect() as conn:
+        row = conn.execute(
+            text(
+                "SELECT enabled, steps FROM workflows WHERE org_id = :org AND module = :mod"
+            ),
+            {"org": session.get("org_id"), "mod": module},
+        ).fetchone()
     if row:
         return row[0], row[1]
     return True, "[]"
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import uuid
+from decimal import Decimal
+
+from erp.extensions import db
+from erp.inventory.costing import FIFO, WEIGHTED_AVERAGE, FifoLayers, revalue
+from erp.inventory.models import StockLedgerEntry, StockValuation
+from erp.services.stock_posting import StockMovement, post_movements
+
+
+def _receipt(item_id, warehouse_id, qty, cost):
+    return StockMovement(
+        item_id=item_id,
+        warehouse_id=warehouse_id,
+        delta=Decimal(qty),
+        tx_type="receipt",
+        unit_cost=Decimal(cost),
+    )
+
+
+def _issue(item_id, warehouse_id, qty):
+    return StockMovement(item_id=item_id, warehouse_id=warehouse_id, delta=-Decimal(qty), tx_type="issue")
+
+
+def _valuation(org_id, item_id, warehouse_id):
+    return (
+        db.session.query(StockValuation)
+        .filter_by(org_id=org_id, item_id=item_id, warehouse_id=warehouse_id)
+        .one()
+    )
+
+
+def test_fifo_layers_cost_issues_across_layers():
+    layers = FifoLayers()
+    layers.add(uuid.uuid4(), Decimal("10"), Decimal("2"))
+    layers.add(uuid.uuid4(), Decimal("5"), Decimal("3"))
+
+    assert layers.issue(Decimal("4")) == Decimal("8")
+    assert layers.issue(Decimal("8")) == Decimal("12") + Decimal("6")
+    assert [layers.remaining(i) for i in range(2)] == [Decimal("0"), Decimal("3")]
+    # Beyond the open layers, issues fall back to the last receipt cost.
+    assert layers.issue(Decimal("5")) == Decimal("9") + Decimal("6")
+
+
+def test_fifo_issue_consumes_oldest_layers(app, monkeypatch, db_session, resolve_org_id):
+    monkeypatch.setitem(app.config, "INVENTORY_VALUATION_METHOD", FIFO)
+    org_id = resolve_org_id()
+    item_id, warehouse_id = uuid.uuid4(), uuid.uuid4()
+    post_movements(org_id, [_receipt(item_id, warehouse_id, "10", "2")])
+    post_movements(org_id, [_receipt(item_id, warehouse_id, "10", "4")])
+    result = post_movements(org_id, [_issue(item_id, warehouse_id, "15")])
+
+    entry = db.session.get(StockLedgerEntry, result.ledger_ids[0])
+    assert Decimal(entry.unit_cost) == Decimal("2.6667")
+    valuation = _valuation(org_id, item_id, warehouse_id)
+    assert Decimal(valuation.qty) == Decimal("5")
+    assert Decimal(valuation.value) == Decimal("20")
+
+
+def test_weighted_average_issue_cost(app, monkeypatch, db_session, resolve_org_id):
+    monkeypatch.setitem(app.config, "INVENTORY_VALUATION_METHOD", WEIGHTED_AVERAGE)
+    org_id = resolve_org_id()
+    item_id, warehouse_id = uuid.uuid4(), uuid.uuid4()
+    post_movements(
+        org_id,
+        [_receipt(item_id, warehouse_id, "10", "2"), _receipt(item_id, warehouse_id, "10", "4")],
+    )
+    result = post_movements(org_id, [_issue(item_id, warehouse_id, "5")])
+
+    entry = db.session.get(StockLedgerEntry, result.ledger_ids[0])
+    assert Decimal(entry.unit_cost) == Decimal("3")
+    assert Decimal(_valuation(org_id, item_id, warehouse_id).value) == Decimal("45")
+
+
+def test_revalue_matches_incremental_costing(app, monkeypatch, db_session, resolve_org_id):
+    monkeypatch.setitem(app.config, "INVENTORY_VALUATION_METHOD", FIFO)
+    org_id = resolve_org_id()
+    item_id, warehouse_id = uuid.uuid4(), uuid.uuid4()
+    for qty, cost in (("8", "1.5"), ("4", "2"), ("6", "2.5")):
+        post_movements(org_id, [_receipt(item_id, warehouse_id, qty, cost)])
+        post_movements(org_id, [_issue(item_id, warehouse_id, "3")])
+    incremental = _valuation(org_id, item_id, warehouse_id)
+    qty, value = Decimal(incremental.qty), Decimal(incremental.value)
+
+    result = revalue(db.session, org_id, item_id, warehouse_id, FIFO)
+
+    assert result["qty"] == qty
+    assert result["value"] == value
+    assert result["issues"] == 3
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from erp.extensions import db
+from erp.inventory.fefo import expiring_page, fefo_pick_list
+from erp.inventory.models import Lot
+from erp.services.stock_posting import StockMovement, post_movements
+
+
+def _lot(org_id, item_id, number, expiry):
+    lot = Lot(org_id=org_id, item_id=item_id, number=number, expiry=expiry, is_active=True)
+    db.session.add(lot)
+    db.session.flush()
+    return lot
+
+
+def test_pick_list_allocates_earliest_expiry_first(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    item_id, warehouse_id = uuid.uuid4(), uuid.uuid4()
+    today = date.today()
+    expired = _lot(org_id, item_id, "OLD", today - timedelta(days=1))
+    late = _lot(org_id, item_id, "LATE", today + timedelta(days=60))
+    soon = _lot(org_id, item_id, "SOON", today + timedelta(days=5))
+    post_movements(
+        org_id,
+        [
+            StockMovement(item_id=item_id, warehouse_id=warehouse_id, delta=Decimal(qty), lot_id=lot.id)
+            for lot, qty in ((expired, "9"), (late, "10"), (soon, "4"))
+        ],
+    )
+
+    first, second = fefo_pick_list(
+        org_id, [(item_id, Decimal("3")), (item_id, Decimal("12"))], warehouse_id=warehouse_id
+    )
+
+    assert [(p["lot_number"], p["qty"]) for p in first.picks] == [("SOON", Decimal("3"))]
+    assert [(p["lot_number"], p["qty"]) for p in second.picks] == [
+        ("SOON", Decimal("1")),
+        ("LATE", Decimal("10")),
+    ]
+    assert second.shortfall == Decimal("1")
+
+
+def test_expiring_page_walks_all_lots_with_cursor(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    item_id = uuid.uuid4()
+    today = date.today()
+    for n in range(7):
+        _lot(org_id, item_id, f"L{n}", today + timedelta(days=n % 3))
+
+    seen, cursor = [], None
+    while True:
+        lots, cursor = expiring_page(org_id, today + timedelta(days=30), after=cursor, limit=3)
+        seen.extend(lot.number for lot in lots)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == [f"L{n}" for n in range(7)]
+    assert len(set(seen)) == 7
+
+
+def test_expiring_page_treats_non_positive_limit_as_one(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    item_id = uuid.uuid4()
+    today = date.today()
+    for n in range(2):
+        _lot(org_id, item_id, f"Z{n}", today + timedelta(days=n))
+
+    lots, cursor = expiring_page(org_id, today + timedelta(days=30), limit=0)
+
+    assert [lot.number for lot in lots] == ["Z0"]
+    assert cursor is not None
+
+
+def test_expiry_alerts_log_each_lot_once_per_expiry(db_session, resolve_org_id):
+    from erp.models import FinanceAuditLog
+    from erp.tasks.inventory import expiry_alerts
+
+    org_id = resolve_org_id()
+    item_id = uuid.uuid4()
+    today = date.today()
+    lots = [_lot(org_id, item_id, f"A{n}", today + timedelta(days=n)) for n in range(3)]
+    db.session.commit()
+
+    def alerted():
+        rows = FinanceAuditLog.query.filter_by(org_id=org_id, event_type="LOT_EXPIRY_ALERT").all()
+        return sorted(row.payload["lot_number"] for row in rows)
+
+    expiry_alerts.run(days=30)
+    assert alerted() == ["A0", "A1", "A2"]
+
+    expiry_alerts.run(days=30)
+    assert alerted() == ["A0", "A1", "A2"]
+
+    lots[0].expiry = today + timedelta(days=10)
+    db.session.commit()
+    expiry_alerts.run(days=30)
+    assert alerted() == ["A0", "A0", "A1", "A2"]
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import uuid
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+from erp.extensions import db
+from erp.inventory.history import quantities_as_of, write_checkpoint
+from erp.inventory.models import StockLedgerEntry
+
+
+def _entry(org_id, item_id, warehouse_id, qty, at):
+    db.session.add(
+        StockLedgerEntry(
+            org_id=org_id,
+            item_id=item_id,
+            warehouse_id=warehouse_id,
+            quantity_delta=Decimal(qty),
+            tx_type="test",
+            created_at=at,
+        )
+    )
+
+
+def test_as_of_matches_full_replay_around_checkpoints(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    warehouse_id = uuid.uuid4()
+    items = [uuid.uuid4() for _ in range(3)]
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    for day in range(10):
+        for n, item in enumerate(items, start=1):
+            _entry(org_id, item, warehouse_id, n * (1 if day % 3 else -1) + 2, start + timedelta(days=day, hours=12))
+    db_session.flush()
+
+    expected = {
+        t: quantities_as_of(org_id, t, item_ids=items)
+        for t in (start + timedelta(days=d) for d in (2, 5, 8))
+    }
+    write_checkpoint(org_id, start + timedelta(days=4))
+    write_checkpoint(org_id, start + timedelta(days=7), period="monthly")
+    db_session.flush()
+
+    for t, quantities in expected.items():
+        assert quantities_as_of(org_id, t, item_ids=items) == quantities
+
+    day5 = expected[start + timedelta(days=5)]
+    assert day5[(items[0], warehouse_id, None)] == Decimal("11")
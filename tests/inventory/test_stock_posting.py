@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from erp.extensions import db
+from erp.inventory.models import StockBalance, StockLedgerEntry
+from erp.services.stock_posting import NegativeStockError, StockMovement, post_movements
+
+
+def _balance(org_id, item_id, warehouse_id):
+    qty = (
+        db.session.query(StockBalance.qty_on_hand)
+        .filter_by(org_id=org_id, item_id=item_id, warehouse_id=warehouse_id)
+        .scalar()
+    )
+    return Decimal(qty) if qty is not None else None
+
+
+def _post_counting(org_id, movements):
+    statements = []
+
+    def _count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "SELECT")):
+            statements.append(statement)
+
+    engine = db.session.get_bind().engine
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        result = post_movements(org_id, movements)
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+    return result, len(statements)
+
+
+def test_batch_posts_with_constant_statement_count(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    warehouse_id = uuid.uuid4()
+    items = [uuid.uuid4() for _ in range(40)]
+    movements = [
+        StockMovement(item_id=item, warehouse_id=warehouse_id, delta=Decimal("2"), tx_type="GRN")
+        for item in items
+    ] + [StockMovement(item_id=items[0], warehouse_id=warehouse_id, delta=Decimal("3"), tx_type="GRN")]
+    small = [
+        StockMovement(item_id=uuid.uuid4(), warehouse_id=warehouse_id, delta=Decimal("2"), tx_type="GRN")
+        for _ in range(2)
+    ]
+
+    _, small_count = _post_counting(org_id, small)
+    result, count = _post_counting(org_id, movements)
+
+    assert len(result.ledger_ids) == 41
+    assert count == small_count
+    assert _balance(org_id, items[0], warehouse_id) == Decimal("5")
+    assert _balance(org_id, items[-1], warehouse_id) == Decimal("2")
+
+
+def test_negative_batch_is_rejected_atomically(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    warehouse_id = uuid.uuid4()
+    ok_item, short_item = uuid.uuid4(), uuid.uuid4()
+    post_movements(
+        org_id,
+        [
+            StockMovement(item_id=ok_item, warehouse_id=warehouse_id, delta=Decimal("5")),
+            StockMovement(item_id=short_item, warehouse_id=warehouse_id, delta=Decimal("1")),
+        ],
+    )
+
+    with pytest.raises(NegativeStockError) as excinfo:
+        post_movements(
+            org_id,
+            [
+                StockMovement(item_id=ok_item, warehouse_id=warehouse_id, delta=Decimal("-2")),
+                StockMovement(item_id=short_item, warehouse_id=warehouse_id, delta=Decimal("-4")),
+            ],
+        )
+
+    assert excinfo.value.keys == [(short_item, warehouse_id)]
+    assert _balance(org_id, ok_item, warehouse_id) == Decimal("5")
+    assert _balance(org_id, short_item, warehouse_id) == Decimal("1")
+    assert StockLedgerEntry.query.filter_by(org_id=org_id, warehouse_id=warehouse_id).count() == 2
+
+
+def test_idempotency_keys_are_posted_once(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    item_id, warehouse_id = uuid.uuid4(), uuid.uuid4()
+    movement = StockMovement(
+        item_id=item_id, warehouse_id=warehouse_id, delta=Decimal("4"), idempotency_key="grn:1:1"
+    )
+
+    first = post_movements(org_id, [movement, movement])
+    second = post_movements(org_id, [movement])
+
+    assert len(first.ledger_ids) == 1
+    assert first.skipped_keys == ["grn:1:1"]
+    assert second.ledger_ids == [] and second.skipped_keys == ["grn:1:1"]
+    assert _balance(org_id, item_id, warehouse_id) == Decimal("4")
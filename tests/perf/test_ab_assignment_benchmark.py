@@ -0,0 +1,23 @@
+import os
+import time
+from collections import Counter
+
+from erp.services.marketing_ab import VariantTable
+
+# Set AB_BENCH_RECIPIENTS=1000000 for the full benchmark and its timing assert.
+FULL_RUN = "AB_BENCH_RECIPIENTS" in os.environ
+RECIPIENTS = int(os.getenv("AB_BENCH_RECIPIENTS", 50_000))
+
+
+def test_bulk_assignment_matches_variant_weights():
+    table = VariantTable(campaign_id=42, variant_ids=(1, 2, 3), bounds=(5000, 8000, 10000))
+
+    start = time.perf_counter()
+    counts = Counter(table.variants_for(range(RECIPIENTS)))
+    elapsed = time.perf_counter() - start
+
+    assert sum(counts.values()) == RECIPIENTS
+    for variant_id, share in ((1, 0.5), (2, 0.3), (3, 0.2)):
+        assert abs(counts[variant_id] / RECIPIENTS - share) < 0.005
+    if FULL_RUN:
+        assert elapsed < 5, f"assigning {RECIPIENTS} recipients took {elapsed:.2f}s"
@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine, event, text
+
+from erp import engines
+
+
+def _count_connects(engine, counter):
+    event.listen(engine.pool, "connect", lambda *_: counter.append(1))
+
+
+def test_registry_reuses_pooled_connections(tmp_path, monkeypatch):
+    url = f"sqlite+pysqlite:///{tmp_path}/churn.db"
+    monkeypatch.setenv("DATABASE_URL", url)
+    engines.dispose_all()
+
+    # Old behaviour: a fresh engine (and pool) per request.
+    legacy_opens: list[int] = []
+    for _ in range(50):
+        engine = create_engine(url, pool_pre_ping=True)
+        _count_connects(engine, legacy_opens)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        engine.dispose()
+
+    registry_opens: list[int] = []
+    shared = engines.get_engine()
+    _count_connects(shared, registry_opens)
+    for _ in range(50):
+        engine = engines.get_engine()
+        assert engine is shared
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    assert len(legacy_opens) == 50
+    assert len(registry_opens) == 1
+    engines.dispose_all()
+
+
+def test_server_databases_get_sized_timed_pool():
+    options = engines.engine_options(
+        "postgresql+psycopg2://u:p@db/erp",
+        engines.REPLICA,
+        {"DB_POOL_SIZE": 5, "DB_MAX_OVERFLOW": 7},
+    )
+
+    assert options["poolclass"] is engines.TimedQueuePool
+    assert options["pool_size"] == 5
+    assert options["max_overflow"] == 7
+    assert options["pool_pre_ping"] is True
+    assert options["pool_recycle"] == engines.DEFAULTS["DB_POOL_RECYCLE"]
@@ -0,0 +1,45 @@
+import random
+import re
+import time
+
+from erp.bots import nlp_intents
+from erp.bots.nlp_intents import INTENT_RULES, parse_intent
+
+TEMPLATES = [
+    "please approve order {n}",
+    "reject invoice #{n}",
+    "how much stock for item {n}",
+    "reorder {n} pcs",
+    "cash balance today",
+    "send bank statement",
+    "end of day report {n}",
+    "analytics score for team {n}",
+    "aprove po {n}",
+    "inventroy check",
+    "good morning {n}",
+]
+
+
+def _legacy(text: str):
+    cleaned = (text or "").lower().strip()
+    for pattern, intent in INTENT_RULES:
+        if re.search(pattern, cleaned):
+            return intent
+    return None
+
+
+def test_parse_10k_corpus_fast_and_consistent():
+    rng = random.Random(7)
+    corpus = [rng.choice(TEMPLATES).format(n=rng.randint(1, 500)) for _ in range(10_000)]
+    nlp_intents._parse_cleaned.cache_clear()
+
+    start = time.perf_counter()
+    results = [parse_intent(text) for text in corpus]
+    duration = time.perf_counter() - start
+
+    assert duration < 2.0, f"parsing 10k messages took {duration:.2f}s"
+    for text, intent in zip(corpus, results):
+        legacy = _legacy(text)
+        if legacy is not None:
+            assert intent == legacy, text
+    assert nlp_intents._parse_cleaned.cache_info().hits > 0
@@ -0,0 +1,97 @@
+import os
+import time
+from datetime import date
+from types import SimpleNamespace
+
+from sqlalchemy import Column, Date, DateTime, Integer, Numeric, String, create_engine, text
+from sqlalchemy.orm import DeclarativeBase, Session
+
+from erp.services.marketing_segment_compiler import ClientSource, iter_audience
+from erp.services.marketing_segment_eval import matches_segment
+
+# Set SEGMENT_BENCH_CLIENTS=1000000 for the full benchmark and its timing asserts.
+FULL_RUN = "SEGMENT_BENCH_CLIENTS" in os.environ
+CLIENTS = int(os.getenv("SEGMENT_BENCH_CLIENTS", 50_000))
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Client(Base):
+    __tablename__ = "bench_clients"
+    id = Column(Integer, primary_key=True)
+    org_id = Column(Integer, nullable=False)
+    client_type = Column(String(32))
+    region = Column(String(64))
+    last_order_date = Column(Date)
+    avg_monthly_spend = Column(Numeric(14, 2))
+    updated_at = Column(DateTime)
+
+
+SOURCE = ClientSource(
+    id=Client.id,
+    org_id=Client.org_id,
+    updated_at=Client.updated_at,
+    fields={
+        "client_type": Client.client_type,
+        "region": Client.region,
+        "last_order_date": Client.last_order_date,
+        "avg_monthly_spend": Client.avg_monthly_spend,
+    },
+)
+
+
+def test_compiled_segment_matches_python_evaluation(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/segments.db")
+    Base.metadata.create_all(engine)
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count)
+                INSERT INTO bench_clients (id, org_id, client_type, region, last_order_date, avg_monthly_spend)
+                SELECT i, 1,
+                       CASE i % 4 WHEN 0 THEN 'hospital' WHEN 1 THEN 'clinic' WHEN 2 THEN 'pharmacy' ELSE 'lab' END,
+                       CASE i % 3 WHEN 0 THEN 'Addis Ababa' WHEN 1 THEN 'Oromia' ELSE 'Amhara' END,
+                       date(:today, '-' || (i % 90) || ' days'),
+                       (i * 7919) % 60000
+                FROM n
+                """
+            ),
+            {"count": CLIENTS, "today": today.isoformat()},
+        )
+    rules = {
+        "client_type": ["hospital", "clinic"],
+        "region": ["Addis Ababa"],
+        "last_order_days_lte": 30,
+        "avg_monthly_spend_gte": 30_000,
+    }
+
+    with Session(engine) as session:
+        start = time.perf_counter()
+        audience = sum(1 for _ in iter_audience(rules, org_id=1, source=SOURCE, session=session, batch_size=5000))
+        compiled_s = time.perf_counter() - start
+
+        # Baseline: load every client and evaluate it in Python.
+        start = time.perf_counter()
+        rows = session.execute(
+            text("SELECT client_type, region, last_order_date, avg_monthly_spend FROM bench_clients")
+        )
+        expected = 0
+        for client_type, region, last_order, spend in rows:
+            client = SimpleNamespace(
+                client_type=client_type,
+                region=region,
+                last_order_date=date.fromisoformat(last_order),
+                avg_monthly_spend=spend,
+            )
+            expected += matches_segment(client, rules)
+        python_s = time.perf_counter() - start
+
+    assert audience == expected
+    assert 0 < audience < CLIENTS // 12
+    if FULL_RUN:
+        assert compiled_s < python_s, f"compiled {compiled_s:.2f}s vs python {python_s:.2f}s"
+        assert compiled_s < 10, f"compiled audience took {compiled_s:.2f}s for {CLIENTS} clients"
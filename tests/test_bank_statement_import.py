@@ -0,0 +1,173 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from erp.banking.models import BankAccount
+from erp.banking.statement_import import (
+    Closing,
+    Opening,
+    Row,
+    RowError,
+    StatementFormatError,
+    parse_camt053,
+    parse_csv,
+    parse_mt940,
+)
+from erp.extensions import db
+from erp.models.finance_gl import BankStatement, BankStatementLine
+
+IMPORT_URL = "/api/finance/reconcile/bank-statements/import"
+
+MT940 = b"""\
+:20:STMT-1
+:25:ETB/1000123
+:28C:1/1
+:60F:C240101ETB1000,00
+:61:2401020102C250,00NTRFINV-7//BR-1
+:86:Customer payment
+:61:2401030103D100,NCHGNONREF//BR-2
+:86:Bank
+ charges
+:62F:C240103ETB1150,00
+-
+"""
+
+CAMT = b"""<?xml version="1.0"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02"><BkToCstmrStmt><Stmt>
+<Bal><Tp><CdOrPrtry><Cd>OPBD</Cd></CdOrPrtry></Tp><Amt Ccy="ETB">500.00</Amt><CdtDbtInd>CRDT</CdtDbtInd></Bal>
+<Bal><Tp><CdOrPrtry><Cd>CLBD</Cd></CdOrPrtry></Tp><Amt Ccy="ETB">420.00</Amt><CdtDbtInd>CRDT</CdtDbtInd></Bal>
+<Ntry><NtryRef>N1</NtryRef><Amt Ccy="ETB">30.00</Amt><CdtDbtInd>CRDT</CdtDbtInd>
+<BookgDt><Dt>2024-02-01</Dt></BookgDt><AcctSvcrRef>SVC-1</AcctSvcrRef>
+<NtryDtls><TxDtls><RmtInf><Ustrd>Invoice 9</Ustrd></RmtInf></TxDtls></NtryDtls></Ntry>
+<Ntry><Amt Ccy="ETB">110.00</Amt><CdtDbtInd>DBIT</CdtDbtInd>
+<BookgDt><Dt>2024-02-02</Dt></BookgDt><AcctSvcrRef>SVC-2</AcctSvcrRef></Ntry>
+<Ntry><Amt Ccy="ETB">1.00</Amt><CdtDbtInd>DBIT</CdtDbtInd></Ntry>
+</Stmt></BkToCstmrStmt></Document>
+"""
+
+
+def _csv(rows: int, *, start: Decimal = Decimal("100")) -> bytes:
+    out = ["date;amount;balance;description;id"]
+    balance = start
+    for i in range(rows):
+        balance += Decimal("5")
+        out.append(f"{date(2024, 3, 1 + i % 28).isoformat()};5,00;{balance};tx {i};CSV-{i}")
+    return ("\n".join(out) + "\n").encode()
+
+
+def test_csv_parser_reports_bad_rows_and_keeps_going():
+    data = b"tx_date,debit,credit,balance,memo\n2024-01-01,,10.00,110.00,in\nnot-a-date,1,,,x\n02/01/2024,4.50,,105.50,out\n"
+
+    events = list(parse_csv(io.BytesIO(data)))
+
+    rows = [e for e in events if isinstance(e, Row)]
+    assert [r.amount for r in rows] == [Decimal("10.00"), Decimal("-4.50")]
+    assert rows[1].tx_date == date(2024, 1, 2)
+    (error,) = [e for e in events if isinstance(e, RowError)]
+    assert error.line_no == 3
+
+
+def test_mt940_parser_reads_balances_and_multiline_details():
+    events = list(parse_mt940(io.BytesIO(MT940)))
+
+    assert events[0] == Opening(Decimal("1000.00"))
+    assert events[-1] == Closing(Decimal("1150.00"))
+    first, second = events[1:3]
+    assert (first.amount, first.reference, first.external_id) == (Decimal("250.00"), "INV-7", "BR-1")
+    assert first.description == "Customer payment"
+    assert (second.amount, second.reference, second.description) == (Decimal("-100"), None, "Bank charges")
+
+
+def test_malformed_input_is_reported_not_raised():
+    bad_amount = MT940.replace(b"C250,00NTRF", b"C1,2,3NTRF")
+    events = list(parse_mt940(io.BytesIO(bad_amount)))
+    assert [e.line_no for e in events if isinstance(e, RowError)] == [5]
+
+    cp1252 = "date,amount,description\n2024-01-01,10,Caf\u00e9\n".encode("cp1252")
+    with pytest.raises(StatementFormatError):
+        list(parse_csv(io.BytesIO(cp1252)))
+
+
+def test_camt053_parser_streams_entries():
+    events = list(parse_camt053(io.BytesIO(CAMT)))
+
+    rows = [e for e in events if isinstance(e, Row)]
+    assert [(r.external_id, r.amount) for r in rows] == [("SVC-1", Decimal("30.00")), ("SVC-2", Decimal("-110.00"))]
+    assert rows[0].description == "Invoice 9"
+    assert Opening(Decimal("500.00")) in events and events[-1] == Closing(Decimal("420.00"))
+    assert [e.line_no for e in events if isinstance(e, RowError)] == [3]
+
+
+@pytest.fixture()
+def account(db_session, resolve_org_id):
+    acct = BankAccount(org_id=resolve_org_id(), name="Main", account_number="1000123", gl_account_code="BANK-IMP")
+    db.session.add(acct)
+    db.session.commit()
+    return acct
+
+
+@pytest.fixture()
+def import_dir(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "BANK_IMPORT_DIR", str(tmp_path))
+    monkeypatch.setitem(app.config, "BANK_IMPORT_CHUNK", 7)
+    return tmp_path
+
+
+def _upload(client, data: bytes, filename: str, **form):
+    form = {"bank_account_code": "BANK-IMP", **form}
+    return client.post(
+        IMPORT_URL,
+        data={**form, "file": (io.BytesIO(data), filename)},
+        content_type="multipart/form-data",
+    )
+
+
+def test_csv_upload_imports_in_chunks_and_skips_known_lines(client, account, import_dir):
+    resp = _upload(client, _csv(30), "march.csv")
+
+    assert resp.status_code == 201
+    body = resp.get_json()
+    assert body["import"]["status"] == "success"
+    assert body["import"]["lines_imported"] == 30
+    stmt = db.session.get(BankStatement, body["statement_id"])
+    assert (stmt.opening_balance, stmt.closing_balance) == (Decimal("100.00"), Decimal("250.00"))
+    assert stmt.period_start == date(2024, 3, 1)
+    assert list(import_dir.iterdir()) == []
+
+    again = _upload(client, _csv(30), "march.csv").get_json()
+    assert again["import"]["lines_imported"] == 0
+    assert BankStatementLine.query.filter_by(bank_account_id=account.id).count() == 30
+
+
+def test_upload_records_balance_mismatches_as_line_errors(client, account, import_dir):
+    data = b"date,amount,balance\n2024-01-01,10,110\n2024-01-02,10,999\n2024-01-03,1,1000\n"
+
+    body = _upload(client, data, "x.csv").get_json()
+
+    assert body["import"]["status"] == "partial"
+    assert body["import"]["lines_imported"] == 3
+    assert body["import"]["errors"] == [{"line": 3, "error": "running balance 999 != expected 120"}]
+
+
+def test_large_upload_is_queued_and_reports_progress(client, app, account, import_dir, monkeypatch):
+    from erp.tasks.bank_import import process_statement_import
+
+    queued = []
+    monkeypatch.setattr(process_statement_import, "delay", queued.append)
+    monkeypatch.setitem(app.config, "BANK_IMPORT_INLINE_BYTES", 10)
+
+    resp = _upload(client, MT940, "stmt.sta")
+
+    assert resp.status_code == 202
+    import_id = resp.get_json()["import"]["id"]
+    assert queued == [import_id]
+    status_url = f"/api/finance/reconcile/bank-statements/imports/{import_id}"
+    assert client.get(status_url).get_json()["status"] == "queued"
+
+    assert process_statement_import.run(import_id) == "success"
+    status = client.get(status_url).get_json()
+    assert (status["format"], status["progress"], status["lines_imported"]) == ("mt940", 1.0, 2)
+    stmt = db.session.get(BankStatement, status["statement_id"])
+    assert (stmt.opening_balance, stmt.closing_balance) == (Decimal("1000.00"), Decimal("1150.00"))
@@ -0,0 +1,214 @@
+import json
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from erp.banking.models import BankAccessToken, BankAccount, BankConnection, BankSyncCursor, BankSyncJob
+from erp.banking.sync import RateLimiter, pending_job_ids, sync_jobs
+from erp.extensions import db
+from erp.models.finance_gl import BankStatement, BankStatementLine
+
+
+class FakeBank:
+    """Paginated transactions API; ``cursor`` is an offset into the feed."""
+
+    def __init__(self) -> None:
+        self.feeds: dict[str, list[dict]] = {}
+        self.requests: list[tuple[str, dict]] = []
+        bank = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                account = parts.path.split("/")[2]
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                bank.requests.append((account, query))
+                if self.headers.get("Authorization") != "Bearer secret":
+                    return self._send(401, {"error": "unauthorized"})
+                feed = bank.feeds.get(account, [])
+                start = int(query.get("cursor", 0))
+                if "from" in query and "cursor" not in query:
+                    start = next((i for i, t in enumerate(feed) if t["tx_date"] >= query["from"]), len(feed))
+                end = start + int(query["limit"])
+                self._send(
+                    200,
+                    {
+                        "transactions": feed[start:end],
+                        "next_cursor": str(end) if end < len(feed) else None,
+                    },
+                )
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add(self, account: str, n: int, start_balance: Decimal = Decimal("100")) -> None:
+        feed = self.feeds.setdefault(account, [])
+        balance = Decimal(feed[-1]["balance"]) if feed else start_balance
+        for _ in range(n):
+            i = len(feed)
+            balance += Decimal("10")
+            feed.append(
+                {
+                    "id": f"{account}-{i}",
+                    "tx_date": date(2024, 1, 1 + i % 28).isoformat(),
+                    "amount": "10.00",
+                    "balance": str(balance),
+                    "description": f"tx {i}",
+                }
+            )
+
+
+@pytest.fixture()
+def bank(app, monkeypatch):
+    monkeypatch.setitem(app.config, "BANK_SYNC_PAGE_SIZE", 4)
+    monkeypatch.setitem(app.config, "BANK_SYNC_RATE_PER_SECOND", 1000)
+    fake = FakeBank()
+    yield fake
+    fake.server.shutdown()
+    fake.server.server_close()
+
+
+def _setup(org_id, bank, numbers):
+    conn = BankConnection(org_id=org_id, name="Fake", provider="rest", api_base_url=bank.url)
+    db.session.add(conn)
+    db.session.flush()
+    db.session.add(BankAccessToken(org_id=org_id, connection_id=conn.id, access_token="secret"))
+    accounts = []
+    for number in numbers:
+        account = BankAccount(
+            org_id=org_id, name=number, account_number=number, gl_account_code=f"BANK-{number}"
+        )
+        db.session.add(account)
+        accounts.append(account)
+    db.session.commit()
+    return conn, accounts
+
+
+def _jobs(org_id, conn, accounts):
+    jobs = [
+        BankSyncJob(org_id=org_id, connection_id=conn.id, bank_account_id=a.id, status="pending")
+        for a in accounts
+    ]
+    db.session.add_all(jobs)
+    db.session.commit()
+    return [job.id for job in jobs]
+
+
+def test_sync_pages_accounts_concurrently_and_records_balances(db_session, resolve_org_id, bank):
+    org_id = resolve_org_id()
+    numbers = ["ACC-A", "ACC-B", "ACC-C"]
+    for number in numbers:
+        bank.add(number, 10)
+    conn, accounts = _setup(org_id, bank, numbers)
+
+    statuses = sync_jobs(_jobs(org_id, conn, accounts))
+
+    assert set(statuses.values()) == {"success"}
+    for account in accounts:
+        statement = BankStatement.query.filter_by(bank_account_id=account.id).one()
+        assert statement.opening_balance == Decimal("100.00")
+        assert statement.closing_balance == Decimal("200.00")
+        assert BankStatementLine.query.filter_by(statement_id=statement.id).count() == 10
+        cursor = BankSyncCursor.query.filter_by(bank_account_id=account.id).one()
+        assert cursor.cursor == "8"  # last page, re-read next time
+        assert cursor.lines_synced == 10
+    assert len(bank.requests) == 3 * 3  # 10 rows in pages of 4
+
+
+def test_second_run_only_fetches_new_transactions(db_session, resolve_org_id, bank):
+    org_id = resolve_org_id()
+    bank.add("ACC-D", 6)
+    conn, accounts = _setup(org_id, bank, ["ACC-D"])
+    sync_jobs(_jobs(org_id, conn, accounts))
+
+    bank.add("ACC-D", 3)
+    bank.requests.clear()
+    (job_id,) = _jobs(org_id, conn, accounts)
+    sync_jobs([job_id])
+
+    job = db.session.get(BankSyncJob, job_id)
+    assert job.status == "success"
+    assert job.lines_created == 3
+    assert [q.get("cursor") for _, q in bank.requests] == ["4", "8"]
+    assert BankStatementLine.query.filter_by(bank_account_id=accounts[0].id).count() == 9
+    second = BankStatement.query.filter_by(external_reference=f"conn:{conn.id}:job:{job_id}").one()
+    assert second.opening_balance == Decimal("160.00")
+    assert second.closing_balance == Decimal("190.00")
+
+
+def test_jobs_claimed_elsewhere_are_not_run_again(db_session, resolve_org_id, bank):
+    org_id = resolve_org_id()
+    bank.add("ACC-F", 2)
+    conn, accounts = _setup(org_id, bank, ["ACC-F"])
+    (job_id,) = _jobs(org_id, conn, accounts)
+    db.session.get(BankSyncJob, job_id).status = "running"
+    db.session.commit()
+
+    assert sync_jobs([job_id]) == {}
+    assert bank.requests == []
+    assert BankStatement.query.filter_by(bank_account_id=accounts[0].id).count() == 0
+
+
+def test_jobs_abandoned_while_running_are_picked_up_again(db_session, resolve_org_id, bank):
+    org_id = resolve_org_id()
+    bank.add("ACC-G", 2)
+    conn, accounts = _setup(org_id, bank, ["ACC-G"])
+    (job_id,) = _jobs(org_id, conn, accounts)
+    job = db.session.get(BankSyncJob, job_id)
+    job.status = "running"
+    job.started_at = datetime.utcnow() - timedelta(hours=2)
+    db.session.commit()
+
+    assert job_id in pending_job_ids(org_id)
+    assert sync_jobs([job_id]) == {job_id: "success"}
+
+
+def test_provider_errors_fail_only_that_job(db_session, resolve_org_id, bank):
+    org_id = resolve_org_id()
+    bank.add("ACC-E", 2)
+    conn, accounts = _setup(org_id, bank, ["ACC-E"])
+    other = BankConnection(org_id=org_id, name="NoToken", provider="rest", api_base_url=bank.url)
+    db.session.add(other)
+    db.session.commit()
+    ok_job, = _jobs(org_id, conn, accounts)
+    bad_job, = _jobs(org_id, other, accounts)
+
+    statuses = sync_jobs([ok_job, bad_job])
+
+    assert statuses == {ok_job: "success", bad_job: "error"}
+    assert "access token" in db.session.get(BankSyncJob, bad_job).error_message
+
+
+def test_rate_limiter_spaces_requests():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(rate=4, clock=lambda: now[0], sleep=sleep)
+    for _ in range(5):
+        limiter.acquire()
+
+    assert now[0] == pytest.approx(1.0)
@@ -0,0 +1,104 @@
+from datetime import UTC, datetime, timedelta
+
+from erp import db
+from erp.models import BotIdempotencyKey, BotJobOutbox
+from erp.tasks import bot_worker
+from erp.tasks.bot_worker import process_bot_batch
+
+
+def _job(message_id: str, **overrides) -> BotJobOutbox:
+    fields = dict(
+        org_id=1,
+        bot_name="batchbot",
+        chat_id="batch-chat",
+        message_id=message_id,
+        raw_text="inventory",
+        status="queued",
+    )
+    fields.update(overrides)
+    return BotJobOutbox(**fields)
+
+
+def test_batch_processes_jobs_and_skips_duplicates(app, monkeypatch):
+    monkeypatch.setattr(bot_worker, "dispatch", lambda **_: {"text": "ok"})
+    monkeypatch.setattr(bot_worker, "send_telegram_message", lambda *_, **__: {"ok": True})
+
+    with app.app_context():
+        fresh = _job("b1")
+        dup = _job("b2")
+        db.session.add_all([fresh, dup])
+        db.session.add(
+            BotIdempotencyKey(org_id=1, bot_name="batchbot", chat_id="batch-chat", message_id="b2")
+        )
+        db.session.commit()
+
+        out = process_bot_batch(limit=10)
+        db.session.refresh(fresh)
+        db.session.refresh(dup)
+
+        assert out["results"][fresh.id] == "ok"
+        assert out["results"][dup.id] == "duplicate_ignored"
+        assert fresh.status == "done"
+        assert dup.status == "done"
+        assert BotIdempotencyKey.query.filter_by(bot_name="batchbot", message_id="b1").count() == 1
+
+
+def test_batch_failure_is_isolated_and_rescheduled(app, monkeypatch):
+    scheduled = []
+
+    def flaky(**kwargs):
+        if kwargs["message_id"] == "bad":
+            raise RuntimeError("boom")
+        return {"text": "ok"}
+
+    monkeypatch.setattr(bot_worker, "dispatch", flaky)
+    monkeypatch.setattr(bot_worker, "send_telegram_message", lambda *_, **__: {"ok": True})
+    monkeypatch.setattr(
+        bot_worker.process_bot_job,
+        "apply_async",
+        lambda args, countdown: scheduled.append((args[0], countdown)),
+    )
+
+    with app.app_context():
+        good = _job("good", chat_id="iso-chat")
+        bad = _job("bad", chat_id="iso-chat")
+        db.session.add_all([good, bad])
+        db.session.commit()
+
+        out = process_bot_batch(limit=10)
+        db.session.refresh(good)
+        db.session.refresh(bad)
+
+        assert out["results"][good.id] == "ok"
+        assert good.status == "done"
+        assert bad.status == "queued"
+        assert bad.retry_count == 1
+        assert scheduled == [(bad.id, 2)]
+
+
+def test_batch_recovers_stale_and_overdue_jobs(app, monkeypatch):
+    monkeypatch.setattr(bot_worker, "dispatch", lambda **_: {"text": "ok"})
+    monkeypatch.setattr(bot_worker, "send_telegram_message", lambda *_, **__: {"ok": True})
+    long_ago = datetime.now(UTC) - timedelta(hours=1)
+
+    with app.app_context():
+        stuck = _job("stuck", chat_id="stale-chat", status="processing")
+        lost_retry = _job("lost", chat_id="stale-chat", retry_count=2)
+        backing_off = _job("wait", chat_id="stale-chat", retry_count=1)
+        db.session.add_all([stuck, lost_retry, backing_off])
+        db.session.flush()
+        BotJobOutbox.query.filter(BotJobOutbox.id.in_([stuck.id, lost_retry.id])).update(
+            {"updated_at": long_ago}, synchronize_session=False
+        )
+        db.session.commit()
+
+        out = process_bot_batch(limit=10)
+        for job in (stuck, lost_retry, backing_off):
+            db.session.refresh(job)
+
+        assert (stuck.status, stuck.retry_count) == ("queued", 1)
+        assert stuck.last_error == "processing timed out"
+        assert out["results"][lost_retry.id] == "ok"
+        assert stuck.id not in out["results"] and backing_off.id not in out["results"]
+        assert lost_retry.status == "done"
+        assert backing_off.status == "queued"
@@ -0,0 +1,36 @@
+from erp import db
+from erp.models import BotJobOutbox
+from erp.tasks.bot_metrics_sweep import metrics_sweep
+
+
+def test_metrics_sweep_groups_all_orgs_in_one_query(app):
+    from sqlalchemy import event
+
+    with app.app_context():
+        db.session.add_all(
+            [
+                BotJobOutbox(org_id=1, bot_name="sweepbot", chat_id="c", message_id="1", status="queued"),
+                BotJobOutbox(org_id=1, bot_name="sweepbot", chat_id="c", message_id="2", status="queued"),
+                BotJobOutbox(org_id=1, bot_name="sweepbot", chat_id="c", message_id="3", status="failed"),
+                BotJobOutbox(org_id=2, bot_name="sweepbot", chat_id="c", message_id="4", status="processing"),
+            ]
+        )
+        db.session.commit()
+
+        statements = []
+
+        def _count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", _count)
+        try:
+            out = metrics_sweep()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", _count)
+
+        groups = {(g["org_id"], g["bot_name"]): g for g in out["groups"]}
+        assert len(statements) == 1
+        assert groups[(1, "sweepbot")]["queued"] == 2
+        assert groups[(1, "sweepbot")]["failed"] == 1
+        assert groups[(2, "sweepbot")]["processing"] == 1
+        assert groups[(1, "sweepbot")]["oldest_queued_age_s"] >= 0
@@ -0,0 +1,29 @@
+from erp.bots.nlp_intents import parse_intent, parse_message
+
+
+def test_exact_rules_keep_first_listed_priority():
+    assert parse_intent("please approve") == "approve_action"
+    assert parse_intent("stock alert") == "inventory_query"
+    assert parse_intent("hello there") is None
+
+
+def test_most_hits_wins_over_rule_order():
+    assert parse_intent("approve? my cash balance is low") == "finance_cash_query"
+
+
+def test_fuzzy_fallback_handles_misspellings():
+    parsed = parse_message("aprove it")
+    assert parsed.intent == "approve_action"
+    assert parsed.fuzzy is True
+    assert parse_intent("inventroy levels") == "inventory_query"
+
+
+def test_entities_are_extracted():
+    parsed = parse_message("Reorder 12 boxes for order #4411")
+    assert parsed.intent == "inventory_reorder"
+    assert parsed.entities == {
+        "entity_type": "ORDER",
+        "entity_id": 4411,
+        "quantity": 12,
+        "unit": "boxes",
+    }
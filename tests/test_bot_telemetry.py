@@ -0,0 +1,66 @@
+import pytest
+
+from erp import db
+from erp.bots.telemetry import EventRecorder, get_event_sink
+from erp.models import BotEvent
+
+
+def test_dispatch_flushes_events_without_committing(app, monkeypatch):
+    from erp.bots.dispatcher import dispatch
+
+    monkeypatch.setattr("erp.bots.dispatcher.resolve_org_id", lambda: 1)
+    commits = []
+
+    with app.app_context():
+        monkeypatch.setattr(db.session, "commit", lambda: commits.append(True))
+        out = dispatch(
+            bot_name="telemetrybot",
+            actor_id=None,
+            chat_id="t1",
+            message_id="m1",
+            raw_text="gibberish",
+            intent=None,
+            ctx={},
+        )
+        events = BotEvent.query.filter_by(bot_name="telemetrybot").all()
+
+        assert "didn't understand" in out["text"]
+        assert [e.event_type for e in events] == ["command_parsed"]
+        assert commits == []
+        db.session.rollback()
+
+
+def test_recorder_offloads_to_sink_under_load(app):
+    sink = get_event_sink()
+    with app.app_context():
+        app.config["BOT_EVENT_OFFLOAD_CONCURRENCY"] = 0
+        try:
+            with EventRecorder(
+                org_id=1, bot_name="sinkbot", actor_id=None, chat_id="s1", message_id="m1"
+            ) as events:
+                events.intent = "help"
+                events.outcome = "ok"
+                events.record("command_executed", {"intent": "help"})
+        finally:
+            app.config.pop("BOT_EVENT_OFFLOAD_CONCURRENCY")
+
+        assert BotEvent.query.filter_by(bot_name="sinkbot").count() == 0
+        sink.drain()
+        assert BotEvent.query.filter_by(bot_name="sinkbot").count() == 1
+
+
+def test_failed_dispatch_events_bypass_the_session(app, monkeypatch):
+    sink = get_event_sink()
+    with app.app_context():
+        monkeypatch.setattr(db.session, "execute", lambda *a, **k: pytest.fail("wrote into the failing session"))
+        with pytest.raises(RuntimeError, match="boom"):
+            with EventRecorder(
+                org_id=1, bot_name="failbot", actor_id=None, chat_id="f1", message_id="m1"
+            ) as events:
+                events.intent = "help"
+                raise RuntimeError("boom")
+        monkeypatch.undo()
+
+        sink.drain()
+        (event,) = BotEvent.query.filter_by(bot_name="failbot").all()
+        assert event.event_type == "command_failed"
@@ -0,0 +1,87 @@
+import pytest
+
+from erp.extensions import db
+from erp.marketing.models import MarketingCampaign, MarketingCampaignStat, MarketingEvent
+from erp.services import campaign_stats
+from erp.services.campaign_stats import campaign_counts, hub
+
+
+@pytest.fixture()
+def campaign(db_session, resolve_org_id):
+    campaign = MarketingCampaign(org_id=resolve_org_id(), name="Launch")
+    db.session.add(campaign)
+    db.session.commit()
+    return campaign
+
+
+def _events(campaign, *types):
+    db.session.add_all(
+        MarketingEvent(org_id=campaign.org_id, campaign_id=campaign.id, event_type=t) for t in types
+    )
+    db.session.commit()
+
+
+def test_counters_follow_event_writes(campaign):
+    _events(campaign, "sent", "sent", "opened")
+    assert campaign_counts(campaign.org_id, campaign.id) == {"sent": 2, "opened": 1}
+
+    _events(campaign, "sent", "clicked")
+    opened = MarketingEvent.query.filter_by(campaign_id=campaign.id, event_type="opened").one()
+    db.session.delete(opened)
+    db.session.commit()
+
+    assert campaign_counts(campaign.org_id, campaign.id) == {"sent": 3, "clicked": 1}
+
+
+def test_counters_are_seeded_from_existing_events(campaign):
+    _events(campaign, "sent", "opened", "opened")
+    stale = MarketingCampaignStat.query.filter_by(campaign_id=campaign.id, event_type="sent").one()
+    stale.count = 99
+    db.session.add(
+        MarketingCampaignStat(org_id=campaign.org_id, campaign_id=campaign.id, event_type="bounced", count=5)
+    )
+    campaign.stats_seeded_at = None
+    db.session.commit()
+
+    assert campaign_counts(campaign.org_id, campaign.id) == {"sent": 1, "opened": 2}
+    db.session.commit()
+    assert campaign.stats_seeded_at is not None
+    assert campaign_stats.seed_campaign_stats(campaign.org_id, campaign.id) is False
+
+
+def test_subscribers_are_notified_on_commit(campaign):
+    key = (campaign.org_id, campaign.id)
+    seen = hub.version(key)
+
+    db.session.add(MarketingEvent(org_id=campaign.org_id, campaign_id=campaign.id, event_type="sent"))
+    db.session.flush()
+    assert hub.wait(key, seen, timeout=0) == seen
+
+    db.session.commit()
+    assert hub.wait(key, seen, timeout=1) == seen + 1
+
+
+def test_socket_subscribers_receive_pushed_counts(app, campaign, monkeypatch):
+    flask_socketio = pytest.importorskip("flask_socketio")
+    from erp import socketio
+
+    if socketio is None or not isinstance(socketio, flask_socketio.SocketIO):
+        pytest.skip("Socket.IO not configured")
+    # Push explicitly below instead of from the background pump.
+    monkeypatch.setattr(campaign_stats, "_ensure_pump", lambda *a: None)
+    client = socketio.test_client(app, namespace=campaign_stats.NAMESPACE)
+    _events(campaign, "sent")
+
+    ack = client.emit(
+        "subscribe_campaign_stats", {"campaign_id": campaign.id}, namespace=campaign_stats.NAMESPACE, callback=True
+    )
+    assert ack == {"campaign_id": campaign.id, "counts": {"sent": 1}}
+
+    hub.take_dirty(timeout=0)
+    _events(campaign, "opened", "opened")
+    assert campaign_stats.push_changes(socketio, timeout=1) == 1
+
+    (message,) = client.get_received(campaign_stats.NAMESPACE)
+    assert message["name"] == "campaign_stats"
+    assert message["args"][0] == {"campaign_id": campaign.id, "counts": {"sent": 1, "opened": 2}}
+    client.disconnect(namespace=campaign_stats.NAMESPACE)
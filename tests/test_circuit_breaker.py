@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from erp.reliability.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    LocalBackend,
+    RedisBackend,
+)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _breaker(backend=None, clock=None, **options):
+    options.setdefault("min_calls", 4)
+    options.setdefault("window_s", 10)
+    options.setdefault("reset_timeout_s", 30)
+    return CircuitBreaker(
+        "bank", backend=backend or LocalBackend(), clock=clock or Clock(), **options
+    )
+
+
+def test_trips_on_failure_rate_not_consecutive_failures():
+    breaker = _breaker(failure_rate=0.5)
+    for ok in (True, False, True, False):
+        (breaker.record_success if ok else breaker.record_failure)()
+
+    assert breaker.state == OPEN
+    assert breaker.allow() is False
+
+
+def test_old_outcomes_slide_out_of_the_window():
+    clock = Clock()
+    breaker = _breaker(clock=clock, failure_rate=0.5)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 11
+    breaker.record_failure()
+
+    assert breaker.failure_stats() == (1, 1)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_admits_limited_probes_then_closes():
+    clock = Clock()
+    breaker = _breaker(clock=clock, half_open_success=2)
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now += 31
+
+    assert breaker.state == HALF_OPEN
+    assert [breaker.allow() for _ in range(3)] == [True, True, False]
+    breaker.record_success()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failure_stats() == (0, 0)
+
+
+def test_half_open_failure_reopens():
+    clock = Clock()
+    breaker = _breaker(clock=clock)
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now += 31
+
+    assert breaker.allow() is True
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_state_is_shared_between_processes_using_one_backend():
+    backend, clock = LocalBackend(), Clock()
+    worker_a = _breaker(backend, clock)
+    worker_b = _breaker(backend, clock)
+    for _ in range(4):
+        worker_a.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        worker_b.call(lambda: "sent")
+
+
+def test_concurrent_updates_are_not_lost():
+    breaker = _breaker(min_calls=10_000, window_s=600)
+    threads = [
+        threading.Thread(target=lambda: [breaker.record_failure() for _ in range(200)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert breaker.failure_stats() == (1600, 1600)
+
+
+def test_redis_backend_shares_state():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    clock = Clock()
+    worker_a = _breaker(RedisBackend(client), clock)
+    worker_b = _breaker(RedisBackend(client), clock)
+    for _ in range(4):
+        worker_a.record_failure()
+
+    assert worker_b.allow() is False
+    clock.now += 31
+    assert worker_b.allow() is True
+    worker_b.record_success()
+    worker_b.record_success()
+    assert worker_a.state == CLOSED
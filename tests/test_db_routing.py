@@ -0,0 +1,82 @@
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from erp import db_routing
+from erp.db_routing import RoutingSession, lag_monitor, replica_reads, use_replica
+
+
+@pytest.fixture()
+def routed(tmp_path, monkeypatch):
+    """Primary and replica as two SQLite files holding different rows."""
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path}/primary.db",
+        SQLALCHEMY_BINDS={"replica": f"sqlite:///{tmp_path}/replica.db"},
+        REPLICA_MAX_LAG_SECONDS=10,
+        REPLICA_LAG_CHECK_SECONDS=0,
+    )
+    db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+    class Report(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        source = db.Column(db.String(16))
+
+    db.init_app(app)
+    lag = {"seconds": 0.0}
+    monkeypatch.setattr(db_routing, "measure_lag", lambda engine: lag["seconds"])
+    lag_monitor.reset()
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines["replica"])
+        db.session.add(Report(source="primary"))
+        db.session.commit()
+        with db.engines["replica"].begin() as conn:
+            conn.execute(Report.__table__.insert().values(source="replica"))
+        yield db, Report, lag
+        db.session.remove()
+    lag_monitor.reset()
+
+
+def _source(db, Report):
+    source = db.session.query(Report.source).scalar()
+    db.session.rollback()
+    return source
+
+
+def test_reads_without_affinity_stay_on_primary(routed):
+    db, Report, _ = routed
+    assert _source(db, Report) == "primary"
+
+
+def test_affinity_routes_reads_to_replica(routed):
+    db, Report, _ = routed
+
+    @replica_reads
+    def report():
+        return _source(db, Report)
+
+    assert report() == "replica"
+    with use_replica():
+        assert _source(db, Report) == "replica"
+        # Locking reads always go to the primary.
+        assert db.session.query(Report.source).with_for_update().scalar() == "primary"
+        db.session.rollback()
+
+
+def test_lagging_replica_falls_back_to_primary(routed):
+    db, Report, lag = routed
+    lag["seconds"] = 60.0
+
+    with use_replica():
+        assert _source(db, Report) == "primary"
+
+
+def test_writes_inside_affinity_hit_primary(routed):
+    db, Report, _ = routed
+    with use_replica():
+        db.session.add(Report(source="written"))
+        db.session.commit()
+
+    assert db.session.query(Report).filter_by(source="written").count() == 1
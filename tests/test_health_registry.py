@@ -0,0 +1,96 @@
+import threading
+import time
+
+from erp.health.registry import HealthCheck, HealthRegistry
+
+
+def _sleeper(seconds, calls=None):
+    def check():
+        if calls is not None:
+            calls.append(1)
+        time.sleep(seconds)
+        return {"ok": True}
+
+    return check
+
+
+def test_checks_run_concurrently_and_timeouts_are_enforced():
+    registry = HealthRegistry(max_workers=8)
+    for n in range(4):
+        registry.register(HealthCheck(f"slow_{n}", _sleeper(0.2), timeout_s=1.0))
+    registry.register(HealthCheck("hung", _sleeper(1.0), timeout_s=0.3, critical=False))
+
+    start = time.monotonic()
+    ok, results = registry.run_all()
+    elapsed = time.monotonic() - start
+
+    assert ok is True
+    assert elapsed < 0.6  # max(0.2, 0.3), not 0.8 + 1.0
+    assert all(results[f"slow_{n}"]["ok"] for n in range(4))
+    assert results["hung"]["ok"] is False
+    assert "timed out" in results["hung"]["error"]
+
+
+def test_timed_out_critical_check_fails_readiness_and_is_not_restarted():
+    registry = HealthRegistry(max_workers=2)
+    release = threading.Event()
+    calls = []
+
+    def stuck():
+        calls.append(1)
+        release.wait(5)
+        return {"ok": True}
+
+    registry.register(HealthCheck("db", stuck, timeout_s=0.1))
+    try:
+        assert registry.run_all()[0] is False
+        ok, results = registry.run_all()
+        assert ok is False
+        assert "timed out" in results["db"]["error"]
+        assert len(calls) == 1
+    finally:
+        release.set()
+
+
+def test_concurrent_probes_share_one_run():
+    registry = HealthRegistry(max_workers=4)
+    calls = []
+    registry.register(HealthCheck("db", _sleeper(0.2, calls), timeout_s=1.0))
+    outcomes = []
+
+    probes = [threading.Thread(target=lambda: outcomes.append(registry.run_all()[0])) for _ in range(5)]
+    for probe in probes:
+        probe.start()
+    for probe in probes:
+        probe.join()
+
+    assert outcomes == [True] * 5
+    assert len(calls) == 1
+
+
+def test_non_critical_results_are_cached_within_staleness_window():
+    registry = HealthRegistry(stale_after_s=60)
+    calls = []
+    registry.register(HealthCheck("banking", _sleeper(0, calls), critical=False))
+    registry.register(HealthCheck("db", _sleeper(0, calls), critical=True))
+
+    registry.run_all()
+    ok, results = registry.run_all()
+
+    assert ok is True
+    assert results["banking"]["cached"] is True
+    assert results["db"]["cached"] is False
+    assert len(calls) == 3
+
+
+def test_liveness_runs_only_flagged_checks():
+    registry = HealthRegistry()
+    calls = []
+    registry.register(HealthCheck("config", _sleeper(0, calls), liveness=True))
+    registry.register(HealthCheck("db", _sleeper(5.0), timeout_s=0.1))
+
+    ok, results = registry.liveness()
+
+    assert ok is True
+    assert list(results) == ["config"]
+    assert len(calls) == 1
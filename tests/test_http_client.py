@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from erp.reliability.circuit_breaker import CircuitBreaker, CircuitOpenError, LocalBackend
+from erp.utils import http_client
+from erp.utils.http_client import UpstreamError
+
+
+class StubUpstream:
+    """Local HTTP/1.1 server counting connections and concurrent requests."""
+
+    def __init__(self) -> None:
+        self.connections = 0
+        self.active = 0
+        self.peak = 0
+        self.statuses: list[int] = []
+        self.delay = 0.0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.active += 1
+                    stub.peak = max(stub.peak, stub.active)
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                time.sleep(stub.delay)
+                body = json.dumps({"path": self.path}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub._lock:
+                    stub.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture()
+def upstream(monkeypatch):
+    monkeypatch.setenv("HTTP_CLIENT_MAX_PER_HOST", "3")
+    http_client.close()
+    stub = StubUpstream()
+    yield stub
+    http_client.close()
+    stub.close()
+
+
+def _breaker():
+    return CircuitBreaker("stub", backend=LocalBackend(), min_calls=2, failure_rate=0.5)
+
+
+def test_sync_calls_reuse_pooled_connections(upstream):
+    for n in range(20):
+        assert http_client.get_json(f"{upstream.url}/p/{n}", breaker=None) == {"path": f"/p/{n}"}
+
+    assert upstream.connections == 1
+
+
+def test_fan_out_runs_concurrently_within_per_host_limit(upstream):
+    upstream.delay = 0.1
+    urls = [f"{upstream.url}/p/{n}" for n in range(9)]
+
+    start = time.monotonic()
+    results = http_client.gather_json(urls, breaker=None)
+    elapsed = time.monotonic() - start
+
+    assert results == [{"path": f"/p/{n}"} for n in range(9)]
+    assert upstream.peak == 3
+    assert elapsed < 0.8  # three waves of 0.1s, not nine
+
+
+def test_server_errors_are_retried(upstream):
+    upstream.statuses = [503]
+    assert http_client.get_json(f"{upstream.url}/flaky", breaker=None) == {"path": "/flaky"}
+
+
+def test_client_errors_are_not_retried(upstream):
+    upstream.statuses = [404, 200]
+    with pytest.raises(UpstreamError) as err:
+        http_client.get_json(f"{upstream.url}/missing", breaker=None)
+
+    assert err.value.status_code == 404
+    assert upstream.statuses == [200]
+
+
+def test_breaker_opens_on_upstream_failures(upstream):
+    breaker = _breaker()
+    upstream.statuses = [500, 500]
+    for _ in range(2):
+        with pytest.raises(Exception):
+            http_client.request("GET", f"{upstream.url}/down", retry=False, breaker=breaker)
+
+    with pytest.raises(CircuitOpenError):
+        http_client.request("GET", f"{upstream.url}/down", retry=False, breaker=breaker)
@@ -0,0 +1,74 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from flask import Blueprint, jsonify
+
+from erp import db
+from erp.middleware.idempotency import REPLAY_HEADER, idempotent
+from erp.models.idempotency import IdempotencyKey
+
+
+@pytest.fixture()
+def idem_client(app):
+    calls = []
+    if "test_idem_replay" not in app.blueprints:
+        bp = Blueprint("test_idem_replay", __name__)
+
+        @bp.post("/idem-replay")
+        @idempotent("test.create")
+        def create():
+            calls.append(1)
+            return jsonify({"id": len(calls)}), 201
+
+        app.register_blueprint(bp)
+    app.config["IDEMPOTENCY_USE_REDIS"] = False
+    app.extensions["idem_calls"] = calls
+    with app.test_client() as client:
+        yield client, calls
+
+
+def test_duplicate_replays_original_response(idem_client):
+    client, calls = idem_client
+    calls.clear()
+    headers = {"Idempotency-Key": "replay-1"}
+
+    first = client.post("/idem-replay", headers=headers)
+    second = client.post("/idem-replay", headers=headers)
+
+    assert first.status_code == 201
+    assert second.status_code == 201
+    assert second.get_json() == first.get_json()
+    assert second.headers[REPLAY_HEADER] == "true"
+    assert len(calls) == 1
+
+
+def test_same_key_in_another_org_is_not_replayed(idem_client):
+    client, calls = idem_client
+    calls.clear()
+
+    first = client.post("/idem-replay", headers={"Idempotency-Key": "shared-1", "X-Org-Id": "1"})
+    other = client.post("/idem-replay", headers={"Idempotency-Key": "shared-1", "X-Org-Id": "2"})
+
+    assert first.status_code == other.status_code == 201
+    assert REPLAY_HEADER not in other.headers
+    assert len(calls) == 2
+
+
+def test_missing_key_is_rejected(idem_client):
+    client, _ = idem_client
+    assert client.post("/idem-replay").status_code == 409
+
+
+def test_purge_older_than_deletes_in_batches(app):
+    with app.app_context():
+        old = datetime.now(UTC) - timedelta(days=3)
+        db.session.add_all(
+            [IdempotencyKey(key=f"old-{i}", endpoint="test.purge", created_at=old) for i in range(5)]
+        )
+        db.session.add(IdempotencyKey(key="fresh", endpoint="test.purge"))
+        db.session.commit()
+
+        deleted = IdempotencyKey.purge_older_than(hours=24, batch_size=2)
+
+        assert deleted == 5
+        assert IdempotencyKey.query.filter_by(endpoint="test.purge").count() == 1
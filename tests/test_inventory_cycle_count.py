@@ -40,3 +40,62 @@ def test_cycle_count_approval_adjusts_stock(client, db_session, resolve_org_id,
     bal2 = StockBalance.query.filter_by(org_id=org_id, item_id=item_id, warehouse_id=warehouse_id).first()
     assert bal2 is not None
     assert Decimal(bal2.qty_on_hand) == Decimal("8")
+
+
+def test_cycle_count_lines_stream_from_csv(client, db_session, resolve_org_id):
+    org_id = resolve_org_id()
+
+    from erp.inventory.models import CycleCountLine, StockBalance
+
+    warehouse_id = uuid.uuid4()
+    items = [uuid.uuid4() for _ in range(3)]
+    db_session.add_all(
+        StockBalance(org_id=org_id, item_id=item, warehouse_id=warehouse_id, qty_on_hand=Decimal("5"))
+        for item in items
+    )
+    db_session.commit()
+
+    resp = client.post("/api/inventory/cycle-counts", json={"warehouse_id": str(warehouse_id)})
+    assert resp.status_code == 201
+    cc_id = resp.get_json()["id"]
+
+    body = "item_id,counted_qty\n" + "".join(f"{item},{n}\n" for n, item in enumerate(items, start=4))
+    resp = client.post(
+        f"/api/inventory/cycle-counts/{cc_id}/lines/import",
+        data=body.encode(),
+        content_type="text/csv",
+    )
+    assert resp.status_code == 200
+    assert resp.get_json()["imported"] == 3
+
+    lines = CycleCountLine.query.filter_by(cycle_count_id=uuid.UUID(cc_id)).all()
+    assert sorted(float(line.variance) for line in lines) == [-1.0, 0.0, 1.0]
+    assert all(Decimal(line.system_qty) == Decimal("5") for line in lines)
+
+
+def test_cycle_count_import_reports_the_bad_line(client, db_session):
+    resp = client.post("/api/inventory/cycle-counts", json={"warehouse_id": str(uuid.uuid4())})
+    cc_id = resp.get_json()["id"]
+
+    body = f"item_id,counted_qty\n{uuid.uuid4()},3\n{uuid.uuid4()},abc\n"
+    resp = client.post(
+        f"/api/inventory/cycle-counts/{cc_id}/lines/import",
+        data=body.encode(),
+        content_type="text/csv",
+    )
+
+    assert resp.status_code == 400
+    assert resp.get_json()["error"].startswith("line 2:")
+
+
+def test_cycle_count_create_reports_the_bad_line(client, db_session):
+    resp = client.post(
+        "/api/inventory/cycle-counts",
+        json={
+            "warehouse_id": str(uuid.uuid4()),
+            "lines": [{"item_id": str(uuid.uuid4()), "counted_qty": 1}, {"item_id": "nope"}],
+        },
+    )
+
+    assert resp.status_code == 400
+    assert resp.get_json()["error"].startswith("line 2:")
@@ -83,3 +83,124 @@ def test_escalation_rule_creation_and_trigger(client, db_session, maintenance_us
     db_session.refresh(wo)
     assert wo.events, "Escalation should create a work order event"
     assert any(ev.event_type == "ESCALATION_TRIGGERED" for ev in wo.events)
+
+
+def test_overdue_schedule_catches_up_in_one_run(client, db_session, resolve_org_id):
+    from erp.models import MaintenanceAsset, MaintenanceSchedule, MaintenanceWorkOrder
+    from erp.tasks.maintenance import generate_scheduled_work_orders
+
+    org_id = resolve_org_id()
+    asset = MaintenanceAsset(org_id=org_id, code="PM-LATE-001", name="Centrifuge")
+    db_session.add(asset)
+    db_session.flush()
+
+    overdue = dt.date.today() - dt.timedelta(days=25)
+    schedule = MaintenanceSchedule(
+        org_id=org_id,
+        asset_id=asset.id,
+        name="Weekly check",
+        schedule_type="time",
+        interval_days=7,
+        next_due_date=overdue,
+        is_active=True,
+    )
+    db_session.add(schedule)
+    db_session.commit()
+
+    generate_scheduled_work_orders(org_id)
+    generate_scheduled_work_orders(org_id)
+
+    db_session.refresh(schedule)
+    assert schedule.next_due_date == overdue + dt.timedelta(days=28)
+    assert MaintenanceWorkOrder.query.filter_by(schedule_id=schedule.id).count() == 1
+
+
+def test_meter_schedule_uses_latest_sensor_reading(client, db_session, resolve_org_id):
+    from decimal import Decimal
+
+    from erp.models import (
+        MaintenanceAsset,
+        MaintenanceSchedule,
+        MaintenanceSensorReading,
+        MaintenanceWorkOrder,
+    )
+    from erp.tasks.maintenance import generate_scheduled_work_orders
+
+    org_id = resolve_org_id()
+    asset = MaintenanceAsset(org_id=org_id, code="PM-METER-001", name="Generator")
+    db_session.add(asset)
+    db_session.flush()
+
+    schedule = MaintenanceSchedule(
+        org_id=org_id,
+        asset_id=asset.id,
+        name="Service every 250h",
+        schedule_type="meter",
+        usage_metric="run_hours",
+        usage_interval=250,
+        last_usage_value=Decimal("1000"),
+        is_active=True,
+    )
+    now = dt.datetime.now(dt.timezone.utc)
+    db_session.add(schedule)
+    db_session.add_all(
+        [
+            MaintenanceSensorReading(
+                org_id=org_id, asset_id=asset.id, sensor_type="run_hours",
+                value=Decimal("1100"), recorded_at=now - dt.timedelta(days=2),
+            ),
+            MaintenanceSensorReading(
+                org_id=org_id, asset_id=asset.id, sensor_type="run_hours",
+                value=Decimal("1260"), recorded_at=now,
+            ),
+        ]
+    )
+    db_session.commit()
+
+    generate_scheduled_work_orders(org_id)
+
+    db_session.refresh(schedule)
+    assert MaintenanceWorkOrder.query.filter_by(schedule_id=schedule.id).count() == 1
+    assert Decimal(schedule.last_usage_value) == Decimal("1260")
+
+
+def test_escalations_fire_once_per_rule_and_respect_category(client, db_session, resolve_org_id):
+    from erp.models import (
+        MaintenanceAsset,
+        MaintenanceEscalationEvent,
+        MaintenanceEscalationRule,
+        MaintenanceWorkOrder,
+    )
+    from erp.tasks.maintenance import check_escalations
+
+    org_id = resolve_org_id()
+    asset = MaintenanceAsset(
+        org_id=org_id, code="CRIT-CAT-001", name="Analyzer", category="lab", is_critical=True
+    )
+    db_session.add(asset)
+    db_session.flush()
+
+    lab_rule = MaintenanceEscalationRule(
+        org_id=org_id, name="Lab downtime", asset_category="lab", downtime_threshold_minutes=1
+    )
+    other_rule = MaintenanceEscalationRule(
+        org_id=org_id, name="Fleet downtime", asset_category="fleet", downtime_threshold_minutes=1
+    )
+    db_session.add_all([lab_rule, other_rule])
+    started = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=10)
+    wo = MaintenanceWorkOrder(
+        org_id=org_id,
+        asset_id=asset.id,
+        title="Analyzer down",
+        status="open",
+        requested_at=started,
+        downtime_start=started,
+    )
+    db_session.add(wo)
+    db_session.commit()
+
+    check_escalations(org_id)
+    check_escalations(org_id)
+
+    fired = MaintenanceEscalationEvent.query.filter_by(work_order_id=wo.id).all()
+    assert [event.rule_id for event in fired] == [lab_rule.id]
@@ -0,0 +1,112 @@
+from collections import Counter
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from erp.extensions import db
+from erp.marketing.models import MarketingABVariant, MarketingCampaign
+from erp.services import marketing_ab
+from erp.services.marketing_ab import (
+    assign,
+    exposure_counts,
+    flush_exposures,
+    pick_variant,
+    pick_variant_id,
+    variant_table,
+)
+
+
+@pytest.fixture()
+def campaign(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    campaign = MarketingCampaign(org_id=org_id, name="AB", ab_test_enabled=True)
+    db.session.add(campaign)
+    db.session.flush()
+    for name, weight in (("A", "70"), ("B", "30"), ("off", "50")):
+        db.session.add(
+            MarketingABVariant(
+                org_id=org_id, campaign_id=campaign.id, name=name, weight=Decimal(weight), is_active=name != "off"
+            )
+        )
+    db.session.commit()
+    marketing_ab.invalidate_campaign(org_id, campaign.id)
+    return campaign
+
+
+def _names(campaign):
+    return {v.id: v.name for v in campaign.variants}
+
+
+def test_assignment_is_sticky_and_weighted(campaign):
+    names = _names(campaign)
+    subjects = list(range(20_000))
+
+    assignments = assign(campaign.org_id, campaign.id, subjects, record=False)
+
+    shares = Counter(names[v] for v in assignments.values())
+    assert set(shares) == {"A", "B"}
+    assert shares["A"] / len(subjects) == pytest.approx(0.7, abs=0.02)
+    for subject in (0, 17, 19_999):
+        picked = pick_variant(campaign.org_id, campaign.id, subject, record=False)
+        assert picked.id == assignments[subject]
+    assert assign(campaign.org_id, campaign.id, subjects[:100], record=False) == {
+        s: assignments[s] for s in subjects[:100]
+    }
+
+
+def test_table_is_cached_until_variants_change(campaign, monkeypatch):
+    builds = []
+    build = marketing_ab.build_table
+    monkeypatch.setattr(marketing_ab, "build_table", lambda *a: builds.append(a) or build(*a))
+
+    for subject in range(50):
+        pick_variant(campaign.org_id, campaign.id, subject, record=False)
+    assert len(builds) == 1
+
+    variant_b = next(v for v in campaign.variants if v.name == "B")
+    variant_b.weight = Decimal("0")
+    db.session.commit()
+
+    table = variant_table(campaign.org_id, campaign.id)
+    assert len(builds) == 2
+    assert set(assign(campaign.org_id, campaign.id, range(500), record=False).values()) == {table.variant_ids[0]}
+
+
+def test_repeated_picks_do_not_query(campaign):
+    pick_variant_id(campaign.org_id, campaign.id, 0, record=False)
+    statements = []
+
+    def _listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _listener)
+    try:
+        for subject in range(50):
+            assert pick_variant_id(campaign.org_id, campaign.id, subject, record=False) is not None
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _listener)
+
+    assert statements == []
+
+
+def test_assignment_counts_are_recorded(campaign):
+    assignments = assign(campaign.org_id, campaign.id, range(1_000))
+    for subject in range(10):
+        pick_variant(campaign.org_id, campaign.id, subject)
+    flush_exposures()
+
+    counts = exposure_counts(campaign.org_id, campaign.id)
+    expected = Counter(assignments.values())
+    expected.update(assignments[s] for s in range(10))
+    assert counts == dict(expected)
+
+
+def test_campaign_without_active_variants(db_session, resolve_org_id):
+    campaign = MarketingCampaign(org_id=resolve_org_id(), name="Empty")
+    db.session.add(campaign)
+    db.session.commit()
+    marketing_ab.invalidate_campaign(campaign.org_id, campaign.id)
+
+    assert pick_variant(campaign.org_id, campaign.id, 1) is None
+    assert assign(campaign.org_id, campaign.id, [1, 2]) == {}
@@ -0,0 +1,140 @@
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import Column, Date, DateTime, Integer, Numeric, String, create_engine
+from sqlalchemy.orm import DeclarativeBase, Session
+
+from erp.extensions import db
+from erp.marketing.models import MarketingCampaign, MarketingSegment, MarketingSegmentMember
+from erp.services.marketing_segment_compiler import ClientSource, compile_segment, iter_audience, refresh_segment
+from erp.services.marketing_segment_eval import matches_segment
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Client(Base):
+    __tablename__ = "segment_clients"
+    id = Column(Integer, primary_key=True)
+    org_id = Column(Integer, nullable=False)
+    client_type = Column(String(32))
+    region = Column(String(64))
+    last_order_date = Column(Date)
+    avg_monthly_spend = Column(Numeric(14, 2))
+    updated_at = Column(DateTime, nullable=False, default=datetime(2024, 1, 1))
+
+
+SOURCE = ClientSource(
+    id=Client.id,
+    org_id=Client.org_id,
+    updated_at=Client.updated_at,
+    fields={
+        "client_type": Client.client_type,
+        "region": Client.region,
+        "last_order_date": Client.last_order_date,
+        "avg_monthly_spend": Client.avg_monthly_spend,
+    },
+)
+
+RULES = [
+    {"client_type": ["hospital", "clinic"]},
+    {"region": ["Addis Ababa"], "avg_monthly_spend_gte": 30_000},
+    {"client_type": ["pharmacy"], "last_order_days_lte": 30},
+    {"region": []},
+    {"unknown_rule": 1},
+]
+
+
+@pytest.fixture()
+def clients():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    rng = random.Random(7)
+    with Session(engine) as session:
+        session.add_all(
+            Client(
+                org_id=rng.choice([1, 1, 2]),
+                client_type=rng.choice(["hospital", "clinic", "pharmacy", None]),
+                region=rng.choice(["Addis Ababa", "Oromia", None]),
+                last_order_date=rng.choice([None, date.today() - timedelta(days=rng.randint(0, 90))]),
+                avg_monthly_spend=Decimal(rng.randint(0, 60_000)),
+            )
+            for _ in range(500)
+        )
+        session.commit()
+        yield session
+
+
+@pytest.mark.parametrize("rules", RULES)
+def test_sql_audience_matches_python_evaluator(clients, rules):
+    expected = [
+        c.id
+        for c in clients.query(Client).filter_by(org_id=1).order_by(Client.id)
+        if matches_segment(c, rules)
+    ]
+
+    assert sorted(iter_audience(rules, org_id=1, source=SOURCE, session=clients, batch_size=64)) == expected
+
+
+def test_unmapped_fields_fall_back_to_python(clients):
+    partial = ClientSource(
+        id=Client.id,
+        org_id=Client.org_id,
+        updated_at=Client.updated_at,
+        fields={"client_type": Client.client_type, "avg_monthly_spend": Client.avg_monthly_spend},
+    )
+    rules = {"client_type": ["hospital"], "region": ["Oromia"], "avg_monthly_spend_gte": 10_000}
+
+    compiled = compile_segment(rules, partial)
+    assert compiled.residual == {"region": ["Oromia"]}
+    audience = list(iter_audience(rules, org_id=1, source=partial, session=clients))
+    assert audience == []  # region is unknown to the source, so nobody matches
+
+    partial.fields["region"] = Client.region
+    assert compile_segment(rules, partial).fully_sql
+
+
+def _institution(org_id, n, **kwargs):
+    from erp.models.core_entities import Institution
+
+    return Institution(org_id=org_id, tin=f"09{n:08d}", legal_name=f"Inst {n}", **kwargs)
+
+
+def test_refresh_only_reevaluates_changed_clients(db_session, resolve_org_id):
+    org_id = resolve_org_id()
+    institutions = [
+        _institution(org_id, 1, institution_type="hospital", region="Addis Ababa"),
+        _institution(org_id, 2, institution_type="clinic", region="Addis Ababa"),
+        _institution(org_id, 3, institution_type="hospital", region="Oromia"),
+    ]
+    db.session.add_all(institutions)
+    campaign = MarketingCampaign(org_id=org_id, name="Segments")
+    db.session.add(campaign)
+    db.session.flush()
+    segment = MarketingSegment(
+        org_id=org_id, campaign_id=campaign.id, name="Hospitals", rules_json={"client_type": ["hospital"]}
+    )
+    db.session.add(segment)
+    db.session.commit()
+
+    def members():
+        return {m.client_id for m in MarketingSegmentMember.query.filter_by(segment_id=segment.id)}
+
+    first = refresh_segment(segment, now=datetime.utcnow())
+    assert first == {"mode": "full", "added": 2, "removed": 0}
+    assert members() == {institutions[0].id, institutions[2].id}
+
+    institutions[1].institution_type = "hospital"
+    institutions[2].institution_type = "clinic"
+    db.session.commit()
+    second = refresh_segment(segment, now=datetime.utcnow() + timedelta(seconds=1))
+    assert second == {"mode": "incremental", "added": 1, "removed": 1}
+    assert members() == {institutions[0].id, institutions[1].id}
+
+    segment.rules_json = {"region": ["Oromia"]}
+    db.session.commit()
+    assert refresh_segment(segment)["mode"] == "full"
+    assert members() == {institutions[2].id}
@@ -0,0 +1,95 @@
+import threading
+from decimal import Decimal
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from erp import create_app, db
+from erp.models import Inventory, InventoryReservation, Order, Organization
+from erp.services.order_reservation import (
+    InsufficientStock,
+    InventoryItemNotFound,
+    aggregate_lines,
+    create_reservations,
+    reserve_stock,
+)
+
+
+def _item(quantity):
+    item = Inventory(
+        org_id=1, name="Reagent", sku=f"RSV-{uuid4().hex[:8]}", quantity=quantity, price=Decimal("1")
+    )
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+def test_reserve_decrements_all_lines_and_bulk_inserts(app):
+    with app.app_context():
+        a, b = _item(10), _item(4)
+        quantities = aggregate_lines([(a, 3), (b, 4), (a, 2)])
+        assert quantities == {a: 5, b: 4}
+
+        order = Order(organization_id=1, total_amount=Decimal("0"))
+        db.session.add(order)
+        db.session.flush()
+        reserve_stock(1, quantities)
+        create_reservations(1, order.id, quantities)
+        db.session.commit()
+
+        assert db.session.get(Inventory, a).quantity == 5
+        assert db.session.get(Inventory, b).quantity == 0
+        assert InventoryReservation.query.filter_by(order_id=order.id).count() == 2
+
+
+def test_reserve_is_all_or_nothing(app):
+    with app.app_context():
+        a, b = _item(10), _item(1)
+        with pytest.raises(InsufficientStock) as excinfo:
+            reserve_stock(1, {a: 1, b: 2})
+        db.session.rollback()
+        assert excinfo.value.inventory_item_id == b
+        assert db.session.get(Inventory, a).quantity == 10
+
+        with pytest.raises(InventoryItemNotFound):
+            reserve_stock(1, {a: 1, 987654: 1})
+        db.session.rollback()
+
+
+def test_parallel_orders_never_oversell(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'reserve.db'}")
+    stress_app = create_app()
+    stress_app.config.update(
+        TESTING=True, SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"timeout": 30}}
+    )
+    with stress_app.app_context():
+        db.create_all()
+        db.session.add(Organization(id=1, name="Stress Org"))
+        db.session.commit()
+        scarce, plenty = _item(20), _item(1000)
+
+    successes = []
+
+    def place_order():
+        with stress_app.app_context():
+            try:
+                reserve_stock(1, {scarce: 1, plenty: 3})
+                db.session.commit()
+                successes.append(1)
+            except (InsufficientStock, OperationalError):
+                db.session.rollback()
+
+    threads = [threading.Thread(target=place_order) for _ in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with stress_app.app_context():
+        remaining = db.session.get(Inventory, scarce).quantity
+        assert remaining >= 0
+        assert len(successes) <= 20
+        assert remaining == 20 - len(successes)
+        assert db.session.get(Inventory, plenty).quantity == 1000 - 3 * len(successes)
+        db.drop_all()
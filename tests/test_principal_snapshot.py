@@ -0,0 +1,94 @@
+from sqlalchemy import event
+
+from erp import db
+
+
+def _count_queries(engine):
+    statements = []
+
+    def _listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _listener)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", _listener)
+
+
+def test_authorization_hot_path_only_checks_active_flag(app, make_user_with_role):
+    from erp.extensions import load_user
+    from erp.security_principal import PrincipalUser, prime_snapshot
+    from erp.security_rbac_phase2 import ensure_default_policy, is_allowed_for
+
+    user = make_user_with_role("admin")
+    with app.app_context():
+        user = db.session.merge(user)
+        ensure_default_policy(user.org_id)
+        snapshot = prime_snapshot(user)
+        is_allowed_for(snapshot, "orders", "view")
+
+        statements, stop = _count_queries(db.engine)
+        try:
+            principal = load_user(str(user.id))
+            assert isinstance(principal, PrincipalUser)
+            assert principal.has_role("admin")
+            assert principal.snapshot.roles == frozenset({"admin"})
+            assert is_allowed_for(principal.snapshot, "orders", "view")
+        finally:
+            stop()
+
+    assert len(statements) == 1
+    assert "is_active" in statements[0]
+
+
+def test_require_roles_reads_the_snapshot_without_queries(app, make_user_with_role, monkeypatch):
+    from flask_login import login_user
+
+    from erp.security import require_roles
+    from erp.security_principal import PrincipalUser, prime_snapshot
+
+    monkeypatch.setitem(app.config, "LOGIN_DISABLED", False)
+    monkeypatch.setitem(app.config, "MFA_REQUIRED_ROLES", ())
+    view = require_roles("finance")(lambda: "ok")
+
+    user = make_user_with_role("finance")
+    with app.app_context():
+        user = db.session.merge(user)
+        principal = PrincipalUser(prime_snapshot(user))
+        with app.test_request_context("/"):
+            login_user(principal)
+            statements, stop = _count_queries(db.engine)
+            try:
+                assert view() == "ok"
+            finally:
+                stop()
+
+    assert statements == []
+
+
+def test_deactivated_user_is_rejected_despite_cached_snapshot(app, make_user_with_role):
+    from erp.extensions import load_user
+    from erp.security_principal import prime_snapshot
+
+    user = make_user_with_role("admin")
+    with app.app_context():
+        user = db.session.merge(user)
+        prime_snapshot(user)
+        assert load_user(str(user.id)) is not None
+
+        user.is_active = False
+        db.session.flush()
+        assert load_user(str(user.id)) is None
+
+
+def test_policy_invalidation_rebuilds_snapshot(app, make_user_with_role):
+    from erp.security_principal import get_snapshot, prime_snapshot
+    from erp.security_rbac_phase2 import invalidate_policy_cache
+
+    user = make_user_with_role("finance")
+    with app.app_context():
+        user = db.session.merge(user)
+        before = prime_snapshot(user)
+        invalidate_policy_cache()
+        after = get_snapshot(user.id)
+
+    assert after.policy_version == before.policy_version + 1
+    assert after.roles == before.roles
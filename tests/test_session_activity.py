@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from erp import db
+from erp.models import UserSession
+from erp.services.session_activity import SessionActivityTracker
+
+
+def _session(org_id, session_id, user_id=1):
+    row = UserSession(
+        org_id=org_id,
+        user_id=user_id,
+        session_id=session_id,
+        last_seen_at=datetime.utcnow() - timedelta(hours=1),
+    )
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+def test_touches_are_coalesced_and_flushed_in_bulk(app):
+    with app.app_context():
+        _session(1, "act-a")
+        _session(1, "act-b")
+        tracker = SessionActivityTracker(flush_interval=3600, granularity=60)
+        now = datetime.utcnow()
+
+        assert tracker.touch(1, "act-a", now)
+        assert not tracker.touch(1, "act-a", now + timedelta(seconds=5))
+        assert tracker.touch(1, "act-b", now)
+
+        assert tracker.flush() == 2
+        db.session.expire_all()
+        stamps = {
+            r.session_id: r.last_seen_at
+            for r in UserSession.query.filter(UserSession.session_id.in_(["act-a", "act-b"]))
+        }
+        assert stamps == {"act-a": now, "act-b": now}
+        assert tracker.flush() == 0
+
+
+def test_revoke_all_is_visible_through_cache(app):
+    from erp.services.session_service import is_session_revoked, revoke_all_sessions_for_user
+
+    with app.app_context():
+        _session(1, "rev-a", user_id=77)
+        assert not is_session_revoked(1, "rev-a")
+
+        revoke_all_sessions_for_user(77)
+
+        assert is_session_revoked(1, "rev-a")
+        other = SessionActivityTracker(flush_interval=0)
+        assert other.is_revoked(1, "rev-a")
+
+
+def test_late_committed_revocation_behind_watermark_is_loaded(app):
+    with app.app_context():
+        tracker = SessionActivityTracker(flush_interval=0)
+        newest = _session(1, "late-new")
+        newest.revoked_at = datetime.utcnow()
+        db.session.commit()
+        assert tracker.is_revoked(1, "late-new")
+
+        # Stamped before the watermark, committed after the last poll.
+        late = _session(1, "late-old")
+        late.revoked_at = newest.revoked_at - timedelta(seconds=30)
+        db.session.commit()
+
+        assert tracker.is_revoked(1, "late-old")
@@ -53,7 +53,7 @@ def test_webhook_accepts_active_session(monkeypatch, app, client):
         def run(self, *_args, **_kwargs):
             return None
 
-    monkeypatch.setattr("erp.blueprints.telegram_webhook.process_bot_job", _StubTask())
+    monkeypatch.setattr("erp.blueprints.telegram_webhook.process_bot_batch", _StubTask())
 
     with app.app_context():
         user = User(